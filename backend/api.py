@@ -1,13 +1,23 @@
 import os
+import json
+import tarfile
+import zipfile
 from datetime import date, datetime, timezone
-from flask import Blueprint, request, jsonify, current_app, send_from_directory, abort
+from flask import Blueprint, request, jsonify, current_app, abort
 from werkzeug.utils import secure_filename
-from models import db, Document, DocumentVersion, UploadLog
+from sqlalchemy import or_
+from models import db, Document, DocumentVersion, UploadLog, Blob, StoredFile, UploadSession
 from pathlib import Path
-from openai import OpenAI
 
 from io import BytesIO
-from PyPDF2 import PdfReader
+from file_service import send_cached_file, extract_pdf_pages
+import blob_store
+import upload_sessions
+import data_version
+from http_cache import conditional_json
+import tracing
+from tracing import span
+from upload_sessions import UploadError
 from ragflow_service import (
     upload_and_parse_file,
     get_doc_status,
@@ -20,6 +30,9 @@ from ragflow_service import (
     update_dataset_chunking,
     upload_file_to_ragflow,
     list_datasets_info,
+    rag_display_name as make_rag_display_name,
+    documents_list_version,
+    datasets_version,
     get_knowledge_bases
 )
 
@@ -55,7 +68,45 @@ def _append_upload_log(*, kb: str | None, doc_no: str | None, title: str,
     _prune_upload_logs(keep=10)
 
 
+# ─────────────────────────── 列表端點的資料版本(弱 ETag) ───────────────────────────
+def _limit_arg(default: int) -> int:
+    try:
+        return int((request.args.get("limit") or "").strip() or default)
+    except ValueError:
+        return default
+
+def _docs_version() -> str:
+    return f"docs:{data_version.current('docs')}"
+
+def _ragflow_docs_version():
+    wm = documents_list_version(
+        keywords=(request.args.get("q") or "").strip() or None,
+        limit=_limit_arg(500),
+        dataset_name=(request.args.get("kb") or "").strip() or None,
+    )
+    return f"rag:{wm}" if wm else None
+
+def _datasets_version():
+    wm = datasets_version()
+    return f"kb:{wm}" if wm else None
+
+def _files_version() -> str:
+    """blob store 由 DB 版本代表；舊的平面檔以各目錄 mtime 當作目錄索引世代(新增 / 刪除檔案都會改變)。"""
+    root = current_app.config["UPLOAD_FOLDER"]
+    blobs_name = blob_store.blob_root(root).name
+    dir_gen = []
+    for dirpath, dirnames, _ in os.walk(root):
+        if Path(dirpath) == Path(root) and blobs_name in dirnames:
+            dirnames.remove(blobs_name)
+        try:
+            dir_gen.append(f"{os.stat(dirpath).st_mtime_ns}")
+        except OSError:
+            pass
+    return f"files:{data_version.current('files')}:{'.'.join(dir_gen)}"
+
+
 @api.get("/knowledge-bases")
+@conditional_json(_datasets_version)
 def api_knowledge_bases():
     """
     獲取知識庫列表 (knowledge bases / datasets)
@@ -74,6 +125,7 @@ def api_knowledge_bases():
 
 
 @api.get("/docs")
+@conditional_json(_docs_version)
 def api_docs_list():
     """
     目前本地 DB 未分 KB,因此此清單不依 kb 過濾;
@@ -113,6 +165,71 @@ def api_docs_list():
     return jsonify(items)
 
 
+@api.get("/docs/as-of")
+@conditional_json(_docs_version)
+def api_docs_as_of():
+    """
+    某一天各規章適用的版本(生效區間見 version_validity.py)
+    ?date=YYYY-MM-DD(必填)&to=YYYY-MM-DD(可選：改查 [date, to] 期間內曾經在效的版本)
+    &page=1&page_size=50&department=<處室>&q=<標題 / 規章編號關鍵字>
+    回傳 {date, to, page, page_size, total, items: [{doc, version}]}
+    """
+    import version_validity
+
+    try:
+        on = date.fromisoformat(request.args["date"])
+        until = date.fromisoformat(request.args["to"]) if request.args.get("to") else None
+        page = max(1, int(request.args.get("page") or 1))
+        page_size = max(1, min(int(request.args.get("page_size") or 50), 500))
+    except KeyError:
+        return jsonify({"success": False, "error": "missing date"}), 400
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if until and until < on:
+        return jsonify({"success": False, "error": "to must not be earlier than date"}), 400
+
+    query = version_validity.in_force_query(on, until)
+    department = (request.args.get("department") or "").strip()
+    if department:
+        query = query.filter(Document.department == department)
+    q = (request.args.get("q") or "").strip()
+    if q:
+        query = query.filter(or_(Document.title.ilike(f"%{q}%"), Document.doc_no.ilike(f"%{q}%")))
+    total = query.count()
+    rows = (query.order_by(Document.title, Document.id, DocumentVersion.effective_from)
+            .offset((page - 1) * page_size).limit(page_size).all())
+
+    items = []
+    for d, v in rows:
+        items.append({
+            "doc": {
+                "id": d.id,
+                "title": d.title,
+                "department": d.department,
+                "doc_no": d.doc_no,
+                "date_issued": d.date_issued.isoformat() if d.date_issued else None,
+                "review_meeting": d.review_meeting,
+            },
+            "version": {
+                "id": v.id,
+                "date_issued": v.date_issued.isoformat() if v.date_issued else None,
+                "effective_from": v.effective_from.isoformat() if v.effective_from else None,
+                "effective_to": v.effective_to.isoformat() if v.effective_to else None,
+                "is_active": v.is_active,
+                "file_path": v.file_path,
+                "filename": os.path.basename(v.file_path) if v.file_path else None,
+            },
+        })
+    return jsonify({
+        "date": on.isoformat(),
+        "to": until.isoformat() if until else None,
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "items": items,
+    }), 200
+
+
 @api.post("/docs")
 def api_docs_upload():
     """
@@ -124,27 +241,43 @@ def api_docs_upload():
     if not f:
         return ("請選擇要上傳的 PDF 檔", 400)
 
-    filename = secure_filename(f.filename or "unnamed.pdf")
-    save_dir = current_app.config["UPLOAD_FOLDER"]
-    os.makedirs(save_dir, exist_ok=True)
-    save_path = os.path.join(save_dir, filename)
-    f.save(save_path)
+    # 原始檔名只做為顯示/對照用;實體檔以內容 SHA-256 存入 blob store(同內容只存一份)
+    filename = _client_filename(f.filename)
+    blob, blob_file = blob_store.put_stream(f.stream, filename)
+
+    form = request.form.to_dict()
+    if not form.get("kb"):
+        form["kb"] = request.args.get("kb")
+    return _ingest_stored_upload(blob, blob_file, filename, form)
+
+
+def _client_filename(raw: str | None) -> str:
+    return (raw or "unnamed.pdf").replace("\\", "/").split("/")[-1] or "unnamed.pdf"
+
+
+def _ingest_stored_upload(blob: Blob, blob_file: Path, filename: str, form: dict):
+    """
+    已存入 blob store 的檔案 → 建 Document/DocumentVersion →(可選)同步 RAGFlow。
+    單次上傳(/api/docs)與分段續傳的 finalize 共用這條路徑。
+    form 欄位同 /api/docs 的 multipart 欄位。
+    """
+    save_path = str(blob_file)
 
     # 2) 表單欄位
-    title           = (request.form.get("title") or Path(filename).stem).strip()
-    department      = (request.form.get("department") or "").strip()
-    doc_no          = (request.form.get("doc_no") or "").strip()
-    date_issued_raw = request.form.get("date_issued") or None
-    review_meeting  = request.form.get("review_meeting") or None
-    version_code    = request.form.get("version_code") or "v1"
-    kb              = request.form.get("kb") or request.args.get("kb")  # dataset 名稱/ID
+    title           = (form.get("title") or Path(filename).stem).strip()
+    department      = (form.get("department") or "").strip()
+    doc_no          = (form.get("doc_no") or "").strip()
+    date_issued_raw = form.get("date_issued") or None
+    review_meeting  = form.get("review_meeting") or None
+    version_code    = form.get("version_code") or "v1"
+    kb              = form.get("kb") or None  # dataset 名稱/ID
 
     # 3) chunking 參數（可選）
-    chunk_method        = request.form.get("chunk_method") or request.form.get("chunking_method")
-    chunk_size          = request.form.get("chunk_size")
-    chunk_overlap       = request.form.get("chunk_overlap")
-    chunk_regex         = request.form.get("chunk_regex")
-    chunk_heading_regex = request.form.get("chunk_heading_regex")
+    chunk_method        = form.get("chunk_method") or form.get("chunking_method")
+    chunk_size          = form.get("chunk_size")
+    chunk_overlap       = form.get("chunk_overlap")
+    chunk_regex         = form.get("chunk_regex")
+    chunk_heading_regex = form.get("chunk_heading_regex")
     parse_options = {}
     if chunk_method:        parse_options["method"] = chunk_method
     if chunk_size:          parse_options["size"] = int(chunk_size)
@@ -154,7 +287,7 @@ def api_docs_upload():
     if not parse_options:   parse_options = None
 
     # 4) 是否同步至 RAGFlow
-    sync_to_ragflow = (request.form.get("sync_to_ragflow") or "").lower() in ("1", "true", "on", "yes")
+    sync_to_ragflow = str(form.get("sync_to_ragflow") or "").lower() in ("1", "true", "on", "yes")
 
     # 5) 寫入本地 DB
     doc = Document(
@@ -165,23 +298,22 @@ def api_docs_upload():
         review_meeting=review_meeting,
     )
     db.session.add(doc)
-    db.session.commit()
+    db.session.flush()
 
     ver = DocumentVersion(
         doc_id=doc.id,
         date_issued=(date.fromisoformat(date_issued_raw) if date_issued_raw else None),
         is_active=True,
         file_path=save_path,
+        kb=kb,
     )
     db.session.add(ver)
+    db.session.flush()
+    blob_store.register_file(blob, filename, version_id=ver.id)
     db.session.commit()
 
     # 6) 組 RAGFlow 顯示名稱：<dept>-<title>.pdf（有部門才加；副檔名避免重覆）
-    ext = Path(save_path).suffix or ""
-    dep = department.strip()
-    use_dep = bool(dep and dep.lower() != "unknown")
-    rag_base = f"{dep}-{title}" if use_dep else title
-    rag_display_name = rag_base if (ext and rag_base.lower().endswith(ext.lower())) else f"{rag_base}{ext}"
+    rag_display_name = make_rag_display_name(title, department, Path(save_path).suffix or "")
 
     # 7) 同步到 RAGFlow（依 kb 切換 dataset）
     rag_result = {"success": False, "error": "not synced"}
@@ -192,6 +324,13 @@ def api_docs_upload():
             dataset_name=kb,
             parse_options=parse_options,
         )
+        if rag_result.get("success"):
+            ids = rag_result.get("parsed_ids") or []
+            ver.kb = rag_result.get("dataset") or kb
+            ver.rag_status = "PENDING"
+            if len(ids) == 1:
+                ver.rag_doc_id = ids[0]
+            db.session.commit()
 
     return (
         jsonify(
@@ -218,6 +357,116 @@ def api_docs_upload():
     )
 
 
+# === 分段續傳:建立 session → PUT 各段 → 查進度 → finalize(走 /api/docs 同一條建檔流程) ===
+def _get_upload_session(session_id: str) -> UploadSession:
+    return db.get_or_404(UploadSession, session_id)
+
+
+@api.post("/uploads/sessions")
+def api_upload_session_create():
+    """
+    JSON:{ filename, size, sha256?(可選,finalize 時比對), chunk_size?, fields:{ /api/docs 的表單欄位 } }
+    回傳 session 進度(含 id、chunk_size、missing 區段)。
+    """
+    payload = request.get_json(silent=True) or {}
+    filename = _client_filename(payload.get("filename"))
+    try:
+        size = int(payload.get("size") or 0)
+        chunk_size = int(payload["chunk_size"]) if payload.get("chunk_size") else None
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "invalid size / chunk_size"}), 400
+    if chunk_size and chunk_size > (current_app.config.get("MAX_CONTENT_LENGTH") or chunk_size):
+        return jsonify({"success": False, "error": "chunk_size exceeds MAX_CONTENT_LENGTH"}), 400
+
+    fields = payload.get("fields") or {}
+    if not fields.get("kb") and request.args.get("kb"):
+        fields["kb"] = request.args.get("kb")
+    try:
+        sess = upload_sessions.create_session(
+            filename, size,
+            chunk_size=chunk_size,
+            expected_sha256=payload.get("sha256"),
+            fields=fields,
+        )
+    except UploadError as e:
+        return jsonify({"success": False, "error": str(e)}), e.status
+    return jsonify(upload_sessions.progress(sess, [])), 201
+
+
+@api.put("/uploads/sessions/<session_id>")
+def api_upload_session_put_chunk(session_id: str):
+    """
+    上傳一段:原始位元組放在 body,位置用 ?offset=N 或 Content-Range: bytes a-b/total。
+    可並行、亂序、重送(重送同一段是冪等的);以不同內容改寫已收到的區段回 409。
+    """
+    sess = _get_upload_session(session_id)
+    length = request.content_length
+    offset_raw = request.args.get("offset")
+    content_range = request.headers.get("Content-Range", "")
+    try:
+        if offset_raw is not None:
+            offset = int(offset_raw)
+        elif content_range.startswith("bytes "):
+            range_spec = content_range[6:].split("/", 1)[0]
+            start, end = (int(x) for x in range_spec.split("-", 1))
+            offset = start
+            length = length if length is not None else end - start + 1
+            if length != end - start + 1:
+                raise ValueError("Content-Range does not match Content-Length")
+        else:
+            return jsonify({"success": False, "error": "missing offset"}), 400
+    except ValueError as e:
+        return jsonify({"success": False, "error": f"invalid offset: {e}"}), 400
+    if not length:
+        return jsonify({"success": False, "error": "missing Content-Length"}), 411
+
+    try:
+        res = upload_sessions.write_chunk(sess, offset, request.stream, length)
+    except UploadError as e:
+        return jsonify({"success": False, "error": str(e)}), e.status
+    return jsonify(res), 200
+
+
+@api.get("/uploads/sessions/<session_id>")
+def api_upload_session_progress(session_id: str):
+    sess = _get_upload_session(session_id)
+    res = upload_sessions.progress(sess)
+    if sess.result:
+        res["result"] = json.loads(sess.result)
+    return jsonify(res), 200
+
+
+@api.post("/uploads/sessions/<session_id>/finalize")
+def api_upload_session_finalize(session_id: str):
+    """所有區段到齊後組檔:驗證雜湊 → 收進 blob store → 與 /api/docs 相同的建檔 / RAGFlow 同步。"""
+    sess = _get_upload_session(session_id)
+    if sess.status == "DONE" and sess.result:  # 重送 finalize:直接回上次結果
+        done = json.loads(sess.result)
+        return jsonify(done.get("body")), done.get("status", 200)
+
+    try:
+        blob, blob_file = upload_sessions.finalize(sess)
+    except UploadError as e:
+        return jsonify({"success": False, "error": str(e)}), e.status
+
+    fields = json.loads(sess.fields or "{}")
+    try:
+        resp, status = _ingest_stored_upload(blob, blob_file, sess.filename, fields)
+    except Exception:
+        upload_sessions.release(sess)
+        raise
+    upload_sessions.mark_done(sess, {"status": status, "body": resp.get_json()})
+    return resp, status
+
+
+@api.delete("/uploads/sessions/<session_id>")
+def api_upload_session_abort(session_id: str):
+    sess = _get_upload_session(session_id)
+    if sess.status == "OPEN":
+        upload_sessions.abort(sess)
+    return jsonify({"success": True, "id": sess.id, "status": sess.status}), 200
+
+
 # === 新增:批量匯入用「單筆直傳 RAG Flow」端點(不寫本地 DB) ===
 @api.post("/ragflow/upload")
 def api_ragflow_direct_upload():
@@ -271,12 +520,124 @@ def api_ragflow_direct_upload():
 
 @api.post("/versions/<int:version_id>/toggle")
 def api_toggle_version(version_id):
+    """切換單一版本的生效狀態，並同步 RAGFlow 文件的啟用狀態(?sync_to_ragflow=0 可略過；?kb= 指定 dataset)。"""
+    import version_lifecycle
+
     ver = DocumentVersion.query.get_or_404(version_id)
     ver.is_active = not ver.is_active
     db.session.commit()
-    return jsonify(
-        {"message": f"版本 {ver.id} 狀態已切換為:{'生效' if ver.is_active else '失效'}"}
+    out = {"message": f"版本 {ver.id} 狀態已切換為:{'生效' if ver.is_active else '失效'}"}
+    if str(request.args.get("sync_to_ragflow") or "1").lower() in ("1", "true", "on", "yes"):
+        out["ragflow"] = version_lifecycle.push([ver], (request.args.get("kb") or "").strip() or None)[ver.id]
+    return jsonify(out)
+
+
+@api.post("/versions/lifecycle")
+def api_versions_lifecycle():
+    """
+    批次生效 / 失效版本，並同步 RAGFlow 文件的啟用狀態(見 version_lifecycle.py)
+    JSON:{
+      action: "activate" | "deactivate",           (必填)
+      version_ids: [...], doc_ids: [...], department: "...",
+      superseded_before: "YYYY-MM-DD",              (在此日前已被新版本取代的版本)
+      kb: dataset 名稱或 ID(版本沒有記錄 dataset 時使用), sync_to_ragflow: true, dry_run: false, concurrency
+    }
+    篩選條件之間為 AND，至少要有一個。回傳 {action, matched, changed, dry_run, items: [...每個版本的結果]}
+    """
+    import version_lifecycle
+
+    body = request.get_json(silent=True) or {}
+    try:
+        superseded_before = (date.fromisoformat(body["superseded_before"])
+                             if body.get("superseded_before") else None)
+        version_ids = [int(x) for x in body.get("version_ids") or []]
+        doc_ids = [int(x) for x in body.get("doc_ids") or []]
+        concurrency = int(body["concurrency"]) if body.get("concurrency") else None
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "error": f"invalid parameter: {e}"}), 400
+    try:
+        res = version_lifecycle.apply(
+            (body.get("action") or "").strip().lower(),
+            version_ids=version_ids,
+            doc_ids=doc_ids,
+            department=(body.get("department") or "").strip() or None,
+            superseded_before=superseded_before,
+            kb=(body.get("kb") or "").strip() or None,
+            sync_to_ragflow=body.get("sync_to_ragflow", True) not in (False, 0, "0", "false"),
+            dry_run=bool(body.get("dry_run")),
+            concurrency=concurrency,
+        )
+    except version_lifecycle.LifecycleError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    failed = sum(1 for it in res["items"] if (it.get("ragflow") or {}).get("status") == "failed")
+    return jsonify({"success": not failed, **res}), (200 if not failed else 207)
+
+
+@api.post("/docs/<int:doc_id>/versions")
+def api_doc_update_version(doc_id: int):
+    """
+    上傳既有文件的新版本(修正案)，只把有變動的條文推送到 RAGFlow(見 version_update.py)。
+    multipart/form-data:
+      - file: 新版 PDF (必填)
+      - date_issued: 新版公布日期(可空)
+      - kb: dataset 名稱或 ID(可空＝用預設)
+      - dry_run: 只回傳條文差異與將採用的模式
+      - force_full: 直接整份重新解析
+      - max_change_ratio: 變動比例上限，超過改走整份重新解析(預設 VERSION_DIFF_MAX_RATIO)
+      - keep_previous_active: 舊版本維持生效(預設會停用)
+      - chunk_method / chunk_size / ...: 走整份重新解析時的解析選項(同 /api/docs)
+    """
+    import version_update
+
+    doc = Document.query.get_or_404(doc_id)
+    f = request.files.get("file")
+    if not f:
+        return jsonify({"success": False, "error": "missing file"}), 400
+
+    form = request.form.to_dict()
+    truthy = ("1", "true", "on", "yes")
+    parse_options = {}
+    try:
+        date_issued = date.fromisoformat(form["date_issued"]) if form.get("date_issued") else None
+        max_ratio = float(form["max_change_ratio"]) if form.get("max_change_ratio") else None
+        if form.get("chunk_size"):      parse_options["size"] = int(form["chunk_size"])
+        if form.get("chunk_overlap"):   parse_options["overlap"] = int(form["chunk_overlap"])
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    if form.get("chunk_method") or form.get("chunking_method"):
+        parse_options["method"] = form.get("chunk_method") or form.get("chunking_method")
+    if form.get("chunk_regex"):         parse_options["pattern"] = form["chunk_regex"]
+    if form.get("chunk_heading_regex"): parse_options["heading_regex"] = form["chunk_heading_regex"]
+
+    filename = _client_filename(f.filename)
+    dry_run = str(form.get("dry_run") or "").lower() in truthy
+    options = dict(
+        date_issued=date_issued,
+        dataset_name=(form.get("kb") or request.args.get("kb") or "").strip() or None,
+        force_full=str(form.get("force_full") or "").lower() in truthy,
+        max_ratio=max_ratio,
+        deactivate_previous=str(form.get("keep_previous_active") or "").lower() not in truthy,
+        dry_run=dry_run,
+        parse_options=parse_options or None,
     )
+    if dry_run:
+        # 試算只需切條比對：寫到暫存檔、用完即刪，不收進 blob store(不留下無人引用的 blob)
+        import shutil
+        import tempfile
+
+        fd, tmp_name = tempfile.mkstemp(suffix=Path(filename).suffix)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                shutil.copyfileobj(f.stream, out)
+            res = version_update.apply_update(doc, None, tmp_name, filename, **options)
+        finally:
+            os.remove(tmp_name)
+        return jsonify(res), 200
+
+    blob, blob_file = blob_store.put_stream(f.stream, filename)
+    res = version_update.apply_update(doc, blob, str(blob_file), filename, **options)
+    return jsonify(res), (200 if res.get("success") else 207)
 
 
 @api.delete("/docs/<int:doc_id>")
@@ -313,19 +674,26 @@ def api_delete_doc(doc_id):
         except Exception as e:
             ragflow_warnings.append({"display_name": name, "error": str(e)})
 
-    # 3) 刪除本地檔案(逐版本)
-    for v in versions:
-        try:
-            if v.file_path and os.path.exists(v.file_path):
-                os.remove(v.file_path)
-        except Exception:
-            pass
+    # 3) 釋放 blob(可能被其他版本共用,只回收已無人引用者;實體檔於 commit 成功後才刪)
+    blob_store.release_versions([v.id for v in versions])
+    legacy_files = [v.file_path for v in versions
+                    if v.file_path and not blob_store.is_blob_path(v.file_path)]
 
     # 4) 刪除 DB 紀錄
+    for v in versions:
+        db.session.delete(v)
     db.session.delete(doc)
     db.session.commit()
 
-    # 5) 回覆
+    # 5) commit 成功後才刪除舊版平面目錄的本地檔案
+    for path in legacy_files:
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except Exception:
+            pass
+
+    # 6) 回覆
     return (
         jsonify(
             {
@@ -434,6 +802,51 @@ def api_update_doc_chunking(doc_id):
     return jsonify(res), (200 if res.get("success") else 400)
 
 
+# === 本地切分預覽(不經 RAGFlow) ===
+@api.post("/docs/<int:doc_id>/chunking/preview")
+def api_doc_chunking_preview(doc_id):
+    """
+    JSON:{ method: laws|naive|one, size?(或 parser_config.chunk_token_num), overlap?,
+           heading_regex?, delimiter?(或 parser_config.delimiter), version_id?(預設最新版), limit? }
+    對快取的全文套用切分策略,回傳邊界 / 數量 / 大小統計(見 chunk_preview.py)。
+    """
+    import chunk_preview
+    from file_service import extract_pdf_text
+
+    payload = request.get_json(silent=True) or {}
+    parser_config = payload.get("parser_config") or {}
+    method = str(payload.get("method") or payload.get("chunk_method") or "laws")
+
+    if payload.get("version_id"):
+        ver = DocumentVersion.query.filter_by(id=payload["version_id"], doc_id=doc_id).first_or_404()
+    else:
+        ver = (
+            DocumentVersion.query.filter_by(doc_id=doc_id)
+            .order_by(DocumentVersion.date_issued.desc(), DocumentVersion.id.desc())
+            .first_or_404()
+        )
+    if not ver.file_path or not os.path.isfile(ver.file_path):
+        return jsonify({"success": False, "error": "NO_FILE"}), 404
+
+    try:
+        size = int(payload.get("size") or parser_config.get("chunk_token_num") or chunk_preview.DEFAULT_SIZE)
+        overlap = int(payload.get("overlap") or 0)
+        limit = int(payload.get("limit") or 200)
+        delimiter = payload.get("delimiter") or parser_config.get("delimiter") or chunk_preview.DEFAULT_DELIMITER
+        text = extract_pdf_text(ver.file_path, current_app.config["CACHE_FOLDER"])
+        res = chunk_preview.preview(
+            text, method,
+            size=size, overlap=overlap,
+            heading_regex=payload.get("heading_regex") or None,
+            delimiters=delimiter,
+            limit=limit,
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    res.update(success=True, doc_id=doc_id, version_id=ver.id)
+    return jsonify(res), 200
+
+
 # === Dataset 預設 chunking ===
 @api.post("/ragflow/dataset/chunking")
 def api_update_dataset_chunking():
@@ -448,16 +861,46 @@ def api_update_dataset_chunking():
 
 # --- 0910 ---
 @api.get("/files")
+@conditional_json(_files_version)
 def api_list_files():
     """
     掃描 UPLOAD_FOLDER 底下所有檔案(預設只列 PDF,可自行放寬),
     依最後修改時間(新→舊)排序,回傳:name, rel_path, size, mtime, url
     """
     root = current_app.config["UPLOAD_FOLDER"]
+    blobs_dir = blob_store.blob_root(root)
     exts = {".pdf"}
     results = []
 
-    for dirpath, _, filenames in os.walk(root):
+    # blob store 內的檔案以原始檔名列出(對照表),內容定址 URL 可長效快取
+    rows = (
+        db.session.query(StoredFile, Blob)
+        .join(Blob, Blob.sha256 == StoredFile.sha256)
+        .order_by(StoredFile.created_at.desc())
+        .all()
+    )
+    seen = set()
+    for sf, b in rows:
+        key = (sf.filename, b.sha256)
+        if key in seen or (exts and Path(sf.filename).suffix.lower() not in exts):
+            continue
+        seen.add(key)
+        rel = blob_store.blob_path(b.sha256, b.ext, root).relative_to(root).as_posix()
+        created = sf.created_at.replace(tzinfo=timezone.utc) if sf.created_at else None
+        results.append(
+            {
+                "name": sf.filename,
+                "rel_path": rel,
+                "size": b.size,
+                "mtime": created.isoformat() if created else None,
+                "url": f"/api/blobs/{b.sha256}",
+                "sha256": b.sha256,
+            }
+        )
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        if Path(dirpath) == Path(root) and blobs_dir.name in dirnames:
+            dirnames.remove(blobs_dir.name)
         for fn in filenames:
             p = Path(dirpath) / fn
             if exts and p.suffix.lower() not in exts:
@@ -478,7 +921,7 @@ def api_list_files():
                 }
             )
 
-    results.sort(key=lambda x: x["mtime"], reverse=True)
+    results.sort(key=lambda x: x["mtime"] or "", reverse=True)
     return jsonify(results)
 
 
@@ -488,13 +931,133 @@ def api_download_file(rel_path: str):
     safe_path = os.path.normpath(os.path.join(root, rel_path))
     if not safe_path.startswith(os.path.abspath(root)):
         abort(403)
-    if not os.path.exists(safe_path):
+    if not os.path.isfile(safe_path):
+        abort(404)
+    # 強 ETag / Last-Modified / Range;帶 ?v=<sha256> 時回長效快取
+    return send_cached_file(safe_path)
+
+
+@api.get("/blobs/<sha256>")
+def api_download_blob(sha256: str):
+    """內容定址下載:URL 即內容雜湊,永不變動 → immutable 長效快取。"""
+    blob = db.session.get(Blob, sha256.lower())
+    if blob is None:
+        abort(404)
+    path = blob_store.blob_path(blob.sha256, blob.ext)
+    if not path.is_file():
         abort(404)
-    directory, filename = os.path.split(safe_path)
-    return send_from_directory(directory, filename, as_attachment=False)
+    name = (request.args.get("name") or "").strip() or None
+    if name is None:
+        sf = StoredFile.query.filter_by(sha256=blob.sha256).order_by(StoredFile.id.desc()).first()
+        name = sf.filename if sf else None
+    return send_cached_file(str(path), immutable=True, download_name=name)
+
+
+@api.post("/blobs/gc")
+def api_blobs_gc():
+    """回收未被引用的 blob;?dry_run=1 只列出不刪除。"""
+    dry_run = (request.args.get("dry_run") or "").lower() in ("1", "true", "yes")
+    try:
+        grace = int(request.args.get("grace_seconds") or 3600)
+    except ValueError:
+        grace = 3600
+    return jsonify(blob_store.collect_garbage(grace_seconds=grace, dry_run=dry_run)), 200
+
+
+# ─────────────────────────── 整庫匯出 / 匯入(備份、搬機) ───────────────────────────
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(64 * 1024 ** 3)))
+
+
+@api.get("/export")
+def api_export():
+    """
+    ?format=tar|tar.gz|zip(預設 tar)&since=<ISO 時間,增量>
+    邊產生邊送出(不先組好整個檔);回應標頭 X-Export-Until 可當下一次增量的 since。
+    """
+    import corpus_archive
+
+    fmt = (request.args.get("format") or "tar").strip().lower()
+    if fmt not in corpus_archive.FORMATS:
+        return jsonify({"success": False, "error": f"format must be one of {list(corpus_archive.FORMATS)}"}), 400
+    try:
+        since = datetime.fromisoformat(request.args["since"]) if request.args.get("since") else None
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if since is not None and since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)  # DB 內為 UTC naive
+
+    body, until = corpus_archive.stream_export(fmt, since)
+    _mode, mimetype, ext = corpus_archive.FORMATS[fmt]
+    resp = current_app.response_class(body, mimetype=mimetype, direct_passthrough=True)
+    name = f"raglaw-export-{until.strftime('%Y%m%dT%H%M%S')}{'-incr' if since else ''}{ext}"
+    resp.headers["Content-Disposition"] = f'attachment; filename="{name}"'
+    resp.headers["X-Export-Until"] = until.isoformat()
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+@api.post("/import")
+def api_import():
+    """
+    匯入 /api/export 產生的封存檔:
+      - 直接以請求本文送 tar / tar.gz(Content-Type: application/x-tar 或 application/gzip),邊收邊處理;
+        大小上限為 IMPORT_MAX_BYTES(不受 MAX_CONTENT_LENGTH 限制)
+      - 或 multipart 的 file 欄位(tar / zip;受 MAX_CONTENT_LENGTH 限制)
+    """
+    import corpus_archive
+    from werkzeug.wsgi import get_input_stream
+
+    try:
+        if request.mimetype == "multipart/form-data":
+            f = request.files.get("file")
+            if not f:
+                return jsonify({"success": False, "error": "missing file"}), 400
+            fmt = "zip" if (f.filename or "").lower().endswith(".zip") else "tar"
+            res = corpus_archive.import_archive(f.stream, fmt)
+        elif request.mimetype in ("application/zip", "application/x-zip-compressed"):
+            return jsonify({"success": False, "error": "zip must be uploaded as multipart; stream tar instead"}), 415
+        else:
+            stream = get_input_stream(request.environ, max_content_length=IMPORT_MAX_BYTES)
+            res = corpus_archive.import_archive(stream, "tar")
+    except (corpus_archive.ArchiveError, tarfile.TarError, zipfile.BadZipFile) as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify(res), (200 if res.get("success") else 207)
+
+
+@api.get("/versions/<int:version_id>/pages")
+def api_version_pages(version_id: int):
+    """
+    只回傳某版本 PDF 的第 N–M 頁(?from=N&to=M,1 起算、含頭尾;省略 to 表示只取 N 頁)。
+    擷取結果依來源雜湊快取於 CACHE_FOLDER,之後的請求直接送快取檔。
+    """
+    ver = DocumentVersion.query.get_or_404(version_id)
+    if not ver.file_path or not os.path.isfile(ver.file_path):
+        return jsonify({"success": False, "error": "NO_FILE"}), 404
+
+    try:
+        start = int(request.args.get("from") or request.args.get("start") or 1)
+        end = int(request.args.get("to") or request.args.get("end") or start)
+    except ValueError:
+        return jsonify({"success": False, "error": "invalid page range"}), 400
+
+    try:
+        out_path = extract_pdf_pages(ver.file_path, start, end, current_app.config["CACHE_FOLDER"])
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 416
+
+    # 版本建立後檔案內容不再變動(blob store 內容定址)，同一組 版本 + 頁碼 的回應永遠相同 → immutable 長效快取
+    stem = Path(ver.file_path).stem
+    return send_cached_file(
+        out_path,
+        immutable=True,
+        mimetype="application/pdf",
+        download_name=f"{stem}-p{start}-{end}.pdf",
+    )
 
 
 @api.get("/ragflow/docs")
+@conditional_json(_ragflow_docs_version)
 def api_ragflow_docs():
     """
     回傳 RAGFlow dataset 裡的全部文件(可用 ?q=keyword 過濾;用 ?kb= 指定 dataset)
@@ -569,6 +1132,272 @@ def api_delete_ragflow_doc_by_display_name():
     return jsonify(res), status
 
 
+# ─────────────────────────── 本地 ⇄ RAGFlow 對帳 ───────────────────────────
+@api.get("/ragflow/reconcile")
+def api_ragflow_reconcile():
+    """
+    對帳報告:?kb=<dataset>&chunk_method=<預期方法,預設為 dataset 預設>&category=<只列某類>
+    回傳 counts 與 items(每項含 key / category / local / upstream)。
+    """
+    import reconcile
+
+    kb = (request.args.get("kb") or "").strip() or None
+    report = reconcile.build_report(kb, request.args.get("chunk_method"))
+    category = (request.args.get("category") or "").strip()
+    if category:
+        report["items"] = [it for it in report["items"] if it["category"] == category]
+    return jsonify(report), 200
+
+
+@api.post("/ragflow/reconcile/repair")
+def api_ragflow_reconcile_repair():
+    """
+    JSON:{ kb?, chunk_method?, actions: ["reupload","delete_orphans","reparse","fix_chunk_method"],
+           keys?: [報告中的 item key,只處理這些], confirm_delete?, dry_run?, concurrency?, batch_size? }
+    先重新產生報告(避免依據過期資料動作)再執行;各動作批次送出、並行數有上限。
+    delete_orphans 不可逆(孤兒可能是 /api/ragflow/upload 直傳的文件):需給 keys 或 confirm_delete: true,否則 400。
+    """
+    import reconcile
+
+    payload = request.get_json(silent=True) or {}
+    actions = payload.get("actions") or []
+    unknown = [a for a in actions if a not in reconcile.ACTIONS]
+    if not actions or unknown:
+        return jsonify({"success": False, "error": f"actions must be a subset of {list(reconcile.ACTIONS)}",
+                        "unknown": unknown}), 400
+    try:
+        concurrency = int(payload["concurrency"]) if payload.get("concurrency") else None
+        batch_size = int(payload["batch_size"]) if payload.get("batch_size") else None
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "invalid concurrency / batch_size"}), 400
+
+    report = reconcile.build_report(payload.get("kb") or request.args.get("kb"), payload.get("chunk_method"))
+    try:
+        result = reconcile.repair(
+            report, actions,
+            keys=payload.get("keys"),
+            dry_run=bool(payload.get("dry_run")),
+            confirm_delete=payload.get("confirm_delete") is True,
+            concurrency=concurrency,
+            batch_size=batch_size,
+        )
+    except reconcile.ReconcileError as e:
+        return jsonify({"success": False, "error": str(e), "counts": report["counts"]}), 400
+    result["success"] = True
+    result["counts_before"] = report["counts"]
+    return jsonify(result), 200
+
+
+# ─────────────────────────── 批次重切分(背景工作) ───────────────────────────
+@api.post("/ragflow/rechunk")
+def api_ragflow_rechunk():
+    """
+    JSON:{ kb?, chunk_method, parser_config?,
+           filter?: { department?, date_from?, date_to?, current_chunk_method?, all? },
+           batch_size?, parse_interval?, concurrency?, force?, dry_run? }
+    dry_run 只回傳符合的數量與前 20 筆;否則建立工作並於背景執行,回 202 與進度。
+    """
+    import rechunk
+    import jobs
+
+    payload = request.get_json(silent=True) or {}
+    filters = payload.get("filter") or {}
+    try:
+        batch_size = int(payload["batch_size"]) if payload.get("batch_size") else None
+        concurrency = int(payload["concurrency"]) if payload.get("concurrency") else None
+        parse_interval = float(payload["parse_interval"]) if payload.get("parse_interval") is not None else None
+        selection = rechunk.select_targets(
+            (payload.get("kb") or "").strip() or None,
+            payload.get("chunk_method") or "",
+            filters,
+            force=bool(payload.get("force")),
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    if payload.get("dry_run"):
+        return jsonify({
+            "success": True,
+            "dry_run": True,
+            "dataset": selection["dataset"],
+            "chunk_method": selection["chunk_method"],
+            "count": len(selection["targets"]),
+            "skipped_same": selection["skipped_same"],
+            "sample": selection["targets"][:20],
+        }), 200
+    if not selection["targets"]:
+        return jsonify({"success": True, "count": 0, "skipped_same": selection["skipped_same"]}), 200
+
+    job = rechunk.create_job(
+        selection,
+        parser_config=payload.get("parser_config"),
+        filters=filters,
+        batch_size=batch_size,
+        parse_interval=parse_interval,
+        concurrency=concurrency,
+    )
+    jobs.start(job, rechunk.run)
+    return jsonify({"success": True, "job": jobs.describe(job)}), 202
+
+
+@api.get("/ragflow/rechunk")
+def api_ragflow_rechunk_jobs():
+    import rechunk
+    import jobs
+
+    return jsonify({"jobs": [jobs.describe(j) for j in jobs.list_jobs(rechunk.KIND, _limit_arg(20))]}), 200
+
+
+def _job_or_404(job_id: str, kind: str):
+    from models import Job
+
+    job = db.session.get(Job, job_id)
+    if job is None or job.kind != kind:
+        abort(404)
+    return job
+
+
+def _job_progress(job):
+    """進度:by_state 各狀態數量;?items=FAILED 可列出該狀態的項目(最多 200 筆)。"""
+    import jobs
+    from models import JobItem
+
+    out = jobs.describe(job)
+    state = (request.args.get("items") or "").strip().upper()
+    if state:
+        rows = (JobItem.query.filter_by(job_id=job.id, state=state)
+                .order_by(JobItem.id).limit(200).all())
+        out["items"] = [{"id": r.key, "state": r.state, "error": r.error,
+                         **json.loads(r.payload or "{}")} for r in rows]
+    return jsonify(out), 200
+
+
+@api.get("/ragflow/rechunk/<job_id>")
+def api_ragflow_rechunk_progress(job_id: str):
+    import rechunk
+
+    return _job_progress(_job_or_404(job_id, rechunk.KIND))
+
+
+@api.post("/ragflow/rechunk/<job_id>/cancel")
+def api_ragflow_rechunk_cancel(job_id: str):
+    import rechunk
+    import jobs
+
+    job = _job_or_404(job_id, rechunk.KIND)
+    jobs.request_cancel(job)
+    return jsonify({"success": True, "job": jobs.describe(job)}), 200
+
+
+@api.post("/ragflow/rechunk/<job_id>/resume")
+def api_ragflow_rechunk_resume(job_id: str):
+    import rechunk
+    import jobs
+
+    job = _job_or_404(job_id, rechunk.KIND)
+    if not jobs.resume(job, rechunk.run):
+        return jsonify({"success": False, "error": f"job is {jobs.describe(job)['status']}, cannot resume"}), 409
+    return jsonify({"success": True, "job": jobs.describe(job)}), 202
+
+
+# ─────────────────────────── 封存檔匯入(背景工作) ───────────────────────────
+def _form_bool(v, default: bool) -> bool:
+    if v is None or v == "":
+        return default
+    return str(v).strip().lower() in ("1", "true", "yes", "on")
+
+
+@api.post("/ingest/archive")
+def api_ingest_archive():
+    """
+    一次匯入大量 PDF:zip / tar(.gz) 內含 PDF 與 manifest.csv(法規名稱、檔名、處室、最後更新日期)。
+      - 直接以請求本文送 tar / tar.gz / zip(參數放 query string);tar 邊收邊寫入 blob store,
+        zip 須先落地到暫存檔才能讀目錄;大小上限為 IMPORT_MAX_BYTES
+      - 或 multipart 的 file 欄位(參數放表單欄位)
+    參數:kb?, sync_to_ragflow?(預設 true), chunk_method?, concurrency?, skip_existing?
+    收完即建立工作並於背景登錄 / 上傳,回 202 與工作進度。
+    """
+    import tempfile
+    import shutil
+    import archive_ingest
+    import corpus_archive
+    import jobs
+    from werkzeug.wsgi import get_input_stream
+
+    multipart = request.mimetype == "multipart/form-data"
+    args = request.form if multipart else request.args
+    try:
+        concurrency = int(args["concurrency"]) if args.get("concurrency") else None
+    except ValueError:
+        return jsonify({"success": False, "error": "concurrency must be an integer"}), 400
+    options = dict(
+        kb=(args.get("kb") or "").strip() or None,
+        sync_to_ragflow=_form_bool(args.get("sync_to_ragflow"), True),
+        chunk_method=(args.get("chunk_method") or "").strip() or None,
+        concurrency=concurrency,
+        skip_existing=_form_bool(args.get("skip_existing"), False),
+    )
+
+    try:
+        if multipart:
+            f = request.files.get("file")
+            if not f:
+                return jsonify({"success": False, "error": "missing file"}), 400
+            fmt = "zip" if (f.filename or "").lower().endswith(".zip") else "tar"
+            job, summary = archive_ingest.receive(f.stream, fmt, **options)
+        else:
+            stream = get_input_stream(request.environ, max_content_length=IMPORT_MAX_BYTES)
+            if request.mimetype in ("application/zip", "application/x-zip-compressed"):
+                with tempfile.TemporaryFile() as spool:
+                    shutil.copyfileobj(stream, spool, 1024 * 1024)
+                    spool.seek(0)
+                    job, summary = archive_ingest.receive(spool, "zip", **options)
+            else:
+                job, summary = archive_ingest.receive(stream, "tar", **options)
+    except (archive_ingest.IngestError, corpus_archive.ArchiveError, tarfile.TarError, zipfile.BadZipFile) as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    jobs.start(job, archive_ingest.run)
+    return jsonify({"success": True, "received": summary, "job": jobs.describe(job)}), 202
+
+
+@api.get("/ingest/archive")
+def api_ingest_archive_jobs():
+    import archive_ingest
+    import jobs
+
+    return jsonify({"jobs": [jobs.describe(j) for j in jobs.list_jobs(archive_ingest.KIND, _limit_arg(20))]}), 200
+
+
+@api.get("/ingest/archive/<job_id>")
+def api_ingest_archive_progress(job_id: str):
+    import archive_ingest
+
+    return _job_progress(_job_or_404(job_id, archive_ingest.KIND))
+
+
+@api.post("/ingest/archive/<job_id>/cancel")
+def api_ingest_archive_cancel(job_id: str):
+    import archive_ingest
+    import jobs
+
+    job = _job_or_404(job_id, archive_ingest.KIND)
+    jobs.request_cancel(job)
+    return jsonify({"success": True, "job": jobs.describe(job)}), 200
+
+
+@api.post("/ingest/archive/<job_id>/resume")
+def api_ingest_archive_resume(job_id: str):
+    import archive_ingest
+    import jobs
+
+    job = _job_or_404(job_id, archive_ingest.KIND)
+    if not jobs.resume(job, archive_ingest.run):
+        return jsonify({"success": False, "error": f"job is {jobs.describe(job)['status']}, cannot resume"}), 409
+    return jsonify({"success": True, "job": jobs.describe(job)}), 202
+
+
 @api.get("/ragflow/docs/matches")
 def api_ragflow_doc_matches():
     kb = (request.args.get("kb") or "").strip() or None
@@ -591,9 +1420,10 @@ def api_ragflow_doc_matches():
 @api.get("/uploads/recent")
 def api_recent_uploads():
     """
-    從既有本地資料庫(raglaw.db)抓最近 10 筆版本記錄,並以 ?kb= 指定的 KB 即時查 RAGFlow 狀態。
+    從既有本地資料庫(raglaw.db)抓最近 10 筆版本記錄,並即時查 RAGFlow 狀態。
     傳入參數:
-      - ?kb=Regulation(可選,用於即時查 RAGFlow 狀態)
+      - ?kb=Regulation(可選;版本沒有記錄上傳到的 dataset 時,以此 KB 查 RAGFlow 狀態)
+    kb 欄位與狀態皆以版本上傳到的 dataset 為準(與首頁彙總的 recent_uploads 相同)
     回傳欄位:
       id, uploaded_at, kb, doc_no, title, display_name, rag_status, rag_url
     """
@@ -627,7 +1457,7 @@ def api_recent_uploads():
         status, url = "UNKNOWN", None
         if display_name:
             try:
-                live = get_doc_status(display_name, dataset_name=kb)
+                live = get_doc_status(display_name, dataset_name=v.kb or kb)
                 if isinstance(live, dict):
                     status = (live.get("status") or live.get("parsing_status") or "UNKNOWN").upper()
                     url = live.get("url")
@@ -637,7 +1467,7 @@ def api_recent_uploads():
         results.append({
             "id": v.id,
             "uploaded_at": uploaded_at,
-            "kb": kb,
+            "kb": v.kb or kb,
             "doc_no": d.doc_no,
             "title": d.title,
             "display_name": display_name,
@@ -648,100 +1478,286 @@ def api_recent_uploads():
     return jsonify(results), 200
 
 
+# ─────────────────────────── 首頁彙總 ───────────────────────────
+def _dashboard_version():
+    from ragflow_service import all_documents_version
+
+    kb = (request.args.get("kb") or "").strip() or None
+    rag_wm, kb_wm = all_documents_version(kb), datasets_version()
+    if not rag_wm or not kb_wm:
+        return None
+    return f"dash:{data_version.current('docs')}:{rag_wm}:{kb_wm}"
+
+
+@api.get("/dashboard")
+@conditional_json(_dashboard_version)
+def api_dashboard():
+    """
+    一次取得首頁需要的全部資料(取代 knowledge-bases → docs → 逐列 ragflow 狀態 → ragflow/docs → uploads/recent)。
+    ?kb=<dataset>&page=1&page_size=50&q=<標題 / 規章編號關鍵字>&department=<處室>
+    各區塊附 freshness(資料取得時間);上游失敗時該區塊為 {error},其餘照常回傳。
+    """
+    import dashboard
+
+    try:
+        page = int(request.args.get("page") or 1)
+        page_size = int(request.args.get("page_size") or dashboard.DEFAULT_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"success": False, "error": "page / page_size must be integers"}), 400
+    out = dashboard.build(
+        (request.args.get("kb") or "").strip() or None,
+        page=page,
+        page_size=page_size,
+        q=(request.args.get("q") or "").strip() or None,
+        department=(request.args.get("department") or "").strip() or None,
+    )
+    return jsonify(out), 200
+
+
+def _stats_version() -> str:
+    return f"docs:{data_version.current('docs')}:{data_version.current('corpus_stats')}"
+
+
+@api.get("/stats")
+@conditional_json(_stats_version)
+def api_stats():
+    """
+    文件庫統計(增量維護的彙總表，讀取不掃描文件表；見 corpus_stats.py)
+    ?group_by=department,kb,status,chunk_method(可多選、逗號分隔；不給只回總計)
+    &kb= &department= &status= &chunk_method= 先篩選
+    """
+    import corpus_stats
+
+    group_by = [g.strip() for g in (request.args.get("group_by") or "").split(",") if g.strip()]
+    bad = [g for g in group_by if g not in corpus_stats.DIMENSIONS]
+    if bad:
+        return jsonify({"success": False, "error": f"unknown group_by: {', '.join(bad)}",
+                        "allowed": list(corpus_stats.DIMENSIONS)}), 400
+    filters = {k: request.args[k].strip() for k in corpus_stats.DIMENSIONS if k in request.args}
+    return jsonify(corpus_stats.summary(list(dict.fromkeys(group_by)), filters)), 200
+
+
+@api.post("/stats/sync")
+def api_stats_sync():
+    """以 RAGFlow dataset(?kb=)全部文件的狀態 / chunk_method / chunk 數更新統計。"""
+    import corpus_stats
+
+    kb = (request.args.get("kb") or "").strip() or None
+    try:
+        return jsonify({"success": True, **corpus_stats.sync(kb)}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 502
+
+
+@api.post("/retrieve")
+def api_retrieve():
+    """
+    RAGFlow 檢索代理(結果快取見 retrieval_cache.py)
+    JSON:{
+      question: "...",                        (必填)
+      kb: ["Regulation", ...] 或 "Regulation", dataset 名稱或 ID(可空＝預設 dataset)
+      top_k: 1024, similarity_threshold: 0.2, vector_similarity_weight: 0.3,
+      page_size: 30(回傳的 chunk 數), keyword: false, document_ids: [...],
+      no_cache: false                          (略過快取，直接打 RAGFlow)
+    }
+    回傳 {success, question, datasets, chunks, total, cached, latency_ms}
+    """
+    import retrieval_cache
+
+    body = request.get_json(silent=True) or {}
+    question = (body.get("question") or "").strip()
+    if not question:
+        return jsonify({"success": False, "error": "missing question"}), 400
+    kbs = body.get("kb") or body.get("kbs") or body.get("dataset_ids") or []
+    if isinstance(kbs, str):
+        kbs = kbs.split(",")
+    try:
+        top_k = int(body.get("top_k") or 1024)
+        page_size = max(1, min(int(body.get("page_size") or 30), 1024))
+        threshold = float(body["similarity_threshold"]) if body.get("similarity_threshold") is not None else 0.2
+        weight = (float(body["vector_similarity_weight"])
+                  if body.get("vector_similarity_weight") is not None else 0.3)
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "invalid top_k / page_size / similarity_threshold"}), 400
+    try:
+        res = retrieval_cache.search(
+            question, kbs,
+            top_k=top_k,
+            similarity_threshold=threshold,
+            vector_similarity_weight=weight,
+            page_size=page_size,
+            keyword=bool(body.get("keyword")),
+            document_ids=body.get("document_ids") or None,
+            use_cache=not body.get("no_cache"),
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 502
+    resp = jsonify({"success": True, **res})
+    resp.headers["X-Cache"] = "HIT" if res["cached"] else "MISS"
+    return resp, 200
+
+
+@api.get("/retrieve/stats")
+def api_retrieve_stats():
+    """檢索結果快取的命中率 / 延遲統計(本 worker 行程；需 debug 權限)。"""
+    import retrieval_cache
+
+    tracing.check_debug_access()
+    return jsonify(retrieval_cache.stats()), 200
+
+
 @api.post("/llm/analyze-doc")
 def api_llm_analyze_doc():
     """
-    呼叫 LLM 分析完整文件 → 產生建議 metadata + chunking + 是否有表格
+    分析文件開頭 → 產生建議 metadata + chunking + 是否有表格
+    先以規則擷取(metadata_extract)，只有信心不足的欄位才呼叫 LLM。
     輸入:
       multipart/form-data:
         - file: 檔案 (必填,PDF)
+        - llm: auto(預設) / off(只用規則) / always(全部欄位都問 LLM);也可放 query string
     回傳:
       {
-        "metadata": {
-          "title": "xxx",
-          "department": "勞動部",
-          "doc_no": "勞動字第...",
-          "date_issued": "2025-09-10",
-          "review_meeting": "第xx次會議"
+        "success": true,
+        "suggestion": {
+          "metadata": {
+            "title": "xxx",
+            "department": "勞動部",
+            "doc_no": "勞動字第...",
+            "date_issued": "2025-09-10",
+            "review_meeting": "第xx次會議"
+          },
+          "confidence": { "title": 0.9, ... },
+          "source": { "title": "rules", "doc_no": "llm", ... },
+          "contains_table": true,
+          "chunking": { "method": "laws", "size": 500, "overlap": 50 }
         },
-        "contains_table": true,
-        "chunking": { "method": "laws", "size": 500, "overlap": 50 }
+        "llm_fields": ["doc_no"],
+        "elapsed_ms": 12.3
       }
     """
+    import metadata_extract
+    import llm_gateway
+
     if "file" not in request.files:
         return jsonify({"success": False, "error": "missing file"}), 400
+    mode = (request.form.get("llm") or request.args.get("llm") or "auto").strip().lower()
+    if mode not in metadata_extract.LLM_MODES:
+        return jsonify({"success": False, "error": f"llm must be one of {list(metadata_extract.LLM_MODES)}"}), 400
 
     up = request.files["file"]
-    reader = PdfReader(BytesIO(up.read()))
-    full_text = ""
-    for page in reader.pages:
-        full_text += page.extract_text() or ""
-
-    if not full_text.strip():
+    with span("pdf", "extract_text"):
+        pages = metadata_extract.read_pages(BytesIO(up.read()))
+    if not "".join(pages).strip():
         return jsonify({"success": False, "error": "empty document"}), 400
 
-    client = OpenAI(
-        api_key="EMPTY",
-        base_url="http://120.126.16.229:3579/v1",
-        default_headers={"X-API-Key":"qE8ByfT1eX4IxJcewLwEpKPWdZsuFPyevWvYznDdAVTrsO0dH2KC1GPrL7bt4HKnoltMeNLprDrr2BpjEZgUHwkGTD5mCSvYcilevrBaS7dYqTBwYDPNOLq18FAvLhes"}
-    )
+    departments = [d for (d,) in db.session.query(Document.department).distinct() if d]
+    try:
+        res = metadata_extract.analyze(pages, departments, llm=mode)
+    except llm_gateway.LLMBusy as e:
+        resp = jsonify({"success": False, "error": f"LLM is busy: {e}"})
+        resp.headers["Retry-After"] = str(llm_gateway.LLM_RETRY_AFTER)
+        return resp, 503
+    if res.get("llm_error") and all(v is None for v in res["metadata"].values()):
+        return jsonify({"success": False, "error": f"LLM analysis failed: {res['llm_error']}"}), 500
+
+    return jsonify(metadata_extract.to_response(res))
 
-    prompt = f"""請閱讀以下完整文件,並輸出 JSON 格式:
-    1. 推測文件標題 (title)
-    2. 推測制定單位 (department)
-    3. 推測規章編號 (doc_no)
-    4. 推測公布日期 (date_issued,格式 YYYY-MM-DD,如無則給 null)
-    5. 是否提及審議會議 (review_meeting)
-    6. 是否含有表格 (contains_table: true/false)
-    7. 建議 chunking (method/size/overlap)
 
-    文件全文:
-    {full_text[:5000]}
+@api.post("/llm/analyze-docs")
+def api_llm_analyze_docs():
     """
+    批次分析(匯入前預填 metadata)；每份結果一好就以 NDJSON 送出一行，順序依完成先後(以 index 對應輸入)。
+    輸入二選一或混用:
+      multipart/form-data:
+        - files(可重複)/ file: PDF
+        - refs: JSON 字串(同下)
+        - llm?, concurrency?
+      application/json:
+        { "refs": [ {"version_id": 12} | {"sha256": "..."} | {"session_id": "..."} ], "llm"?, "concurrency"? }
+        session_id 為已收齊、尚未 finalize 的分段上傳
+    每行:{ index, name, source, success, suggestion?, llm_fields?, error?, elapsed_ms };最後一行 { summary }
+    index 先依序編上傳檔案、再接著編 refs(混用時 refs[0] 的 index 為上傳檔數)；
+    source 帶回原始位置：上傳檔為 {"upload": i}，ref 為原 ref 加上 "ref": k(refs 陣列中的位置)
+    """
+    import metadata_extract
+    import upload_sessions
+    from models import UploadSession
+    from flask import stream_with_context
 
+    multipart = request.mimetype == "multipart/form-data"
+    payload = request.form if multipart else (request.get_json(silent=True) or {})
     try:
-        resp = client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct",
-            messages=[
-                {"role": "system", "content": "你是文件上傳分析助手,輸出嚴格 JSON"},
-                {"role": "user", "content": prompt},
-            ],
-            response_format={"type": "json_object"}
-        )
-        
-        # [修改] 增加安全檢查，防止 resp.choices[0] 崩潰
-        if not resp.choices or not resp.choices[0].message.content:
-            print("⚠️ Chat API returned empty choices, falling back.")
-            raise RuntimeError("Empty choices from Chat API") # 強制觸發 fallback
-            
-        suggestion = resp.choices[0].message.content
+        refs = payload.get("refs") or []
+        if isinstance(refs, str):
+            refs = json.loads(refs)
+        if not isinstance(refs, list):
+            raise ValueError("refs must be a list")
+        concurrency = int(payload["concurrency"]) if payload.get("concurrency") else None
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    mode = (payload.get("llm") or request.args.get("llm") or "auto").strip().lower()
+    if mode not in metadata_extract.LLM_MODES:
+        return jsonify({"success": False, "error": f"llm must be one of {list(metadata_extract.LLM_MODES)}"}), 400
+
+    uploads = (request.files.getlist("files") + request.files.getlist("file")) if multipart else []
+    if not uploads and not refs:
+        return jsonify({"success": False, "error": "no files or refs"}), 400
+    if len(uploads) + len(refs) > metadata_extract.METADATA_BULK_MAX_FILES:
+        return jsonify({"success": False,
+                        "error": f"at most {metadata_extract.METADATA_BULK_MAX_FILES} files per request"}), 413
+
+    def _missing(msg: str):
+        def _open():
+            raise FileNotFoundError(msg)
+        return _open
+
+    items = [(up.filename or f"file{i}", {"upload": i}, (lambda up=up: up.stream)) for i, up in enumerate(uploads)]
+    for k, ref in enumerate(refs):
+        ref = {**ref, "ref": k} if isinstance(ref, dict) else {"ref": k}
+        path, name = None, None
+        if ref.get("version_id") is not None:
+            ver = db.session.get(DocumentVersion, ref["version_id"])
+            if ver is not None and ver.file_path and os.path.isfile(ver.file_path):
+                path, name = ver.file_path, Path(ver.file_path).name
+        elif ref.get("sha256"):
+            blob = db.session.get(Blob, str(ref["sha256"]).lower())
+            if blob is not None:
+                path, name = str(blob_store.blob_path(blob.sha256, blob.ext)), blob.sha256 + (blob.ext or "")
+        elif ref.get("session_id"):
+            sess = db.session.get(UploadSession, ref["session_id"])
+            if sess is not None and sess.status == "OPEN" and upload_sessions.progress(sess)["complete"]:
+                path, name = str(upload_sessions.temp_path(sess.id)), sess.filename
+        if path is None:
+            items.append((name, ref, _missing("referenced file not found")))
+        else:
+            items.append((name, ref, (lambda path=path: open(path, "rb"))))
 
-    except Exception as e:
-        print("⚠️ Chat API 不存在,改用 completions API:", e)
-        
-        # [修改] 增加巢狀 try...except 來捕捉 fallback 失敗
-        try:
-            resp = client.completions.create(
-                model="meta-llama/Llama-3.3-70B-Instruct",
-                prompt=f"你是文件上傳分析助手,輸出嚴格 JSON。\n\n使用者需求:\n{prompt}",
-                max_tokens=1024
-            )
-            
-            # [修改] 增加安全檢查
-            if not resp.choices or not resp.choices[0].text:
-                print("⚠️ Completions API also returned empty choices.")
-                raise RuntimeError("Empty choices from Completions API")
+    departments = [d for (d,) in db.session.query(Document.department).distinct() if d]
+
+    def _lines():
+        for r in metadata_extract.analyze_many(items, departments, llm=mode, concurrency=concurrency):
+            yield (json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8")
+
+    resp = current_app.response_class(stream_with_context(_lines()), mimetype="application/x-ndjson",
+                                      direct_passthrough=True)
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"   # 反向代理不要整包緩衝
+    return resp
 
-            suggestion = resp.choices[0].text
-            
-        except Exception as e2:
-            # [修改] 如果 fallback 也失敗，安全地回傳 JSON 錯誤
-            current_app.logger.error(f"LLM analysis failed on fallback: {e2}", exc_info=True)
-            return jsonify({"success": False, "error": f"LLM analysis failed (Chat: {e}; Fallback: {e2})"}), 500
 
-    return jsonify({"success": True, "suggestion": suggestion})
+@api.get("/llm/stats")
+def api_llm_stats():
+    """LLM 閘道的並行 / 排隊 / 合併 / token 用量統計(本 worker 行程；需 debug 權限)。"""
+    import llm_gateway
+
+    tracing.check_debug_access()
+    return jsonify(llm_gateway.stats()), 200
+
 
 @api.get("/ragflow/kb")
+@conditional_json(_datasets_version)
 def api_ragflow_kb_list():
     """
     從 RAGFlow 同步 datasets(KB)清單。
@@ -755,4 +1771,72 @@ def api_ragflow_kb_list():
     except ValueError:
         limit = 200
     items = list_datasets_info(keyword=q, limit=limit)
-    return jsonify(items), 200
\ No newline at end of file
+    return jsonify(items), 200
+
+
+# ─────────────────────────── 除錯：請求追蹤 ───────────────────────────
+@api.get("/debug/traces")
+def api_debug_traces():
+    """最近被抽樣追蹤的請求(需 debug 權限)；只含回應這個請求的 worker 行程所保留者。"""
+    tracing.check_debug_access()
+    try:
+        limit = max(1, min(int(request.args.get("limit", 50)), 500))
+    except ValueError:
+        limit = 50
+    return jsonify(tracing.recent_traces(limit)), 200
+
+
+@api.get("/debug/traces/<request_id>")
+def api_debug_trace(request_id: str):
+    """單一請求的完整 span 清單；request id 取自回應的 X-Request-ID / X-Trace-ID。"""
+    tracing.check_debug_access()
+    trace = tracing.get_trace(request_id)
+    if trace is None:
+        # 追蹤紀錄只存在處理該請求的 worker 行程；多 worker 時可能是別的行程保留著(見 X-Trace-Worker)
+        return jsonify({
+            "success": False,
+            "error": "trace not found in this worker (not sampled, expired, or kept by another worker process)",
+            "worker_pid": os.getpid(),
+        }), 404
+    return jsonify(trace), 200
+
+
+# ─────────────────────────── 除錯：請求效能剖析 ───────────────────────────
+@api.get("/debug/profiles")
+def api_debug_profiles():
+    """最近存下的剖析結果(需 debug 權限)；以 X-Profile: 1 / sample 或 ?__profile= 觸發。"""
+    import request_profiler
+
+    tracing.check_debug_access()
+    return jsonify(request_profiler.list_profiles(_limit_arg(50))), 200
+
+
+@api.get("/debug/profiles/<profile_id>")
+def api_debug_profile(profile_id: str):
+    """
+    下載剖析結果:?format=pstats(cProfile 原始檔,可用 snakeviz / pstats 開)
+                 | text(pstats 文字摘要;&sort=cumulative|tottime|calls)
+                 | collapsed(堆疊抽樣,flamegraph.pl / speedscope 格式)
+    省略 format 時回傳 meta。
+    """
+    import request_profiler
+    from flask import send_file
+
+    tracing.check_debug_access()
+    meta = request_profiler.get_meta(profile_id)
+    if meta is None:
+        return jsonify({"success": False, "error": "profile not found (expired or never saved)"}), 404
+    fmt = (request.args.get("format") or "").strip().lower()
+    if not fmt:
+        return jsonify(meta), 200
+    if fmt not in meta["formats"]:
+        return jsonify({"success": False, "error": f"{meta['mode']} profile supports format {meta['formats']}"}), 400
+    if fmt == "text":
+        sort = request.args.get("sort") or "cumulative"
+        if sort not in ("cumulative", "tottime", "calls"):
+            return jsonify({"success": False, "error": "sort must be cumulative, tottime or calls"}), 400
+        body = request_profiler.text_summary(profile_id, limit=_limit_arg(60), sort=sort)
+        return current_app.response_class(body, mimetype="text/plain; charset=utf-8")
+    path = request_profiler.profile_file(profile_id, fmt)
+    mimetype = "application/octet-stream" if fmt == "pstats" else "text/plain; charset=utf-8"
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=path.name, max_age=0)
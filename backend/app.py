@@ -1,26 +1,41 @@
 import os
 import sys
+import json
 import logging
 import traceback
 from pathlib import Path
 
+import startup_profile  # 需最先載入:PROFILE_STARTUP=1 / --profile-startup 時記錄後續 import 耗時
+
 from dotenv import load_dotenv
+load_dotenv()  # 先載入 .env,後續模組(ragflow_service 等)在 import 時才讀得到設定
+
+import click
 from flask import Flask, jsonify
 from flask_cors import CORS
 from werkzeug.exceptions import HTTPException
+startup_profile.mark("flask")
 
 from models import db
 from api import api as api_blueprint
+from request_logging import configure_logging, init_request_logging
+from tracing import init_tracing
+from request_profiler import init_profiler
+from http_cache import init_compression
+import data_version
+import corpus_stats
+import version_validity
+import blob_store
+startup_profile.mark("models / api")
+
+DEBUG = os.getenv("DEBUG", "0") == "1"
+
+# Logging:QueueHandler → 背景 listener 輸出 JSON(LOG_FORMAT=text 可改純文字);
+# 預設 INFO,DEBUG=1 時才輸出 ragflow_service 的除錯訊息(LOG_DEBUG_SAMPLE 可抽樣)
+configure_logging(debug=DEBUG)
+if DEBUG:
+    logging.getLogger("ragflow").setLevel(logging.DEBUG)
 
-# Logging
-logging.basicConfig(
-    level=logging.DEBUG if os.getenv("DEBUG", "1") == "1" else logging.INFO,
-    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
-    handlers=[logging.StreamHandler(sys.stdout)],
-)
-logging.getLogger("ragflow").setLevel(logging.DEBUG)  # 讓 ragflow_service 的 log 也輸出
-
-load_dotenv()
 BASE_DIR = Path(__file__).parent
 
 
@@ -37,10 +52,29 @@ def create_app() -> Flask:
     app.config["UPLOAD_FOLDER"] = upload_dir
     app.config["MAX_CONTENT_LENGTH"] = 50 * 1024 * 1024  # 50MB
 
-    # DB
+    # 衍生檔快取(PDF 頁面擷取等);不放在 UPLOAD_FOLDER 以免出現在 /api/files
+    cache_dir = os.getenv("CACHE_DIR") or str(BASE_DIR / "cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    app.config["CACHE_FOLDER"] = cache_dir
+
+    # DB(建表 / 補欄位改由 init-db 明確執行,見 db_migrate.py)
     db.init_app(app)
-    with app.app_context():
-        db.create_all()
+    data_version.install()  # Document / 檔案異動時遞增資料版本(列表端點的 ETag 依據)
+    corpus_stats.install()  # 文件 / 版本異動時增量更新文件庫統計(/api/stats)
+    version_validity.install()  # 版本新增 / 切換時重算該文件的生效區間(/api/docs/as-of)
+    blob_store.install()  # 回收的 blob 實體檔等 commit 成功後才刪
+
+    # 每個請求:request_id / 耗時 / 上游呼叫次數
+    init_request_logging(app)
+
+    # 抽樣追蹤:Server-Timing / /api/debug/traces(見 tracing.py)
+    init_tracing(app)
+
+    # 指定 / 抽樣請求的 cProfile / 堆疊抽樣(見 request_profiler.py)
+    init_profiler(app)
+
+    # 大型 JSON 回應 gzip / br 壓縮(見 http_cache.py)
+    init_compression(app)
 
     # CORS
     CORS(app, resources={r"/api/*": {"origins": "*"}})
@@ -48,6 +82,98 @@ def create_app() -> Flask:
     # 藍圖
     app.register_blueprint(api_blueprint)
 
+    # ── CLI:資料庫初始化 ─────────────────────────────────────────────────
+    @app.cli.command("init-db")
+    def init_db_cmd():
+        """建立缺少的資料表,並補上既有資料表缺少的欄位 / index。"""
+        from db_migrate import init_db
+        added = init_db()
+        click.echo(json.dumps({"added_columns": added}, ensure_ascii=False, indent=2))
+
+    # ── CLI:上傳檔案 blob store 維護 ─────────────────────────────────────
+    @app.cli.command("migrate-uploads")
+    @click.option("--dry-run", is_flag=True, help="只統計,不搬移也不改寫 DB")
+    @click.option("--keep-originals", is_flag=True, help="搬移後保留舊的平面檔案")
+    def migrate_uploads_cmd(dry_run: bool, keep_originals: bool):
+        """把 uploads/ 舊檔搬進內容定址 blob store 並改寫 DocumentVersion.file_path。"""
+        click.echo(json.dumps(blob_store.migrate_legacy_uploads(dry_run, keep_originals),
+                              ensure_ascii=False, indent=2))
+
+    @app.cli.command("gc-blobs")
+    @click.option("--dry-run", is_flag=True)
+    @click.option("--grace-seconds", default=3600, show_default=True)
+    def gc_blobs_cmd(dry_run: bool, grace_seconds: int):
+        """刪除未被任何 StoredFile 引用的 blob 與中斷遺留的暫存檔。"""
+        click.echo(json.dumps(blob_store.collect_garbage(grace_seconds, dry_run),
+                              ensure_ascii=False, indent=2))
+
+    # ── CLI:本地 ⇄ RAGFlow 對帳 ─────────────────────────────────────────
+    @app.cli.command("reconcile")
+    @click.option("--kb", default=None, help="dataset 名稱(預設 RAGFLOW_DATASET)")
+    @click.option("--chunk-method", default=None, help="預期的 chunk_method(預設為 dataset 預設值)")
+    @click.option("--repair", "actions", default="", help="逗號分隔:reupload,delete_orphans,reparse,fix_chunk_method")
+    @click.option("--keys", default="", help="逗號分隔:只處理報告中的這些 item key")
+    @click.option("--confirm-delete", is_flag=True, help="未指定 --keys 時,delete_orphans 必須加上此旗標")
+    @click.option("--dry-run", is_flag=True)
+    @click.option("--concurrency", default=None, type=int)
+    @click.option("--batch-size", default=None, type=int)
+    def reconcile_cmd(kb, chunk_method, actions, keys, confirm_delete, dry_run, concurrency, batch_size):
+        """比對本地 DB 與 RAGFlow dataset;加 --repair 依類別批次修復。"""
+        import reconcile
+        report = reconcile.build_report(kb, chunk_method)
+        out = {k: report[k] for k in ("dataset", "expected_chunk_method", "local_total", "upstream_total", "counts")}
+        if actions:
+            try:
+                out["repair"] = reconcile.repair(
+                    report, [a.strip() for a in actions.split(",") if a.strip()],
+                    keys=[k.strip() for k in keys.split(",") if k.strip()] or None,
+                    dry_run=dry_run, confirm_delete=confirm_delete,
+                    concurrency=concurrency, batch_size=batch_size,
+                )
+            except reconcile.ReconcileError as e:
+                raise click.UsageError(str(e))
+        click.echo(json.dumps(out, ensure_ascii=False, indent=2))
+
+    @app.cli.command("export-corpus")
+    @click.argument("out", type=click.Path(dir_okay=False))
+    @click.option("--format", "fmt", default="tar", type=click.Choice(["tar", "tar.gz", "zip"]))
+    @click.option("--since", default=None, help="ISO 時間(UTC);只匯出之後的異動")
+    def export_corpus_cmd(out, fmt, since):
+        """把整個文件庫(DB 列 + 檔案)匯出成封存檔。"""
+        from datetime import datetime
+        import corpus_archive
+        with open(out, "wb") as fh:
+            manifest = corpus_archive.write_archive(
+                fh, fmt, datetime.fromisoformat(since) if since else None)
+        click.echo(json.dumps(manifest, ensure_ascii=False, indent=2))
+
+    @app.cli.command("import-corpus")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    def import_corpus_cmd(path):
+        """匯入 export-corpus / /api/export 產生的封存檔(同 id 覆寫)。"""
+        import corpus_archive
+        fmt = "zip" if path.lower().endswith(".zip") else "tar"
+        with open(path, "rb") as fh:
+            res = corpus_archive.import_archive(fh, fmt)
+        click.echo(json.dumps(res, ensure_ascii=False, indent=2))
+
+    # ── CLI:文件庫統計 ─────────────────────────────────────────────────
+    @app.cli.command("rebuild-stats")
+    def rebuild_stats_cmd():
+        """依目前 DB 全量重建文件庫統計(平常由寫入增量維護，不需要執行)。"""
+        click.echo(json.dumps(corpus_stats.rebuild(), ensure_ascii=False, indent=2))
+
+    @app.cli.command("sync-stats")
+    @click.option("--kb", default=None, help="dataset 名稱(預設 RAGFLOW_DATASET)")
+    def sync_stats_cmd(kb):
+        """以 RAGFlow dataset 全部文件的狀態 / chunk 數更新統計。"""
+        click.echo(json.dumps(corpus_stats.sync(kb), ensure_ascii=False, indent=2))
+
+    @app.cli.command("rebuild-validity")
+    def rebuild_validity_cmd():
+        """依目前 DB 全量重算各版本的生效區間(平常由寫入增量維護，不需要執行)。"""
+        click.echo(json.dumps(version_validity.rebuild(), ensure_ascii=False, indent=2))
+
     # ── 統一錯誤處理：回傳 JSON（含 traceback / 上游 HTTP 細節） ─────────────
     @app.errorhandler(HTTPException)
     def handle_http_error(e: HTTPException):
@@ -90,6 +216,18 @@ def create_app() -> Flask:
 
 # 供 WSGI / 直接執行兩用
 app = create_app()
+startup_profile.mark("create_app")
+startup_profile.stop()  # 之後的 import 不再計時(還原 builtins.__import__)
+
+
+def init_db(flask_app: Flask = app) -> None:
+    from db_migrate import init_db as _init_db
+    with flask_app.app_context():
+        _init_db()
+
 
 if __name__ == "__main__":
+    if "--profile-startup" in sys.argv:
+        sys.exit(0 if startup_profile.report() else 1)
+    init_db()
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=True)
@@ -0,0 +1,296 @@
+# backend/archive_ingest.py
+"""
+伺服器端封存檔匯入(取代瀏覽器逐檔上傳的 BulkFolderUpload)
+
+一個 zip / tar(.gz) 內含 PDF 與 manifest.csv(欄位同前端：法規名稱 / 檔名 / 處室 / 最後更新日期)：
+1. 接收(請求內)：邊讀封存檔邊把 PDF 串流寫進 blob store、讀出 manifest.csv；
+   讀完後依 manifest 對應檔案，建立匯入工作(jobs.py)，每列一個項目 —— 之後的處理與請求脫鉤
+2. 登錄(背景)：每 INGEST_DB_BATCH 列一次交易建立 Document / DocumentVersion / StoredFile
+3. 推送(背景，sync_to_ragflow 時)：以 INGEST_CONCURRENCY 個 worker、每次請求 INGEST_UPLOAD_BATCH 個檔案上傳 RAGFlow，
+   再依批觸發解析
+項目狀態：PENDING → REGISTERED → UPLOADED → DONE(或 FAILED / SKIPPED)。
+工作可查進度、取消、續跑；續跑時已登錄的列不會重建、已上傳的檔案不會重傳。
+"""
+import io
+import os
+import re
+import csv
+import json
+import logging
+from datetime import date
+from pathlib import PurePosixPath
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any, Dict, List, Optional, Tuple
+
+from models import db, Blob, Document, DocumentVersion, JobItem
+import blob_store
+import jobs
+from corpus_archive import iter_members
+from ragflow_service import (
+    rag_display_name,
+    upload_documents_batch,
+    update_documents_chunking,
+    parse_documents_batched,
+)
+
+log = logging.getLogger("ingest")
+
+KIND = "archive_ingest"
+INGEST_DB_BATCH = int(os.getenv("INGEST_DB_BATCH", "200"))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+INGEST_UPLOAD_BATCH = int(os.getenv("INGEST_UPLOAD_BATCH", "8"))
+_BLOB_COMMIT_EVERY = 100
+
+# 與 BulkFolderUpload.tsx 相同的欄位別名
+NAME_HEADERS = ["法規名稱", "名稱", "display_name", "displayName", "name", "title"]
+FILE_HEADERS = ["檔名", "檔案", "檔案名稱", "filename", "file"]
+DATE_HEADERS = ["最後更新日期", "更新日期", "last_update", "updated_at", "date"]
+DEPT_HEADERS = ["處室", "部門", "department"]
+
+_DATE_RE = re.compile(r"^(\d{4})[/.\-](\d{1,2})[/.\-](\d{1,2})$")
+
+
+class IngestError(Exception):
+    pass
+
+
+# ─────────────────────────── manifest.csv ───────────────────────────
+def _norm_header(h: str) -> str:
+    return re.sub(r"[^\w一-鿿]", "", re.sub(r"\s+", "", h.strip().lower()))
+
+
+def _pick_header(headers: List[str], candidates: List[str]) -> Optional[str]:
+    idx = {_norm_header(h): h for h in headers}
+    for c in candidates:
+        if _norm_header(c) in idx:
+            return idx[_norm_header(c)]
+    return None
+
+
+def normalize_date(s: Optional[str]) -> Optional[str]:
+    m = _DATE_RE.match((s or "").strip())
+    if not m:
+        return None
+    try:
+        return date(int(m[1]), int(m[2]), int(m[3])).isoformat()
+    except ValueError:
+        return None
+
+
+def parse_manifest(data: bytes) -> List[Dict[str, Any]]:
+    """回傳 [{row, filename, title, department, date_issued, doc_no}]；缺必要欄位時 raise IngestError。"""
+    for enc in ("utf-8-sig", "cp950"):  # Excel 另存的 CSV 常是 Big5
+        try:
+            text = data.decode(enc)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise IngestError("manifest.csv: unsupported encoding (expected UTF-8 or Big5)")
+
+    reader = csv.DictReader(io.StringIO(text))
+    headers = [h for h in (reader.fieldnames or []) if h]
+    h_name, h_file = _pick_header(headers, NAME_HEADERS), _pick_header(headers, FILE_HEADERS)
+    h_date, h_dept = _pick_header(headers, DATE_HEADERS), _pick_header(headers, DEPT_HEADERS)
+    if not h_name or not h_file or not h_dept:
+        raise IngestError(f"manifest.csv 缺少必要欄位(法規名稱、檔名、處室)；目前欄位：{', '.join(headers)}")
+
+    rows = []
+    for i, r in enumerate(reader, start=2):  # 第 1 列為標題
+        raw = (r.get(h_file) or "").strip().replace("\\", "/")
+        if not raw:
+            continue
+        if not raw.lower().endswith(".pdf"):
+            raw = f"{raw}.pdf"
+        rows.append({
+            "row": i,
+            "filename": raw,
+            "title": (r.get(h_name) or "").strip() or PurePosixPath(raw).stem,
+            "department": (r.get(h_dept) or "").strip(),
+            "date_issued": normalize_date(r.get(h_date)) if h_date else None,
+            "doc_no": PurePosixPath(raw).stem,
+        })
+    return rows
+
+
+# ─────────────────────────── 接收 ───────────────────────────
+def receive(stream: IO[bytes], fmt: str, *, kb: Optional[str] = None, sync_to_ragflow: bool = True,
+            chunk_method: Optional[str] = None, concurrency: Optional[int] = None,
+            skip_existing: bool = False) -> Tuple[Any, Dict[str, Any]]:
+    """讀完整個封存檔並建立工作(尚未啟動)；回傳 (job, 接收摘要)。"""
+    by_rel: Dict[str, Dict[str, Any]] = {}
+    by_base: Dict[str, Dict[str, Any]] = {}
+    manifest: Optional[bytes] = None
+    manifest_name = None
+    skipped: List[str] = []
+    stored = 0
+
+    for name, fh in iter_members(stream, fmt):
+        path = PurePosixPath(name.replace("\\", "/"))
+        lower = path.name.lower()
+        if lower.endswith(".csv"):
+            if manifest is None or lower == "manifest.csv":
+                manifest, manifest_name = fh.read(), name
+        elif lower.endswith(".pdf"):
+            blob, _p = blob_store.put_stream(fh, path.name)
+            info = {"sha256": blob.sha256, "ext": blob.ext, "size": blob.size, "name": path.name}
+            rel = "/".join(path.parts[1:]) if len(path.parts) > 1 else path.name  # 去掉最上層資料夾
+            by_rel[rel] = by_rel[str(path)] = info
+            by_base.setdefault(path.name, info)
+            stored += 1
+            if stored % _BLOB_COMMIT_EVERY == 0:
+                db.session.commit()
+        else:
+            skipped.append(name)
+    db.session.commit()
+
+    if manifest is None:
+        raise IngestError("archive has no manifest.csv")
+    rows = parse_manifest(manifest)
+    if not rows:
+        raise IngestError("manifest.csv has no rows with a filename")
+
+    items, missing = [], []
+    for r in rows:
+        info = by_rel.get(r["filename"]) or by_base.get(PurePosixPath(r["filename"]).name)
+        if info is None:
+            missing.append(r["filename"])
+        items.append((r["filename"], {**r, "file": info}))
+
+    params = {
+        "kb": kb,
+        "sync_to_ragflow": sync_to_ragflow,
+        "chunk_method": chunk_method,
+        "concurrency": max(1, min(concurrency or INGEST_CONCURRENCY, 16)),
+        "skip_existing": skip_existing,
+        "manifest": manifest_name,
+    }
+    job = jobs.create(KIND, params, items)
+    if missing:
+        JobItem.query.filter(JobItem.job_id == job.id, JobItem.key.in_(missing)).update(
+            {"state": "FAILED", "error": "file not found in archive"}, synchronize_session=False)
+        db.session.commit()
+    summary = {"files_stored": stored, "rows": len(rows), "missing_files": missing, "ignored_entries": skipped}
+    return job, summary
+
+
+# ─────────────────────────── 背景處理 ───────────────────────────
+def _register(ctx: jobs.JobContext, batch: List[JobItem]) -> None:
+    """一批列在同一個交易內建 Document / DocumentVersion / StoredFile 並更新項目狀態。"""
+    payloads = [json.loads(it.payload) for it in batch]
+    existing = set()
+    if ctx.params.get("skip_existing"):
+        titles = {p["title"] for p in payloads}
+        existing = {
+            (t, d or "") for t, d in db.session.query(Document.title, Document.department)
+            .filter(Document.title.in_(titles))
+        }
+
+    todo = []
+    for it, p in zip(batch, payloads):
+        if (p["title"], p["department"]) in existing:
+            it.state, it.error = "SKIPPED", "document already exists"
+            continue
+        issued = date.fromisoformat(p["date_issued"]) if p.get("date_issued") else None
+        doc = Document(title=p["title"], department=p["department"], doc_no=p["doc_no"], date_issued=issued)
+        todo.append((it, p, doc, issued))
+    db.session.add_all(doc for _it, _p, doc, _d in todo)
+    db.session.flush()
+
+    versions = []
+    for it, p, doc, issued in todo:
+        f = p["file"]
+        ver = DocumentVersion(doc_id=doc.id, date_issued=issued, is_active=True, kb=ctx.params.get("kb"),
+                              file_path=str(blob_store.blob_path(f["sha256"], f["ext"])))
+        versions.append(ver)
+    db.session.add_all(versions)
+    db.session.flush()
+
+    for (it, p, doc, _d), ver in zip(todo, versions):
+        blob_store.register_file(db.session.get(Blob, p["file"]["sha256"]), p["file"]["name"],
+                                 version_id=ver.id)
+        p.update(doc_id=doc.id, version_id=ver.id)
+        it.payload = json.dumps(p, ensure_ascii=False)
+        it.state, it.error = "REGISTERED", None
+    db.session.commit()
+
+
+def _push(ctx: jobs.JobContext, batch: List[JobItem]) -> None:
+    """REGISTERED → 上傳(多 worker、每請求多檔)→ UPLOADED；UPLOADED → 觸發解析 → DONE。"""
+    params = ctx.params
+    kb = params.get("kb")
+    to_upload = [it for it in batch if it.state == "REGISTERED"]
+    groups = [to_upload[i:i + INGEST_UPLOAD_BATCH] for i in range(0, len(to_upload), INGEST_UPLOAD_BATCH)]
+
+    def _upload(group: List[Tuple[int, str, str]]):
+        files = []
+        for _id, name, path in group:
+            with open(path, "rb") as fh:
+                files.append((name, fh.read()))
+        try:
+            return group, upload_documents_batch(files, kb)["ids"], None
+        except Exception as e:
+            return group, [], str(e)
+
+    requests_in = []
+    for g in groups:
+        entry = []
+        for it in g:
+            p = json.loads(it.payload)
+            f = p["file"]
+            name = rag_display_name(p["title"], p["department"], f["ext"] or ".pdf")
+            entry.append((it.id, name, str(blob_store.blob_path(f["sha256"], f["ext"]))))
+        requests_in.append(entry)
+
+    by_id = {it.id: it for it in batch}
+    with ThreadPoolExecutor(max_workers=params["concurrency"]) as pool:
+        for group, ids, err in pool.map(_upload, requests_in):
+            for k, (item_id, _name, _path) in enumerate(group):
+                it = by_id[item_id]
+                rag_id = ids[k] if k < len(ids) else None
+                if err or not rag_id:
+                    it.state, it.error = "FAILED", f"upload: {err or 'no document id returned'}"
+                    continue
+                p = json.loads(it.payload)
+                p["rag_doc_id"] = rag_id
+                it.payload = json.dumps(p, ensure_ascii=False)
+                it.state, it.error = "UPLOADED", None
+                ver = db.session.get(DocumentVersion, p["version_id"])
+                if ver is not None:
+                    ver.rag_doc_id, ver.rag_status = rag_id, "PENDING"
+    db.session.commit()
+
+    uploaded = [it for it in batch if it.state == "UPLOADED"]
+    if not uploaded:
+        return
+    rag_ids = {json.loads(it.payload)["rag_doc_id"]: it for it in uploaded}
+    if params.get("chunk_method"):
+        res = update_documents_chunking(list(rag_ids), params["chunk_method"], dataset_name=kb,
+                                        concurrency=params["concurrency"])
+        for f in res["failed"]:
+            it = rag_ids.pop(f["id"])
+            it.state, it.error = "FAILED", f"chunk_method: {f['error']}"
+    res = parse_documents_batched(list(rag_ids), kb, batch_size=len(rag_ids) or 1)
+    for doc_id in res["triggered"]:
+        rag_ids[doc_id].state = "DONE"
+    for f in res["failed"]:
+        for doc_id in f["ids"]:
+            rag_ids[doc_id].state, rag_ids[doc_id].error = "FAILED", f"parse: {f['error']}"
+    db.session.commit()
+
+
+def run(ctx: jobs.JobContext) -> None:
+    for batch in ctx.batches(("PENDING",), INGEST_DB_BATCH):
+        _register(ctx, batch)
+        ctx.heartbeat(stage="register")
+
+    if not ctx.params.get("sync_to_ragflow"):
+        JobItem.query.filter_by(job_id=ctx.job_id, state="REGISTERED").update(
+            {"state": "DONE"}, synchronize_session=False)
+        db.session.commit()
+        return
+
+    size = INGEST_UPLOAD_BATCH * ctx.params["concurrency"]
+    for batch in ctx.batches(("REGISTERED", "UPLOADED"), size):
+        _push(ctx, batch)
+        ctx.heartbeat(stage="push")
@@ -0,0 +1,306 @@
+# backend/bench/bulk_import.py
+"""
+年度大量匯入的壓力測試：重播 BulkFolderUpload 的流程，同時模擬其他同仁在用 UI。
+
+    cd backend
+    python -m bench.bulk_import --docs 500 --concurrency 4 --background 4
+    python -m bench.bulk_import --docs 200 --size-kb 12000          # 大檔，走分段續傳
+    python -m bench.bulk_import --app-url http://127.0.0.1:5000 --pid 12345 --folder ./regs
+
+流程：
+1. 產生合成資料夾：N 個 PDF + manifest.csv(法規名稱, 檔名, 處室, 最後更新日期)；--folder 可改用現成資料夾
+2. 依 manifest 逐列上傳(欄位與檔名規則同前端 BulkFolderUpload；超過 8MB 走 /api/uploads/sessions)，
+   同時開 --concurrency 個上傳者
+3. 背景 --background 個使用者輪流打 /api/docs、/api/ragflow/docs、/api/uploads/recent、文件狀態
+4. 報告：匯入吞吐量、各類請求的 p50/p95/p99、RSS 高水位、錯誤數；結果存 JSON
+
+預設在本行程內啟動 app + fake RAGFlow(RSS 為兩者合計)；--app-url 指向外部 server 時用 --pid 取樣其記憶體。
+"""
+import sys
+import csv
+import time
+import random
+import argparse
+import tempfile
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from bench.fake_ragflow import FakeRagflow
+from bench import harness
+
+KB = harness.DATASET
+RESUMABLE_THRESHOLD = 8 * 1024 * 1024   # 與前端 api/index.ts 相同
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+# ─────────────────────────── 資料夾 / manifest ───────────────────────────
+def build_folder(root: Path, n: int, size_kb: int) -> Path:
+    root.mkdir(parents=True, exist_ok=True)
+    rows = []
+    for i in range(n):
+        fname = f"REG-{i:05d}.pdf"
+        lines = [f"Regulation {i}"] + [f"Article {k}: synthetic clause {i}-{k}" for k in range(1, 11)]
+        (root / fname).write_bytes(harness.make_pdf(lines, pad_bytes=size_kb * 1024))
+        rows.append({
+            "法規名稱": harness.doc_title(i),
+            "檔名": fname,
+            "處室": harness.DEPARTMENTS[i % len(harness.DEPARTMENTS)],
+            "最後更新日期": f"{2000 + i % 25}/{1 + i % 12}/{1 + i % 28}",
+        })
+    with open(root / "manifest.csv", "w", encoding="utf-8-sig", newline="") as fh:
+        w = csv.DictWriter(fh, fieldnames=list(rows[0]))
+        w.writeheader()
+        w.writerows(rows)
+    return root
+
+
+def _pick(row: Dict[str, str], *names: str) -> str:
+    for n in names:
+        if row.get(n):
+            return row[n].strip()
+    return ""
+
+
+def _normalize_date(s: str) -> str:
+    parts = s.replace(".", "/").replace("-", "/").split("/")
+    if len(parts) == 3 and all(p.isdigit() for p in parts):
+        return f"{int(parts[0]):04d}-{int(parts[1]):02d}-{int(parts[2]):02d}"
+    return s
+
+
+def read_manifest(folder: Path) -> List[Dict[str, Any]]:
+    """與前端相同的欄位對應：法規名稱 / 檔名(自動補 .pdf) / 處室 / 最後更新日期。"""
+    with open(folder / "manifest.csv", encoding="utf-8-sig", newline="") as fh:
+        rows = list(csv.DictReader(fh))
+    items = []
+    for r in rows:
+        raw = _pick(r, "檔名", "檔案", "檔案名稱", "filename", "file").replace("\\", "/")
+        if not raw:
+            continue
+        if not raw.lower().endswith(".pdf"):
+            raw += ".pdf"
+        display = _pick(r, "法規名稱", "名稱", "display_name", "name", "title") or raw
+        items.append({
+            "path": folder / raw,
+            "display": display,
+            "department": _pick(r, "處室", "部門", "department"),
+            "date": _normalize_date(_pick(r, "最後更新日期", "更新日期", "last_update", "date")),
+            "doc_no": Path(raw).stem,
+        })
+    return items
+
+
+# ─────────────────────────── 上傳 ───────────────────────────
+def _fields(item: Dict[str, Any]) -> Dict[str, str]:
+    f = {"title": item["display"], "department": item["department"], "doc_no": item["doc_no"],
+         "kb": KB, "sync_to_ragflow": "true"}
+    if item["date"]:
+        f["date_issued"] = item["date"]
+    return f
+
+
+def upload_one(session: requests.Session, base: str, item: Dict[str, Any]) -> requests.Response:
+    path: Path = item["path"]
+    name = f"{item['department']}-{item['display']}{path.suffix or '.pdf'}"
+    size = path.stat().st_size
+    if size <= RESUMABLE_THRESHOLD:
+        with open(path, "rb") as fh:
+            return session.post(f"{base}/api/docs", data=_fields(item),
+                                files={"file": (name, fh, "application/pdf")}, timeout=600)
+
+    created = session.post(f"{base}/api/uploads/sessions", json={
+        "filename": name, "size": size, "chunk_size": CHUNK_SIZE, "fields": _fields(item),
+    }, timeout=60)
+    if created.status_code >= 400:
+        return created
+    sid = created.json()["id"]
+    with open(path, "rb") as fh:
+        offset = 0
+        while offset < size:
+            chunk = fh.read(CHUNK_SIZE)
+            r = session.put(f"{base}/api/uploads/sessions/{sid}", params={"offset": offset},
+                            data=chunk, timeout=600)
+            if r.status_code >= 400:
+                return r
+            offset += len(chunk)
+    return session.post(f"{base}/api/uploads/sessions/{sid}/finalize", timeout=600)
+
+
+# ─────────────────────────── 紀錄 ───────────────────────────
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+
+    def record(self, kind: str, started: float, resp: Optional[requests.Response] = None,
+               exc: Optional[BaseException] = None) -> None:
+        ms = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.latency[kind].append(ms)
+            if exc is not None:
+                self.errors[f"{kind}: {type(exc).__name__}"] += 1
+            elif resp is not None and resp.status_code >= 400:
+                self.errors[f"{kind}: HTTP {resp.status_code}"] += 1
+            elif resp is not None and resp.status_code == 207:
+                self.errors[f"{kind}: partial(207)"] += 1
+
+
+def _background_user(base: str, rec: Recorder, stop: threading.Event, think_ms: float, seed: int) -> None:
+    rnd = random.Random(seed)
+    session = requests.Session()
+    doc_ids: List[int] = []
+    while not stop.is_set():
+        roll = rnd.random()
+        if roll < 0.3:
+            kind, url = "bg GET /api/docs", f"{base}/api/docs"
+        elif roll < 0.55:
+            kind, url = "bg GET /api/ragflow/docs", f"{base}/api/ragflow/docs?kb={KB}"
+        elif roll < 0.75:
+            kind, url = "bg GET /api/uploads/recent", f"{base}/api/uploads/recent?kb={KB}"
+        elif doc_ids:
+            kind, url = "bg GET /api/docs/<id>/ragflow", f"{base}/api/docs/{rnd.choice(doc_ids)}/ragflow?kb={KB}"
+        else:
+            continue
+        t = time.perf_counter()
+        try:
+            r = session.get(url, timeout=120)
+            rec.record(kind, t, resp=r)
+            if kind == "bg GET /api/docs" and r.ok:
+                doc_ids = [d["doc"]["id"] for d in r.json()[:500]]
+        except requests.RequestException as e:
+            rec.record(kind, t, exc=e)
+        stop.wait(think_ms / 1000.0 * rnd.uniform(0.5, 1.5))
+
+
+def run(args) -> Dict[str, Any]:
+    fake = None
+    workdir = Path(tempfile.mkdtemp(prefix="raglaw-load-"))
+    pid = args.pid
+    if args.app_url:
+        base = args.app_url.rstrip("/")
+    else:
+        fake = FakeRagflow(latency_ms=args.latency_ms, list_cost_us=args.list_cost_us,
+                           parse_seconds=args.parse_seconds).start()
+        harness.prepare_env(str(workdir), fake)
+        app, base = harness.start_app(threads=args.threads)
+        if args.preload:
+            harness.seed_corpus(app, fake, args.preload)
+
+    folder = Path(args.folder) if args.folder else build_folder(workdir / "folder", args.docs, args.size_kb)
+    items = read_manifest(folder)
+    total_bytes = sum(i["path"].stat().st_size for i in items if i["path"].exists())
+    print(f"manifest: {len(items)} rows, {total_bytes / 1024 / 1024:.1f} MB, "
+          f"concurrency={args.concurrency}, background={args.background}", flush=True)
+
+    rec = Recorder()
+    stop = threading.Event()
+    done = Counter()
+    local = threading.local()
+
+    def _upload(item):
+        if not hasattr(local, "s"):
+            local.s = requests.Session()
+        t = time.perf_counter()
+        try:
+            if not item["path"].exists():
+                raise FileNotFoundError(item["path"])
+            r = upload_one(local.s, base, item)
+            rec.record("upload", t, resp=r)
+        except (requests.RequestException, OSError) as e:
+            rec.record("upload", t, exc=e)
+        with rec.lock:
+            done["n"] += 1
+            if done["n"] % max(1, len(items) // 10) == 0:
+                print(f"  {done['n']}/{len(items)}", flush=True)
+
+    upstream_before = fake.snapshot() if fake else 0
+    bg = [threading.Thread(target=_background_user, args=(base, rec, stop, args.think_ms, i), daemon=True)
+          for i in range(args.background)]
+    with harness.RssSampler(pid) as mem:
+        for t in bg:
+            t.start()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(_upload, items))
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        for t in bg:
+            t.join()
+
+    ok = len(rec.latency["upload"]) - sum(v for k, v in rec.errors.items() if k.startswith("upload:"))
+    summary = {
+        "import": {
+            "docs": len(items), "ok": ok, "seconds": round(elapsed, 2),
+            "docs_per_sec": round(len(items) / elapsed, 2) if elapsed else None,
+            "mb_per_sec": round(total_bytes / 1024 / 1024 / elapsed, 2) if elapsed else None,
+        },
+        "latency": {k: harness.summarize(v) for k, v in sorted(rec.latency.items())},
+        "errors": dict(rec.errors),
+        "memory": mem.as_dict(),
+    }
+    if fake:
+        summary["upstream"] = {"calls": fake.snapshot() - upstream_before,
+                               "by_route": dict(fake.calls_by_route.most_common())}
+        fake.stop()
+    return {
+        "meta": harness.run_meta(kind="bulk_import", docs=len(items), size_kb=args.size_kb,
+                                 concurrency=args.concurrency, background=args.background,
+                                 think_ms=args.think_ms, latency_ms=args.latency_ms,
+                                 parse_seconds=args.parse_seconds, preload=args.preload,
+                                 app_url=args.app_url),
+        **summary,
+    }
+
+
+def _print(report: Dict[str, Any]) -> None:
+    imp = report["import"]
+    print(f"\nimport: {imp['ok']}/{imp['docs']} ok in {imp['seconds']}s "
+          f"({imp['docs_per_sec']} docs/s, {imp['mb_per_sec']} MB/s)")
+    for kind, s in report["latency"].items():
+        print(f"  {kind:<32} n={s['count']:<6} p50={s['p50_ms']}ms p95={s['p95_ms']}ms "
+              f"p99={s['p99_ms']}ms max={s['max_ms']}ms")
+    mem = report["memory"]
+    print(f"memory: baseline={mem['rss_baseline_mb']}MB peak={mem['rss_peak_mb']}MB "
+          f"growth={mem['rss_growth_mb']}MB")
+    if report["errors"]:
+        print("errors:")
+        for k, v in sorted(report["errors"].items()):
+            print(f"  {k}: {v}")
+    else:
+        print("errors: none")
+    if "upstream" in report:
+        print(f"upstream calls: {report['upstream']['calls']}")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Replay a bulk folder import under background load")
+    ap.add_argument("--docs", type=int, default=200, help="合成 PDF 數量")
+    ap.add_argument("--size-kb", type=int, default=200, help="每個合成 PDF 的大小(KB)")
+    ap.add_argument("--folder", help="改用現成資料夾(需含 manifest.csv)")
+    ap.add_argument("--concurrency", type=int, default=4, help="同時上傳數")
+    ap.add_argument("--background", type=int, default=4, help="背景使用者數(列表 / 狀態查詢)")
+    ap.add_argument("--think-ms", type=float, default=200.0, help="背景使用者每次請求間隔")
+    ap.add_argument("--preload", type=int, default=0, help="匯入前先灌入的既有文件數")
+    ap.add_argument("--threads", type=int, default=8, help="內建 app 的 waitress 執行緒數")
+    ap.add_argument("--latency-ms", type=float, default=20.0, help="fake RAGFlow 每個請求的延遲")
+    ap.add_argument("--list-cost-us", type=float, default=2.0)
+    ap.add_argument("--parse-seconds", type=float, default=2.0, help="fake RAGFlow 解析完成所需秒數")
+    ap.add_argument("--app-url", help="改打外部 server(不啟動內建 app / fake RAGFlow)")
+    ap.add_argument("--pid", type=int, help="外部 server 的 PID(取樣其 RSS)")
+    ap.add_argument("--out", help="結果 JSON 路徑(預設 bench/results/bulk_import-<時間>.json)")
+    args = ap.parse_args(argv)
+
+    report = run(args)
+    _print(report)
+    print(f"results → {harness.save_results('bulk_import', report, args.out)}")
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
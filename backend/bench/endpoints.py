@@ -0,0 +1,142 @@
+# backend/bench/endpoints.py
+"""
+API 端點 benchmark(對本機 fake RAGFlow)
+
+    cd backend
+    python -m bench.endpoints                          # 100 / 1k / 10k 份文件，每端點 30 次
+    python -m bench.endpoints --sizes 100,1000 --iterations 50 --latency-ms 20
+    python -m bench.endpoints --compare bench/results/a.json bench/results/b.json
+
+每個規模分別量測：/api/docs、/api/ragflow/docs、/api/uploads/recent、
+/api/docs/<id>/ragflow(狀態)、DELETE /api/docs/<id>；
+輸出 p50 / p95 延遲與每個請求造成的上游(RAGFlow)呼叫數，結果存成 JSON 方便前後比較。
+請求依序送出，上游呼叫數以 fake RAGFlow 的計數前後差值計算，因此是精確值。
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+from typing import Any, Callable, Dict, List
+
+import requests
+
+from bench.fake_ragflow import FakeRagflow
+from bench import harness
+
+KB = harness.DATASET
+
+
+def _scenarios(doc_ids: List[int]) -> List[Dict[str, Any]]:
+    status_ids = doc_ids[: max(1, len(doc_ids) // 2)]
+    delete_ids = list(reversed(doc_ids[len(doc_ids) // 2:]))   # 刪除用另一半，不影響狀態查詢
+
+    return [
+        {"name": "GET /api/docs", "method": "GET", "path": lambda i: "/api/docs"},
+        {"name": "GET /api/ragflow/docs", "method": "GET", "path": lambda i: f"/api/ragflow/docs?kb={KB}"},
+        {"name": "GET /api/uploads/recent", "method": "GET", "path": lambda i: f"/api/uploads/recent?kb={KB}"},
+        {"name": "GET /api/docs/<id>/ragflow", "method": "GET",
+         "path": lambda i: f"/api/docs/{status_ids[i % len(status_ids)]}/ragflow?kb={KB}"},
+        {"name": "DELETE /api/docs/<id>", "method": "DELETE",
+         "path": lambda i: f"/api/docs/{delete_ids[i % len(delete_ids)]}?kb={KB}",
+         "max_iterations": len(delete_ids)},
+    ]
+
+
+def _measure(session: requests.Session, fake: FakeRagflow, base: str, method: str,
+             path: Callable[[int], str], iterations: int, warmup: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    upstream: List[int] = []
+    statuses: Dict[str, int] = {}
+    for i in range(warmup + iterations):
+        before = fake.snapshot()
+        t = time.perf_counter()
+        resp = session.request(method, base + path(i), timeout=300)
+        _ = resp.content
+        elapsed = (time.perf_counter() - t) * 1000
+        if i < warmup:
+            continue
+        latencies.append(elapsed)
+        upstream.append(fake.snapshot() - before)
+        statuses[str(resp.status_code)] = statuses.get(str(resp.status_code), 0) + 1
+    out = harness.summarize(latencies)
+    out["upstream_calls_per_req"] = round(sum(upstream) / len(upstream), 2) if upstream else None
+    out["upstream_calls_max"] = max(upstream) if upstream else None
+    out["status_codes"] = statuses
+    return out
+
+
+def run(sizes: List[int], iterations: int, warmup: int, latency_ms: float,
+        list_cost_us: float, shared_cache: bool) -> Dict[str, Any]:
+    fake = FakeRagflow(latency_ms=latency_ms, list_cost_us=list_cost_us).start()
+    workdir = tempfile.mkdtemp(prefix="raglaw-bench-")
+    harness.prepare_env(workdir, fake, shared_cache=shared_cache)
+    app, base = harness.start_app()
+    session = requests.Session()
+
+    results: Dict[str, Any] = {}
+    for n in sizes:
+        doc_ids = harness.seed_corpus(app, fake, n)
+        per_size: Dict[str, Any] = {}
+        for sc in _scenarios(doc_ids):
+            iters = min(iterations, sc.get("max_iterations", iterations))
+            w = 0 if sc["method"] == "DELETE" else warmup
+            per_size[sc["name"]] = _measure(session, fake, base, sc["method"], sc["path"], iters, w)
+            r = per_size[sc["name"]]
+            print(f"[{n:>6}] {sc['name']:<30} p50={r['p50_ms']:>9}ms p95={r['p95_ms']:>9}ms "
+                  f"upstream/req={r['upstream_calls_per_req']}", flush=True)
+        results[str(n)] = per_size
+    fake.stop()
+    return {
+        "meta": harness.run_meta(kind="endpoints", sizes=sizes, iterations=iterations, warmup=warmup,
+                                 latency_ms=latency_ms, list_cost_us=list_cost_us,
+                                 shared_cache=shared_cache),
+        "results": results,
+    }
+
+
+def compare(a_path: str, b_path: str) -> None:
+    a = json.load(open(a_path, encoding="utf-8"))["results"]
+    b = json.load(open(b_path, encoding="utf-8"))["results"]
+    print(f"{'size':>6}  {'endpoint':<30} {'p50 A':>9} {'p50 B':>9} {'Δ%':>7} {'p95 A':>9} {'p95 B':>9} {'Δ%':>7} {'up A':>6} {'up B':>6}")
+    for size in sorted(set(a) & set(b), key=int):
+        for name in a[size]:
+            if name not in b[size]:
+                continue
+            ra, rb = a[size][name], b[size][name]
+
+            def pct(k):
+                if not ra.get(k) or rb.get(k) is None:
+                    return "n/a"
+                return f"{(rb[k] - ra[k]) / ra[k] * 100:+.1f}"
+            print(f"{size:>6}  {name:<30} {ra['p50_ms']:>9} {rb['p50_ms']:>9} {pct('p50_ms'):>7} "
+                  f"{ra['p95_ms']:>9} {rb['p95_ms']:>9} {pct('p95_ms'):>7} "
+                  f"{ra['upstream_calls_per_req']!s:>6} {rb['upstream_calls_per_req']!s:>6}")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="API endpoint benchmark against a local fake RAGFlow")
+    ap.add_argument("--sizes", default="100,1000,10000", help="逗號分隔的文件數")
+    ap.add_argument("--iterations", type=int, default=30)
+    ap.add_argument("--warmup", type=int, default=2)
+    ap.add_argument("--latency-ms", type=float, default=5.0, help="fake RAGFlow 每個請求的延遲")
+    ap.add_argument("--list-cost-us", type=float, default=2.0, help="列表時每份文件的額外延遲(微秒)")
+    ap.add_argument("--no-shared-cache", action="store_true", help="停用跨 worker 共用快取")
+    ap.add_argument("--out", help="結果 JSON 路徑(預設 bench/results/endpoints-<時間>.json)")
+    ap.add_argument("--compare", nargs=2, metavar=("A", "B"), help="比較兩份結果 JSON")
+    args = ap.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    payload = run(sizes, args.iterations, args.warmup, args.latency_ms, args.list_cost_us,
+                  shared_cache=not args.no_shared_cache)
+    path = harness.save_results("endpoints", payload, args.out)
+    print(f"results → {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
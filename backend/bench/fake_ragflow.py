@@ -0,0 +1,401 @@
+# backend/bench/fake_ragflow.py
+"""
+本機 RAGFlow 替身(只實作本專案用到的 /api/v1 端點)，供 benchmark / 壓測使用。
+
+    from bench.fake_ragflow import FakeRagflow
+    fake = FakeRagflow(latency_ms=20).start()
+    fake.seed("Regulation", [f"人事室-規章{i:05d}.pdf" for i in range(1000)])
+    os.environ["RAGFLOW_BASE_URL"] = fake.base_url
+
+也可單獨執行：python -m bench.fake_ragflow --port 9380 --docs 1000 --latency-ms 20
+
+- latency_ms：每個請求固定延遲(模擬網路 + RAGFlow 處理)
+- list_cost_us：列表端點每掃描一份文件額外的延遲(微秒)，模擬大 dataset 的查詢成本
+- calls / calls_by_route：累計呼叫數，benchmark 以前後差值計算每個 API 請求造成的上游呼叫
+"""
+import re
+import json
+import time
+import uuid
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class FakeRagflow:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 latency_ms: float = 0.0, list_cost_us: float = 0.0, parse_seconds: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.list_cost_us = list_cost_us
+        self.parse_seconds = parse_seconds   # >0 時解析需經過這段時間才會 DONE
+        self.lock = threading.Lock()
+        self.datasets: Dict[str, Dict[str, Any]] = {}          # id -> dataset
+        self.docs: Dict[str, Dict[str, Dict[str, Any]]] = {}   # dataset_id -> {doc_id: doc}
+        self.chunks: Dict[str, Dict[str, Dict[str, Any]]] = {} # doc_id -> {chunk_id: chunk}
+        self.calls = 0
+        self.calls_by_route: Counter = Counter()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    # ─────────────────────────── 生命週期 ───────────────────────────
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> "FakeRagflow":
+        fake = self
+
+        class Handler(_Handler):
+            server_state = fake
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    # ─────────────────────────── 資料 ───────────────────────────
+    def reset(self) -> None:
+        with self.lock:
+            self.datasets.clear()
+            self.docs.clear()
+            self.chunks.clear()
+            self.calls = 0
+            self.calls_by_route.clear()
+
+    def ensure_dataset(self, name: str, chunk_method: str = "laws") -> Dict[str, Any]:
+        with self.lock:
+            for ds in self.datasets.values():
+                if ds["name"] == name:
+                    return ds
+            ds = {
+                "id": uuid.uuid4().hex, "name": name, "description": "",
+                "chunk_method": chunk_method, "parser_config": {},
+                "document_count": 0, "chunk_count": 0, "permission": "me",
+            }
+            self.datasets[ds["id"]] = ds
+            self.docs[ds["id"]] = {}
+            return ds
+
+    def new_doc(self, ds: Dict[str, Any], name: str, size: int = 0, run: str = "UNSTART",
+                chunk_count: int = 0) -> Dict[str, Any]:
+        doc = {
+            "id": uuid.uuid4().hex, "name": name, "dataset_id": ds["id"],
+            "chunk_method": ds["chunk_method"], "parser_config": {}, "size": size,
+            "run": run, "status": "1", "progress": 1.0 if run == "DONE" else 0.0,
+            "chunk_count": chunk_count, "token_count": 0, "meta_fields": {},
+            "create_time": _now_ms(), "update_time": _now_ms(), "type": "pdf",
+        }
+        self.docs[ds["id"]][doc["id"]] = doc
+        return doc
+
+    def seed(self, dataset_name: str, names: List[str], run: str = "DONE") -> Dict[str, Any]:
+        ds = self.ensure_dataset(dataset_name)
+        with self.lock:
+            for i, name in enumerate(names):
+                self.new_doc(ds, name, size=100_000, run=run, chunk_count=10 + i % 50)
+        return ds
+
+    def snapshot(self) -> int:
+        with self.lock:
+            return self.calls
+
+    def _tick_parsing(self, doc: Dict[str, Any]) -> None:
+        started = doc.get("_parse_started")
+        if doc["run"] == "RUNNING" and started and time.time() - started >= self.parse_seconds:
+            doc["run"], doc["progress"] = "DONE", 1.0
+            doc["chunk_count"] = doc.get("chunk_count") or 12
+            doc["update_time"] = _now_ms()
+
+
+def _public(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in doc.items() if not k.startswith("_")}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_state: FakeRagflow
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):  # 安靜
+        pass
+
+    # ─────────────────────────── 共用 ───────────────────────────
+    def _send(self, payload: Any, status: int = 200) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _ok(self, data: Any = None) -> None:
+        self._send({"code": 0, "data": data})
+
+    def _err(self, message: str, code: int = 102) -> None:
+        self._send({"code": code, "message": message})
+
+    def _body(self) -> bytes:
+        # 一律整段讀完(keep-alive 連線上未讀完的 body 會污染下一個請求)
+        if not hasattr(self, "_raw"):
+            n = int(self.headers.get("Content-Length") or 0)
+            self._raw = self.rfile.read(n) if n else b""
+        return self._raw
+
+    def _json(self) -> Dict[str, Any]:
+        raw = self._body()
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return {}
+
+    def _route(self, method: str) -> None:
+        st = self.server_state
+        url = urlparse(self.path)
+        qs = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        path = url.path.rstrip("/")
+        route = re.sub(r"/[0-9a-f]{32}", "/<id>", path)
+        self.__dict__.pop("_raw", None)  # 同一條連線會重用 handler,先清掉上一個請求的 body
+        self._body()
+        with st.lock:
+            st.calls += 1
+            st.calls_by_route[f"{method} {route}"] += 1
+        if st.latency_ms:
+            time.sleep(st.latency_ms / 1000.0)
+        try:
+            self._dispatch(method, path, qs)
+        except Exception as e:  # 保持回應格式與 RAGFlow 一致
+            self._err(f"fake ragflow error: {e}", code=500)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PUT(self):
+        self._route("PUT")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+    # ─────────────────────────── 路由 ───────────────────────────
+    def _dispatch(self, method: str, path: str, qs: Dict[str, str]) -> None:
+        st = self.server_state
+        parts = [p for p in path.split("/") if p]
+        if parts[:2] == ["api", "documents"] and method == "DELETE" and len(parts) == 3:
+            return self._delete_any_doc(parts[2])
+        if parts[:2] != ["api", "v1"]:
+            return self._send({"code": 404, "message": "not found"}, 404)
+        parts = parts[2:]
+
+        if parts == ["version"]:
+            return self._ok("fake-ragflow")
+        if parts == ["datasets"] and method == "GET":
+            items = list(st.datasets.values())
+            if qs.get("name"):
+                items = [d for d in items if d["name"] == qs["name"]]
+            if qs.get("id"):
+                items = [d for d in items if d["id"] == qs["id"]]
+            return self._ok(self._page(items, qs))
+        if parts == ["datasets"] and method == "POST":
+            body = self._json()
+            ds = st.ensure_dataset(body.get("name") or "dataset", body.get("chunk_method") or "naive")
+            return self._ok(ds)
+        if parts == ["retrieval"] and method == "POST":
+            return self._retrieval(self._json())
+
+        if len(parts) < 2 or parts[0] != "datasets" or parts[1] not in st.datasets:
+            return self._err("You don't own the dataset.", 102)
+        ds = st.datasets[parts[1]]
+        docs = st.docs[ds["id"]]
+        rest = parts[2:]
+
+        if not rest and method == "PUT":
+            ds.update({k: v for k, v in self._json().items() if k in ("chunk_method", "parser_config", "name", "description")})
+            return self._ok(ds)
+        if rest == ["documents"] and method == "GET":
+            return self._list_docs(docs, qs)
+        if rest == ["documents"] and method == "POST":
+            return self._upload(ds)
+        if rest == ["documents"] and method == "DELETE":
+            ids = self._json().get("ids") or []
+            with st.lock:
+                for i in ids:
+                    docs.pop(i, None)
+                    st.chunks.pop(i, None)
+            return self._ok()
+        if rest == ["chunks"] and method == "POST":
+            ids = self._json().get("document_ids") or []
+            with st.lock:
+                for i in ids:
+                    if i in docs:
+                        self._start_parse(docs[i])
+            return self._ok()
+        if rest == ["chunks"] and method == "DELETE":
+            ids = self._json().get("document_ids") or []
+            with st.lock:
+                for i in ids:
+                    if i in docs:
+                        docs[i]["run"] = "CANCEL"
+            return self._ok()
+        if len(rest) >= 2 and rest[0] == "documents":
+            doc = docs.get(rest[1])
+            if doc is None:
+                return self._err("You don't own the document.", 102)
+            if len(rest) == 2 and method == "PUT":
+                body = self._json()
+                with st.lock:
+                    for k in ("chunk_method", "parser_config", "name", "meta_fields"):
+                        if k in body:
+                            doc[k] = body[k]
+                    if "enabled" in body:
+                        doc["status"] = "1" if body["enabled"] else "0"
+                    doc["update_time"] = _now_ms()
+                return self._ok(_public(doc))
+            if len(rest) == 2 and method == "GET":
+                body = b"%PDF-fake"
+                self.send_response(200)
+                self.send_header("Content-Type", "application/pdf")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return None
+            if rest[2:] == ["chunks"]:
+                return self._doc_chunks(doc, method, qs)
+            if len(rest) == 4 and rest[2] == "chunks" and method == "PUT":
+                chunk = st.chunks.get(doc["id"], {}).get(rest[3])
+                if chunk is None:
+                    return self._err("chunk not found")
+                chunk.update({k: v for k, v in self._json().items() if k in ("content", "important_keywords", "available")})
+                return self._ok()
+        return self._send({"code": 404, "message": f"no route {method} {path}"}, 404)
+
+    # ─────────────────────────── 各端點 ───────────────────────────
+    def _page(self, items: List[Any], qs: Dict[str, str]) -> List[Any]:
+        page = max(1, int(qs.get("page") or 1))
+        size = max(1, int(qs.get("page_size") or 30))
+        return items[(page - 1) * size: page * size]
+
+    def _list_docs(self, docs: Dict[str, Dict[str, Any]], qs: Dict[str, str]) -> None:
+        st = self.server_state
+        with st.lock:
+            items = list(docs.values())
+        if st.list_cost_us:
+            time.sleep(len(items) * st.list_cost_us / 1e6)
+        if qs.get("id"):
+            items = [d for d in items if d["id"] == qs["id"]]
+        if qs.get("name"):
+            items = [d for d in items if d["name"] == qs["name"]]
+        if qs.get("keywords"):
+            kw = qs["keywords"].lower()
+            items = [d for d in items if kw in d["name"].lower()]
+        for d in items:
+            st._tick_parsing(d)
+        items.sort(key=lambda d: d["create_time"], reverse=str(qs.get("desc", "True")).lower() != "false")
+        page = self._page(items, qs)
+        return self._ok({"docs": [_public(d) for d in page], "total": len(items)})
+
+    def _upload(self, ds: Dict[str, Any]) -> None:
+        st = self.server_state
+        ctype = self.headers.get("Content-Type", "")
+        raw = self._body()
+        names = re.findall(rb'filename="([^"]*)"', raw) if "multipart" in ctype else []
+        created = []
+        with st.lock:
+            for n in names or [b"upload.pdf"]:
+                created.append(_public(st.new_doc(ds, n.decode("utf-8", "ignore"), size=len(raw))))
+        return self._ok(created)
+
+    def _start_parse(self, doc: Dict[str, Any]) -> None:
+        st = self.server_state
+        if st.parse_seconds > 0:
+            doc["run"], doc["progress"], doc["_parse_started"] = "RUNNING", 0.1, time.time()
+        else:
+            doc["run"], doc["progress"] = "DONE", 1.0
+            doc["chunk_count"] = doc.get("chunk_count") or 12
+        doc["update_time"] = _now_ms()
+
+    def _doc_chunks(self, doc: Dict[str, Any], method: str, qs: Dict[str, str]) -> None:
+        st = self.server_state
+        bucket = st.chunks.setdefault(doc["id"], {})
+        if method == "GET":
+            items = list(bucket.values())
+            if qs.get("keywords"):
+                items = [c for c in items if qs["keywords"] in c["content"]]
+            return self._ok({"chunks": self._page(items, qs), "total": len(items), "doc": _public(doc)})
+        if method == "POST":
+            body = self._json()
+            chunk = {"id": uuid.uuid4().hex, "content": body.get("content", ""),
+                     "important_keywords": body.get("important_keywords", []),
+                     "document_id": doc["id"], "dataset_id": doc["dataset_id"], "available": True}
+            with st.lock:
+                bucket[chunk["id"]] = chunk
+                doc["chunk_count"] = len(bucket)
+            return self._ok({"chunk": chunk})
+        if method == "DELETE":
+            ids = self._json().get("chunk_ids")
+            with st.lock:
+                for cid in (ids if ids is not None else list(bucket)):
+                    bucket.pop(cid, None)
+                doc["chunk_count"] = len(bucket)
+            return self._ok()
+        return self._err("unsupported")
+
+    def _retrieval(self, body: Dict[str, Any]) -> None:
+        st = self.server_state
+        q = (body.get("question") or "").strip()
+        hits = []
+        for ds_id in body.get("dataset_ids") or []:
+            for doc in st.docs.get(ds_id, {}).values():
+                if doc.get("status") == "0":
+                    continue
+                for c in st.chunks.get(doc["id"], {}).values():
+                    if q and q in c["content"]:
+                        hits.append({**c, "similarity": 0.9, "document_keyword": doc["name"]})
+                if q and q in doc["name"]:
+                    hits.append({"id": doc["id"], "content": doc["name"], "document_id": doc["id"],
+                                 "dataset_id": ds_id, "similarity": 0.5, "document_keyword": doc["name"]})
+        top = int(body.get("page_size") or 30)
+        return self._ok({"chunks": hits[:top], "total": len(hits)})
+
+    def _delete_any_doc(self, doc_id: str) -> None:
+        st = self.server_state
+        with st.lock:
+            for docs in st.docs.values():
+                if docs.pop(doc_id, None) is not None:
+                    st.chunks.pop(doc_id, None)
+                    return self._send({"code": 0}, 200)
+        return self._send({"code": 404, "message": "not found"}, 404)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="本機 RAGFlow 替身")
+    ap.add_argument("--port", type=int, default=9380)
+    ap.add_argument("--docs", type=int, default=0, help="預先建立的文件數")
+    ap.add_argument("--dataset", default="Regulation")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--list-cost-us", type=float, default=0.0)
+    ap.add_argument("--parse-seconds", type=float, default=0.0)
+    args = ap.parse_args()
+    fake = FakeRagflow(port=args.port, latency_ms=args.latency_ms,
+                       list_cost_us=args.list_cost_us, parse_seconds=args.parse_seconds).start()
+    fake.seed(args.dataset, [f"規章{i:05d}.pdf" for i in range(args.docs)])
+    print(f"fake RAGFlow on {fake.base_url} ({args.docs} docs in {args.dataset!r})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,224 @@
+# backend/bench/harness.py
+"""
+benchmark / 壓測共用：在暫存目錄準備環境、啟動 fake RAGFlow 與 Flask app(waitress, 背景執行緒)、
+灌入測試資料、統計與輸出結果。
+
+注意：app / ragflow_service 在 import 時讀環境變數，必須先呼叫 prepare_env() 再 start_app()。
+"""
+import os
+import sys
+import json
+import math
+import time
+import logging
+import platform
+import subprocess
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from bench.fake_ragflow import FakeRagflow
+
+DATASET = "Regulation"
+DEPARTMENTS = ["人事室", "教務處", "學務處", "總務處", "研發處", "秘書室"]
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def prepare_env(workdir: str, fake: FakeRagflow, *, shared_cache: bool = True) -> None:
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{Path(workdir) / 'bench.db'}",
+        "UPLOAD_DIR": str(Path(workdir) / "uploads"),
+        "CACHE_DIR": str(Path(workdir) / "cache"),
+        "SHARED_CACHE_PATH": str(Path(workdir) / "cache" / "shared_cache.sqlite3"),
+        "SHARED_CACHE": "1" if shared_cache else "0",
+        "RAGFLOW_BASE_URL": fake.base_url,
+        "RAGFLOW_API_KEY": "bench-key",
+        "RAGFLOW_DATASET": DATASET,
+        "LOG_FORMAT": "text",
+    })
+
+
+def start_app(threads: int = 8):
+    """import app → init_db → waitress 於背景執行緒；回傳 (flask_app, base_url)。"""
+    from waitress.server import create_server
+    from app import app, init_db
+
+    init_db()
+    logging.getLogger("access").setLevel(logging.WARNING)
+    logging.getLogger("ragflow").setLevel(logging.WARNING)
+    logging.getLogger("waitress").setLevel(logging.ERROR)
+    server = create_server(app, host="127.0.0.1", port=0, threads=threads)
+    threading.Thread(target=server.run, daemon=True).start()
+    return app, f"http://127.0.0.1:{server.effective_port}"
+
+
+def doc_title(i: int) -> str:
+    return f"規章{i:05d}"
+
+
+def seed_corpus(app, fake: FakeRagflow, n: int, with_files: bool = False) -> List[int]:
+    """清空本地 DB 與 fake RAGFlow，建立 n 份對應的文件；回傳本地 doc id 清單。"""
+    from models import db, Document, DocumentVersion, UploadLog
+    import corpus_stats
+    import shared_cache
+
+    fake.reset()
+    fake.seed(DATASET, [f"{doc_title(i)}.pdf" for i in range(n)])
+    with app.app_context():
+        for model in (DocumentVersion, Document, UploadLog):
+            model.query.delete()
+        db.session.commit()
+        upload_dir = Path(app.config["UPLOAD_FOLDER"])
+        docs = [
+            Document(
+                title=doc_title(i),
+                department=DEPARTMENTS[i % len(DEPARTMENTS)],
+                doc_no=f"REG-{i:05d}",
+                date_issued=date(2000 + i % 25, 1 + i % 12, 1 + i % 28),
+            )
+            for i in range(n)
+        ]
+        db.session.add_all(docs)
+        db.session.flush()
+        versions = []
+        for i, d in enumerate(docs):
+            path = upload_dir / f"{doc_title(i)}.pdf"
+            if with_files:
+                path.write_bytes(b"%PDF-1.4 bench\n")
+            versions.append(DocumentVersion(doc_id=d.id, date_issued=d.date_issued,
+                                            is_active=True, file_path=str(path)))
+        db.session.add_all(versions)
+        db.session.commit()
+        corpus_stats.rebuild()  # 上面的 query.delete() 不經 ORM flush
+        ids = [d.id for d in docs]
+    for ns in ("docs", "datasets"):
+        shared_cache.invalidate(ns)
+    return ids
+
+
+# ─────────────────────────── 統計 / 輸出 ───────────────────────────
+def percentile(values: Sequence[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100.0
+    lo, hi = math.floor(k), math.ceil(k)
+    if lo == hi:
+        return ordered[int(k)]
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(latencies_ms: List[float]) -> Dict[str, Any]:
+    return {
+        "count": len(latencies_ms),
+        "p50_ms": _r(percentile(latencies_ms, 50)),
+        "p95_ms": _r(percentile(latencies_ms, 95)),
+        "p99_ms": _r(percentile(latencies_ms, 99)),
+        "max_ms": _r(max(latencies_ms) if latencies_ms else None),
+        "mean_ms": _r(sum(latencies_ms) / len(latencies_ms) if latencies_ms else None),
+    }
+
+
+def _r(v: Optional[float]) -> Optional[float]:
+    return None if v is None else round(v, 2)
+
+
+def run_meta(**extra: Any) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=Path(__file__).parent, timeout=5).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit or None,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        **extra,
+    }
+
+
+def save_results(kind: str, payload: Dict[str, Any], out: Optional[str] = None) -> Path:
+    path = Path(out) if out else RESULTS_DIR / f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+# ─────────────────────────── 合成 PDF ───────────────────────────
+def make_pdf(lines: Sequence[str], pad_bytes: int = 0) -> bytes:
+    """產生一頁、可被 PyPDF2 讀取的最小 PDF；pad_bytes 以註解填充到指定大小(模擬掃描檔體積)。"""
+    text = "BT /F1 11 Tf 50 800 Td 14 TL " + " ".join(
+        "(" + ln.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") '" for ln in lines
+    ) + " ET"
+    stream = text.encode("latin-1", "replace")
+    objs = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    if pad_bytes > len(out):
+        filler = pad_bytes - len(out)
+        out += (b"%" + b"x" * 78 + b"\n") * (filler // 80)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    return bytes(out)
+
+
+# ─────────────────────────── 記憶體 ───────────────────────────
+def rss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    """目前 RSS(Linux /proc)；讀不到回傳 None。"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler:
+    """背景執行緒定期取樣 RSS，記錄高水位。"""
+
+    def __init__(self, pid: Optional[int] = None, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.baseline = rss_bytes(pid)
+        self.peak = self.baseline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            cur = rss_bytes(self.pid)
+            if cur is not None and (self.peak is None or cur > self.peak):
+                self.peak = cur
+
+    def __enter__(self) -> "RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        cur = rss_bytes(self.pid)
+        if cur is not None and (self.peak is None or cur > self.peak):
+            self.peak = cur
+
+    def as_dict(self) -> Dict[str, Any]:
+        mb = lambda v: None if v is None else round(v / 1024 / 1024, 1)
+        return {"rss_baseline_mb": mb(self.baseline), "rss_peak_mb": mb(self.peak),
+                "rss_growth_mb": mb(self.peak - self.baseline) if self.peak and self.baseline else None}
@@ -0,0 +1,324 @@
+# backend/blob_store.py
+"""
+內容定址上傳儲存(content-addressed blob store)
+
+佈局：UPLOAD_FOLDER/blobs/<sha[0:2]>/<sha[2:4]>/<sha256><ext>
+- 寫入時邊讀邊算 SHA-256，先寫暫存檔再 os.replace 到定位；同內容只存一份
+- StoredFile 記錄「原始檔名 → blob」；DocumentVersion.file_path 指向 blob 實體路徑
+- collect_garbage() 清掉不再被任何 StoredFile 引用的 blob；實體檔等交易 commit 成功後才刪(rollback 則保留)
+- migrate_legacy_uploads() 把舊的平面 uploads/ 搬進 blob store 並改寫 file_path
+"""
+import os
+import hashlib
+import logging
+import tempfile
+import time
+from pathlib import Path, PureWindowsPath
+from typing import IO, Dict, Any, Iterable, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, Blob, StoredFile, DocumentVersion, UploadSession
+from file_service import prime_etag
+import data_version
+
+log = logging.getLogger("blobs")
+
+BLOB_DIRNAME = "blobs"
+_COPY_BUFSIZE = 1024 * 1024
+_PENDING_UNLINK = "blob_store.pending_unlink"   # session.info 中待 commit 後才刪的實體檔
+
+_installed = False
+
+
+# ─────────────────────────── 路徑 ───────────────────────────
+def blob_root(upload_folder: Optional[str] = None) -> Path:
+    return Path(upload_folder or current_app.config["UPLOAD_FOLDER"]) / BLOB_DIRNAME
+
+def blob_path(sha256: str, ext: str = "", upload_folder: Optional[str] = None) -> Path:
+    return blob_root(upload_folder) / sha256[:2] / sha256[2:4] / f"{sha256}{ext}"
+
+def is_blob_path(path: Optional[str], upload_folder: Optional[str] = None) -> bool:
+    if not path:
+        return False
+    try:
+        Path(path).resolve().relative_to(blob_root(upload_folder).resolve())
+        return True
+    except ValueError:
+        return False
+
+def _normalize_ext(filename: Optional[str]) -> str:
+    ext = Path(filename or "").suffix.lower()
+    return ext if 0 < len(ext) <= 16 else ""
+
+
+# ─────────────────────────── 寫入 ───────────────────────────
+def put_stream(stream: IO[bytes], filename: Optional[str] = None,
+               upload_folder: Optional[str] = None) -> Tuple[Blob, Path]:
+    """
+    串流寫入 blob store，回傳 (Blob, 實體路徑)。
+    已存在相同內容時丟棄暫存檔、沿用既有 blob（不 commit，由呼叫端決定交易邊界）。
+    """
+    root = blob_root(upload_folder)
+    tmp_dir = root / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp_name = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for block in iter(lambda: stream.read(_COPY_BUFSIZE), b""):
+                h.update(block)
+                out.write(block)
+                size += len(block)
+        return commit_temp_file(tmp_name, h.hexdigest(), size, filename, upload_folder)
+    finally:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+def put_file(src_path: str, filename: Optional[str] = None,
+             upload_folder: Optional[str] = None) -> Tuple[Blob, Path]:
+    with open(src_path, "rb") as fh:
+        return put_stream(fh, filename or Path(src_path).name, upload_folder)
+
+def commit_temp_file(tmp_name: str, sha256: str, size: int, filename: Optional[str] = None,
+                     upload_folder: Optional[str] = None) -> Tuple[Blob, Path]:
+    """
+    把已算好雜湊的暫存檔收進 blob store（暫存檔須與 blob store 同一檔案系統）。
+    已有相同內容時暫存檔保留給呼叫端清理。
+    """
+    blob = db.session.get(Blob, sha256)
+    if blob is not None:
+        target = blob_path(sha256, blob.ext, upload_folder)
+        if not target.exists():  # DB 有紀錄但實體檔遺失：補回
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_name, target)
+        return blob, target
+
+    ext = _normalize_ext(filename)
+    target = blob_path(sha256, ext, upload_folder)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    moved = not target.exists()
+    if moved:
+        os.replace(tmp_name, target)
+    # 兩個 worker 同時收進相同內容時，先查後加會撞主鍵：改用 insert-or-ignore，之後一律重讀 DB 紀錄
+    if _insert_blob(sha256, ext, size):
+        data_version.bump("files")
+    blob = db.session.get(Blob, sha256)
+    if blob.ext != ext:  # 對方先以別的副檔名建立：以 DB 紀錄為準
+        ours, target = target, blob_path(sha256, blob.ext, upload_folder)
+        if not target.exists():
+            os.replace(ours, target)
+        elif moved:
+            ours.unlink(missing_ok=True)
+    prime_etag(str(target), sha256)
+    return blob, target
+
+def _insert_blob(sha256: str, ext: str, size: int) -> bool:
+    """新增 Blob 列，已存在則略過；回傳是否真的新增。sqlite / postgresql 用 ON CONFLICT DO NOTHING。"""
+    table = Blob.__table__
+    stmt_values = {"sha256": sha256, "ext": ext, "size": size}
+    dialect = db.engine.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        res = db.session.execute(dialect_insert(table).values(**stmt_values).on_conflict_do_nothing())
+        return res.rowcount > 0
+    # 其他資料庫沒有通用寫法：撞鍵時 IntegrityError 交由呼叫端(整個交易重試)
+    db.session.execute(table.insert().values(**stmt_values))
+    return True
+
+def register_file(blob: Blob, filename: str, version_id: Optional[int] = None) -> StoredFile:
+    rec = StoredFile(filename=filename, sha256=blob.sha256, version_id=version_id)
+    db.session.add(rec)
+    return rec
+
+
+# ─────────────────────────── 釋放 / 垃圾回收 ───────────────────────────
+def release_versions(version_ids: Iterable[int]) -> List[str]:
+    """刪除版本前呼叫：移除其 StoredFile 對照，並回收變成無人引用的 blob(實體檔於 commit 後才刪)。"""
+    version_ids = list(version_ids)
+    if not version_ids:
+        return []
+    shas = {
+        sha for (sha,) in db.session.query(StoredFile.sha256)
+        .filter(StoredFile.version_id.in_(version_ids)).distinct()
+    }
+    StoredFile.query.filter(StoredFile.version_id.in_(version_ids)).delete(synchronize_session=False)
+    data_version.bump("files")
+    db.session.flush()
+    return _delete_unreferenced(shas, releasing_versions=version_ids)
+
+def _delete_unreferenced(candidates: Iterable[str],
+                         releasing_versions: Iterable[int] = ()) -> List[str]:
+    releasing = list(releasing_versions)
+    removed: List[str] = []
+    for sha in candidates:
+        if StoredFile.query.filter_by(sha256=sha).first() is not None:
+            continue
+        blob = db.session.get(Blob, sha)
+        if blob is None:
+            continue
+        p = blob_path(sha, blob.ext)
+        # 仍有版本直接指向此路徑（例如對照表遺失）就保留
+        still_used = DocumentVersion.query.filter(DocumentVersion.file_path == str(p))
+        if releasing:
+            still_used = still_used.filter(DocumentVersion.id.notin_(releasing))
+        if still_used.first() is not None:
+            continue
+        db.session.delete(blob)
+        db.session.info.setdefault(_PENDING_UNLINK, []).append(p)
+        removed.append(sha)
+    return removed
+
+def _unlink(paths: Iterable[Path]) -> None:
+    for p in paths:
+        try:
+            p.unlink(missing_ok=True)
+            for shard in (p.parent, p.parent.parent):  # 空的分片目錄順手清掉
+                shard.rmdir()
+        except OSError:
+            pass
+
+def install() -> None:
+    """註冊交易事件(全域一次)：回收的 blob 檔在 commit 成功後才刪除，rollback 時放棄。"""
+    global _installed
+    if _installed:
+        return
+
+    @event.listens_for(Session, "after_commit")
+    def _unlink_released(session):
+        _unlink(session.info.pop(_PENDING_UNLINK, []))
+
+    @event.listens_for(Session, "after_soft_rollback")
+    def _keep_released(session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop(_PENDING_UNLINK, None)
+
+    _installed = True
+
+def collect_garbage(grace_seconds: int = 3600, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    全面回收：
+      1) Blob 表中沒有任何 StoredFile 引用者 → 刪除
+      2) 磁碟上不在 Blob 表中的檔案(含中斷留下的 .part) → 超過 grace_seconds 才刪
+    """
+    referenced = {sha for (sha,) in db.session.query(StoredFile.sha256).distinct()}
+    orphans = [b.sha256 for b in Blob.query.all() if b.sha256 not in referenced]
+
+    removed_rows: List[str] = []
+    if not dry_run:
+        removed_rows = _delete_unreferenced(orphans)
+        db.session.commit()
+
+    known = {sha for (sha,) in db.session.query(Blob.sha256)}
+    # 進行中的分段續傳暫存檔(tmp/<session>.part)不可回收
+    known |= {sid for (sid,) in db.session.query(UploadSession.id)
+              .filter(UploadSession.status.in_(("OPEN", "FINALIZING")))}
+    cutoff = time.time() - grace_seconds
+    stray: List[str] = []
+    root = blob_root()
+    if root.exists():
+        for dirpath, _, filenames in os.walk(root):
+            for fn in filenames:
+                p = Path(dirpath) / fn
+                sha = fn.split(".", 1)[0]
+                if sha in known:
+                    continue
+                try:
+                    if p.stat().st_mtime > cutoff:
+                        continue
+                    if not dry_run:
+                        p.unlink()
+                    stray.append(str(p.relative_to(root)))
+                except OSError:
+                    pass
+
+    return {
+        "success": True,
+        "dry_run": dry_run,
+        "unreferenced_blobs": orphans if dry_run else removed_rows,
+        "stray_files": stray,
+    }
+
+
+# ─────────────────────────── 舊資料遷移 ───────────────────────────
+def _locate_legacy_file(file_path: str, upload_folder: str) -> Optional[Path]:
+    """舊紀錄可能是其他機器的 Windows 絕對路徑；找不到時退回 UPLOAD_FOLDER/<檔名>。"""
+    p = Path(file_path)
+    if p.is_file():
+        return p
+    name = PureWindowsPath(file_path).name if "\\" in file_path else p.name
+    alt = Path(upload_folder) / name
+    return alt if alt.is_file() else None
+
+def migrate_legacy_uploads(dry_run: bool = False, keep_originals: bool = False) -> Dict[str, Any]:
+    """
+    把平面 uploads/ 下的檔案搬進 blob store：
+      - 每個 DocumentVersion.file_path → 改寫成 blob 路徑，並建立 StoredFile 對照
+      - 未被任何版本引用的舊檔也收進 blob store（version_id 為空）
+      - 全部 commit 成功後才刪除原檔（keep_originals=True 則保留）；只刪 UPLOAD_FOLDER 內的檔案，
+        file_path 指向外部(共用磁碟、使用者自己的副本)的只複製不刪，列在 kept_outside_upload_folder
+    """
+    upload_folder = current_app.config["UPLOAD_FOLDER"]
+    uploads_root = Path(upload_folder).resolve()
+    stats = {"versions_rewritten": 0, "versions_missing_file": [], "loose_files": 0,
+             "blobs_created": 0, "deduplicated": 0, "kept_outside_upload_folder": [], "dry_run": dry_run}
+    consumed: set = set()
+    seen_blobs: set = {sha for (sha,) in db.session.query(Blob.sha256)}
+
+    def _ingest(src: Path) -> Tuple[Blob, Path]:
+        blob, target = put_file(str(src), src.name, upload_folder)
+        if blob.sha256 not in seen_blobs:
+            stats["blobs_created"] += 1
+        else:
+            stats["deduplicated"] += 1
+        seen_blobs.add(blob.sha256)
+        return blob, target
+
+    for ver in DocumentVersion.query.filter(DocumentVersion.file_path.isnot(None)).all():
+        if is_blob_path(ver.file_path, upload_folder):
+            continue
+        src = _locate_legacy_file(ver.file_path, upload_folder)
+        if src is None:
+            stats["versions_missing_file"].append(ver.id)
+            continue
+        if dry_run:
+            stats["versions_rewritten"] += 1
+            consumed.add(src.resolve())
+            continue
+        blob, target = _ingest(src)
+        register_file(blob, src.name, version_id=ver.id)
+        ver.file_path = str(target)
+        consumed.add(src.resolve())
+        stats["versions_rewritten"] += 1
+
+    root = blob_root(upload_folder).resolve()
+    for p in sorted(Path(upload_folder).iterdir()):
+        if not p.is_file() or p.resolve() in consumed or p.resolve().parent == root:
+            continue
+        stats["loose_files"] += 1
+        consumed.add(p.resolve())
+        if not dry_run:
+            blob, _ = _ingest(p)
+            register_file(blob, p.name)
+
+    outside = {src for src in consumed if uploads_root not in src.parents}
+    stats["kept_outside_upload_folder"] = sorted(str(src) for src in outside)
+    if dry_run:
+        db.session.rollback()
+        return stats
+
+    db.session.commit()
+    if not keep_originals:
+        for src in consumed - outside:
+            try:
+                src.unlink()
+            except OSError as e:
+                log.warning("cannot remove migrated file %s: %s", src, e)
+    return stats
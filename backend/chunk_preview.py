@@ -0,0 +1,189 @@
+# backend/chunk_preview.py
+"""
+本地切分預覽(ChunkingDialog 調參用)
+
+對已擷取並快取的全文(file_service.extract_pdf_text)套用近似 RAGFlow 的切分策略，
+回傳每塊的邊界(全文字元位移)、數量與大小統計，不必等 RAGFlow 解析：
+- laws ：依標題(預設行首「第X條 / 第X條之Y」，可用 heading_regex 覆寫)切段；
+          超過 size 的條文再依 naive 規則細切
+- naive：依分隔字元切成小段後，依序合併到 size tokens；相鄰兩塊重疊 overlap tokens；
+          有給 heading_regex 時標題處一律斷開
+- one  ：全文一塊
+token 數為估算值(中日韓文字 / 全形標點各算 1，其餘非空白字元每 4 個算 1)，與 RAGFlow 的 tokenizer 不完全相同。
+"""
+import os
+import re
+import math
+import time
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+from regulation_text import ARTICLE_RE
+
+METHODS = ("laws", "naive", "one")
+_ALIASES = {"general": "naive"}
+DEFAULT_SIZE = int(os.getenv("CHUNK_PREVIEW_DEFAULT_SIZE", "128"))   # 對應 naive 的 chunk_token_num 預設
+MAX_SIZE = 8192
+DEFAULT_DELIMITER = "\n。；！？"
+PREVIEW_CHARS = 80
+
+Span = Tuple[int, int]
+
+
+def estimate_tokens(text: str) -> int:
+    # 只用 C 層級的字串操作(整份彙編數十萬字也只要幾毫秒)：
+    # UTF-8 多出的位元組數 / 2 ≈ 寬字元數(中日韓文字與全形標點皆為 3 位元組)
+    wide = (len(text.encode("utf-8")) - len(text)) // 2
+    visible = len("".join(text.split()))
+    return wide + math.ceil(max(0, visible - wide) / 4)
+
+
+def compile_heading(pattern: Optional[str]) -> Optional[Pattern[str]]:
+    """使用者提供的 heading_regex 以多行模式編譯；格式錯誤時 raise ValueError。"""
+    if not pattern:
+        return None
+    try:
+        return re.compile(pattern, re.M)
+    except re.error as e:
+        raise ValueError(f"invalid heading_regex: {e}") from None
+
+
+# ─────────────────────────── 切分 ───────────────────────────
+def _heading_spans(text: str, heading: Pattern[str]) -> List[Span]:
+    """依標題位置切成 [start, end)；第一個標題前的文字自成一段。"""
+    starts = sorted({m.start() for m in heading.finditer(text) if m.end() > m.start()})
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    return [(s, e) for s, e in zip(starts, starts[1:] + [len(text)]) if text[s:e].strip()]
+
+
+def _pieces(text: str, start: int, end: int, delimiters: str, size: int) -> List[Tuple[int, int, int]]:
+    """[start, end) 依分隔字元切成小段 (s, e, tokens)；單段超過 size 時依字數硬切。"""
+    out: List[Tuple[int, int, int]] = []
+    cut = re.compile("[" + re.escape(delimiters) + "]") if delimiters else None
+    pos = start
+    bounds = [m.end() for m in cut.finditer(text, start, end)] if cut else []
+    for b in bounds + [end]:
+        if b <= pos:
+            continue
+        seg = text[pos:b]
+        tokens = estimate_tokens(seg)
+        if tokens > size:
+            step = max(1, int(len(seg) * size / tokens))
+            for s in range(pos, b, step):
+                e = min(b, s + step)
+                out.append((s, e, estimate_tokens(text[s:e])))
+        elif seg.strip():
+            out.append((pos, b, tokens))
+        pos = b
+    return out
+
+
+def _merge(pieces: List[Tuple[int, int, int]], size: int, overlap: int) -> List[Span]:
+    """依序合併小段到 size tokens；下一塊從「上一塊最後 overlap tokens 內的小段」開始。"""
+    spans: List[Span] = []
+    i, n = 0, len(pieces)
+    while i < n:
+        j, total = i, 0
+        while j < n and (j == i or total + pieces[j][2] <= size):
+            total += pieces[j][2]
+            j += 1
+        spans.append((pieces[i][0], pieces[j - 1][1]))
+        if j >= n:
+            break
+        back, carried = j, 0
+        while overlap > 0 and back - 1 > i and carried + pieces[back - 1][2] <= overlap:
+            back -= 1
+            carried += pieces[back][2]
+        i = back
+    return spans
+
+
+def _naive(text: str, span: Span, size: int, overlap: int, delimiters: str) -> List[Span]:
+    return _merge(_pieces(text, span[0], span[1], delimiters, size), size, overlap)
+
+
+def clamp(size: int, overlap: int) -> Tuple[int, int]:
+    """實際採用的 (size, overlap)：size 限制在 1..MAX_SIZE，overlap 小於 size。"""
+    size = max(1, min(size, MAX_SIZE))
+    return size, max(0, min(overlap, size - 1))
+
+
+def split(text: str, method: str, *, size: int = DEFAULT_SIZE, overlap: int = 0,
+          heading_regex: Optional[str] = None, delimiters: str = DEFAULT_DELIMITER) -> List[Span]:
+    """回傳各塊在 text 內的 [start, end)。"""
+    method = _ALIASES.get(method.strip().lower(), method.strip().lower())
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {list(METHODS)}")
+    size, overlap = clamp(size, overlap)
+    if not text.strip():
+        return []
+    if method == "one":
+        return [(0, len(text))]
+
+    heading = compile_heading(heading_regex)
+    if method == "laws":
+        sections = _heading_spans(text, heading or ARTICLE_RE)
+        out: List[Span] = []
+        for s in sections:
+            if estimate_tokens(text[s[0]:s[1]]) <= size:
+                out.append(s)
+            else:
+                out.extend(_naive(text, s, size, overlap, delimiters))
+        return out
+
+    sections = _heading_spans(text, heading) if heading else [(0, len(text))]
+    return [c for s in sections for c in _naive(text, s, size, overlap, delimiters)]
+
+
+# ─────────────────────────── 統計 / 輸出 ───────────────────────────
+def _stats(values: List[int]) -> Dict[str, Any]:
+    if not values:
+        return {"min": 0, "max": 0, "mean": 0, "median": 0, "p95": 0}
+    ordered = sorted(values)
+    n = len(ordered)
+    return {
+        "min": ordered[0],
+        "max": ordered[-1],
+        "mean": round(sum(ordered) / n, 1),
+        "median": ordered[n // 2],
+        "p95": ordered[min(n - 1, int(math.ceil(0.95 * n)) - 1)],
+    }
+
+
+def preview(text: str, method: str, *, size: int = DEFAULT_SIZE, overlap: int = 0,
+            heading_regex: Optional[str] = None, delimiters: str = DEFAULT_DELIMITER,
+            limit: int = 200) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    size, overlap = clamp(size, overlap)   # params / over_size 以實際採用的值回報
+    spans = split(text, method, size=size, overlap=overlap, heading_regex=heading_regex, delimiters=delimiters)
+    chunks = []
+    tokens: List[int] = []
+    chars: List[int] = []
+    for i, (s, e) in enumerate(spans):
+        body = text[s:e]
+        tk = estimate_tokens(body)
+        tokens.append(tk)
+        chars.append(e - s)
+        if i < limit:
+            head = body.strip()
+            chunks.append({
+                "index": i,
+                "start": s,
+                "end": e,
+                "chars": e - s,
+                "tokens": tk,
+                "preview": head[:PREVIEW_CHARS],
+            })
+    return {
+        "method": _ALIASES.get(method.strip().lower(), method.strip().lower()),
+        "params": {"size": size, "overlap": overlap, "heading_regex": heading_regex, "delimiter": delimiters},
+        "text_chars": len(text),
+        "text_tokens": estimate_tokens(text),
+        "count": len(spans),
+        "tokens": _stats(tokens),
+        "chars": _stats(chars),
+        "over_size": sum(1 for t in tokens if t > size),
+        "chunks": chunks,
+        "truncated": len(spans) > limit,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
@@ -0,0 +1,452 @@
+# backend/corpus_archive.py
+"""
+整個文件庫的串流匯出 / 匯入(備份、搬機)
+
+封存檔內容(tar / tar.gz / zip 皆同)，依此順序寫入，匯入端可邊讀邊處理：
+  manifest.json                      格式版本、since / until、各表筆數
+  blobs/<sha256><ext>                blob store 內的檔案(匯入時驗證 SHA-256)
+  tables/<table>/<NNNNNN>.ndjson     各資料表，每個分段最多 ARCHIVE_PART_ROWS 列
+  legacy/<version_id>/<檔名>         尚未搬進 blob store 的舊版本檔案(匯入時收進 blob store 並改寫路徑)
+
+匯出：
+- 背景執行緒寫封存檔、經有上限的佇列交給回應產生器，記憶體用量固定、不落地暫存檔
+- since=<ISO 時間> 只匯出之後新增 / 修改的版本、條文、檔案與上傳紀錄(含其所屬文件)；
+  刪除不會出現在增量匯出中。manifest 的 until 可當下一次的 since
+匯入：
+- tar 可直接從請求串流讀(r|*)；zip 需可 seek(上傳檔或本機檔)
+- 每個 ndjson 分段一次交易 upsert(保留原 id；同 id 覆寫)
+- blob 邊寫暫存檔邊算雜湊，與檔名不符者略過並列入 errors
+"""
+import io
+import os
+import json
+import queue
+import hashlib
+import logging
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import date, datetime
+from pathlib import Path, PurePosixPath
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import Date, DateTime, insert, or_, select, text
+
+from models import db, Document, DocumentVersion, Chunk, Blob, StoredFile, UploadLog
+import blob_store
+import data_version
+import corpus_stats
+import version_validity
+
+log = logging.getLogger("archive")
+
+FORMAT = "raglaw-export"
+FORMAT_VERSION = 1
+ARCHIVE_PART_ROWS = int(os.getenv("ARCHIVE_PART_ROWS", "5000"))
+_PIPE_CHUNK = 256 * 1024
+_PIPE_DEPTH = 16          # 佇列中最多 16 × 256KB 待送出
+_COPY_BUFSIZE = 1024 * 1024
+
+# 匯入時依此順序處理(外鍵：文件 → 版本 → 條文 / 檔案對照)
+TABLES: List[Tuple[str, Any]] = [
+    ("document", Document),
+    ("document_version", DocumentVersion),
+    ("chunk", Chunk),
+    ("stored_files", StoredFile),
+    ("upload_logs", UploadLog),
+]
+_MODELS = dict(TABLES)
+
+FORMATS = {
+    "tar": ("w|", "application/x-tar", ".tar"),
+    "tar.gz": ("w|gz", "application/gzip", ".tar.gz"),
+    "zip": (None, "application/zip", ".zip"),
+}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+# ─────────────────────────── 串流管線 ───────────────────────────
+class _Pipe:
+    """寫入端(背景執行緒)→ 讀取端(回應產生器)；佇列滿時寫入端阻塞，形成背壓。"""
+
+    def __init__(self):
+        self._q: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=_PIPE_DEPTH)
+        self._buf = bytearray()
+        self.cancelled = False
+
+    def write(self, data) -> int:
+        self._buf += data
+        if len(self._buf) >= _PIPE_CHUNK:
+            self._put(bytes(self._buf))
+            self._buf.clear()
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def _put(self, item: Optional[bytes]) -> None:
+        while True:
+            if self.cancelled:
+                raise BrokenPipeError("export cancelled by client")
+            try:
+                self._q.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self) -> None:
+        try:
+            if self._buf:
+                self._put(bytes(self._buf))
+                self._buf.clear()
+            self._put(None)
+        except BrokenPipeError:
+            pass
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            item = self._q.get()
+            if item is None:
+                return
+            yield item
+
+
+class _Writer:
+    """tar / zip 的共同介面：add_bytes(name, data)、add_file(name, path)。"""
+
+    def __init__(self, fileobj, fmt: str):
+        self.fmt = fmt
+        if fmt == "zip":
+            self._zip = zipfile.ZipFile(fileobj, "w", allowZip64=True)
+        else:
+            self._tar = tarfile.open(fileobj=fileobj, mode=FORMATS[fmt][0], format=tarfile.PAX_FORMAT)
+
+    def add_bytes(self, name: str, data: bytes) -> None:
+        if self.fmt == "zip":
+            self._zip.writestr(zipfile.ZipInfo(name, time.localtime()[:6]), data, zipfile.ZIP_DEFLATED)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size, info.mtime = len(data), int(time.time())
+            self._tar.addfile(info, io.BytesIO(data))
+
+    def add_file(self, name: str, path: str) -> None:
+        st = os.stat(path)
+        with open(path, "rb") as fh:
+            if self.fmt == "zip":
+                zi = zipfile.ZipInfo(name, time.localtime(st.st_mtime)[:6])
+                zi.compress_type = zipfile.ZIP_STORED  # PDF 已壓縮過
+                with self._zip.open(zi, "w", force_zip64=True) as out:
+                    for block in iter(lambda: fh.read(_COPY_BUFSIZE), b""):
+                        out.write(block)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size, info.mtime = st.st_size, int(st.st_mtime)
+                self._tar.addfile(info, fh)
+
+    def close(self) -> None:
+        (self._zip if self.fmt == "zip" else self._tar).close()
+
+
+# ─────────────────────────── 匯出 ───────────────────────────
+def _jsonable(v: Any) -> Any:
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, bytes):
+        return None  # embedding 等二進位欄位不匯出(可重新計算)
+    return v
+
+
+def _row(obj) -> Dict[str, Any]:
+    return {c.name: _jsonable(getattr(obj, c.key)) for c in obj.__mapper__.columns}
+
+
+def _queries(since: Optional[datetime]) -> Dict[str, Any]:
+    """各表要匯出的查詢；since 為 None 時為全部。"""
+    if since is None:
+        return {name: model.query for name, model in TABLES} | {"blobs": Blob.query}
+    versions = select(DocumentVersion.id).where(DocumentVersion.updated_at >= since)
+    stored = select(StoredFile.sha256).where(StoredFile.created_at >= since)
+    return {
+        "document": Document.query.filter(
+            Document.id.in_(select(DocumentVersion.doc_id).where(DocumentVersion.updated_at >= since))),
+        "document_version": DocumentVersion.query.filter(DocumentVersion.updated_at >= since),
+        "chunk": Chunk.query.filter(or_(Chunk.updated_at >= since, Chunk.version_id.in_(versions))),
+        "stored_files": StoredFile.query.filter(StoredFile.created_at >= since),
+        "upload_logs": UploadLog.query.filter(UploadLog.uploaded_at >= since),
+        "blobs": Blob.query.filter(or_(Blob.created_at >= since, Blob.sha256.in_(stored))),
+    }
+
+
+def _keyset(query, pk, size: int) -> Iterator[List[Any]]:
+    """依主鍵分批讀(不長時間佔住一個查詢游標)。"""
+    last = None
+    while True:
+        q = query if last is None else query.filter(pk > last)
+        rows = q.order_by(pk).limit(size).all()
+        if not rows:
+            return
+        last = getattr(rows[-1], pk.key)
+        yield rows
+
+
+def write_archive(fileobj, fmt: str = "tar", since: Optional[datetime] = None,
+                  until: Optional[datetime] = None) -> Dict[str, Any]:
+    """把封存檔寫進 fileobj(只需 write())；回傳 manifest。"""
+    until = until or datetime.utcnow()
+    queries = _queries(since)
+    manifest = {
+        "format": FORMAT,
+        "format_version": FORMAT_VERSION,
+        "created_at": until.isoformat(),
+        "since": since.isoformat() if since else None,
+        "until": until.isoformat(),
+        "tables": {name: queries[name].count() for name, _ in TABLES},
+        "blobs": queries["blobs"].count(),
+    }
+    w = _Writer(fileobj, fmt)
+    w.add_bytes("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"))
+
+    missing: List[str] = []
+    for batch in _keyset(queries["blobs"], Blob.sha256, 500):
+        for b in batch:
+            p = blob_store.blob_path(b.sha256, b.ext)
+            if p.is_file():
+                w.add_file(f"blobs/{b.sha256}{b.ext}", str(p))
+            else:
+                missing.append(b.sha256)
+        db.session.expunge_all()
+
+    legacy: List[Tuple[int, str]] = []
+    for name, model in TABLES:
+        for part, batch in enumerate(_keyset(queries[name], model.id, ARCHIVE_PART_ROWS), start=1):
+            lines = []
+            for obj in batch:
+                lines.append(json.dumps(_row(obj), ensure_ascii=False))
+                if model is DocumentVersion and obj.file_path and not blob_store.is_blob_path(obj.file_path) \
+                        and os.path.isfile(obj.file_path):
+                    legacy.append((obj.id, obj.file_path))
+            w.add_bytes(f"tables/{name}/{part:06d}.ndjson", ("\n".join(lines) + "\n").encode("utf-8"))
+            db.session.expunge_all()
+
+    for version_id, path in legacy:
+        w.add_file(f"legacy/{version_id}/{Path(path).name}", path)
+
+    w.close()
+    if missing:
+        log.warning("export: %d blobs missing on disk, skipped", len(missing))
+    return manifest
+
+
+def stream_export(fmt: str = "tar", since: Optional[datetime] = None) -> Tuple[Iterator[bytes], datetime]:
+    """回傳 (bytes 產生器, until)；封存檔在背景執行緒中邊寫邊送。"""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {list(FORMATS)}")
+    app = current_app._get_current_object()
+    until = datetime.utcnow()
+    pipe = _Pipe()
+
+    def _produce():
+        with app.app_context():
+            try:
+                write_archive(pipe, fmt, since, until)
+            except BrokenPipeError:
+                log.info("export aborted by client")
+            except Exception:
+                log.exception("export failed")  # 客戶端會收到不完整的封存檔(tar / zip 解開時即報錯)
+            finally:
+                pipe.finish()
+                db.session.remove()
+
+    def _body():
+        t = threading.Thread(target=_produce, daemon=True, name="export")
+        t.start()
+        try:
+            yield from pipe
+        finally:
+            pipe.cancelled = True
+
+    return _body(), until
+
+
+# ─────────────────────────── 匯入 ───────────────────────────
+def iter_members(fileobj: IO[bytes], fmt: str) -> Iterator[Tuple[str, IO[bytes]]]:
+    """依封存檔順序產生 (名稱, 可讀串流)；tar 自動辨識是否 gzip 壓縮。"""
+    if fmt == "zip":
+        if not (hasattr(fileobj, "seek") and fileobj.seekable()):
+            raise ArchiveError("zip import needs a seekable file; upload it as multipart or use tar")
+        with zipfile.ZipFile(fileobj) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    with zf.open(info) as fh:
+                        yield info.filename, fh
+        return
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tf:
+        for m in tf:
+            if m.isfile():
+                yield m.name, tf.extractfile(m)
+
+
+def _coerce(model, row: Dict[str, Any]) -> Dict[str, Any]:
+    out = {}
+    for c in model.__table__.columns:
+        if c.name not in row:
+            continue
+        v = row[c.name]
+        if v is not None and isinstance(c.type, DateTime):
+            v = datetime.fromisoformat(v)
+        elif v is not None and isinstance(c.type, Date):
+            v = date.fromisoformat(v)
+        out[c.name] = v
+    return out
+
+
+def _upsert(model, rows: List[Dict[str, Any]]) -> None:
+    """同主鍵覆寫；sqlite / postgresql 用 ON CONFLICT，其餘先刪後插。"""
+    if not rows:
+        return
+    table = model.__table__
+    pk = [c.name for c in table.primary_key.columns]
+    dialect = db.engine.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        cols = [c.name for c in table.columns if c.name not in pk and c.name in rows[0]]
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=pk, set_={c: stmt.excluded[c] for c in cols})
+        db.session.execute(stmt, rows)
+    else:
+        key = table.c[pk[0]]
+        db.session.execute(table.delete().where(key.in_([r[pk[0]] for r in rows])))
+        db.session.execute(insert(table), rows)
+
+
+def _fix_sequences() -> None:
+    """postgresql 以明確 id 寫入後需把序號推到目前最大值。"""
+    if db.engine.dialect.name != "postgresql":
+        return
+    for name, model in TABLES:
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), COALESCE((SELECT MAX(id) FROM {name}), 1))"
+        ))
+
+
+def _store_blob(src: IO[bytes], expected: Optional[str], filename: str) -> Tuple[Optional[Blob], str, bool]:
+    """邊寫暫存檔邊算雜湊；回傳 (Blob 或 None(雜湊不符), 實際雜湊, 是否為新 blob)。"""
+    root = blob_store.blob_root()
+    tmp_dir = root / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp_name = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for block in iter(lambda: src.read(_COPY_BUFSIZE), b""):
+                h.update(block)
+                out.write(block)
+                size += len(block)
+        sha = h.hexdigest()
+        if expected and sha != expected:
+            return None, sha, False
+        is_new = db.session.get(Blob, sha) is None
+        blob, _path = blob_store.commit_temp_file(tmp_name, sha, size, filename)
+        return blob, sha, is_new
+    finally:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+
+def import_archive(fileobj: IO[bytes], fmt: str = "tar",
+                   progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    result: Dict[str, Any] = {
+        "manifest": None,
+        "tables": {name: 0 for name, _ in TABLES},
+        "blobs": {"restored": 0, "existing": 0, "mismatched": 0},
+        "legacy_files": 0,
+        "errors": [],
+    }
+    pending_blobs = 0
+    for name, fh in iter_members(fileobj, fmt):
+        parts = PurePosixPath(name).parts
+        if name == "manifest.json":
+            manifest = json.loads(fh.read().decode("utf-8"))
+            if manifest.get("format") != FORMAT or manifest.get("format_version", 0) > FORMAT_VERSION:
+                raise ArchiveError(f"unsupported archive: {manifest.get('format')} v{manifest.get('format_version')}")
+            result["manifest"] = manifest
+            continue
+        if result["manifest"] is None:
+            raise ArchiveError("manifest.json must be the first entry")
+
+        if parts[0] == "blobs" and len(parts) == 2:
+            fname = parts[1]
+            expected = fname.split(".", 1)[0]
+            blob, sha, is_new = _store_blob(fh, expected, fname)
+            if blob is None:
+                result["blobs"]["mismatched"] += 1
+                result["errors"].append({"entry": name, "error": f"sha256 mismatch: got {sha}"})
+                continue
+            result["blobs"]["restored" if is_new else "existing"] += 1
+            pending_blobs += 1
+            if pending_blobs >= 200:
+                db.session.commit()
+                pending_blobs = 0
+        elif parts[0] == "tables" and len(parts) == 3 and parts[1] in _MODELS:
+            if pending_blobs:
+                db.session.commit()
+                pending_blobs = 0
+            model = _MODELS[parts[1]]
+            rows = []
+            for line in fh.read().decode("utf-8").splitlines():  # 一個分段最多 ARCHIVE_PART_ROWS 列
+                if line.strip():
+                    row = _coerce(model, json.loads(line))
+                    if model is DocumentVersion:
+                        row["file_path"] = _local_file_path(row.get("file_path"))
+                    rows.append(row)
+            _upsert(model, rows)
+            db.session.commit()
+            result["tables"][parts[1]] += len(rows)
+        elif parts[0] == "legacy" and len(parts) == 3:
+            version_id = int(parts[1])
+            blob, _sha, _is_new = _store_blob(fh, None, parts[2])
+            ver = db.session.get(DocumentVersion, version_id)
+            if ver is not None:
+                # 只改寫路徑、不新增 StoredFile：本機自行配發的 id 會與之後增量匯入的來源 id 衝突。
+                # blob 仍被版本路徑引用，不會被 GC 回收
+                ver.file_path = str(blob_store.blob_path(blob.sha256, blob.ext))
+            db.session.commit()
+            result["legacy_files"] += 1
+        else:
+            result["errors"].append({"entry": name, "error": "unknown entry, skipped"})
+            continue
+        if progress:
+            progress(name)
+
+    if result["manifest"] is None:
+        raise ArchiveError("empty archive or missing manifest.json")
+    if pending_blobs:
+        db.session.commit()
+    _fix_sequences()
+    data_version.bump("docs", "files")  # bulk upsert 不經 ORM flush，手動遞增資料版本
+    db.session.commit()
+    corpus_stats.rebuild()              # 同上，統計與生效區間也不會增量更新
+    version_validity.rebuild()
+    result["success"] = not result["errors"]
+    return result
+
+
+def _local_file_path(path: Optional[str]) -> Optional[str]:
+    """來源機器的 blob 路徑 → 本機 blob 路徑(檔名即 <sha256><ext>)；舊檔路徑原樣保留，待 legacy/ 項目改寫。"""
+    if not path:
+        return path
+    fname = PurePosixPath(path.replace("\\", "/")).name
+    sha, _, ext = fname.partition(".")
+    if f"/{blob_store.BLOB_DIRNAME}/" in path.replace("\\", "/") and len(sha) == 64:
+        return str(blob_store.blob_path(sha, f".{ext}" if ext else ""))
+    return path
@@ -0,0 +1,322 @@
+# backend/corpus_stats.py
+"""
+文件庫統計(/api/stats、首頁 counts)
+
+原本每次都對 Document / DocumentVersion 全表 count()，文件一多首頁就跟著變慢。這裡改成增量維護：
+- corpus_stats      依 (kb, department, status, chunk_method) 分組的彙總：documents / versions / active_versions / chunks
+- corpus_stat_docs  每份文件目前計入哪一組、貢獻多少(用來算差額)
+ORM flush 後(after_flush，與寫入同一交易)重算「這次有動到的文件」的貢獻，把舊值 → 新值的差額加到彙總表；
+上傳、刪除、版本切換、新版本都走 ORM，因此自動涵蓋。ORM 批次寫入(Query.update() / delete()、
+session.execute(update(DocumentVersion)...))不經 flush，改由 do_orm_execute 在執行前以同一個 WHERE 查出
+受影響的文件、執行後重算。直接對 Table 下的 Core 寫入(封存匯入、conn.execute(update(table)))仍需之後呼叫 rebuild()。
+RAGFlow 端狀態(status / chunk_method / chunks)記在 DocumentVersion.rag_*，由 apply_upstream() 以
+dataset 全部文件的列表同步(對帳、POST /api/stats/sync、flask sync-stats)。
+
+每份文件歸入「最新版本」(與 /api/docs 相同排序)那一組：
+  kb           版本上傳到的 dataset(空＝RAGFLOW_DATASET)
+  status       沒有檔案 NO_FILE；有記錄的 RAGFlow 狀態用該狀態；有 rag_doc_id 但狀態未知 PENDING；否則 NOT_SYNCED
+  chunk_method 最近一次同步得知的 chunk_method(未知為空)
+  chunks       最新版本在 RAGFlow 的 chunk 數
+尚未建立過統計(升級後第一次)時，第一次讀取會先 rebuild()；在那之前的 flush 不做增量。
+"""
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import and_, delete, event, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import db, CorpusStat, CorpusStatDoc, DataVersion, Document, DocumentVersion
+import data_version
+from ragflow_service import RAGFLOW_DATASET
+
+log = logging.getLogger("corpus_stats")
+
+DIMENSIONS = ("kb", "department", "status", "chunk_method")
+METRICS = ("documents", "versions", "active_versions", "chunks")
+MARKER = "corpus_stats"   # data_versions 中的標記：> 0 表示已建立過統計
+_BATCH = 500
+
+_installed = False
+_ready = False
+
+Key = Tuple[str, str, str, str]
+
+
+# ─────────────────────────── 單份文件的貢獻 ───────────────────────────
+def _contributions(conn, doc_ids: Sequence[int]) -> Dict[int, Tuple[Key, Tuple[int, int, int]]]:
+    """{doc_id: ((kb, department, status, chunk_method), (versions, active_versions, chunks))}；已刪除的文件不在結果內。"""
+    d, v = Document.__table__, DocumentVersion.__table__
+    depts = dict(conn.execute(select(d.c.id, d.c.department).where(d.c.id.in_(doc_ids))).all())
+    rows = conn.execute(
+        select(v.c.doc_id, v.c.is_active, v.c.file_path, v.c.kb, v.c.rag_doc_id,
+               v.c.rag_status, v.c.rag_chunk_method, v.c.rag_chunks)
+        .where(v.c.doc_id.in_(list(depts)))
+        .order_by(v.c.doc_id, v.c.date_issued.desc(), v.c.id.desc())
+    ).all()
+    by_doc: Dict[int, List[Any]] = defaultdict(list)
+    for r in rows:
+        by_doc[r.doc_id].append(r)
+
+    out = {}
+    for doc_id, dept in depts.items():
+        vers = by_doc.get(doc_id, [])
+        cur = vers[0] if vers else None
+        if cur is None or not cur.file_path:
+            status = "NO_FILE"
+        elif cur.rag_status:
+            status = cur.rag_status.upper()
+        elif cur.rag_doc_id:
+            status = "PENDING"
+        else:
+            status = "NOT_SYNCED"
+        key = (
+            (cur.kb if cur is not None and cur.kb else RAGFLOW_DATASET),
+            dept or "",
+            status,
+            (cur.rag_chunk_method or "") if cur is not None else "",
+        )
+        active = sum(1 for r in vers if r.is_active)
+        chunks = int(cur.rag_chunks or 0) if cur is not None else 0
+        out[doc_id] = (key, (len(vers), active, chunks))
+    return out
+
+
+def _apply_delta(conn, delta: Dict[Key, List[int]]) -> None:
+    t = CorpusStat.__table__
+    touched = []
+    for key, (docs, vers, active, chunks) in delta.items():
+        if not (docs or vers or active or chunks):
+            continue
+        match = and_(*(t.c[dim] == val for dim, val in zip(DIMENSIONS, key)))
+        res = conn.execute(update(t).where(match).values(
+            documents=t.c.documents + docs,
+            versions=t.c.versions + vers,
+            active_versions=t.c.active_versions + active,
+            chunks=t.c.chunks + chunks,
+        ))
+        if res.rowcount == 0:
+            conn.execute(insert(t).values(**dict(zip(DIMENSIONS, key)), documents=docs, versions=vers,
+                                          active_versions=active, chunks=chunks))
+        touched.append(match)
+    for match in touched:
+        conn.execute(delete(t).where(match, t.c.documents <= 0))
+
+
+def _refresh(conn, doc_ids: Iterable[int]) -> None:
+    """重算指定文件的貢獻並把差額套用到彙總表(在呼叫端的交易內)。"""
+    sd = CorpusStatDoc.__table__
+    ids = sorted(doc_ids)
+    for i in range(0, len(ids), _BATCH):
+        part = ids[i:i + _BATCH]
+        delta: Dict[Key, List[int]] = defaultdict(lambda: [0, 0, 0, 0])
+        for r in conn.execute(select(sd).where(sd.c.doc_id.in_(part))):
+            acc = delta[(r.kb, r.department, r.status, r.chunk_method)]
+            acc[0] -= 1
+            acc[1] -= r.versions
+            acc[2] -= r.active_versions
+            acc[3] -= r.chunks
+        new = _contributions(conn, part)
+        for key, (vers, active, chunks) in new.values():
+            acc = delta[key]
+            acc[0] += 1
+            acc[1] += vers
+            acc[2] += active
+            acc[3] += chunks
+        conn.execute(delete(sd).where(sd.c.doc_id.in_(part)))
+        if new:
+            conn.execute(insert(sd), [
+                {"doc_id": doc_id, **dict(zip(DIMENSIONS, key)),
+                 "versions": vers, "active_versions": active, "chunks": chunks}
+                for doc_id, (key, (vers, active, chunks)) in new.items()
+            ])
+        _apply_delta(conn, delta)
+
+
+# ─────────────────────────── flush 事件 ───────────────────────────
+def _affected(session: Session) -> Set[int]:
+    ids: Set[int] = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Document):
+            doc_id = obj.id
+        elif isinstance(obj, DocumentVersion):
+            doc_id = obj.doc_id
+        else:
+            continue
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        if doc_id is not None:
+            ids.add(doc_id)
+    return ids
+
+
+def _bulk_affected(conn, stmt, entity) -> Set[int]:
+    """批次 update / delete 會動到的文件(執行前以同一個 WHERE 查；沒有 WHERE 時為全部)。"""
+    col = DocumentVersion.doc_id if entity is DocumentVersion else Document.id
+    query = select(col).distinct()
+    if stmt.whereclause is not None:
+        query = query.where(stmt.whereclause)
+    return {doc_id for (doc_id,) in conn.execute(query) if doc_id is not None}
+
+
+def _is_ready(conn) -> bool:
+    global _ready
+    if not _ready:
+        t = DataVersion.__table__
+        _ready = bool(conn.execute(select(t.c.version).where(t.c.name == MARKER)).scalar())
+    return _ready
+
+
+def install() -> None:
+    """註冊 flush 與 ORM 批次寫入事件(全域一次)。"""
+    global _installed
+    if _installed:
+        return
+
+    @event.listens_for(Session, "after_flush")
+    def _update_stats(session, flush_context):
+        ids = _affected(session)
+        if not ids:
+            return
+        conn = session.connection()
+        if _is_ready(conn):
+            _refresh(conn, ids)
+
+    @event.listens_for(Session, "do_orm_execute")
+    def _update_stats_bulk(state):
+        if not (state.is_update or state.is_delete) or state.bind_mapper is None:
+            return None
+        entity = state.bind_mapper.class_
+        if entity not in (Document, DocumentVersion):
+            return None
+        conn = state.session.connection()
+        if not _is_ready(conn):
+            return None
+        ids = _bulk_affected(conn, state.statement, entity)
+        result = state.invoke_statement()
+        if ids:
+            _refresh(conn, ids)
+        return result
+
+    _installed = True
+
+
+# ─────────────────────────── 全量重建 / 上游同步 ───────────────────────────
+def rebuild() -> Dict[str, int]:
+    """清空後依目前 DB 重算全部統計並 commit；封存匯入等繞過 ORM 的寫入之後呼叫。需在 app context 內。"""
+    global _ready
+    conn = db.session.connection()
+    t, sd, d = CorpusStat.__table__, CorpusStatDoc.__table__, Document.__table__
+    conn.execute(delete(t))
+    conn.execute(delete(sd))
+    ids = [doc_id for (doc_id,) in conn.execute(select(d.c.id).order_by(d.c.id))]
+    agg: Dict[Key, List[int]] = defaultdict(lambda: [0, 0, 0, 0])
+    for i in range(0, len(ids), _BATCH):
+        new = _contributions(conn, ids[i:i + _BATCH])
+        if not new:
+            continue
+        conn.execute(insert(sd), [
+            {"doc_id": doc_id, **dict(zip(DIMENSIONS, key)),
+             "versions": vers, "active_versions": active, "chunks": chunks}
+            for doc_id, (key, (vers, active, chunks)) in new.items()
+        ])
+        for key, (vers, active, chunks) in new.values():
+            acc = agg[key]
+            acc[0] += 1
+            acc[1] += vers
+            acc[2] += active
+            acc[3] += chunks
+    if agg:
+        conn.execute(insert(t), [{**dict(zip(DIMENSIONS, key)), **dict(zip(METRICS, vals))}
+                                 for key, vals in agg.items()])
+    data_version.bump(MARKER)
+    db.session.commit()
+    _ready = True
+    return {"documents": len(ids), "groups": len(agg)}
+
+
+def ensure_ready() -> None:
+    if not _is_ready(db.session.connection()):
+        log.info("corpus stats not built yet, rebuilding")
+        rebuild()
+
+
+def apply_upstream(dataset: Dict[str, Any], upstream: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    以 dataset 全部文件的列表(list_all_documents 的結果)更新各文件最新版本的 rag_* 欄位並 commit；
+    統計隨 flush 增量更新。只更新有變動的版本。
+    """
+    from reconcile import match_local, pick_primary
+
+    names = {n for n in (dataset.get("id"), dataset.get("name")) if n}
+    default = dataset.get("name") == RAGFLOW_DATASET
+    matched = updated = 0
+    for _doc, v, _names, hits in match_local(upstream):
+        if v.kb and v.kb not in names:
+            continue   # 上傳到其他 dataset 的版本
+        if hits:
+            matched += 1
+            d = pick_primary(hits)
+            values = {
+                "kb": v.kb or dataset.get("name"),
+                "rag_doc_id": v.rag_doc_id or d["id"],
+                "rag_status": (d.get("status") or "UNKNOWN").upper(),
+                "rag_chunk_method": d.get("chunk_method"),
+                "rag_chunks": int(d.get("chunks") or 0),
+            }
+        elif v.rag_doc_id and (v.kb or default):
+            values = {"rag_status": "NOT_FOUND", "rag_chunks": 0}
+        else:
+            continue
+        changed = False
+        for k, val in values.items():
+            if getattr(v, k) != val:
+                setattr(v, k, val)
+                changed = True
+        updated += changed
+    db.session.commit()
+    return {"dataset": dataset.get("name"), "upstream_total": len(upstream), "matched": matched, "updated": updated}
+
+
+def sync(dataset_name: Optional[str] = None) -> Dict[str, Any]:
+    from ragflow_service import list_all_documents
+
+    ds, upstream = list_all_documents(dataset_name)
+    return apply_upstream(ds, upstream)
+
+
+# ─────────────────────────── 查詢 ───────────────────────────
+def totals() -> Dict[str, int]:
+    """全部文件的 documents / versions / active_versions / chunks(讀彙總表)。"""
+    ensure_ready()
+    t = CorpusStat.__table__
+    row = db.session.execute(select(*(func.coalesce(func.sum(t.c[m]), 0) for m in METRICS))).one()
+    return {m: int(n) for m, n in zip(METRICS, row)}
+
+
+def summary(group_by: Sequence[str] = (), filters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """依 group_by(DIMENSIONS 的子集)分組的統計；filters {dimension: 值} 先篩選。"""
+    ensure_ready()
+    t = CorpusStat.__table__
+    cols = [t.c[g] for g in group_by]
+    metrics = [func.coalesce(func.sum(t.c[m]), 0).label(m) for m in METRICS]
+    conds = [t.c[k] == (v or "") for k, v in (filters or {}).items()]
+
+    total = db.session.execute(select(*metrics).where(*conds)).one()
+    groups = []
+    if cols:
+        rows = db.session.execute(
+            select(*cols, *metrics).where(*conds).group_by(*cols).order_by(*cols)
+        ).all()
+        for r in rows:
+            groups.append({
+                **{g: (getattr(r, g) or None) for g in group_by},
+                **{m: int(getattr(r, m)) for m in METRICS},
+            })
+    return {
+        "group_by": list(group_by),
+        "filters": filters or {},
+        "totals": {m: int(n) for m, n in zip(METRICS, total)},
+        "groups": groups,
+        "version": data_version.current("docs"),
+    }
@@ -0,0 +1,248 @@
+# backend/dashboard.py
+"""
+首頁彙總(/api/dashboard)
+
+前端載入時原本依序打 /api/knowledge-bases → /api/docs → 每列一次 /api/docs/<id>/ragflow
+→ /api/ragflow/docs → /api/uploads/recent，是一長串相依的請求。這裡一次回傳：
+  knowledge_bases   KB 清單
+  documents         本地文件(分頁)+ 最新版本 + RAGFlow 狀態(與 /api/docs/<id>/ragflow 同格式)
+  ragflow_documents RAGFlow dataset 內的文件
+  recent_uploads    最近上傳的版本(與 /api/uploads/recent 同格式)
+  counts            數量統計(讀 corpus_stats 彙總表)
+兩個上游部分(KB 清單、dataset 全部文件)在背景執行緒並行抓取(皆經共用快取)，同時在請求執行緒查本地 DB；
+每份文件的狀態由「一次列出的全部文件」比對而來，不再逐份查詢。
+每個區塊附 freshness：{source: db / ragflow, as_of: 資料取得時間(UTC ISO)}；上游失敗時該區塊改為 {error}，其餘照常回傳。
+"""
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+
+from models import db, Document, DocumentVersion
+from request_logging import with_request_counter
+import data_version
+import corpus_stats
+from ragflow_service import (
+    RAGFLOW_BASE_URL,
+    DATASET_CACHE_TTL,
+    list_datasets_info,
+    datasets_version,
+    list_all_documents_cached,
+)
+from reconcile import index_upstream, match_version, pick_primary
+
+DASHBOARD_UPSTREAM_TIMEOUT = float(os.getenv("DASHBOARD_UPSTREAM_TIMEOUT", "20"))
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+RECENT_LIMIT = 10
+
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="dashboard")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _cached_at(watermark: Optional[str], ttl: float) -> Optional[str]:
+    """由快取 watermark(<世代>-<到期時間>)反推寫入時間。"""
+    try:
+        expires = float(watermark.rsplit("-", 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+    return datetime.fromtimestamp(expires - ttl, tz=timezone.utc).isoformat()
+
+
+def _fetch_kbs() -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    items = list_datasets_info()
+    return items, _cached_at(datasets_version(), DATASET_CACHE_TTL)
+
+
+# ─────────────────────────── 狀態 ───────────────────────────
+def _rag_url(dataset_id: Optional[str], doc_id: Optional[str]) -> Optional[str]:
+    if not dataset_id or not doc_id:
+        return None
+    base = os.getenv("RAGFLOW_UI_BASE", RAGFLOW_BASE_URL)
+    return f"{base.rstrip('/')}/#/datasets/{dataset_id}/documents/{doc_id}"
+
+
+def _status(doc: Document, ver: Optional[DocumentVersion], index, dataset: Dict[str, Any]) -> Dict[str, Any]:
+    """與 get_doc_status() 相同的欄位。"""
+    if not ver or not ver.file_path:
+        return {"found": False, "status": "NO_FILE"}
+    if index is None:
+        return {"found": False, "status": "UNKNOWN", "dataset": dataset.get("name")}
+    _names, hits = match_version(doc, ver, *index)
+    if not hits:
+        return {"found": False, "status": "NOT_FOUND", "dataset": dataset.get("name")}
+    d = pick_primary(hits)
+    return {
+        "found": True,
+        "status": d["status"],
+        "chunks": d["chunks"],
+        "enabled": d["enabled"],
+        "updated_at": d.get("updated_at"),
+        "doc_id": d["id"],
+        "url": _rag_url(dataset.get("id"), d["id"]),
+        "dataset": dataset.get("name"),
+        "chunk_method": d.get("chunk_method"),
+        "duplicates": len(hits) - 1,
+    }
+
+
+# ─────────────────────────── 本地 ───────────────────────────
+def _doc_query(q: Optional[str], department: Optional[str]):
+    query = Document.query
+    if q:
+        like = f"%{q}%"
+        query = query.filter(or_(Document.title.ilike(like), Document.doc_no.ilike(like)))
+    if department:
+        query = query.filter(Document.department == department)
+    return query
+
+
+def _latest_for(doc_ids: List[int]) -> Dict[int, DocumentVersion]:
+    """指定文件的最新版本(與 /api/docs 相同排序)，一次查詢。"""
+    latest: Dict[int, DocumentVersion] = {}
+    if not doc_ids:
+        return latest
+    rows = (DocumentVersion.query.filter(DocumentVersion.doc_id.in_(doc_ids))
+            .order_by(DocumentVersion.doc_id, DocumentVersion.date_issued.desc(), DocumentVersion.id.desc())
+            .all())
+    for v in rows:
+        latest.setdefault(v.doc_id, v)
+    return latest
+
+
+def _doc_item(d: Document, v: Optional[DocumentVersion]) -> Dict[str, Any]:
+    """與 /api/docs 每列相同的格式。"""
+    latest = None
+    if v:
+        latest = {
+            "id": v.id,
+            "doc_id": v.doc_id,
+            "date_issued": d.date_issued.isoformat() if d.date_issued else None,
+            "is_active": v.is_active,
+            "file_path": v.file_path,
+            "filename": os.path.basename(v.file_path) if v.file_path else None,
+        }
+    return {
+        "doc": {
+            "id": d.id,
+            "title": d.title,
+            "department": d.department,
+            "doc_no": d.doc_no,
+            "date_issued": d.date_issued.isoformat() if d.date_issued else None,
+            "review_meeting": d.review_meeting,
+        },
+        "latest": latest,
+    }
+
+
+def _uploaded_at(v: DocumentVersion) -> str:
+    mtime = None
+    try:
+        if v.file_path and os.path.exists(v.file_path):
+            mtime = datetime.fromtimestamp(os.path.getmtime(v.file_path), tz=timezone.utc)
+    except OSError:
+        mtime = None
+    return (
+        mtime
+        or (v.date_issued and datetime.combine(v.date_issued, datetime.min.time(), tzinfo=timezone.utc))
+        or datetime.now(timezone.utc)
+    ).isoformat()
+
+
+# ─────────────────────────── 彙總 ───────────────────────────
+def build(kb: Optional[str], *, page: int = 1, page_size: int = DEFAULT_PAGE_SIZE,
+          q: Optional[str] = None, department: Optional[str] = None) -> Dict[str, Any]:
+    page = max(1, page)
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    kb_future = _pool.submit(with_request_counter(_fetch_kbs))
+    docs_future = _pool.submit(with_request_counter(list_all_documents_cached), kb)
+
+    # 上游在背景抓取的同時查本地 DB
+    local_as_of = _now()
+    query = _doc_query(q, department)
+    total = query.count()
+    page_docs = (query.order_by(Document.date_issued.desc(), Document.id.desc())
+                 .offset((page - 1) * page_size).limit(page_size).all())
+    latest = _latest_for([d.id for d in page_docs])
+    recent = (
+        db.session.query(Document, DocumentVersion)
+        .join(DocumentVersion, Document.id == DocumentVersion.doc_id)
+        .order_by(DocumentVersion.id.desc())
+        .limit(RECENT_LIMIT)
+        .all()
+    )
+    counts = corpus_stats.totals()   # 增量維護的彙總表，不掃描全表
+    local_fresh = {"source": "db", "as_of": local_as_of, "version": data_version.current("docs")}
+
+    out: Dict[str, Any] = {"kb": kb}
+    try:
+        kbs, kb_as_of = kb_future.result(timeout=DASHBOARD_UPSTREAM_TIMEOUT)
+        out["knowledge_bases"] = {"items": kbs, "freshness": {"source": "ragflow", "as_of": kb_as_of or _now()}}
+    except Exception as e:
+        out["knowledge_bases"] = {"error": str(e), "freshness": {"source": "ragflow", "as_of": None}}
+
+    index, dataset, rag_fresh = None, {"name": kb}, {"source": "ragflow", "as_of": None}
+    try:
+        listing = docs_future.result(timeout=DASHBOARD_UPSTREAM_TIMEOUT)
+        dataset, upstream = listing["dataset"], listing["docs"]
+        index = index_upstream(upstream)
+        rag_fresh["as_of"] = listing["fetched_at"]
+        by_status = Counter(d["status"] for d in upstream)
+        counts["ragflow"] = {"documents": len(upstream), "by_status": dict(by_status)}
+        out["ragflow_documents"] = {
+            "dataset": dataset,
+            "items": [{
+                "id": d["id"],
+                "display_name": d["name"],
+                "status": d["status"],
+                "chunks": d["chunks"],
+                "enabled": d["enabled"],
+                "updated_at": d.get("updated_at"),
+                "url": _rag_url(dataset.get("id"), d["id"]),
+                "dataset": dataset.get("name"),
+                "chunk_method": d.get("chunk_method"),
+            } for d in upstream],
+            "freshness": rag_fresh,
+        }
+    except Exception as e:
+        out["ragflow_documents"] = {"error": str(e), "freshness": rag_fresh}
+
+    items = []
+    for d in page_docs:
+        item = _doc_item(d, latest.get(d.id))
+        item["ragflow"] = _status(d, latest.get(d.id), index, dataset)
+        items.append(item)
+    out["documents"] = {
+        "items": items,
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "freshness": {**local_fresh, "ragflow_as_of": rag_fresh["as_of"]},
+    }
+
+    recent_items = []
+    names = {n for n in (dataset.get("id"), dataset.get("name"), kb) if n}
+    for d, v in recent:
+        ext = Path(v.file_path).suffix if v.file_path else ""
+        # 上傳到其他 dataset 的版本不能拿這次取得的列表判斷狀態
+        st = _status(d, v, index, dataset) if not v.kb or v.kb in names else {}
+        recent_items.append({
+            "id": v.id,
+            "uploaded_at": _uploaded_at(v),
+            "kb": v.kb or kb,
+            "doc_no": d.doc_no,
+            "title": d.title,
+            "display_name": f"{d.title}{ext}" if ext and not str(d.title).endswith(ext) else d.title,
+            "rag_status": (st.get("status") or "UNKNOWN").upper(),
+            "rag_url": st.get("url"),
+        })
+    out["recent_uploads"] = {"items": recent_items, "freshness": {**local_fresh, "ragflow_as_of": rag_fresh["as_of"]}}
+    out["counts"] = {**counts, "freshness": {**local_fresh, "ragflow_as_of": rag_fresh["as_of"]}}
+    return out
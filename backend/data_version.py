@@ -0,0 +1,71 @@
+# backend/data_version.py
+"""
+資料版本號(給 ETag / 304 使用)
+
+- 每個「資料面」一個計數器(data_versions 表)：docs = Document + DocumentVersion，files = StoredFile + Blob
+- ORM flush 時若有相關物件新增 / 修改 / 刪除，在同一個交易裡把計數 +1 —— rollback 時一併還原，
+  多 worker 共用同一個 DB，因此不需另外廣播
+- 繞過 ORM 的批次寫入(query.delete() 等)需自行呼叫 bump()
+"""
+import logging
+from typing import Dict, Iterable, Set
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import db, DataVersion, Document, DocumentVersion, StoredFile, Blob
+
+log = logging.getLogger("data_version")
+
+TRACKED: Dict[type, str] = {
+    Document: "docs",
+    DocumentVersion: "docs",
+    StoredFile: "files",
+    Blob: "files",
+}
+
+_installed = False
+
+
+def _touched(session: Session) -> Set[str]:
+    names: Set[str] = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        name = TRACKED.get(type(obj))
+        if name and (obj not in session.dirty or session.is_modified(obj, include_collections=False)):
+            names.add(name)
+    return names
+
+
+def _increment(session: Session, names: Iterable[str]) -> None:
+    table = DataVersion.__table__
+    for name in sorted(names):
+        res = session.execute(
+            update(table).where(table.c.name == name).values(version=table.c.version + 1)
+        )
+        if res.rowcount == 0:
+            session.execute(insert(table).values(name=name, version=1))
+
+
+def bump(*names: str) -> None:
+    """繞過 ORM 的寫入之後呼叫(與呼叫端同一交易，由呼叫端 commit)。"""
+    _increment(db.session, names)
+
+
+def current(name: str) -> int:
+    table = DataVersion.__table__
+    return db.session.execute(select(table.c.version).where(table.c.name == name)).scalar() or 0
+
+
+def install() -> None:
+    """註冊 flush 事件(全域一次)。"""
+    global _installed
+    if _installed:
+        return
+
+    @event.listens_for(Session, "before_flush")
+    def _bump_on_flush(session, flush_context, instances):
+        names = _touched(session)
+        if names:
+            _increment(session, names)
+
+    _installed = True
@@ -0,0 +1,52 @@
+# backend/db_migrate.py
+"""
+資料庫初始化 / 輕量遷移(明確步驟，不在 import 或 create_app 時執行)
+
+  flask --app app init-db          # 建表 + 補欄位
+  python server.py                 # 主行程啟動前會先跑一次(SKIP_DB_INIT=1 可略過)
+  python app.py                    # 開發模式同上
+
+- db.create_all() 建立缺少的資料表
+- 既有資料表缺少的欄位以 ALTER TABLE ADD COLUMN 補上(只新增，不改型別 / 不刪欄位)
+- 模型上宣告的 index 若不存在也一併建立
+"""
+import logging
+from typing import Dict, List
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from models import db
+
+log = logging.getLogger("db_migrate")
+
+
+def _add_missing_columns() -> Dict[str, List[str]]:
+    engine = db.engine
+    insp = inspect(engine)
+    added: Dict[str, List[str]] = {}
+    existing_tables = set(insp.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        have_cols = {c["name"] for c in insp.get_columns(table.name)}
+        have_idx = {i["name"] for i in insp.get_indexes(table.name)}
+        with engine.begin() as conn:
+            for col in table.columns:
+                if col.name in have_cols:
+                    continue
+                col_type = col.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{col.name}" {col_type}'))
+                added.setdefault(table.name, []).append(col.name)
+                log.info("added column %s.%s (%s)", table.name, col.name, col_type)
+            for idx in table.indexes:
+                if idx.name and idx.name not in have_idx:
+                    conn.execute(CreateIndex(idx))
+                    log.info("created index %s", idx.name)
+    return added
+
+
+def init_db() -> Dict[str, List[str]]:
+    """需在 app context 內呼叫；回傳補上的欄位 {table: [columns]}。"""
+    db.create_all()
+    return _add_missing_columns()
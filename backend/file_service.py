@@ -0,0 +1,138 @@
+# backend/file_service.py
+"""
+檔案下載輔助：
+- 以內容 SHA-256 作為強 ETag（依 size + mtime 快取，避免每次重算）
+- 條件式 GET（If-None-Match / If-Modified-Since）與 HTTP Range（交給 werkzeug 處理）
+- 內容定址 URL（?v=<sha256>）回傳長效 immutable 快取標頭
+- PDF 指定頁面擷取，結果依來源雜湊落地快取
+- PDF 全文文字擷取(各頁以換頁字元分隔)，同樣依來源雜湊落地快取
+"""
+import os
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from flask import request, send_file
+
+from tracing import span
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # 一年
+
+_HASH_CACHE: Dict[str, Tuple[int, int, str]] = {}
+_HASH_LOCK = threading.Lock()
+
+
+# ─────────────────────────── 雜湊 / ETag ───────────────────────────
+def sha256_file(path: str, bufsize: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(bufsize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_etag(path: str) -> str:
+    """回傳檔案內容的 SHA-256；檔案 size/mtime 未變時直接用快取。"""
+    st = os.stat(path)
+    key = os.path.abspath(path)
+    with _HASH_LOCK:
+        hit = _HASH_CACHE.get(key)
+    if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+        return hit[2]
+    digest = sha256_file(path)
+    with _HASH_LOCK:
+        _HASH_CACHE[key] = (st.st_size, st.st_mtime_ns, digest)
+    return digest
+
+
+def prime_etag(path: str, digest: str) -> None:
+    """寫入端已算好雜湊時（如 blob store）直接登記，省去下載時重讀整檔。"""
+    st = os.stat(path)
+    with _HASH_LOCK:
+        _HASH_CACHE[os.path.abspath(path)] = (st.st_size, st.st_mtime_ns, digest)
+
+
+# ─────────────────────────── 傳送檔案 ───────────────────────────
+def send_cached_file(path: str, *, immutable: bool = False,
+                     mimetype: Optional[str] = None,
+                     download_name: Optional[str] = None):
+    """
+    以強 ETag + Last-Modified 傳送檔案，支援 304 與 Range(206/416)。
+    - immutable=True 或 ?v= 等於目前內容雜湊時：Cache-Control: public, max-age=1y, immutable
+    - 否則：no-cache（瀏覽器每次以 If-None-Match 重新驗證，未變更回 304）
+    """
+    etag = file_etag(path)
+    if not immutable:
+        v = (request.args.get("v") or "").strip().strip('"')
+        immutable = bool(v) and v == etag
+
+    rv = send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=False,
+        download_name=download_name,
+        conditional=True,
+        etag=etag,
+        max_age=IMMUTABLE_MAX_AGE if immutable else None,
+    )
+    if immutable:
+        rv.cache_control.immutable = True
+    return rv
+
+
+# ─────────────────────────── PDF 頁面擷取 ───────────────────────────
+def extract_pdf_pages(src_path: str, start: int, end: int, cache_dir: str) -> str:
+    """
+    擷取 src_path 的第 start..end 頁（1 起算、含頭尾）成為新的 PDF。
+    結果以「來源 SHA-256 + 頁碼範圍」命名存於 cache_dir，之後直接重用。
+    頁碼超出範圍時 raise ValueError。
+    """
+    src_hash = file_etag(src_path)
+    out_dir = Path(cache_dir) / "pages"
+    out_path = out_dir / f"{src_hash}-p{start}-{end}.pdf"
+    if out_path.exists():
+        return str(out_path)
+
+    from PyPDF2 import PdfReader, PdfWriter
+
+    with span("pdf", "extract_pages"):
+        reader = PdfReader(src_path)
+        total = len(reader.pages)
+        if start < 1 or end < start or end > total:
+            raise ValueError(f"page range {start}-{end} out of bounds (1-{total})")
+
+        writer = PdfWriter()
+        for i in range(start - 1, end):
+            writer.add_page(reader.pages[i])
+
+        out_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = out_path.with_name(f"{out_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as fh:
+            writer.write(fh)
+    os.replace(tmp_path, out_path)  # 原子替換，並行請求不會讀到半個檔
+    return str(out_path)
+
+
+def extract_pdf_text(src_path: str, cache_dir: str) -> str:
+    """
+    擷取 PDF 全文(各頁以換頁字元 \\f 分隔)。
+    結果以來源 SHA-256 命名存於 cache_dir/text，同內容的檔案只解析一次。
+    """
+    src_hash = file_etag(src_path)
+    out_dir = Path(cache_dir) / "text"
+    out_path = out_dir / f"{src_hash}.txt"
+    if out_path.exists():
+        return out_path.read_text(encoding="utf-8")
+
+    from PyPDF2 import PdfReader
+
+    with span("pdf", "extract_text"):
+        reader = PdfReader(src_path)
+        text = "\f".join((page.extract_text() or "") for page in reader.pages)
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_name(f"{out_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, out_path)
+    return text
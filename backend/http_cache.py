@@ -0,0 +1,127 @@
+# backend/http_cache.py
+"""
+JSON 回應的壓縮與條件式快取
+
+- 壓縮：JSON 回應超過 COMPRESS_MIN_BYTES(預設 1024)且客戶端接受時，
+  依 Accept-Encoding 選 br(有安裝 brotli 才會啟用)或 gzip；串流回應不處理
+- 弱 ETag：@conditional_json(version_fn) 以「資料版本」而非回應內容產生 ETag，
+  版本沒變就直接回 304，不必查詢 / 序列化 / 傳輸
+  * version_fn 回傳 None 表示目前無法便宜地判斷版本(例如快取剛過期)：照常執行 view，
+    結束後再取一次版本；仍取不到就以回應內容雜湊當 ETag(至少省下傳輸)
+  * Cache-Control: no-cache —— 瀏覽器每次都會帶 If-None-Match 回來驗證
+"""
+import os
+import gzip
+import hashlib
+import functools
+from typing import Callable, Optional
+
+from flask import Flask, request, make_response
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+
+_brotli = None
+_brotli_checked = False
+
+
+def _get_brotli():
+    global _brotli, _brotli_checked
+    if not _brotli_checked:
+        try:
+            import brotli  # 選用套件；沒裝就只提供 gzip
+            _brotli = brotli
+        except ImportError:
+            _brotli = None
+        _brotli_checked = True
+    return _brotli
+
+
+def _accepts(encoding: str) -> bool:
+    return request.accept_encodings[encoding] > 0
+
+
+# ─────────────────────────── 壓縮 ───────────────────────────
+def compress_response(response):
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype != "application/json"
+    ):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    brotli = _get_brotli()
+    if brotli is not None and _accepts("br"):
+        body, encoding = brotli.compress(data, quality=5), "br"
+    elif _accepts("gzip"):
+        body, encoding = gzip.compress(data, compresslevel=COMPRESS_LEVEL), "gzip"
+    else:
+        response.vary.add("Accept-Encoding")
+        return response
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    # 壓縮後的表示法不同：強 ETag 需轉為弱 ETag
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app: Flask) -> None:
+    app.after_request(compress_response)
+
+
+# ─────────────────────────── 條件式 GET ───────────────────────────
+def _etag_for(version: str) -> str:
+    raw = f"{version}|{request.path}|{request.query_string.decode('latin-1')}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]
+
+
+def _not_modified(etag: str):
+    resp = make_response("", 304)
+    resp.set_etag(etag, weak=True)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+def conditional_json(version_fn: Callable[[], Optional[str]]):
+    """
+    以資料版本產生弱 ETag，If-None-Match 相符時回 304。
+    version_fn 在 request context 內呼叫，應只做便宜的查詢(單列 SELECT / 快取中繼資料)。
+    """
+
+    def deco(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            version = version_fn()
+            if version is not None:
+                etag = _etag_for(version)
+                if request.if_none_match.contains_weak(etag):
+                    return _not_modified(etag)
+
+            resp = make_response(view(*args, **kwargs))
+            if resp.status_code != 200 or resp.is_streamed:
+                return resp
+
+            if version is None:
+                version = version_fn()
+            if version is None:
+                version = "body:" + hashlib.sha1(resp.get_data()).hexdigest()
+            etag = _etag_for(version)
+            if request.if_none_match.contains_weak(etag):
+                return _not_modified(etag)
+            resp.set_etag(etag, weak=True)
+            resp.headers["Cache-Control"] = "no-cache"
+            return resp
+
+        return wrapper
+
+    return deco
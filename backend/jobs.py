@@ -0,0 +1,206 @@
+# backend/jobs.py
+"""
+背景工作(可查進度、可取消、可續跑)
+
+- 工作與其項目存在 DB(jobs / job_items)：任一 worker 都能查進度、送出取消
+- 執行端是一個 runner(ctx) 函式，在背景執行緒(含 app context)裡跑；
+  以 ctx.batches() 依 id 順序取出尚未完成的項目，ctx.mark() 更新狀態，
+  ctx.heartbeat() 更新心跳並檢查取消旗標(被取消時 raise JobCancelled)
+- 續跑(resume)：已取消 / 失敗 / 心跳過期(執行的行程已結束)的工作可重新啟動，只處理未完成的項目
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from flask import current_app
+from sqlalchemy import func, insert, update
+
+from models import db, Job, JobItem
+
+log = logging.getLogger("jobs")
+
+HEARTBEAT_STALE_SECONDS = int(os.getenv("JOB_HEARTBEAT_STALE", "120"))
+ACTIVE = ("PENDING", "RUNNING", "CANCELLING")
+
+_running: Dict[str, threading.Thread] = {}
+_running_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    def __init__(self, job: Job):
+        self.job_id = job.id
+        self.kind = job.kind
+        self.params: Dict[str, Any] = json.loads(job.params or "{}")
+        self.summary: Dict[str, Any] = json.loads(job.summary or "{}")
+
+    def batches(self, states: Sequence[str], size: int) -> Iterator[List[JobItem]]:
+        """依 id 由小到大取出 states 內的項目；處理後狀態沒變的項目也不會重複取出。"""
+        last_id = 0
+        while True:
+            batch = (
+                JobItem.query.filter(JobItem.job_id == self.job_id, JobItem.state.in_(states),
+                                     JobItem.id > last_id)
+                .order_by(JobItem.id).limit(max(1, size)).all()
+            )
+            if not batch:
+                return
+            last_id = batch[-1].id
+            yield batch
+
+    def mark(self, item_ids: Iterable[int], state: str, error: Optional[str] = None) -> None:
+        ids = list(item_ids)
+        if not ids:
+            return
+        db.session.execute(
+            update(JobItem).where(JobItem.id.in_(ids))
+            .values(state=state, error=error, updated_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+    def heartbeat(self, **summary: Any) -> None:
+        """更新心跳(與自訂統計)；若已被要求取消則 raise JobCancelled。"""
+        self.summary.update(summary)
+        job = db.session.get(Job, self.job_id, populate_existing=True)
+        job.heartbeat_at = datetime.utcnow()
+        job.summary = json.dumps(self.summary, ensure_ascii=False)
+        db.session.commit()
+        if job.status == "CANCELLING":
+            raise JobCancelled()
+
+    def sleep(self, seconds: float) -> None:
+        """可被取消打斷的等待(每秒檢查一次)。"""
+        deadline = time.monotonic() + seconds
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return
+            time.sleep(min(1.0, left))
+            self.heartbeat()
+
+
+# ─────────────────────────── 建立 / 查詢 ───────────────────────────
+def create(kind: str, params: Dict[str, Any], items: Iterable[Tuple[str, Dict[str, Any]]]) -> Job:
+    job = Job(id=uuid.uuid4().hex, kind=kind, status="PENDING",
+              params=json.dumps(params, ensure_ascii=False, default=str))
+    db.session.add(job)
+    db.session.flush()
+    rows = [{"job_id": job.id, "key": key, "payload": json.dumps(payload, ensure_ascii=False),
+             "state": "PENDING"} for key, payload in items]
+    if rows:
+        db.session.execute(insert(JobItem), rows)
+    db.session.commit()
+    return job
+
+
+def counts(job_id: str) -> Dict[str, int]:
+    rows = (db.session.query(JobItem.state, func.count(JobItem.id))
+            .filter(JobItem.job_id == job_id).group_by(JobItem.state).all())
+    return {state: n for state, n in rows}
+
+
+def _is_stale(job: Job) -> bool:
+    if job.status not in ACTIVE or job.id in _running:
+        return False
+    ref = job.heartbeat_at or job.updated_at or job.created_at
+    return ref is None or datetime.utcnow() - ref > timedelta(seconds=HEARTBEAT_STALE_SECONDS)
+
+
+def can_resume(job: Job) -> bool:
+    return job.status in ("CANCELLED", "FAILED") or _is_stale(job)
+
+
+def describe(job: Job) -> Dict[str, Any]:
+    by_state = counts(job.id)
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": "INTERRUPTED" if _is_stale(job) else job.status,
+        "params": json.loads(job.params or "{}"),
+        "summary": json.loads(job.summary or "{}"),
+        "error": job.error,
+        "total": sum(by_state.values()),
+        "by_state": by_state,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "heartbeat_at": job.heartbeat_at.isoformat() if job.heartbeat_at else None,
+        "can_resume": can_resume(job),
+    }
+
+
+def list_jobs(kind: Optional[str] = None, limit: int = 20) -> List[Job]:
+    q = Job.query
+    if kind:
+        q = q.filter(Job.kind == kind)
+    return q.order_by(Job.created_at.desc()).limit(limit).all()
+
+
+# ─────────────────────────── 執行 / 取消 / 續跑 ───────────────────────────
+def _run(app, job_id: str, runner: Callable[[JobContext], Any]) -> None:
+    with app.app_context():
+        try:
+            job = db.session.get(Job, job_id)
+            if job.status != "CANCELLING":  # 啟動前就被要求取消時保留旗標，runner 第一次心跳即停下
+                job.status = "RUNNING"
+            job.error, job.heartbeat_at = None, datetime.utcnow()
+            db.session.commit()
+            ctx = JobContext(job)
+            try:
+                runner(ctx)
+                final, error = "DONE", None
+            except JobCancelled:
+                final, error = "CANCELLED", None
+            except Exception as e:
+                log.exception("job %s (%s) failed", job_id, ctx.kind)
+                db.session.rollback()
+                final, error = "FAILED", f"{type(e).__name__}: {e}"
+            job = db.session.get(Job, job_id, populate_existing=True)
+            if final == "DONE" and job.status == "CANCELLING":
+                final = "CANCELLED"
+            job.status, job.error = final, error
+            job.summary = json.dumps(ctx.summary, ensure_ascii=False)
+            db.session.commit()
+            log.info("job %s (%s) finished: %s", job_id, ctx.kind, final)
+        finally:
+            db.session.remove()
+            with _running_lock:
+                _running.pop(job_id, None)
+
+
+def start(job: Job, runner: Callable[[JobContext], Any]) -> bool:
+    """在本行程的背景執行緒啟動；已在執行中則回傳 False。"""
+    app = current_app._get_current_object()
+    with _running_lock:
+        if job.id in _running:
+            return False
+        t = threading.Thread(target=_run, args=(app, job.id, runner), daemon=True, name=f"job-{job.id[:8]}")
+        _running[job.id] = t
+    job.status, job.heartbeat_at = "RUNNING", datetime.utcnow()
+    db.session.commit()
+    t.start()
+    return True
+
+
+def request_cancel(job: Job) -> None:
+    if job.status not in ACTIVE:
+        return
+    # 尚未開始或執行的行程已不在(心跳過期)就直接標成已取消；否則由執行端在下一批前停下
+    if job.status == "PENDING" or _is_stale(job):
+        job.status = "CANCELLED"
+    else:
+        job.status = "CANCELLING"
+    db.session.commit()
+
+
+def resume(job: Job, runner: Callable[[JobContext], Any]) -> bool:
+    if not can_resume(job):
+        return False
+    return start(job, runner)
@@ -0,0 +1,282 @@
+# backend/llm_gateway.py
+"""
+LLM 呼叫閘道(自架 Llama 端點的共用入口)
+
+原本每個請求各自建 OpenAI client、直接打模型伺服器，同時分析的人一多(或批次匯入逐份分析)就全部一起變慢 / 逾時。
+這裡統一：
+- 並行上限：同時最多 LLM_MAX_CONCURRENCY 個請求打到模型伺服器(每個 worker 行程各自計算)
+- 等待佇列：額滿時排隊最多 LLM_QUEUE_TIMEOUT 秒；排隊人數超過 LLM_MAX_WAITING 直接拒絕(LLMBusy → 503)
+- 合併：同一模型、同一組 prompt / 參數的請求在執行中時，後到的直接等前一個的結果，不重打
+- chat → completions 降級：每個模型只判斷一次(第一次 chat 失敗且 completions 成功後記住)，之後直接走對的 API
+- 統計：請求數、合併數、拒絕數、token 用量(依模型)、排隊與呼叫延遲(p50 / p95)，見 stats()
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from request_logging import count_upstream
+from tracing import span
+
+log = logging.getLogger("llm")
+
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://120.126.16.229:3579/v1")
+LLM_API_KEY = os.getenv("LLM_API_KEY", "")   # 必須由環境變數(.env)提供，不在程式碼中放預設值
+LLM_MODEL = os.getenv("LLM_MODEL", "meta-llama/Llama-3.3-70B-Instruct")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_WAITING = int(os.getenv("LLM_MAX_WAITING", "32"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+LLM_RETRY_AFTER = int(os.getenv("LLM_RETRY_AFTER", "5"))   # LLMBusy → 503 時建議客戶端等待的秒數
+_LATENCY_SAMPLES = 500
+
+
+class LLMError(RuntimeError):
+    pass
+
+
+class LLMBusy(LLMError):
+    """排隊逾時或佇列已滿；API 層轉成 503 + Retry-After。"""
+
+
+# ─────────────────────────── client / 並行控制 ───────────────────────────
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+_slots = threading.BoundedSemaphore(max(1, LLM_MAX_CONCURRENCY))
+_waiting = 0
+_running = 0
+_state_lock = threading.Lock()
+
+_modes: Dict[str, str] = {}   # model → "chat" / "completions"
+
+
+def _get_client():
+    """整個行程共用一個 client(連線可重用)；fork 後重建。"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            if not LLM_API_KEY:
+                raise LLMError("LLM_API_KEY is not set")
+            from openai import OpenAI  # 延遲載入:import openai 本身就要數百毫秒
+
+            _client = OpenAI(
+                api_key="EMPTY",
+                base_url=LLM_BASE_URL,
+                default_headers={"X-API-Key": LLM_API_KEY},
+                timeout=LLM_REQUEST_TIMEOUT,
+                max_retries=0,
+            )
+            _client_pid = os.getpid()
+        return _client
+
+
+def _acquire() -> float:
+    """取得一個執行名額；回傳排隊毫秒數。"""
+    global _waiting, _running
+    t0 = time.perf_counter()
+    if _slots.acquire(blocking=False):
+        with _state_lock:
+            _running += 1
+        return 0.0
+    with _state_lock:
+        if _waiting >= LLM_MAX_WAITING:
+            _metrics["rejected"] += 1
+            raise LLMBusy(f"LLM queue is full ({_waiting} waiting)")
+        _waiting += 1
+    try:
+        ok = _slots.acquire(timeout=LLM_QUEUE_TIMEOUT)
+    finally:
+        with _state_lock:
+            _waiting -= 1
+    if not ok:
+        with _state_lock:
+            _metrics["rejected"] += 1
+        raise LLMBusy(f"waited {LLM_QUEUE_TIMEOUT:g}s for an LLM slot")
+    with _state_lock:
+        _running += 1
+    return (time.perf_counter() - t0) * 1000
+
+
+def _release() -> None:
+    global _running
+    with _state_lock:
+        _running -= 1
+    _slots.release()
+
+
+# ─────────────────────────── 統計 ───────────────────────────
+_metrics: Dict[str, int] = {"requests": 0, "calls": 0, "coalesced": 0, "rejected": 0, "errors": 0, "fallbacks": 0}
+_tokens: Dict[str, Dict[str, int]] = {}
+_latency: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+_queue_wait: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+
+
+def _record(model: str, usage, latency_ms: float, queue_ms: float) -> Dict[str, int]:
+    used = {
+        "prompt_tokens": int(getattr(usage, "prompt_tokens", 0) or 0),
+        "completion_tokens": int(getattr(usage, "completion_tokens", 0) or 0),
+        "total_tokens": int(getattr(usage, "total_tokens", 0) or 0),
+    }
+    with _state_lock:
+        t = _tokens.setdefault(model, {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "calls": 0})
+        for k, v in used.items():
+            t[k] += v
+        t["calls"] += 1
+        _latency.append(latency_ms)
+        _queue_wait.append(queue_ms)
+    return used
+
+
+def _pct(values, p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1)
+
+
+def stats() -> Dict[str, Any]:
+    with _state_lock:
+        lat, wait = list(_latency), list(_queue_wait)
+        return {
+            "max_concurrency": LLM_MAX_CONCURRENCY,
+            "running": _running,
+            "waiting": _waiting,
+            "in_flight_prompts": len(_inflight),
+            **_metrics,
+            "modes": dict(_modes),
+            "tokens": {m: dict(t) for m, t in _tokens.items()},
+            "latency_ms": {"p50": _pct(lat, 0.5), "p95": _pct(lat, 0.95), "samples": len(lat)},
+            "queue_ms": {"p50": _pct(wait, 0.5), "p95": _pct(wait, 0.95), "samples": len(wait)},
+        }
+
+
+# ─────────────────────────── 呼叫 ───────────────────────────
+def _is_transient(e: Exception) -> bool:
+    """逾時 / 連線失敗 / 過載不代表該模型不支援 chat，不拿來決定降級。"""
+    import openai
+
+    return isinstance(e, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                          openai.InternalServerError))
+
+
+def _call_chat(client, model: str, prompt: str, system: Optional[str], json_mode: bool, max_tokens: Optional[int]):
+    messages = ([{"role": "system", "content": system}] if system else []) + [{"role": "user", "content": prompt}]
+    kwargs: Dict[str, Any] = {"model": model, "messages": messages}
+    if json_mode:
+        kwargs["response_format"] = {"type": "json_object"}
+    if max_tokens:
+        kwargs["max_tokens"] = max_tokens
+    count_upstream()
+    with span("llm", "chat.completions"):
+        resp = client.chat.completions.create(**kwargs)
+    if not resp.choices or not resp.choices[0].message.content:
+        raise LLMError("empty choices from chat API")
+    return resp.choices[0].message.content, resp.usage
+
+
+def _call_completions(client, model: str, prompt: str, system: Optional[str], max_tokens: Optional[int]):
+    text = f"{system}\n\n使用者需求:\n{prompt}" if system else prompt
+    count_upstream()
+    with span("llm", "completions"):
+        resp = client.completions.create(model=model, prompt=text, max_tokens=max_tokens or 1024)
+    if not resp.choices or not resp.choices[0].text:
+        raise LLMError("empty choices from completions API")
+    return resp.choices[0].text, resp.usage
+
+
+def _execute(model: str, prompt: str, system: Optional[str], json_mode: bool,
+             max_tokens: Optional[int]) -> Dict[str, Any]:
+    queue_ms = _acquire()
+    with _state_lock:
+        _metrics["calls"] += 1
+    try:
+        client = _get_client()
+        mode = _modes.get(model)
+        t0 = time.perf_counter()
+        if mode == "completions":
+            text, usage = _call_completions(client, model, prompt, system, max_tokens)
+        else:
+            try:
+                text, usage = _call_chat(client, model, prompt, system, json_mode, max_tokens)
+                _modes.setdefault(model, "chat")
+                mode = "chat"
+            except Exception as e:
+                if mode == "chat" or _is_transient(e):
+                    raise
+                log.warning("chat API failed for %s, trying completions: %s", model, e)
+                try:
+                    text, usage = _call_completions(client, model, prompt, system, max_tokens)
+                except Exception as e2:
+                    raise LLMError(f"chat: {e}; completions: {e2}") from e2
+                _modes[model] = mode = "completions"
+                with _state_lock:
+                    _metrics["fallbacks"] += 1
+                log.info("model %s: using completions API from now on", model)
+        latency_ms = (time.perf_counter() - t0) * 1000
+    finally:
+        _release()
+    usage = _record(model, usage, latency_ms, queue_ms)
+    return {"text": text, "model": model, "api": mode, "usage": usage,
+            "latency_ms": round(latency_ms, 1), "queue_ms": round(queue_ms, 1)}
+
+
+class _Pending:
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+_inflight: Dict[str, _Pending] = {}
+_inflight_lock = threading.Lock()
+
+
+def complete(prompt: str, *, system: Optional[str] = None, model: Optional[str] = None,
+             json_mode: bool = False, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """
+    回傳 {text, model, api, usage, latency_ms, queue_ms, coalesced}。
+    排隊逾時 raise LLMBusy；chat 與 completions 都失敗 raise LLMError；其他錯誤(逾時、連線)原樣拋出。
+    """
+    model = model or LLM_MODEL
+    key = hashlib.sha256("\x1f".join(
+        [model, system or "", prompt, "json" if json_mode else "", str(max_tokens or "")]
+    ).encode("utf-8")).hexdigest()
+
+    with _inflight_lock:
+        _metrics["requests"] += 1
+        pending = _inflight.get(key)
+        leader = pending is None
+        if leader:
+            pending = _inflight[key] = _Pending()
+        else:
+            pending.followers += 1
+            _metrics["coalesced"] += 1
+
+    if not leader:
+        if not pending.done.wait(LLM_QUEUE_TIMEOUT + LLM_REQUEST_TIMEOUT):
+            raise LLMBusy("timed out waiting for an identical in-flight LLM request")
+        if pending.error is not None:
+            raise pending.error
+        return {**pending.result, "coalesced": True}
+
+    try:
+        pending.result = _execute(model, prompt, system, json_mode, max_tokens)
+        return {**pending.result, "coalesced": False}
+    except BaseException as e:
+        if not isinstance(e, LLMBusy):
+            with _state_lock:
+                _metrics["errors"] += 1
+        pending.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        pending.done.set()
@@ -0,0 +1,397 @@
+# backend/metadata_extract.py
+"""
+規則式 metadata 擷取(上傳分析的快速路徑)
+
+大多數規章 PDF 第一頁的格式都很固定：
+    國立○○大學學生請假規則                       ← 標題(以 辦法 / 規則 / 要點 … 結尾)
+    民國89年5月10日本校行政會議通過                ← 沿革：日期 + 會議 + 通過 / 修正
+    中華民國112年3月8日第123次行政會議修正通過
+    第一條 …                                      ← 條文開始
+因此先用規則(正規式 + 版面位置)從前幾頁擷取 title / department / doc_no / date_issued / review_meeting，
+每個欄位附信心分數(0–1)；只有低於 METADATA_LLM_THRESHOLD 的欄位才交給 LLM(llm_gateway)補，
+大部分上傳幾毫秒內就有結果。
+日期支援民國紀年(民國112年3月8日、一一二年三月八日、112.3.8)，一律轉成 ISO(YYYY-MM-DD)。
+contains_table 與 chunking 建議只用規則判斷(LLM 看到的也只是同一份抽出的文字)。
+"""
+import os
+import re
+import json
+import time
+import logging
+import unicodedata
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from regulation_text import ARTICLE_RE
+from request_logging import with_request_counter
+
+log = logging.getLogger("metadata_extract")
+
+METADATA_LLM_THRESHOLD = float(os.getenv("METADATA_LLM_THRESHOLD", "0.7"))
+METADATA_MAX_PAGES = int(os.getenv("METADATA_MAX_PAGES", "5"))
+METADATA_BULK_CONCURRENCY = int(os.getenv("METADATA_BULK_CONCURRENCY", "4"))
+METADATA_BULK_MAX_FILES = int(os.getenv("METADATA_BULK_MAX_FILES", "500"))
+LLM_TEXT_CHARS = 5000
+FIELDS = ("title", "department", "doc_no", "date_issued", "review_meeting")
+LLM_MODES = ("auto", "off", "always")
+
+_CN_DIGITS = {"零": 0, "〇": 0, "○": 0, "一": 1, "二": 2, "兩": 2, "三": 3, "四": 4,
+              "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_CN_UNITS = {"十": 10, "百": 100, "千": 1000}
+_NUM = r"[0-9〇○零一二三四五六七八九十百兩]+"
+
+_DATE_CN_RE = re.compile(rf"(?:中華)?(民國)?\s*({_NUM})\s*年\s*({_NUM})\s*月\s*({_NUM})\s*日")
+_DATE_NUM_RE = re.compile(r"(?<![0-9])(\d{2,4})\s*[./-]\s*(\d{1,2})\s*[./-]\s*(\d{1,2})(?![0-9])")
+_MEETING_RE = re.compile(
+    rf"((?:{_NUM}\s*學年度\s*)?(?:第\s*{_NUM}\s*學期\s*)?"
+    rf"(?:[一-鿿]{{0,12}}?委員會\s*)?第\s*{_NUM}\s*次\s*[一-鿿]{{0,12}}?會議?)"
+)
+_HISTORY_KW_RE = re.compile(r"通過|修正|訂定|制定|公布|發布|核定|核備|施行|廢止")
+_TITLE_SUFFIX_RE = re.compile(
+    r"(辦法|規則|要點|規定|準則|細則|章程|條例|須知|規程|標準|作業程序|實施計畫|原則|組織規程|法)$"
+)
+_DOC_NO_LABEL_RE = re.compile(r"(?:法規|規章|文件)?(?:編號|代碼|字號)\s*[:：]\s*([A-Za-z0-9一-鿿\-_.()（）]{2,40})")
+_DOC_NO_WORD_RE = re.compile(r"([一-鿿]{1,12}字第\s*[0-9A-Za-z]+\s*號)")
+_DEPT_LABEL_RE = re.compile(r"(?:主管|承辦|權責|業務)單位\s*[:：]\s*([一-鿿]{2,16})")
+_DEPT_WORD_RE = re.compile(r"([一-鿿]{1,8}(?:處|室|中心|學院|館|委員會))")
+_TABLE_WORD_RE = re.compile(r"附表|表\s*[一二三四五六七八九十0-9]+\s|如下表")
+
+
+# ─────────────────────────── 日期 ───────────────────────────
+def cn_number(s: str) -> Optional[int]:
+    """阿拉伯數字、逐字中文數字(一一二)或位值中文數字(一百一十二、八十九)轉整數。"""
+    s = s.strip()
+    if not s:
+        return None
+    if s.isdigit():
+        return int(s)
+    if not any(c in _CN_UNITS for c in s):
+        if not all(c in _CN_DIGITS for c in s):
+            return None
+        return int("".join(str(_CN_DIGITS[c]) for c in s))
+    total, cur = 0, 0
+    for c in s:
+        if c in _CN_DIGITS:
+            cur = _CN_DIGITS[c]
+        elif c in _CN_UNITS:
+            total += (cur or 1) * _CN_UNITS[c]
+            cur = 0
+        else:
+            return None
+    return total + cur
+
+
+def _to_iso(y: Optional[int], m: Optional[int], d: Optional[int], roc: bool) -> Optional[str]:
+    if y is None or m is None or d is None:
+        return None
+    if roc or y < 1000:
+        y += 1911
+    try:
+        return date(y, m, d).isoformat()
+    except ValueError:
+        return None
+
+
+def find_dates(text: str) -> List[Tuple[int, str]]:
+    """回傳 [(位置, ISO 日期)]；三位數以內的年份一律視為民國紀年。"""
+    text = unicodedata.normalize("NFKC", text)
+    out = []
+    for m in _DATE_CN_RE.finditer(text):
+        iso = _to_iso(cn_number(m[2]), cn_number(m[3]), cn_number(m[4]), bool(m[1]))
+        if iso:
+            out.append((m.start(), iso))
+    for m in _DATE_NUM_RE.finditer(text):
+        iso = _to_iso(int(m[1]), int(m[2]), int(m[3]), False)
+        if iso:
+            out.append((m.start(), iso))
+    return sorted(out)
+
+
+def parse_date(text: str) -> Optional[str]:
+    """字串中的第一個日期轉 ISO(例：中華民國一一二年三月八日 → 2023-03-08)。"""
+    found = find_dates(text)
+    return found[0][1] if found else None
+
+
+# ─────────────────────────── 版面 ───────────────────────────
+def _lines(text: str) -> List[str]:
+    return [ln.strip() for ln in unicodedata.normalize("NFKC", text).splitlines() if ln.strip()]
+
+
+def _cjk_ratio(s: str) -> float:
+    return sum(1 for c in s if "一" <= c <= "鿿") / max(1, len(s))
+
+
+def _header(lines: List[str]) -> List[str]:
+    """第一條之前的行(沒有條文時取前 15 行)。"""
+    for i, ln in enumerate(lines):
+        if ARTICLE_RE.match(ln):
+            return lines[:i]
+    return lines[:15]
+
+
+def _field(value: Any, confidence: float, source: str = "rules") -> Dict[str, Any]:
+    return {"value": value, "confidence": round(confidence, 2), "source": source}
+
+
+def _title(header: List[str]) -> Dict[str, Any]:
+    candidates = [ln for ln in header[:8] if len(ln) <= 60 and _cjk_ratio(ln) >= 0.6
+                  and not _HISTORY_KW_RE.search(ln) and not find_dates(ln)]
+    for i, ln in enumerate(candidates):
+        if _TITLE_SUFFIX_RE.search(ln):
+            return _field(ln, 0.9)
+        if i + 1 < len(candidates) and _TITLE_SUFFIX_RE.search(candidates[i + 1]) \
+                and len(ln) + len(candidates[i + 1]) <= 60:
+            return _field(ln + candidates[i + 1], 0.8)   # 標題過長被折成兩行
+    if candidates:
+        return _field(candidates[0], 0.5)
+    return _field(None, 0.0)
+
+
+def _history(header: List[str]) -> List[str]:
+    return [ln for ln in header if find_dates(ln) and _HISTORY_KW_RE.search(ln)]
+
+
+def _date_issued(header: List[str], history: List[str], first_page: str) -> Dict[str, Any]:
+    dates = [iso for ln in history for _p, iso in find_dates(ln)]
+    if dates:
+        return _field(max(dates), 0.9)   # 沿革中最近一次修正 / 通過
+    dates = [iso for ln in header for _p, iso in find_dates(ln)]
+    if dates:
+        return _field(max(dates), 0.7)
+    dates = [iso for _p, iso in find_dates(first_page)]
+    if dates:
+        return _field(dates[0], 0.4)
+    return _field(None, 0.2)
+
+
+def _review_meeting(history: List[str], header: List[str]) -> Dict[str, Any]:
+    if history:
+        latest = max(history, key=lambda ln: max(iso for _p, iso in find_dates(ln)))
+        m = _MEETING_RE.search(latest)
+        if m:
+            return _field(re.sub(r"\s+", "", m[1]), 0.9)
+    for ln in header:
+        m = _MEETING_RE.search(ln)
+        if m:
+            return _field(re.sub(r"\s+", "", m[1]), 0.7)
+    # 有沿革卻沒寫會議 → 確實沒有；連沿革都沒有 → 交給 LLM
+    return _field(None, 0.75 if history else 0.3)
+
+
+def _doc_no(first_page: str, has_history: bool) -> Dict[str, Any]:
+    text = unicodedata.normalize("NFKC", first_page)
+    m = _DOC_NO_LABEL_RE.search(text)
+    if m:
+        return _field(m[1], 0.9)
+    m = _DOC_NO_WORD_RE.search(text)
+    if m:
+        return _field(re.sub(r"\s+", "", m[1]), 0.85)
+    # 版面完整(有沿革)卻沒有編號 → 多半本來就沒編號
+    return _field(None, 0.7 if has_history else 0.3)
+
+
+def _department(header: List[str], first_page: str, known: Iterable[str]) -> Dict[str, Any]:
+    text = unicodedata.normalize("NFKC", first_page)
+    m = _DEPT_LABEL_RE.search(text)
+    if m:
+        return _field(m[1], 0.9)
+    head = "\n".join(header)
+    hits = [d for d in known if d and d in head]
+    if len(hits) == 1:
+        return _field(hits[0], 0.75)
+    if hits:
+        return _field(min(hits, key=head.index), 0.6)
+    m = _DEPT_WORD_RE.search(head)
+    if m:
+        return _field(m[1], 0.4)
+    return _field(None, 0.2)
+
+
+def _contains_table(pages: List[str]) -> bool:
+    text = "\n".join(pages)
+    if _TABLE_WORD_RE.search(text):
+        return True
+    # 抽出的文字裡，表格多半是連續數行「以多個空白分隔的短欄位」
+    rows = [ln for ln in text.splitlines() if len(re.split(r"\s{2,}|\t", ln.strip())) >= 3]
+    return len(rows) >= 3
+
+
+def _chunking(pages: List[str]) -> Dict[str, Any]:
+    articles = sum(len(ARTICLE_RE.findall(p)) for p in pages)
+    if articles >= 3:
+        return {"method": "laws", "size": 500, "overlap": 0}
+    return {"method": "general", "size": 500, "overlap": 50}
+
+
+# ─────────────────────────── 擷取 ───────────────────────────
+def read_pages(stream: IO[bytes], max_chars: int = LLM_TEXT_CHARS, max_pages: int = METADATA_MAX_PAGES) -> List[str]:
+    """只讀前幾頁(累積到 max_chars 字或 max_pages 頁為止)。"""
+    from PyPDF2 import PdfReader  # 延遲載入:只有分析端點用得到
+
+    pages: List[str] = []
+    total = 0
+    for page in PdfReader(stream).pages[:max_pages]:
+        text = page.extract_text() or ""
+        pages.append(text)
+        total += len(text)
+        if total >= max_chars:
+            break
+    return pages
+
+
+def extract(pages: List[str], known_departments: Iterable[str] = ()) -> Dict[str, Dict[str, Any]]:
+    """規則擷取；回傳 {欄位: {value, confidence, source}}。"""
+    first = pages[0] if pages else ""
+    lines = _lines(first)
+    header = _header(lines)
+    history = _history(header)
+    return {
+        "title": _title(header),
+        "department": _department(header, first, known_departments),
+        "doc_no": _doc_no(first, bool(history)),
+        "date_issued": _date_issued(header, history, first),
+        "review_meeting": _review_meeting(history, header),
+    }
+
+
+def _llm_prompt(text: str, fields: List[str]) -> str:
+    desc = {
+        "title": "文件標題 (title)",
+        "department": "制定單位 (department)",
+        "doc_no": "規章編號 (doc_no)",
+        "date_issued": "公布日期 (date_issued,格式 YYYY-MM-DD,如無則給 null)",
+        "review_meeting": "審議會議 (review_meeting,如無則給 null)",
+    }
+    items = "\n".join(f"{i}. 推測{desc[f]}" for i, f in enumerate(fields, 1))
+    return f"""請閱讀以下文件開頭,只輸出含下列欄位的 JSON 物件:
+{items}
+
+文件內容:
+{text[:LLM_TEXT_CHARS]}
+"""
+
+
+def _parse_llm_json(text: str) -> Dict[str, Any]:
+    m = re.search(r"\{.*\}", text, re.S)
+    if not m:
+        raise ValueError("LLM output is not JSON")
+    data = json.loads(m.group(0))
+    if isinstance(data.get("metadata"), dict):
+        data = {**data, **data["metadata"]}
+    return data
+
+
+def analyze(pages: List[str], known_departments: Iterable[str] = (), llm: str = "auto") -> Dict[str, Any]:
+    """
+    規則擷取 + 只對低信心欄位呼叫 LLM。llm：auto(預設) / off(只用規則) / always(全部欄位都問 LLM)。
+    回傳 {metadata, confidence, source, contains_table, chunking, llm_fields, usage?, llm_error?, elapsed_ms}；
+    LLM 失敗時仍回傳規則結果並附 llm_error；LLM 閘道額滿(llm_gateway.LLMBusy)則原樣拋出，由呼叫端決定回 503 或降級。
+    """
+    t0 = time.perf_counter()
+    fields = extract(pages, known_departments)
+    if llm == "always":
+        ask = list(FIELDS)
+    elif llm == "off":
+        ask = []
+    else:
+        ask = [f for f in FIELDS if fields[f]["confidence"] < METADATA_LLM_THRESHOLD]
+
+    out: Dict[str, Any] = {"llm_fields": ask}
+    text = "\n".join(pages)
+    if ask and text.strip():
+        import llm_gateway
+
+        try:
+            res = llm_gateway.complete(_llm_prompt(text, ask), system="你是文件上傳分析助手,輸出嚴格 JSON",
+                                       json_mode=True)
+            out["usage"] = res["usage"]
+            answer = _parse_llm_json(res["text"])
+            for f in ask:
+                v = answer.get(f)
+                if isinstance(v, str):
+                    v = v.strip() or None
+                if f == "date_issued" and v:
+                    v = parse_date(str(v)) or (str(v) if re.match(r"^\d{4}-\d{2}-\d{2}$", str(v)) else None)
+                if v not in (None, "", "null") or fields[f]["value"] is None:
+                    fields[f] = _field(v if v not in ("", "null") else None, 0.6, "llm")
+        except llm_gateway.LLMBusy:
+            raise
+        except Exception as e:
+            log.warning("LLM metadata fallback failed: %s", e)
+            out["llm_error"] = str(e)
+
+    out.update(
+        metadata={f: fields[f]["value"] for f in FIELDS},
+        confidence={f: fields[f]["confidence"] for f in FIELDS},
+        source={f: fields[f]["source"] for f in FIELDS},
+        contains_table=_contains_table(pages),
+        chunking=_chunking(pages),
+        elapsed_ms=round((time.perf_counter() - t0) * 1000, 2),
+    )
+    return out
+
+
+def to_response(res: Dict[str, Any]) -> Dict[str, Any]:
+    """analyze() 的結果轉成 /api/llm/analyze-doc 的回應格式。"""
+    out = {
+        "success": True,
+        "suggestion": {k: res[k] for k in ("metadata", "confidence", "source", "contains_table", "chunking")},
+        "llm_fields": res["llm_fields"],
+        "elapsed_ms": res["elapsed_ms"],
+    }
+    for k in ("usage", "llm_error"):
+        if k in res:
+            out[k] = res[k]
+    return out
+
+
+# ─────────────────────────── 批次分析 ───────────────────────────
+def _analyze_one(index: int, name: str, source: Dict[str, Any], opener: Callable[[], IO[bytes]],
+                 known: List[str], llm: str) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    base = {"index": index, "name": name, "source": source}
+    try:
+        with opener() as fh:
+            pages = read_pages(fh)
+        if not "".join(pages).strip():
+            return {**base, "success": False, "error": "empty document"}
+        import llm_gateway
+
+        try:
+            res = analyze(pages, known, llm=llm)
+        except llm_gateway.LLMBusy as e:
+            # 批次中單份遇到 LLM 額滿：降級為只用規則的結果，不讓整份失敗
+            res = {**analyze(pages, known, llm="off"), "llm_error": str(e)}
+    except Exception as e:
+        return {**base, "success": False, "error": str(e),
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2)}
+    return {**base, **to_response(res), "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2)}
+
+
+def analyze_many(items: List[Tuple[str, Dict[str, Any], Callable[[], IO[bytes]]]], known: Iterable[str] = (),
+                 llm: str = "auto", concurrency: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    items 為 [(檔名, 來源描述, 開檔函式)]；以最多 concurrency 個 worker 分析，哪一份先好就先產出哪一份，
+    最後產出一筆 {summary: {...}}。呼叫端中途停止迭代(客戶端斷線)時，尚未開始的項目會被取消。
+    """
+    t0 = time.perf_counter()
+    known = list(known)
+    workers = max(1, min(concurrency or METADATA_BULK_CONCURRENCY, 16))
+    pool = ThreadPoolExecutor(max_workers=workers)
+    analyze_one = with_request_counter(_analyze_one)
+    futures = [pool.submit(analyze_one, i, name, src, opener, known, llm)
+               for i, (name, src, opener) in enumerate(items)]
+    ok = llm_calls = 0
+    try:
+        for fut in as_completed(futures):
+            r = fut.result()
+            ok += bool(r["success"])
+            llm_calls += bool(r.get("llm_fields"))
+            yield r
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    yield {"summary": {"count": len(items), "succeeded": ok, "failed": len(items) - ok,
+                       "used_llm": llm_calls, "concurrency": workers,
+                       "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2)}}
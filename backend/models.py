@@ -10,6 +10,10 @@ class BaseModel(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+# 注意：Document / DocumentVersion 的衍生資料(corpus_stats 統計、version_validity 生效區間、data_version)
+# 靠 ORM flush 事件維護。Query.update() / delete() 不經 flush：corpus_stats 另以 do_orm_execute 涵蓋，
+# version_validity / data_version 則不會更新；直接以 Core 或原生 SQL 寫入 document / document_version 表更是全部略過。
+# 這類寫入之後必須呼叫 corpus_stats.rebuild() / version_validity.rebuild() / data_version.bump()。
 class Document(db.Model):  # <-- [修改] 不再繼承 BaseModel，改為繼承 db.Model
     __tablename__ = 'document' # <-- [新增] 明確指定表名
     
@@ -31,6 +35,18 @@ class DocumentVersion(BaseModel):
     file_path = db.Column(db.String(500))             # 原檔路徑
     text_hash = db.Column(db.String(64), index=True)  # 全文雜湊，用於比對重複
     rag_doc_id = db.Column(db.String(128), index=True)
+    kb = db.Column(db.String(128), index=True)         # 上傳到的 dataset(空＝預設 dataset)
+    rag_status = db.Column(db.String(32))              # 最近一次得知的 RAGFlow 狀態(上傳 / 對帳時更新)
+    rag_chunk_method = db.Column(db.String(32))
+    rag_chunks = db.Column(db.Integer)
+    # 生效區間 [effective_from, effective_to)，依公布日期排序與 is_active 推導(見 version_validity.py)；
+    # effective_to 為空＝至今仍生效
+    effective_from = db.Column(db.Date)
+    effective_to = db.Column(db.Date)
+
+    __table_args__ = (
+        db.Index("ix_document_version_effective", "effective_from", "effective_to"),
+    )
 
 class Chunk(BaseModel):
     id = db.Column(db.Integer, primary_key=True)
@@ -43,6 +59,7 @@ class Chunk(BaseModel):
     language = db.Column(db.String(10), default='zh-TW')
     hash = db.Column(db.String(64), index=True)
     rag_doc_id = db.Column(db.String(128), index=True)
+    rag_chunk_id = db.Column(db.String(64), index=True)   # RAGFlow 端 chunk id(條文增量更新用)
 
 class QaLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -60,4 +77,98 @@ class UploadLog(db.Model):
     display_name = db.Column(db.String(512), nullable=True)
     rag_doc_id = db.Column(db.String(128), nullable=True)
     rag_status = db.Column(db.String(32), nullable=True)  # NOT_SYNCED / PENDING / SUCCESS / ERROR / ...
-    uploaded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
\ No newline at end of file
+    uploaded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class Blob(db.Model):
+    """內容定址儲存：以 SHA-256 命名、依前綴分片存放，同內容只存一份。"""
+    __tablename__ = "blobs"
+    sha256 = db.Column(db.String(64), primary_key=True)
+    ext = db.Column(db.String(16), nullable=False, default="")   # 首次寫入時的副檔名(.pdf)
+    size = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class StoredFile(db.Model):
+    """原始檔名 → blob 對照；version_id 為引用此 blob 的版本（可空，如直傳 / 孤兒檔）。"""
+    __tablename__ = "stored_files"
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(512), nullable=False)   # 使用者上傳的原始檔名(保留中文)
+    sha256 = db.Column(db.String(64), db.ForeignKey("blobs.sha256"), nullable=False, index=True)
+    version_id = db.Column(db.Integer, db.ForeignKey("document_version.id"), nullable=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class UploadSession(db.Model):
+    """分段續傳工作階段：暫存檔位於 blob store 的 tmp/<id>.part。"""
+    __tablename__ = "upload_sessions"
+    id = db.Column(db.String(32), primary_key=True)           # uuid4().hex
+    filename = db.Column(db.String(512), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    expected_sha256 = db.Column(db.String(64), nullable=True)  # 客戶端可先宣告，finalize 時比對
+    fields = db.Column(db.Text)                                # JSON：/api/docs 的表單欄位
+    status = db.Column(db.String(16), nullable=False, default="OPEN", index=True)  # OPEN / FINALIZING / DONE / ABORTED
+    result = db.Column(db.Text)                                # JSON：finalize 結果（重送 finalize 時直接回）
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+class UploadChunk(db.Model):
+    """已收到的區段 [offset, offset+length)；每段一列，多 worker 並行寫入也不互相覆蓋。"""
+    __tablename__ = "upload_chunks"
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(32), db.ForeignKey("upload_sessions.id"), nullable=False, index=True)
+    offset = db.Column(db.BigInteger, nullable=False)
+    length = db.Column(db.BigInteger, nullable=False)
+
+class Job(db.Model):
+    """長時間背景工作(批次重切分、封存匯入...)：狀態存 DB，任一 worker 都查得到進度、可取消 / 續跑。"""
+    __tablename__ = "jobs"
+    id = db.Column(db.String(32), primary_key=True)            # uuid4().hex
+    kind = db.Column(db.String(32), nullable=False, index=True)
+    status = db.Column(db.String(16), nullable=False, default="PENDING", index=True)
+    # PENDING / RUNNING / CANCELLING / CANCELLED / DONE / FAILED
+    params = db.Column(db.Text)                                # JSON
+    summary = db.Column(db.Text)                               # JSON：執行端自訂的統計
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    heartbeat_at = db.Column(db.DateTime)                      # 執行中定期更新；過久未更新視為中斷
+
+class JobItem(db.Model):
+    """工作中的單一項目；state 由執行端定義(PENDING → ... → DONE / FAILED)，續跑時略過已完成者。"""
+    __tablename__ = "job_items"
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(32), db.ForeignKey("jobs.id"), nullable=False, index=True)
+    key = db.Column(db.String(256), nullable=False)
+    payload = db.Column(db.Text)                               # JSON
+    state = db.Column(db.String(16), nullable=False, default="PENDING", index=True)
+    error = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DataVersion(db.Model):
+    """資料版本計數：相關資料表有寫入時於同一交易 +1(見 data_version.py)，供 ETag / 快取失效使用。"""
+    __tablename__ = "data_versions"
+    name = db.Column(db.String(32), primary_key=True)   # docs / files ...
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class CorpusStatDoc(db.Model):
+    """每份文件目前計入哪一組統計(見 corpus_stats.py)；異動時用來算出舊值 → 新值的差額。"""
+    __tablename__ = "corpus_stat_docs"
+    doc_id = db.Column(db.Integer, primary_key=True)
+    kb = db.Column(db.String(128), nullable=False, default="")
+    department = db.Column(db.String(120), nullable=False, default="")
+    status = db.Column(db.String(32), nullable=False, default="")
+    chunk_method = db.Column(db.String(32), nullable=False, default="")
+    versions = db.Column(db.Integer, nullable=False, default=0)
+    active_versions = db.Column(db.Integer, nullable=False, default=0)
+    chunks = db.Column(db.Integer, nullable=False, default=0)
+
+class CorpusStat(db.Model):
+    """文件庫統計(依 kb / 處室 / RAGFlow 狀態 / chunk_method 分組)，隨寫入增量維護，讀取不需掃描全表。"""
+    __tablename__ = "corpus_stats"
+    kb = db.Column(db.String(128), primary_key=True, default="")
+    department = db.Column(db.String(120), primary_key=True, default="")
+    status = db.Column(db.String(32), primary_key=True, default="")
+    chunk_method = db.Column(db.String(32), primary_key=True, default="")
+    documents = db.Column(db.Integer, nullable=False, default=0)
+    versions = db.Column(db.Integer, nullable=False, default=0)
+    active_versions = db.Column(db.Integer, nullable=False, default=0)
+    chunks = db.Column(db.Integer, nullable=False, default=0)
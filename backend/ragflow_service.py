@@ -1,11 +1,20 @@
 # backend/ragflow_service.py
-import os, re, logging
+from __future__ import annotations  # 型別註記不在 import 時求值,ragflow_sdk 可延遲到第一次使用才載入
+
+import os, re, json, logging
+from functools import lru_cache
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Optional, Dict, Any, IO, Tuple
-from ragflow_sdk import RAGFlow
-import requests
+from typing import List, Optional, Dict, Any, IO, Tuple, TYPE_CHECKING
 import traceback
 
+if TYPE_CHECKING:
+    from ragflow_sdk import RAGFlow
+
+import shared_cache
+from request_logging import count_upstream, with_request_counter
+from tracing import span, traced
+
 log = logging.getLogger("ragflow")
 
 # ─────────────────────────── 環境變數 ───────────────────────────
@@ -14,11 +23,63 @@ RAGFLOW_API_KEY  = os.getenv("RAGFLOW_API_KEY", "")
 RAGFLOW_DATASET  = os.getenv("RAGFLOW_DATASET", os.getenv("RAGFLOW_DATASET_ID", "Regulation"))
 log.info("RAGFLOW_BASE_URL = %s", RAGFLOW_BASE_URL)
 
+# 跨 worker 共用快取的存活秒數(dataset 查詢 / 文件列表)
+DATASET_CACHE_TTL = float(os.getenv("RAGFLOW_DATASET_TTL", "300"))
+LIST_CACHE_TTL    = float(os.getenv("RAGFLOW_LIST_TTL", "15"))
+
+# ─────────────────────────── 共用快取 ───────────────────────────
+def _dataset_dict(ds) -> Dict[str, Any]:
+    d = ds.to_json() if hasattr(ds, "to_json") else dict(ds)
+    return {k: v for k, v in d.items() if not k.startswith("_")}
+
+def _cached_datasets(client: RAGFlow) -> List[Dict[str, Any]]:
+    """client.list_datasets() 的快取版(回傳 dict 清單)。"""
+    return shared_cache.get_or_set(
+        "datasets", "all",
+        lambda: [_dataset_dict(ds) for ds in (client.list_datasets() or [])],
+        DATASET_CACHE_TTL,
+    )
+
+def _docs_cache_key(ds_name: str, keywords: Optional[str], limit: int) -> str:
+    return json.dumps([ds_name, keywords, limit], ensure_ascii=False)
+
+def documents_list_version(keywords: Optional[str] = None, limit: int = 500,
+                           dataset_name: Optional[str] = None) -> Optional[str]:
+    """list_ragflow_documents() 目前快取內容的版本(mirror watermark)；沒有快取時回傳 None。"""
+    ds_name = dataset_name.strip() if dataset_name and len(dataset_name) <= 30 else RAGFLOW_DATASET
+    return shared_cache.watermark("docs", _docs_cache_key(ds_name, keywords, limit))
+
+def datasets_version() -> Optional[str]:
+    """dataset 清單快取的版本；沒有快取時回傳 None。"""
+    return shared_cache.watermark("datasets", "all")
+
+def retrieval_namespace(dataset_id: Optional[str] = None) -> str:
+    """檢索結果快取(retrieval_cache.py)以 dataset 為單位的失效世代；不指定 dataset 為全部共用的世代。"""
+    return f"retrieval:{dataset_id}" if dataset_id else "retrieval"
+
+def invalidate_documents_cache(dataset_id: Optional[str] = None) -> None:
+    """
+    RAGFlow 文件有異動(上傳/刪除/重解析/改 chunking)後呼叫，通知所有 worker。
+    dataset_id 已知時只讓該 dataset 的檢索結果快取失效，否則全部失效。
+    """
+    shared_cache.invalidate("docs")
+    shared_cache.invalidate(retrieval_namespace(dataset_id))
+
+def invalidate_datasets_cache() -> None:
+    shared_cache.invalidate("datasets")
+
 # ─────────────────────────── 工具：檔名清理 / 取值 ───────────────────────────
 _ZW_RE = re.compile(r"[\u200B-\u200F\uFEFF]")
 def clean_name(s: str) -> str:
     return _ZW_RE.sub("", s.replace("\u3000", " ")).strip()
 
+def rag_display_name(title: str, department: Optional[str], ext: str) -> str:
+    """上傳到 RAGFlow 的顯示名稱：<dept>-<title><ext>（有部門才加；副檔名避免重覆）。"""
+    dep = (department or "").strip()
+    base = f"{dep}-{title}" if dep and dep.lower() != "unknown" else title
+    return base if (ext and base.lower().endswith(ext.lower())) else f"{base}{ext}"
+
+@traced("ragflow")
 def resolve_dataset_name(client: RAGFlow, dataset_input: Optional[str]) -> str:
     """
     將輸入的 dataset_input 解析為資料集名稱。
@@ -35,10 +96,10 @@ def resolve_dataset_name(client: RAGFlow, dataset_input: Optional[str]) -> str:
         
     # 嘗試用 ID 查找資料集名稱
     try:
-        datasets = client.list_datasets() or []
+        datasets = _cached_datasets(client)
         for ds in datasets:
-            if getattr(ds, "id", None) == dataset_input:
-                name = getattr(ds, "name", None)
+            if ds.get("id") == dataset_input:
+                name = ds.get("name")
                 if name:
                     log.info(f"Resolved dataset ID {dataset_input} to name: {name}")
                     return name
@@ -93,28 +154,67 @@ def _normalize_chunk_method(label: Optional[str]) -> Optional[str]:
     return aliases.get(key, key)
 
 # ─────────────────────────── 內部：RAGFlow client / dataset ───────────────────────────
+@lru_cache(maxsize=1)
+def _client_class():
+    """RAGFlow 子類別：SDK 的每次 HTTP 呼叫(含 DataSet / Document 方法)都計入當前請求的 upstream_calls 並記錄 span。"""
+    from ragflow_sdk import RAGFlow
+
+    class _InstrumentedRAGFlow(RAGFlow):
+        def post(self, path, json=None, stream=False, files=None):
+            count_upstream()
+            with span("http", f"POST {path}"):
+                return super().post(path, json=json, stream=stream, files=files)
+
+        def get(self, path, params=None, json=None):
+            count_upstream()
+            with span("http", f"GET {path}"):
+                return super().get(path, params=params, json=json)
+
+        def delete(self, path, json):
+            count_upstream()
+            with span("http", f"DELETE {path}"):
+                return super().delete(path, json)
+
+        def put(self, path, json):
+            count_upstream()
+            with span("http", f"PUT {path}"):
+                return super().put(path, json)
+
+    return _InstrumentedRAGFlow
+
 def _client() -> RAGFlow:
     if not RAGFLOW_API_KEY:
         raise RuntimeError("RAGFLOW_API_KEY 未設定")
-    return RAGFlow(api_key=RAGFLOW_API_KEY, base_url=RAGFLOW_BASE_URL)
+    return _client_class()(api_key=RAGFLOW_API_KEY, base_url=RAGFLOW_BASE_URL)
 
+@traced("ragflow")
 def _get_or_create_dataset(client: RAGFlow, name: str):
+    cached = shared_cache.get("datasets", f"name:{name}")
+    if cached:
+        from ragflow_sdk.modules.dataset import DataSet
+        return DataSet(client, dict(cached))
     hits = client.list_datasets(name=name)
     if hits:
-        return hits[0]
-    # 【修改】建立時加入預設 chunk_method
-    return client.create_dataset(
-        name=name, 
-        description="Regulations dataset",
-        chunk_method="laws"  # 預設使用法規文件切分方法
-    )
+        ds = hits[0]
+    else:
+        # 【修改】建立時加入預設 chunk_method
+        ds = client.create_dataset(
+            name=name, 
+            description="Regulations dataset",
+            chunk_method="laws"  # 預設使用法規文件切分方法
+        )
+        invalidate_datasets_cache()
+    shared_cache.put("datasets", f"name:{name}", _dataset_dict(ds), DATASET_CACHE_TTL)
+    return ds
 
+@traced("ragflow")
 def _get_dataset_for(client: RAGFlow, dataset_name: Optional[str]) -> Tuple[Any, str]:
     """依參數或預設名稱取得/建立 dataset。注意：使用資料集名稱而非 ID"""
     ds_name = resolve_dataset_name(client, dataset_name)
     return _get_or_create_dataset(client, ds_name), ds_name
 
 # ─────────────────────────── 【新增】上傳(不解析)for 批量匯入 ───────────────────────────
+@traced("ragflow")
 def upload_file_to_ragflow(
     file_stream: IO[bytes],
     filename: str,
@@ -157,6 +257,7 @@ def upload_file_to_ragflow(
 
     try:
         ds.upload_documents([{"display_name": name, "name": name, "blob": blob}])
+        invalidate_documents_cache(ds.id)
     except Exception as e:
         return {
             "success": False,
@@ -197,6 +298,7 @@ def upload_file_to_ragflow(
     }
 
 # ─────────────────────────── 上傳 + 解析 ───────────────────────────
+@traced("ragflow")
 def upload_and_parse_file(
     file_path: str,
     display_name: Optional[str] = None,
@@ -227,6 +329,7 @@ def upload_and_parse_file(
     try:
         # 以 SDK 目前行為，display_name/name 皆能接受；雙寫提高相容性
         dataset.upload_documents([{"display_name": name, "name": name, "blob": blob}])
+        invalidate_documents_cache(dataset.id)
     except Exception as e:
         return {
             "success": False,
@@ -261,6 +364,7 @@ def upload_and_parse_file(
                         pass
         
         dataset.async_parse_documents(ids)
+        invalidate_documents_cache(dataset.id)
         return {"success": True, "display_name": name, "dataset": ds_name, "parsed_ids": ids}
     except Exception as e:
         return {
@@ -272,6 +376,7 @@ def upload_and_parse_file(
         }
 
 # ─────────────────────────── 查詢狀態 ───────────────────────────
+@traced("ragflow")
 def get_doc_status(display_name: str, dataset_name: Optional[str] = None) -> Dict[str, Any]:
     """
     以 display_name 查詢 RAGFlow 當前狀態。
@@ -314,6 +419,7 @@ def get_doc_status(display_name: str, dataset_name: Optional[str] = None) -> Dic
     }
 
 # ─────────────────────────── 重新觸發解析 ───────────────────────────
+@traced("ragflow")
 def resync_by_display_name(
     display_name: str, 
     dataset_name: Optional[str] = None,
@@ -331,9 +437,11 @@ def resync_by_display_name(
         return {"success": False, "error": "no_valid_ids", "dataset": ds_name}
 
     dataset.async_parse_documents(ids)
+    invalidate_documents_cache(dataset.id)
     return {"success": True, "parsed_ids": ids, "dataset": ds_name}
 
 # ─────────────────────────── 【新增】單檔永久更新 chunking ───────────────────────────
+@traced("ragflow")
 def update_document_chunking_by_display_name(
     display_name: str, 
     chunking_method: str, 
@@ -376,6 +484,7 @@ def update_document_chunking_by_display_name(
         doc_id = getattr(doc, "id", None)
         if reparse and doc_id:
             dataset.async_parse_documents([doc_id])
+        invalidate_documents_cache(dataset.id)
         
         return {
             "success": True, 
@@ -387,6 +496,7 @@ def update_document_chunking_by_display_name(
         return {"success": False, "error": str(e), "dataset": ds_name}
 
 # ─────────────────────────── 【新增】Dataset 預設 chunking ───────────────────────────
+@traced("ragflow")
 def update_dataset_chunking(
     dataset_name: Optional[str], 
     chunking_method: str
@@ -407,11 +517,13 @@ def update_dataset_chunking(
     try:
         cm = _normalize_chunk_method(chunking_method)
         dataset.update({"chunk_method": cm})
+        invalidate_datasets_cache()
         return {"success": True, "dataset": ds_name, "chunk_method": cm}
     except Exception as e:
         return {"success": False, "error": str(e), "dataset": ds_name}
 
 # ─────────────────────────── 列表 ───────────────────────────
+@traced("ragflow")
 def list_ragflow_documents(
     keywords: Optional[str] = None,
     limit: int = 500,
@@ -431,6 +543,15 @@ def list_ragflow_documents(
     
     dataset, ds_name = _get_dataset_for(client, dataset_name)
 
+    cache_key = _docs_cache_key(ds_name, keywords, limit)
+    return shared_cache.get_or_set(
+        "docs", cache_key,
+        lambda: _list_documents_uncached(dataset, ds_name, keywords, limit),
+        LIST_CACHE_TTL,
+    )
+
+@traced("ragflow", "list_documents")
+def _list_documents_uncached(dataset, ds_name: str, keywords: Optional[str], limit: int) -> List[Dict[str, Any]]:
     docs = dataset.list_documents(keywords=keywords) or []
     base = os.getenv("RAGFLOW_UI_BASE", RAGFLOW_BASE_URL)
 
@@ -471,6 +592,7 @@ def _auth_headers():
         headers["Authorization"] = f"Bearer {RAGFLOW_API_KEY}"
     return headers
 
+@traced("ragflow")
 def delete_document(doc_id: str) -> None:
     """
     直接呼叫 RAGFlow 後端 API 以 doc_id 刪除；與 dataset 無關。
@@ -478,11 +600,17 @@ def delete_document(doc_id: str) -> None:
     """
     if not doc_id:
         return
+    import requests
+
     url = f"{RAGFLOW_BASE_URL}/api/documents/{doc_id}"
-    resp = requests.delete(url, headers=_auth_headers(), timeout=30)
+    count_upstream()
+    with span("http", "DELETE /api/documents/<id>"):
+        resp = requests.delete(url, headers=_auth_headers(), timeout=30)
     if resp.status_code not in (200, 204, 404):
         raise RuntimeError(f"RAG delete failed: {resp.status_code} {resp.text}")
+    invalidate_documents_cache()
 
+@traced("ragflow")
 def delete_document_by_id(doc_id: str) -> Dict[str, Any]:
     """
     友善回傳版(供 API 層直接 jsonify)：成功/失敗皆回 dict。
@@ -525,8 +653,10 @@ def _delete_ids_with_dataset(dataset, ids: List[str]) -> None:
             dataset.delete_document(i)
     else:
         raise AttributeError("RAGFlow dataset has no delete_document(s) method")
+    invalidate_documents_cache(getattr(dataset, "id", None))
 
 # ─────────────────────────── 以 display_name 查找 / 刪除 ───────────────────────────
+@traced("ragflow")
 def find_by_display_name_exact(target_name: str, dataset_name: Optional[str] = None) -> Dict[str, Any]:
     """
     只查不刪：以"完全相等"的 name 或 display_name 找出文件。
@@ -549,6 +679,7 @@ def find_by_display_name_exact(target_name: str, dataset_name: Optional[str] = N
         err.update({"success": False, "dataset": ds_name})
         return err
 
+@traced("ragflow")
 def delete_by_display_name(target_name: str, dataset_name: Optional[str] = None) -> Dict[str, Any]:
     """
     用 display_name(或 name)"完全相等"匹配 → 找到 id → 刪除。
@@ -577,6 +708,7 @@ def delete_by_display_name(target_name: str, dataset_name: Optional[str] = None)
         return err
 
 # ─────────────────────────── 【新增】知識庫(Datasets)列表 ───────────────────────────
+@traced("ragflow")
 def list_datasets_info(keyword: Optional[str] = None, limit: int = 200) -> List[Dict[str, Any]]:
     """
     列出所有 Dataset (Knowledge Base)
@@ -590,26 +722,373 @@ def list_datasets_info(keyword: Optional[str] = None, limit: int = 200) -> List[
     """
     try:
         client = _client()
-        datasets = client.list_datasets() or []
+        datasets = _cached_datasets(client)
         results = []
         for ds in datasets[:limit]:
-            ds_name = getattr(ds, "name", "")
+            ds_name = ds.get("name") or ""
             # 如果有 keyword，進行過濾
             if keyword and keyword.lower() not in ds_name.lower():
                 continue
             results.append({
-                "id": getattr(ds, "id", None),
+                "id": ds.get("id"),
                 "name": ds_name,
-                "description": getattr(ds, "description", ""),
+                "description": ds.get("description") or "",
             })
         return results
     except Exception as e:
         log.error(f"list_datasets_info error: {e}")
         return []
 
+@traced("ragflow")
 def get_knowledge_bases() -> List[Dict[str, Any]]:
     """
     相容舊端點：/api/knowledge-bases
     直接呼叫 list_datasets_info()
     """
-    return list_datasets_info()
\ No newline at end of file
+    return list_datasets_info()
+
+
+# ─────────────────────────── 完整列表 / 批次操作(對帳、批次重切分用) ───────────────────────────
+LIST_PAGE_SIZE = int(os.getenv("RAGFLOW_LIST_PAGE_SIZE", "100"))
+
+def _doc_record(d) -> Dict[str, Any]:
+    run = _pick(d, "run", "status", "parsing_status")
+    chunks = _pick(d, "chunk_count", "chunk_num", "chunks") or 0
+    try:
+        chunks = int(chunks)
+    except (TypeError, ValueError):
+        chunks = 0
+    return {
+        "id": _pick(d, "id", "_id", "doc_id"),
+        "name": _pick(d, "name", "display_name", "filename") or "",
+        "run": str(run or "").upper(),
+        "status": _map_run_to_status(run),
+        "enabled": str(_pick(d, "status") or "1") == "1",
+        "chunk_method": _pick(d, "chunk_method"),
+        "parser_config": _pick(d, "parser_config"),
+        "chunks": chunks,
+        "progress": _pick(d, "progress"),
+        "size": _pick(d, "size"),
+        "updated_at": _pick(d, "update_time", "updated_at", "create_time", "created_at"),
+    }
+
+@traced("ragflow")
+def list_all_documents(dataset_name: Optional[str] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    逐頁列出 dataset 內「全部」文件(不經快取、不做關鍵字搜尋)。
+    回傳 (dataset 資訊 {id, name, chunk_method}, [文件 dict])。
+    """
+    client = _client()
+    dataset, ds_name = _get_dataset_for(client, dataset_name)
+    out: List[Dict[str, Any]] = []
+    page = 1
+    while True:
+        batch = dataset.list_documents(page=page, page_size=LIST_PAGE_SIZE) or []
+        out.extend(_doc_record(d) for d in batch)
+        if len(batch) < LIST_PAGE_SIZE:
+            break
+        page += 1
+    info = {"id": dataset.id, "name": ds_name, "chunk_method": getattr(dataset, "chunk_method", None)}
+    return info, out
+
+def _all_docs_key(dataset_name: Optional[str]) -> str:
+    return json.dumps(["all", (dataset_name or "").strip() or RAGFLOW_DATASET], ensure_ascii=False)
+
+def list_all_documents_cached(dataset_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    list_all_documents() 的共用快取版(LIST_CACHE_TTL；文件異動時隨 docs namespace 一起失效)。
+    回傳 {fetched_at, dataset, docs}；fetched_at 為實際向 RAGFlow 取得的時間(UTC ISO)。
+    """
+    def _load():
+        info, docs = list_all_documents(dataset_name)
+        return {"fetched_at": datetime.now(timezone.utc).isoformat(), "dataset": info, "docs": docs}
+
+    return shared_cache.get_or_set("docs", _all_docs_key(dataset_name), _load, LIST_CACHE_TTL)
+
+def all_documents_version(dataset_name: Optional[str] = None) -> Optional[str]:
+    return shared_cache.watermark("docs", _all_docs_key(dataset_name))
+
+# ─────────────────────────── 檢索(retrieval) ───────────────────────────
+def resolve_datasets(names_or_ids: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """
+    dataset 名稱或 ID → [{id, name}](依 dataset 清單快取比對，不會自動建立)。
+    空清單表示預設 dataset；找不到的 raise ValueError。
+    """
+    wanted = [n.strip() for n in (names_or_ids or []) if n and n.strip()] or [RAGFLOW_DATASET]
+    datasets = _cached_datasets(_client())
+    by_id = {d.get("id"): d for d in datasets}
+    by_name = {d.get("name"): d for d in datasets}
+    out, missing = [], []
+    for n in wanted:
+        d = by_id.get(n) or by_name.get(n)
+        if d is None:
+            missing.append(n)
+        elif all(x["id"] != d["id"] for x in out):
+            out.append({"id": d["id"], "name": d.get("name")})
+    if missing:
+        raise ValueError(f"unknown dataset: {', '.join(missing)}")
+    return out
+
+def _chunk_record(c: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": _pick(c, "id", "chunk_id"),
+        "content": _pick(c, "content", "content_with_weight") or "",
+        "document_id": _pick(c, "document_id", "doc_id"),
+        "document_name": _pick(c, "document_keyword", "docnm_kwd", "document_name"),
+        "dataset_id": _pick(c, "dataset_id", "kb_id"),
+        "similarity": _pick(c, "similarity"),
+        "vector_similarity": _pick(c, "vector_similarity"),
+        "term_similarity": _pick(c, "term_similarity"),
+        "highlight": _pick(c, "highlight"),
+        "important_keywords": _pick(c, "important_keywords"),
+    }
+
+@traced("ragflow")
+def retrieve(question: str, dataset_ids: List[str], *,
+             top_k: int = 1024,
+             similarity_threshold: float = 0.2,
+             vector_similarity_weight: float = 0.3,
+             page_size: int = 30,
+             keyword: bool = False,
+             document_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    RAGFlow 檢索 API(POST /retrieval)。回傳 {chunks: [...], total}；上游錯誤 raise RuntimeError。
+    top_k 為參與向量計算的候選數，page_size 為回傳的 chunk 數。
+    """
+    body: Dict[str, Any] = {
+        "question": question,
+        "dataset_ids": list(dataset_ids),
+        "top_k": top_k,
+        "similarity_threshold": similarity_threshold,
+        "vector_similarity_weight": vector_similarity_weight,
+        "page": 1,
+        "page_size": page_size,
+        "keyword": keyword,
+    }
+    if document_ids:
+        body["document_ids"] = list(document_ids)
+    res = _client().post("/retrieval", body).json()
+    if res.get("code") != 0:
+        raise RuntimeError(res.get("message") or f"code {res.get('code')}")
+    data = res.get("data") or {}
+    chunks = [_chunk_record(c) for c in (data.get("chunks") or [])]
+    return {"chunks": chunks, "total": int(data.get("total") or len(chunks))}
+
+def _batches(items: List[Any], size: int):
+    size = max(1, size)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+@traced("ragflow")
+def delete_documents_batched(ids: List[str], dataset_name: Optional[str] = None,
+                             batch_size: int = 50) -> Dict[str, Any]:
+    """依批次刪除(每批一次 API 呼叫)；回傳 {deleted: [...], failed: [{ids, error}]}。"""
+    client = _client()
+    dataset, ds_name = _get_dataset_for(client, dataset_name)
+    deleted, failed = [], []
+    for batch in _batches(list(ids), batch_size):
+        try:
+            _delete_ids_with_dataset(dataset, batch)
+            deleted.extend(batch)
+        except Exception as e:
+            failed.append({"ids": batch, "error": str(e)})
+    if deleted:
+        invalidate_documents_cache(dataset.id)
+    return {"dataset": ds_name, "deleted": deleted, "failed": failed}
+
+@traced("ragflow")
+def parse_documents_batched(ids: List[str], dataset_name: Optional[str] = None,
+                            batch_size: int = 50) -> Dict[str, Any]:
+    """依批次觸發解析(async_parse_documents)；回傳 {triggered: [...], failed: [{ids, error}]}。"""
+    client = _client()
+    dataset, ds_name = _get_dataset_for(client, dataset_name)
+    triggered, failed = [], []
+    for batch in _batches(list(ids), batch_size):
+        try:
+            dataset.async_parse_documents(batch)
+            triggered.extend(batch)
+        except Exception as e:
+            failed.append({"ids": batch, "error": str(e)})
+    if triggered:
+        invalidate_documents_cache(dataset.id)
+    return {"dataset": ds_name, "triggered": triggered, "failed": failed}
+
+@traced("ragflow")
+def update_documents_chunking(ids: List[str], chunking_method: str,
+                              parser_config: Optional[Dict[str, Any]] = None,
+                              dataset_name: Optional[str] = None,
+                              concurrency: int = 4) -> Dict[str, Any]:
+    """
+    以 doc_id 直接更新多份文件的 chunk_method / parser_config(不需先 keyword 搜尋)。
+    RAGFlow 沒有批次更新 API，因此以有上限的執行緒池並行送出。
+    回傳 {updated: [...], failed: [{id, error}]}。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    client = _client()
+    dataset, ds_name = _get_dataset_for(client, dataset_name)
+    cm = _normalize_chunk_method(chunking_method)
+    body: Dict[str, Any] = {"chunk_method": cm}
+    if parser_config is not None:
+        body["parser_config"] = parser_config
+
+    def _one(doc_id: str):
+        try:
+            res = client.put(f"/datasets/{dataset.id}/documents/{doc_id}", body).json()
+            if res.get("code") != 0:
+                return doc_id, res.get("message") or f"code {res.get('code')}"
+            return doc_id, None
+        except Exception as e:
+            return doc_id, str(e)
+
+    updated, failed = [], []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for doc_id, err in pool.map(with_request_counter(_one), list(ids)):
+            if err:
+                failed.append({"id": doc_id, "error": err})
+            else:
+                updated.append(doc_id)
+    if updated:
+        invalidate_documents_cache(dataset.id)
+    return {"dataset": ds_name, "chunk_method": cm, "updated": updated, "failed": failed}
+
+
+@traced("ragflow")
+def update_documents_enabled(states: Dict[str, bool], dataset_name: Optional[str] = None,
+                             concurrency: int = 4) -> Dict[str, Any]:
+    """
+    以 doc_id 啟用 / 停用多份文件({doc_id: enabled})；停用的文件不會出現在檢索結果。
+    同 update_documents_chunking：沒有批次 API，以有上限的執行緒池並行送出。
+    回傳 {dataset, updated: [...], failed: [{id, error}]}。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    client = _client()
+    dataset, ds_name = _get_dataset_for(client, dataset_name)
+
+    def _one(item: Tuple[str, bool]):
+        doc_id, enabled = item
+        try:
+            res = client.put(f"/datasets/{dataset.id}/documents/{doc_id}", {"enabled": 1 if enabled else 0}).json()
+            if res.get("code") != 0:
+                return doc_id, res.get("message") or f"code {res.get('code')}"
+            return doc_id, None
+        except Exception as e:
+            return doc_id, str(e)
+
+    updated, failed = [], []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for doc_id, err in pool.map(with_request_counter(_one), list(states.items())):
+            if err:
+                failed.append({"id": doc_id, "error": err})
+            else:
+                updated.append(doc_id)
+    if updated:
+        invalidate_documents_cache(dataset.id)
+    return {"dataset": ds_name, "updated": updated, "failed": failed}
+
+
+@traced("ragflow")
+def upload_documents_batch(files: List[Tuple[str, bytes]], dataset_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    一次 multipart 請求上傳多個檔案(不解析)；files 為 [(顯示名稱, 內容)]。
+    文件 id 取自上傳回應(不再以 keyword 搜尋)，順序與輸入相同。
+    回傳 {dataset, ids: [...]}；失敗時 raise。
+    """
+    client = _client()
+    dataset, ds_name = _get_dataset_for(client, dataset_name)
+    docs = dataset.upload_documents([{"display_name": clean_name(n), "blob": b} for n, b in files])
+    invalidate_documents_cache(dataset.id)
+    return {"dataset": ds_name, "ids": [getattr(d, "id", None) for d in docs]}
+
+
+# ─────────────────────────── Chunk 層級操作(條文增量更新用) ───────────────────────────
+@traced("ragflow")
+def list_document_chunks(rag_doc_id: str, dataset_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    """逐頁列出單一文件的全部 chunk：[{id, content}]。"""
+    client = _client()
+    dataset, _ds_name = _get_dataset_for(client, dataset_name)
+    out: List[Dict[str, Any]] = []
+    page = 1
+    while True:
+        res = client.get(f"/datasets/{dataset.id}/documents/{rag_doc_id}/chunks",
+                         {"page": page, "page_size": LIST_PAGE_SIZE}).json()
+        if res.get("code") != 0:
+            raise RuntimeError(res.get("message") or f"code {res.get('code')}")
+        batch = (res.get("data") or {}).get("chunks") or []
+        out.extend({"id": c.get("id"), "content": c.get("content") or ""} for c in batch)
+        if len(batch) < LIST_PAGE_SIZE:
+            break
+        page += 1
+    return out
+
+@traced("ragflow")
+def apply_chunk_changes(rag_doc_id: str, *,
+                        add: Optional[List[Dict[str, Any]]] = None,
+                        update: Optional[List[Dict[str, Any]]] = None,
+                        delete: Optional[List[str]] = None,
+                        dataset_name: Optional[str] = None,
+                        concurrency: int = 4) -> Dict[str, Any]:
+    """
+    對單一文件做 chunk 層級的新增 / 修改 / 刪除(只有這些 chunk 會重新 embedding)。
+    - add: [{content, important_keywords?}]；回傳 added 與輸入同順序(失敗者為 None)
+    - update: [{id, content, important_keywords?}]
+    - delete: [chunk_id, ...]，一次 API 呼叫
+    回傳 {added: [...], updated: [...], deleted: [...], failed: [{op, id?, index?, error}]}。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    client = _client()
+    dataset, ds_name = _get_dataset_for(client, dataset_name)
+    base = f"/datasets/{dataset.id}/documents/{rag_doc_id}/chunks"
+    add, update, delete = list(add or []), list(update or []), list(delete or [])
+
+    def _check(res) -> Dict[str, Any]:
+        body = res.json()
+        if body.get("code") != 0:
+            raise RuntimeError(body.get("message") or f"code {body.get('code')}")
+        return body.get("data") or {}
+
+    def _add(item):
+        data = _check(client.post(base, {"content": item["content"],
+                                         "important_keywords": item.get("important_keywords") or []}))
+        return (data.get("chunk") or {}).get("id")
+
+    def _update(item):
+        body = {"content": item["content"]}
+        if "important_keywords" in item:
+            body["important_keywords"] = item["important_keywords"]
+        _check(client.put(f"{base}/{item['id']}", body))
+        return item["id"]
+
+    def _safe(fn, item):
+        try:
+            return fn(item), None
+        except Exception as e:
+            return None, str(e)
+
+    added: List[Optional[str]] = []
+    updated: List[str] = []
+    deleted: List[str] = []
+    failed: List[Dict[str, Any]] = []
+
+    if delete:
+        try:
+            _check(client.delete(base, {"chunk_ids": delete}))
+            deleted = delete
+        except Exception as e:
+            failed.append({"op": "delete", "ids": delete, "error": str(e)})
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for i, (chunk_id, err) in enumerate(pool.map(with_request_counter(lambda it: _safe(_update, it)), update)):
+            if err:
+                failed.append({"op": "update", "id": update[i]["id"], "error": err})
+            else:
+                updated.append(chunk_id)
+        for i, (chunk_id, err) in enumerate(pool.map(with_request_counter(lambda it: _safe(_add, it)), add)):
+            added.append(chunk_id)
+            if err or not chunk_id:
+                failed.append({"op": "add", "index": i, "error": err or "no chunk id returned"})
+
+    invalidate_documents_cache(dataset.id)
+    return {"dataset": ds_name, "added": added, "updated": updated, "deleted": deleted, "failed": failed}
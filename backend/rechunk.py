@@ -0,0 +1,142 @@
+# backend/rechunk.py
+"""
+整個 dataset 的批次重切分(背景工作，見 jobs.py)
+
+原本要逐份呼叫 /api/docs/<id>/ragflow/chunking(每份一次 keyword 搜尋 + 更新 + 觸發解析)。
+這裡改為：
+1. 一次列出 dataset 全部文件，依篩選條件選出目標：
+   - department / date_from / date_to：比對本地文件(與對帳相同的比對規則)後取其 RAGFlow 文件
+   - current_chunk_method：只處理目前是某種切分方法的文件
+   - all：dataset 內全部文件(含本地沒有對應者)
+   預設略過 chunk_method 已是目標值的文件(force=true 時仍處理)
+2. 建立工作，每批 RECHUNK_BATCH 份：並行更新 chunk_method / parser_config(RECHUNK_CONCURRENCY)，
+   再一次觸發該批解析；兩批解析之間至少間隔 RECHUNK_PARSE_INTERVAL 秒，避免 RAGFlow 解析佇列被灌爆
+3. 項目狀態 PENDING → UPDATED → DONE(或 FAILED)；取消後續跑會從 PENDING / UPDATED 接著做
+"""
+import os
+import time
+import logging
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from models import Document
+from ragflow_service import (
+    list_all_documents,
+    update_documents_chunking,
+    parse_documents_batched,
+    _normalize_chunk_method,
+)
+import jobs
+from reconcile import match_local
+
+log = logging.getLogger("rechunk")
+
+KIND = "rechunk"
+RECHUNK_BATCH = int(os.getenv("RECHUNK_BATCH", "20"))
+RECHUNK_CONCURRENCY = int(os.getenv("RECHUNK_CONCURRENCY", "4"))
+RECHUNK_PARSE_INTERVAL = float(os.getenv("RECHUNK_PARSE_INTERVAL", "2"))
+
+
+def _as_list(v) -> List[str]:
+    if v is None or v == "":
+        return []
+    return [x for x in (v if isinstance(v, list) else str(v).split(",")) if str(x).strip()]
+
+
+def select_targets(dataset_name: Optional[str], chunk_method: str, filters: Dict[str, Any],
+                   force: bool = False) -> Dict[str, Any]:
+    """回傳 {dataset, chunk_method, targets: [{id, name, chunk_method, doc_id}], skipped_same}。"""
+    target = _normalize_chunk_method(chunk_method)
+    if not target:
+        raise ValueError("chunk_method is required")
+    ds, upstream = list_all_documents(dataset_name)
+
+    departments = _as_list(filters.get("department"))
+    date_from = filters.get("date_from")
+    date_to = filters.get("date_to")
+    use_local = bool(departments or date_from or date_to) and not filters.get("all")
+
+    if use_local:
+        q = Document.query
+        if departments:
+            q = q.filter(Document.department.in_(departments))
+        if date_from:
+            q = q.filter(Document.date_issued >= date.fromisoformat(date_from))
+        if date_to:
+            q = q.filter(Document.date_issued <= date.fromisoformat(date_to))
+        candidates, seen = [], set()
+        for doc, _v, _names, hits in match_local(upstream, q.order_by(Document.id).all()):
+            for d in hits:
+                if d["id"] not in seen:
+                    seen.add(d["id"])
+                    candidates.append({**d, "doc_id": doc.id})
+    else:
+        candidates = [{**d, "doc_id": None} for d in upstream]
+
+    current = [_normalize_chunk_method(m) for m in _as_list(filters.get("current_chunk_method"))]
+    if current:
+        candidates = [d for d in candidates if _normalize_chunk_method(d.get("chunk_method")) in current]
+
+    skipped_same = 0
+    if not force:
+        before = len(candidates)
+        candidates = [d for d in candidates if _normalize_chunk_method(d.get("chunk_method")) != target]
+        skipped_same = before - len(candidates)
+
+    return {
+        "dataset": ds["name"],
+        "chunk_method": target,
+        "targets": [{"id": d["id"], "name": d["name"], "chunk_method": d.get("chunk_method"),
+                     "doc_id": d.get("doc_id")} for d in candidates],
+        "skipped_same": skipped_same,
+    }
+
+
+def create_job(selection: Dict[str, Any], *, parser_config: Optional[Dict[str, Any]] = None,
+               filters: Optional[Dict[str, Any]] = None, batch_size: Optional[int] = None,
+               parse_interval: Optional[float] = None, concurrency: Optional[int] = None):
+    params = {
+        "dataset": selection["dataset"],
+        "chunk_method": selection["chunk_method"],
+        "parser_config": parser_config,
+        "filters": filters or {},
+        "batch_size": max(1, batch_size or RECHUNK_BATCH),
+        "parse_interval": RECHUNK_PARSE_INTERVAL if parse_interval is None else max(0.0, parse_interval),
+        "concurrency": max(1, min(concurrency or RECHUNK_CONCURRENCY, 16)),
+        "skipped_same": selection["skipped_same"],
+    }
+    items = [(t["id"], {"name": t["name"], "from": t["chunk_method"], "doc_id": t["doc_id"]})
+             for t in selection["targets"]]
+    return jobs.create(KIND, params, items)
+
+
+def run(ctx: jobs.JobContext) -> None:
+    p = ctx.params
+    ds_name, method = p["dataset"], p["chunk_method"]
+    last_parse = 0.0
+    for batch in ctx.batches(("PENDING", "UPDATED"), p["batch_size"]):
+        ready = [it for it in batch if it.state == "UPDATED"]   # 續跑時上次已更新、尚未觸發解析
+        todo = [it for it in batch if it.state == "PENDING"]
+
+        if todo:
+            res = update_documents_chunking([it.key for it in todo], method, p.get("parser_config"),
+                                            dataset_name=ds_name, concurrency=p["concurrency"])
+            by_key = {it.key: it for it in todo}
+            ok = set(res["updated"])
+            ctx.mark([by_key[k].id for k in ok], "UPDATED")
+            for f in res["failed"]:
+                ctx.mark([by_key[f["id"]].id], "FAILED", f"update: {f['error']}")
+            ready.extend(it for it in todo if it.key in ok)
+
+        if ready:
+            wait = p["parse_interval"] - (time.monotonic() - last_parse)
+            if last_parse and wait > 0:
+                ctx.sleep(wait)
+            res = parse_documents_batched([it.key for it in ready], ds_name, batch_size=len(ready))
+            last_parse = time.monotonic()
+            by_key = {it.key: it for it in ready}
+            ctx.mark([by_key[k].id for k in res["triggered"]], "DONE")
+            for f in res["failed"]:
+                ctx.mark([by_key[k].id for k in f["ids"]], "FAILED", f"parse: {f['error']}")
+
+        ctx.heartbeat(batches=ctx.summary.get("batches", 0) + 1)
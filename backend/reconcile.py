@@ -0,0 +1,363 @@
+# backend/reconcile.py
+"""
+本地 DB ⇄ RAGFlow dataset 對帳
+
+一次取得 dataset 全部文件(逐頁列表，不做 keyword 搜尋)，與本地 Document / 最新 DocumentVersion 比對：
+
+  missing_upstream       本地有檔案，RAGFlow 找不到對應文件
+  orphan_upstream        RAGFlow 有文件，本地任何文件的任何版本都對不到
+                         (也包含 /api/ragflow/upload 直傳、本來就不寫本地 DB 的文件)
+  duplicate              同一份本地文件在 RAGFlow 對到多份(保留一份，其餘為多餘)
+  stale_parse            對到的文件解析未完成 / 失敗 / 取消，或完成但 0 個 chunk
+  chunk_method_mismatch  對到的文件 chunk_method 與預期(參數或 dataset 預設)不同
+
+比對順序：DocumentVersion.rag_doc_id → 顯示名稱 <部門>-<標題><副檔名> → 舊格式 <標題><副檔名>
+(名稱比對前先 clean_name + 小寫)。各分類以最新版本判斷；較舊版本對到的 RAGFlow 文件仍屬本地，不算孤兒。
+版本記有 kb(上傳到的 dataset)且不是本次對帳的 dataset 時略過(與 corpus_stats.apply_upstream 相同)；
+沒有 kb 的舊資料照常比對，但只有對帳預設 dataset(RAGFLOW_DATASET)時才會列為 missing_upstream。
+
+修復動作(repair)皆為批次、有並行上限：
+  reupload          missing_upstream → 重新上傳 + 解析(執行緒池，RECONCILE_CONCURRENCY)
+  delete_orphans    orphan_upstream + duplicate 的多餘文件 → 批次刪除(RECONCILE_BATCH 筆一批)；
+                    不可逆，需以 keys 明確指定項目或帶 confirm_delete，否則 raise ReconcileError(dry_run 不受限)
+  reparse           stale_parse → 批次觸發解析
+  fix_chunk_method  chunk_method_mismatch → 並行更新 chunk_method，再批次觸發解析
+"""
+import os
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import or_
+
+from models import db, Document, DocumentVersion
+from request_logging import with_request_counter
+from ragflow_service import (
+    RAGFLOW_DATASET,
+    clean_name,
+    rag_display_name,
+    list_all_documents,
+    upload_and_parse_file,
+    delete_documents_batched,
+    parse_documents_batched,
+    update_documents_chunking,
+    _normalize_chunk_method,
+)
+
+log = logging.getLogger("reconcile")
+
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "4"))
+RECONCILE_BATCH = int(os.getenv("RECONCILE_BATCH", "50"))
+MAX_CONCURRENCY = 16
+
+CATEGORIES = ("missing_upstream", "orphan_upstream", "duplicate", "stale_parse", "chunk_method_mismatch")
+ACTIONS = ("reupload", "delete_orphans", "reparse", "fix_chunk_method")
+
+# RAGFlow run 欄位可能是代碼或文字
+_RUN_CODES = {"0": "UNSTART", "1": "RUNNING", "2": "CANCEL", "3": "DONE", "4": "FAIL"}
+_STALE_RUNS = {"UNSTART", "CANCEL", "FAIL"}
+
+
+class ReconcileError(ValueError):
+    pass
+
+
+def _norm(name: str) -> str:
+    return clean_name(name or "").lower()
+
+
+def _run(doc: Dict[str, Any]) -> str:
+    r = doc.get("run") or ""
+    return _RUN_CODES.get(r, r)
+
+
+def _upstream_view(d: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: d.get(k) for k in ("id", "name", "run", "status", "chunk_method", "chunks", "enabled")}
+
+
+def pick_primary(hits: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """重複時保留：解析完成 > chunk 多 > 其他。"""
+    return max(hits, key=lambda d: (_run(d) == "DONE", d.get("chunks") or 0))
+
+
+def _dataset_names(dataset: Optional[Dict[str, Any]]) -> set:
+    return {n for n in ((dataset or {}).get("id"), (dataset or {}).get("name")) if n}
+
+
+def _latest_versions() -> Dict[int, DocumentVersion]:
+    """每份文件的最新版本(與 /api/docs 相同的排序：date_issued 新→舊)，一次查詢。"""
+    latest: Dict[int, DocumentVersion] = {}
+    rows = DocumentVersion.query.order_by(
+        DocumentVersion.doc_id, DocumentVersion.date_issued.desc(), DocumentVersion.id.desc()
+    ).all()
+    for v in rows:
+        latest.setdefault(v.doc_id, v)
+    return latest
+
+
+# ─────────────────────────── 比對 ───────────────────────────
+def index_upstream(upstream: List[Dict[str, Any]]):
+    by_id = {d["id"]: d for d in upstream if d.get("id")}
+    by_name: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for d in upstream:
+        by_name[_norm(d["name"])].append(d)
+    return by_id, by_name
+
+
+def match_version(doc: Document, v: DocumentVersion, by_id, by_name) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """單一版本的 (候選顯示名稱, 對到的 RAGFlow 文件清單)；by_id / by_name 來自 index_upstream()。"""
+    ext = Path(v.file_path).suffix
+    names = [rag_display_name(doc.title, doc.department, ext)]
+    legacy = doc.title if ext and doc.title.endswith(ext) else f"{doc.title}{ext}"
+    if legacy not in names:
+        names.append(legacy)
+
+    if v.rag_doc_id and v.rag_doc_id in by_id:
+        return names, [by_id[v.rag_doc_id]]
+    seen, hits = set(), []
+    for n in names:
+        for d in by_name.get(_norm(n), []):
+            if d["id"] not in seen:
+                seen.add(d["id"])
+                hits.append(d)
+    return names, hits
+
+
+def match_local(upstream: List[Dict[str, Any]], docs: Optional[Iterable[Document]] = None,
+                dataset: Optional[Dict[str, Any]] = None
+                ) -> Iterator[Tuple[Document, DocumentVersion, List[str], List[Dict[str, Any]]]]:
+    """
+    逐一產生 (文件, 最新版本, 候選顯示名稱, 對到的 RAGFlow 文件清單)；沒有檔案的文件略過。
+    docs 預設為全部本地文件(可傳入已過濾的查詢)。給 dataset({id, name})時略過上傳到其他 dataset 的版本。
+    """
+    by_id, by_name = index_upstream(upstream)
+    latest = _latest_versions()
+    names = _dataset_names(dataset)
+    if docs is None:
+        docs = Document.query.order_by(Document.id).all()
+    for doc in docs:
+        v = latest.get(doc.id)
+        if not v or not v.file_path:
+            continue
+        if names and v.kb and v.kb not in names:
+            continue
+        names, hits = match_version(doc, v, by_id, by_name)
+        yield doc, v, names, hits
+
+
+def _older_version_matches(upstream: List[Dict[str, Any]], latest_ids: set, dataset: Dict[str, Any]) -> set:
+    """非最新版本對到的 RAGFlow 文件 id(舊版的上傳 / 條文增量更新沿用的 rag_doc_id)；略過其他 dataset 的版本。"""
+    by_id, by_name = index_upstream(upstream)
+    names = _dataset_names(dataset)
+    docs = {d.id: d for d in Document.query}
+    out: set = set()
+    for v in DocumentVersion.query.filter(
+            or_(DocumentVersion.rag_doc_id.isnot(None), DocumentVersion.file_path.isnot(None))):
+        if v.id in latest_ids or (v.kb and v.kb not in names):
+            continue
+        if v.rag_doc_id and v.rag_doc_id in by_id:
+            out.add(v.rag_doc_id)
+        elif v.file_path and v.doc_id in docs:
+            out.update(d["id"] for d in match_version(docs[v.doc_id], v, by_id, by_name)[1])
+    return out
+
+
+# ─────────────────────────── 對帳報告 ───────────────────────────
+def build_report(dataset_name: Optional[str] = None,
+                 expected_chunk_method: Optional[str] = None) -> Dict[str, Any]:
+    """需在 app context 內呼叫；順便以取得的列表更新文件庫統計(corpus_stats.apply_upstream)。"""
+    import corpus_stats
+
+    ds, upstream = list_all_documents(dataset_name)
+    corpus_stats.apply_upstream(ds, upstream)
+    expected = _normalize_chunk_method(expected_chunk_method) or ds.get("chunk_method")
+    default = ds.get("name") == RAGFLOW_DATASET
+
+    matched: set = set()
+    items: List[Dict[str, Any]] = []
+    local_total = 0
+    latest_ids: set = set()
+
+    for doc, v, names, hits in match_local(upstream, dataset=ds):
+        if not hits and not v.kb and not default:
+            continue   # 沒有 kb 的舊資料：只在預設 dataset 找不到時才算缺漏，不補傳到其他 dataset
+        local_total += 1
+        latest_ids.add(v.id)
+        local = {
+            "doc_id": doc.id,
+            "version_id": v.id,
+            "title": doc.title,
+            "department": doc.department,
+            "display_name": names[0],
+            "is_active": v.is_active,
+        }
+        if not hits:
+            items.append({
+                "key": f"missing_upstream:{v.id}",
+                "category": "missing_upstream",
+                "local": {**local, "file_exists": os.path.isfile(v.file_path)},
+                "upstream": None,
+            })
+            continue
+
+        matched.update(d["id"] for d in hits)
+        primary = pick_primary(hits)
+        if len(hits) > 1:
+            extra = [d for d in hits if d["id"] != primary["id"]]
+            items.append({
+                "key": f"duplicate:{v.id}",
+                "category": "duplicate",
+                "local": local,
+                "upstream": _upstream_view(primary),
+                "extra": [_upstream_view(d) for d in extra],
+            })
+        run = _run(primary)
+        if run in _STALE_RUNS or (run == "DONE" and not primary.get("chunks")):
+            items.append({
+                "key": f"stale_parse:{primary['id']}",
+                "category": "stale_parse",
+                "reason": "no chunks" if run == "DONE" else run.lower(),
+                "local": local,
+                "upstream": _upstream_view(primary),
+            })
+        if expected and _normalize_chunk_method(primary.get("chunk_method")) != expected:
+            items.append({
+                "key": f"chunk_method_mismatch:{primary['id']}",
+                "category": "chunk_method_mismatch",
+                "expected": expected,
+                "local": local,
+                "upstream": _upstream_view(primary),
+            })
+
+    matched |= _older_version_matches(upstream, latest_ids, ds)
+    for d in upstream:
+        if d["id"] not in matched:
+            items.append({
+                "key": f"orphan_upstream:{d['id']}",
+                "category": "orphan_upstream",
+                "local": None,
+                "upstream": _upstream_view(d),
+            })
+
+    counts = {c: 0 for c in CATEGORIES}
+    for it in items:
+        counts[it["category"]] += 1
+    return {
+        "dataset": ds["name"],
+        "expected_chunk_method": expected,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "local_total": local_total,
+        "upstream_total": len(upstream),
+        "counts": counts,
+        "items": items,
+    }
+
+
+# ─────────────────────────── 修復 ───────────────────────────
+def _select(items: Iterable[Dict[str, Any]], category: str, keys: Optional[set]) -> List[Dict[str, Any]]:
+    return [it for it in items if it["category"] == category and (keys is None or it["key"] in keys)]
+
+
+def _reupload(items: List[Dict[str, Any]], dataset_name: str, expected: Optional[str],
+              concurrency: int) -> Dict[str, Any]:
+    versions = {v.id: v for v in DocumentVersion.query.filter(
+        DocumentVersion.id.in_([it["local"]["version_id"] for it in items])).all()}
+    jobs = []
+    skipped = []
+    for it in items:
+        v = versions.get(it["local"]["version_id"])
+        if not v or not v.file_path or not os.path.isfile(v.file_path):
+            skipped.append({"key": it["key"], "error": "local file missing"})
+            continue
+        jobs.append((it, v.file_path))
+
+    parse_options = {"method": expected} if expected else None
+
+    def _one(job):
+        it, path = job
+        try:
+            return it, upload_and_parse_file(path, title=it["local"]["display_name"],
+                                             dataset_name=dataset_name, parse_options=parse_options)
+        except Exception as e:
+            return it, {"success": False, "error": str(e)}
+
+    results = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for it, res in pool.map(with_request_counter(_one), jobs):
+            ids = res.get("parsed_ids") or []
+            if res.get("success") and len(ids) == 1:
+                v = versions[it["local"]["version_id"]]
+                v.rag_doc_id = ids[0]  # 之後對帳直接以 id 比對，不受顯示名稱變動影響
+            results.append({"key": it["key"], "success": bool(res.get("success")),
+                            "doc_ids": ids, "error": res.get("error")})
+    db.session.commit()
+    ok = [r for r in results if r["success"]]
+    return {"done": len(ok), "failed": [r for r in results if not r["success"]] + skipped, "results": results}
+
+
+def repair(report: Dict[str, Any], actions: Iterable[str], *,
+           keys: Optional[Iterable[str]] = None,
+           dry_run: bool = False,
+           confirm_delete: bool = False,
+           concurrency: Optional[int] = None,
+           batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    依報告執行修復動作。keys 可限定只處理報告中的部分項目(item["key"])。
+    dry_run 只回傳各動作會處理的數量與 id。需在 app context 內呼叫。
+    delete_orphans 會刪掉 RAGFlow 上的文件(可能是直傳、本地沒有紀錄的文件)：
+    沒有 keys 時必須 confirm_delete=True，否則 raise ReconcileError。
+    """
+    actions = [a for a in actions if a in ACTIONS]
+    key_set = set(keys) if keys else None
+    if "delete_orphans" in actions and not dry_run and key_set is None and not confirm_delete:
+        raise ReconcileError("delete_orphans deletes RAGFlow documents that have no local record; "
+                             "pass the item keys to delete or confirm_delete=true (use dry_run to preview)")
+    concurrency = max(1, min(concurrency or RECONCILE_CONCURRENCY, MAX_CONCURRENCY))
+    batch_size = max(1, batch_size or RECONCILE_BATCH)
+    ds_name = report["dataset"]
+    expected = report.get("expected_chunk_method")
+    items = report["items"]
+    out: Dict[str, Any] = {"dataset": ds_name, "dry_run": dry_run, "actions": {}}
+
+    if "delete_orphans" in actions:
+        ids = [it["upstream"]["id"] for it in _select(items, "orphan_upstream", key_set)]
+        for it in _select(items, "duplicate", key_set):
+            ids.extend(d["id"] for d in it["extra"])
+        out["actions"]["delete_orphans"] = (
+            {"planned": len(ids), "ids": ids} if dry_run
+            else delete_documents_batched(ids, ds_name, batch_size) if ids else {"deleted": [], "failed": []}
+        )
+
+    if "fix_chunk_method" in actions:
+        ids = [it["upstream"]["id"] for it in _select(items, "chunk_method_mismatch", key_set)]
+        if dry_run:
+            out["actions"]["fix_chunk_method"] = {"planned": len(ids), "ids": ids, "chunk_method": expected}
+        elif ids and expected:
+            res = update_documents_chunking(ids, expected, dataset_name=ds_name, concurrency=concurrency)
+            res["parse"] = parse_documents_batched(res["updated"], ds_name, batch_size) if res["updated"] else None
+            out["actions"]["fix_chunk_method"] = res
+        else:
+            out["actions"]["fix_chunk_method"] = {"updated": [], "failed": []}
+
+    if "reparse" in actions:
+        # 已由 fix_chunk_method 觸發過解析的不重複觸發
+        already = set((out["actions"].get("fix_chunk_method") or {}).get("updated") or [])
+        ids = [it["upstream"]["id"] for it in _select(items, "stale_parse", key_set)
+               if it["upstream"]["id"] not in already]
+        out["actions"]["reparse"] = (
+            {"planned": len(ids), "ids": ids} if dry_run
+            else parse_documents_batched(ids, ds_name, batch_size) if ids else {"triggered": [], "failed": []}
+        )
+
+    if "reupload" in actions:
+        todo = _select(items, "missing_upstream", key_set)
+        out["actions"]["reupload"] = (
+            {"planned": len(todo), "keys": [it["key"] for it in todo]} if dry_run
+            else _reupload(todo, ds_name, expected, concurrency)
+        )
+
+    log.info("reconcile repair on %s: actions=%s dry_run=%s", ds_name, list(out["actions"]), dry_run)
+    return out
@@ -0,0 +1,10 @@
+# backend/regulation_text.py
+"""
+規章全文的共用樣式(只依賴 re，給條文增量更新 / 切分預覽 / 中繼資料擷取共用，不必為了一條 regex 載入整條上傳流程)
+
+ARTICLE_RE：行首「第X條 / 第X條之Y」(條號可為阿拉伯或中文數字，允許半形 / 全形空白)，group(1) 為條號本身
+"""
+import re
+
+_NUM = r"[0-9０-９一二三四五六七八九十百千零〇兩]+"
+ARTICLE_RE = re.compile(rf"^[ \t　]*(第[ \t　]*{_NUM}[ \t　]*條(?:[ \t　]*之[ \t　]*{_NUM})?)", re.M)
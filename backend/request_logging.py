@@ -0,0 +1,235 @@
+# backend/request_logging.py
+"""
+非阻塞、結構化的 logging
+
+- 所有 handler 改成 QueueHandler → 背景 QueueListener 才真正寫 stdout；請求執行緒只做一次 put_nowait
+- 輸出為 JSON 一行一筆(LOG_FORMAT=text 可改回人類可讀格式)
+- 每個請求：request_id(沿用 X-Request-ID 或自動產生)、route、status、duration_ms、upstream_calls，
+  請求結束時由 "access" logger 輸出一筆紀錄，並在回應帶 X-Request-ID
+- DEBUG 紀錄可抽樣(LOG_DEBUG_SAMPLE=0.1 表示只留 10%)，高流量時不被除錯訊息拖慢
+- fork 之後(server.py 多 worker)子行程換上自己的 queue / handler 並重啟 listener 執行緒
+- upstream_calls 存在 ContextVar：丟進 ThreadPoolExecutor 的工作用 with_request_counter() 包裝後，
+  工作執行緒裡的上游呼叫也算進發起請求
+"""
+import os
+import sys
+import copy
+import json
+import time
+import uuid
+import queue
+import random
+import logging
+import logging.handlers
+import threading
+import functools
+from contextvars import ContextVar
+from typing import Callable, Optional, TypeVar
+
+from flask import Flask, g, has_request_context, request
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_DEBUG_SAMPLE = float(os.getenv("LOG_DEBUG_SAMPLE", "1.0"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# LogRecord 內建屬性；其餘(extra=...)才輸出成 JSON 欄位
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_lock = threading.Lock()
+_queue_handler: Optional[logging.Handler] = None
+_fork_hook_registered = False
+_dropped = 0
+
+T = TypeVar("T")
+
+
+# ─────────────────────────── Formatter / Filter / Handler ───────────────────────────
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k, v in record.__dict__.items():
+            if k not in _RESERVED and not k.startswith("_"):
+                out[k] = v
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """在發出 log 的執行緒上補 request_id / route；DEBUG 依比例抽樣。"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and LOG_DEBUG_SAMPLE < 1.0:
+            if random.random() >= LOG_DEBUG_SAMPLE:
+                return False
+        if has_request_context() and not hasattr(record, "request_id"):
+            record.request_id = getattr(g, "request_id", None)
+            record.route = request.url_rule.rule if request.url_rule else request.path
+        return True
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """在請求執行緒只做最小處理：合併 msg/args、把 traceback 轉成字串，滿了就丟棄(不阻塞)。"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 與標準庫相同先複製：同一筆 record 還會交給其他 handler，不可就地改掉 msg / args / exc_info
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.stack_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+
+# ─────────────────────────── 設定 ───────────────────────────
+def _install_queue() -> None:
+    """建立新的 queue + QueueHandler 換掉 root 上的舊 handler，並啟動寫 stdout 的 listener 執行緒。"""
+    global _listener, _queue_handler
+    with _listener_lock:
+        q: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        qh = _NonBlockingQueueHandler(q)
+        qh.addFilter(RequestContextFilter())
+
+        root = logging.getLogger()
+        for h in list(root.handlers):
+            root.removeHandler(h)
+        root.addHandler(qh)
+        _queue_handler = qh
+
+        out = logging.StreamHandler(sys.stdout)
+        if LOG_FORMAT == "json":
+            out.setFormatter(JsonFormatter())
+        else:
+            out.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        _listener = logging.handlers.QueueListener(q, out, respect_handler_level=False)
+        _listener.start()
+
+
+def _reinit_after_fork() -> None:
+    # 子行程繼承的 queue 可能停在 fork 當下的狀態(內部鎖被其他執行緒持有、殘留父行程未寫出的紀錄)，
+    # listener 執行緒也不會跟過來：整組換新，不沿用父行程的任何物件
+    global _listener_lock
+    _listener_lock = threading.Lock()
+    _install_queue()
+
+
+def configure_logging(debug: bool = False) -> None:
+    global _fork_hook_registered
+    if _listener is not None:
+        _listener.stop()
+    _install_queue()
+    logging.getLogger().setLevel(logging.DEBUG if debug else logging.INFO)
+
+    if hasattr(os, "register_at_fork") and not _fork_hook_registered:
+        os.register_at_fork(after_in_child=_reinit_after_fork)
+        _fork_hook_registered = True
+
+
+def dropped_count() -> int:
+    """佇列滿時被丟棄的紀錄數(正常應為 0)。"""
+    return _dropped
+
+
+def stop_logging() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+# ─────────────────────────── 每個請求的計時 ───────────────────────────
+class _Counter:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+
+_upstream: ContextVar[Optional[_Counter]] = ContextVar("upstream_calls", default=None)
+
+
+def count_upstream(n: int = 1) -> None:
+    """RAGFlow / LLM 等上游呼叫時累加；不在請求內(CLI / 背景工作)則忽略。"""
+    counter = _upstream.get()
+    if counter is not None:
+        with counter.lock:
+            counter.value += n
+
+
+def with_request_counter(fn: Callable[..., T]) -> Callable[..., T]:
+    """
+    包裝要交給 ThreadPoolExecutor 的函式，讓工作執行緒的上游呼叫算進目前請求。
+    只帶計數器，不帶整個 contextvars.copy_context()：工作執行緒若看得到 Flask 的請求 context，
+    會共用請求的 db.session(flask_sqlalchemy 以 app context 區分 session)。
+    """
+    counter = _upstream.get()
+    if counter is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        token = _upstream.set(counter)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _upstream.reset(token)
+
+    return run
+
+
+def upstream_calls() -> int:
+    counter = _upstream.get()
+    return counter.value if counter is not None else 0
+
+
+def current_request_id() -> Optional[str]:
+    return getattr(g, "request_id", None) if has_request_context() else None
+
+
+def init_request_logging(app: Flask) -> None:
+    access_log = logging.getLogger("access")
+
+    @app.before_request
+    def _start_request_timer():
+        rid = (request.headers.get("X-Request-ID") or "").strip()[:64]
+        g.request_id = rid or uuid.uuid4().hex[:16]
+        g.request_started = time.perf_counter()
+        _upstream.set(_Counter())
+
+    @app.after_request
+    def _log_request(response):
+        started = getattr(g, "request_started", None)
+        if started is None:
+            return response
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        response.headers["X-Request-ID"] = g.request_id
+        access_log.info(
+            "%s %s %s %.1fms",
+            request.method, request.path, response.status_code, duration_ms,
+            extra={
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": duration_ms,
+                "upstream_calls": upstream_calls(),
+            },
+        )
+        return response
+
+    @app.teardown_request
+    def _clear_upstream_counter(exc=None):
+        _upstream.set(None)
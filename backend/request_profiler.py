@@ -0,0 +1,227 @@
+# backend/request_profiler.py
+"""
+單一請求的效能剖析(只在正式環境才重現的慢請求用)
+
+觸發(預設關閉；PROFILE_ENABLED=1 才掛 hook，關閉時零成本)：
+- 指定：請求帶 `X-Profile: 1 | cprofile | sample` 或 `?__profile=...`；需通過 tracing.check_debug_access，
+  沒有權限時直接忽略(照常處理請求，不回 403)
+- 抽樣：PROFILE_SAMPLE(0~1，預設 0)，以 cProfile 記錄
+兩種模式：
+- cprofile：cProfile 量測處理請求的 thread(同一時間只剖析一個請求，忙碌時略過)；可下載 pstats 或文字摘要
+- sample  ：背景 thread 每 PROFILE_INTERVAL_MS 毫秒抓一次該 thread 的呼叫堆疊；可下載 collapsed stacks
+  (每行 `a;b;c 次數`，可直接餵給 flamegraph.pl / speedscope)
+結果存於 CACHE_FOLDER/profiles，最多保留 PROFILE_KEEP 份(超過時刪最舊的)；
+回應帶 X-Profile-ID，列表 / 下載見 /api/debug/profiles。
+量測範圍為 view 函式本身；串流回應(direct_passthrough)的本文產生不在範圍內。
+"""
+import os
+import sys
+import time
+import json
+import random
+import marshal
+import pstats
+import cProfile
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from flask import Flask, current_app, g, request
+from werkzeug.exceptions import HTTPException
+
+from tracing import check_debug_access
+
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "0") == "1"
+PROFILE_SAMPLE = float(os.getenv("PROFILE_SAMPLE", "0"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+MODES = ("cprofile", "sample")
+FORMATS = {"cprofile": ("pstats", "text"), "sample": ("collapsed",)}
+
+_cprofile_lock = threading.Lock()   # cProfile 同時只能有一個在量測
+_files_lock = threading.Lock()
+
+
+def profile_dir() -> Path:
+    d = Path(current_app.config["CACHE_FOLDER"]) / "profiles"
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+# ─────────────────────────── 堆疊抽樣 ───────────────────────────
+class _Sampler(threading.Thread):
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or self.thread_id == me:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join(timeout=1)
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+# ─────────────────────────── 開始 / 結束 ───────────────────────────
+def _requested_mode() -> Optional[str]:
+    raw = (request.headers.get("X-Profile") or request.args.get("__profile") or "").strip().lower()
+    if not raw or raw in ("0", "false", "off"):
+        return None
+    try:
+        check_debug_access()
+    except HTTPException:
+        return None
+    return raw if raw in MODES else "cprofile"
+
+
+def _start() -> None:
+    mode = _requested_mode()
+    trigger = "forced"
+    if mode is None:
+        if not (PROFILE_SAMPLE > 0 and random.random() < PROFILE_SAMPLE):
+            return
+        mode, trigger = "cprofile", "sampled"
+
+    if mode == "cprofile":
+        if not _cprofile_lock.acquire(blocking=False):
+            return
+        prof = cProfile.Profile()
+        g.profile = {"mode": mode, "trigger": trigger, "profiler": prof, "started": time.perf_counter()}
+        prof.enable()
+    else:
+        sampler = _Sampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+        g.profile = {"mode": mode, "trigger": trigger, "sampler": sampler, "started": time.perf_counter()}
+        sampler.start()
+
+
+def _stop(state: Dict[str, Any]) -> float:
+    total_ms = (time.perf_counter() - state["started"]) * 1000
+    if state["mode"] == "cprofile":
+        state["profiler"].disable()
+        _cprofile_lock.release()
+    else:
+        state["sampler"].stop()
+    return total_ms
+
+
+def _save(state: Dict[str, Any], status: int, total_ms: float) -> str:
+    pid = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{os.urandom(4).hex()}"
+    d = profile_dir()
+    meta = {
+        "id": pid,
+        "request_id": getattr(g, "request_id", None),
+        "method": request.method,
+        "path": request.path,
+        "query": request.query_string.decode("latin-1"),
+        "status": status,
+        "total_ms": round(total_ms, 3),
+        "mode": state["mode"],
+        "trigger": state["trigger"],
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "formats": list(FORMATS[state["mode"]]),
+    }
+    if state["mode"] == "cprofile":
+        prof = state["profiler"]
+        prof.create_stats()
+        (d / f"{pid}.pstats").write_bytes(marshal.dumps(prof.stats))
+    else:
+        sampler = state["sampler"]
+        meta["samples"] = sampler.samples
+        meta["interval_ms"] = PROFILE_INTERVAL_MS
+        (d / f"{pid}.collapsed").write_text(sampler.collapsed(), encoding="utf-8")
+    (d / f"{pid}.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+    _enforce_retention(d)
+    return pid
+
+
+def _enforce_retention(d: Path) -> None:
+    with _files_lock:
+        metas = sorted(d.glob("*.json"), key=lambda p: p.name)
+        for old in metas[:max(0, len(metas) - PROFILE_KEEP)]:
+            for f in d.glob(f"{old.stem}.*"):
+                f.unlink(missing_ok=True)
+
+
+# ─────────────────────────── 查詢 ───────────────────────────
+def list_profiles(limit: int = 50) -> List[Dict[str, Any]]:
+    out = []
+    for p in sorted(profile_dir().glob("*.json"), key=lambda p: p.name, reverse=True)[:limit]:
+        try:
+            out.append(json.loads(p.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            continue
+    return out
+
+
+def get_meta(pid: str) -> Optional[Dict[str, Any]]:
+    if not pid or "/" in pid or "\\" in pid or pid.startswith("."):
+        return None
+    p = profile_dir() / f"{pid}.json"
+    if not p.is_file():
+        return None
+    return json.loads(p.read_text(encoding="utf-8"))
+
+
+def profile_file(pid: str, fmt: str) -> Path:
+    return profile_dir() / f"{pid}.{'pstats' if fmt == 'text' else fmt}"
+
+
+def text_summary(pid: str, limit: int = 60, sort: str = "cumulative") -> str:
+    """pstats 的文字摘要(前 limit 個函式)。"""
+    import io
+
+    out = io.StringIO()
+    stats = pstats.Stats(str(profile_file(pid, "pstats")), stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def init_profiler(app: Flask) -> None:
+    if not PROFILE_ENABLED:
+        return
+
+    @app.before_request
+    def _maybe_start_profile():
+        _start()
+
+    @app.after_request
+    def _finish_profile(response):
+        state = getattr(g, "profile", None)
+        if state is None:
+            return response
+        g.profile = None
+        total_ms = _stop(state)
+        try:
+            response.headers["X-Profile-ID"] = _save(state, response.status_code, total_ms)
+        except OSError as e:
+            app.logger.warning(f"failed to save profile: {e}")
+        return response
+
+    @app.teardown_request
+    def _abandon_profile(_exc):
+        # 未處理的例外不會經過 after_request：停止量測、釋放鎖，不存檔
+        state = getattr(g, "profile", None)
+        if state is not None:
+            g.profile = None
+            _stop(state)
@@ -0,0 +1,168 @@
+# backend/retrieval_cache.py
+"""
+RAGFlow 檢索代理的結果快取(/api/retrieve)
+
+內部工具常對同一個問題反覆檢索，每次都打到 RAGFlow 做 embedding + 向量搜尋。這裡在行程內快取結果：
+- key：正規化後的問題(NFKC、合併空白、不分大小寫)+ 排序後的 dataset id + 其他檢索參數
+- LRU：最多 RETRIEVAL_CACHE_SIZE 筆，超過時淘汰最久沒用到的；每筆 RETRIEVAL_CACHE_TTL 秒後過期
+- 失效：每個 dataset 一個世代號(shared_cache 的 retrieval:<dataset_id> namespace，所有 worker 共用)，
+  經本後端上傳 / 刪除 / 重解析 / 改 chunking 時由 invalidate_documents_cache(dataset_id) 遞增；
+  快取項目記下寫入時各 dataset 的世代，讀取時世代不同就丟掉(只影響該 dataset，其他 dataset 的結果照常命中)
+- 統計：命中率、過期 / 失效 / 淘汰次數、命中與未命中(上游)延遲 p50 / p95，見 stats()
+"""
+import os
+import re
+import json
+import time
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import shared_cache
+from ragflow_service import retrieve, resolve_datasets, retrieval_namespace
+
+RETRIEVAL_CACHE = os.getenv("RETRIEVAL_CACHE", "1") == "1"
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1000"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))
+_LATENCY_SAMPLES = 500
+
+_entries: "OrderedDict[str, Tuple[float, Tuple[int, ...], Dict[str, Any]]]" = OrderedDict()
+_lock = threading.Lock()
+
+_metrics: Dict[str, int] = {"requests": 0, "hits": 0, "misses": 0, "bypassed": 0, "expired": 0,
+                            "invalidated": 0, "evictions": 0, "errors": 0}
+_hit_ms: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+_miss_ms: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+
+
+def normalize_question(q: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", q or "")).strip().casefold()
+
+
+def _key(question: str, dataset_ids: List[str], params: Dict[str, Any]) -> str:
+    return json.dumps([normalize_question(question), sorted(dataset_ids), sorted(params.items())],
+                      ensure_ascii=False, default=str)
+
+
+def _generations(dataset_ids: List[str]) -> Tuple[int, ...]:
+    return (shared_cache.generation(retrieval_namespace()),
+            *(shared_cache.generation(retrieval_namespace(d)) for d in sorted(dataset_ids)))
+
+
+def _lookup(key: str, gens: Tuple[int, ...]) -> Optional[Dict[str, Any]]:
+    with _lock:
+        hit = _entries.get(key)
+        if hit is None:
+            return None
+        expires, entry_gens, value = hit
+        if expires <= time.time():
+            _metrics["expired"] += 1
+        elif entry_gens != gens:
+            _metrics["invalidated"] += 1
+        else:
+            _entries.move_to_end(key)
+            return value
+        del _entries[key]
+        return None
+
+
+def _store(key: str, gens: Tuple[int, ...], value: Dict[str, Any]) -> None:
+    with _lock:
+        _entries[key] = (time.time() + RETRIEVAL_CACHE_TTL, gens, value)
+        _entries.move_to_end(key)
+        while len(_entries) > max(1, RETRIEVAL_CACHE_SIZE):
+            _entries.popitem(last=False)
+            _metrics["evictions"] += 1
+
+
+def search(question: str, kbs: Optional[List[str]] = None, *,
+           top_k: int = 1024,
+           similarity_threshold: float = 0.2,
+           vector_similarity_weight: float = 0.3,
+           page_size: int = 30,
+           keyword: bool = False,
+           document_ids: Optional[List[str]] = None,
+           use_cache: bool = True) -> Dict[str, Any]:
+    """
+    回傳 {question, datasets: [{id, name}], chunks, total, cached, latency_ms}。
+    kbs 為 dataset 名稱或 ID(空＝預設 dataset)；未知 dataset raise ValueError，上游錯誤 raise RuntimeError。
+    """
+    t0 = time.perf_counter()
+    datasets = resolve_datasets(kbs)
+    ids = [d["id"] for d in datasets]
+    params = {
+        "top_k": top_k,
+        "similarity_threshold": similarity_threshold,
+        "vector_similarity_weight": vector_similarity_weight,
+        "page_size": page_size,
+        "keyword": keyword,
+        "document_ids": sorted(document_ids or []),
+    }
+    use_cache = use_cache and RETRIEVAL_CACHE
+    key = _key(question, ids, params)
+    # 先取世代再打上游：檢索期間若有失效，這筆結果寫入後下一次讀取就會被丟掉
+    gens = _generations(ids) if use_cache else ()
+
+    with _lock:
+        _metrics["requests"] += 1
+        if not use_cache:
+            _metrics["bypassed"] += 1
+    value = _lookup(key, gens) if use_cache else None
+    cached = value is not None
+    if not cached:
+        try:
+            value = retrieve(question, ids, top_k=top_k, similarity_threshold=similarity_threshold,
+                             vector_similarity_weight=vector_similarity_weight, page_size=page_size,
+                             keyword=keyword, document_ids=document_ids)
+        except Exception:
+            with _lock:
+                _metrics["errors"] += 1
+            raise
+        if use_cache:
+            _store(key, gens, value)
+
+    latency_ms = (time.perf_counter() - t0) * 1000
+    with _lock:
+        if cached:
+            _metrics["hits"] += 1
+            _hit_ms.append(latency_ms)
+        else:
+            _metrics["misses"] += 1
+            _miss_ms.append(latency_ms)
+    return {"question": question, "datasets": datasets, **value,
+            "cached": cached, "latency_ms": round(latency_ms, 1)}
+
+
+def clear() -> int:
+    with _lock:
+        n = len(_entries)
+        _entries.clear()
+        return n
+
+
+def _pct(values, p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1)
+
+
+def stats() -> Dict[str, Any]:
+    """本 worker 行程的快取統計(hit_rate = hits / (hits + misses)，不含 bypassed)。"""
+    with _lock:
+        hits, misses = _metrics["hits"], _metrics["misses"]
+        lookups = hits + misses - _metrics["bypassed"]
+        hit_ms, miss_ms = list(_hit_ms), list(_miss_ms)
+        return {
+            "enabled": RETRIEVAL_CACHE,
+            "size": len(_entries),
+            "max_entries": RETRIEVAL_CACHE_SIZE,
+            "ttl_seconds": RETRIEVAL_CACHE_TTL,
+            **_metrics,
+            "hit_rate": round(hits / lookups, 4) if lookups > 0 else None,
+            "latency_ms": {
+                "hit": {"p50": _pct(hit_ms, 0.5), "p95": _pct(hit_ms, 0.95), "samples": len(hit_ms)},
+                "miss": {"p50": _pct(miss_ms, 0.5), "p95": _pct(miss_ms, 0.95), "samples": len(miss_ms)},
+            },
+        }
@@ -1,5 +1,112 @@
+"""
+正式環境啟動入口(waitress)
+
+環境變數：
+  HOST / PORT        監聽位址，預設 127.0.0.1:5000
+  THREADS            每個 worker 的 waitress 執行緒數，預設 8
+  WORKERS            worker 行程數，預設 1（單行程，與舊行為相同）
+                     >1 時採 pre-fork：主行程先載入 app、綁好 socket，再 fork 出 N 個 worker
+                     共用同一個 listening socket；worker 異常結束會自動補上。
+                     不支援 fork 的平台(Windows)會退回單行程。
+  SKIP_DB_INIT=1     啟動時不執行 init_db(建表 / 補欄位)
+  PROFILE_STARTUP=1  輸出啟動耗時報告(見 startup_profile.py)
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+
 from waitress import serve
-from app import app   # 匯入 app.py 裡的 app 物件
+import startup_profile
+from app import app, init_db   # 匯入 app.py 裡的 app 物件(pre-fork 模式下只在主行程載入一次)
+
+log = logging.getLogger("server")
+
+HOST    = os.getenv("HOST", "127.0.0.1")
+PORT    = int(os.getenv("PORT", "5000"))
+THREADS = int(os.getenv("THREADS", "8"))
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+
+def _bind_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(1024)
+    sock.setblocking(False)
+    return sock
+
+
+def _after_fork() -> None:
+    """子行程不可沿用父行程的 DB 連線(連線池在 fork 前可能已開過)。"""
+    from models import db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def _run_worker(sock: socket.socket) -> None:
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    _after_fork()
+    log.info("worker %d serving on %s:%d (threads=%d)", os.getpid(), HOST, PORT, THREADS)
+    try:
+        serve(app, sockets=[sock], threads=THREADS)
+    finally:
+        os._exit(0)
+
+
+def _spawn(sock: socket.socket) -> int:
+    pid = os.fork()
+    if pid == 0:
+        _run_worker(sock)
+    return pid
+
+
+def serve_prefork(workers: int) -> None:
+    sock = _bind_socket()
+    children = {_spawn(sock) for _ in range(workers)}
+    stopping = False
+
+    def _stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    log.info("master %d: %d workers on %s:%d", os.getpid(), workers, HOST, PORT)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if stopping:
+            continue
+        log.warning("worker %d exited (status=%s); respawning", pid, status)
+        time.sleep(0.5)  # 避免啟動即崩潰時瘋狂重生
+        children.add(_spawn(sock))
+    sock.close()
+
 
 if __name__ == "__main__":
-    serve(app, host="127.0.0.1", port=5000, threads=8)
+    if startup_profile.ENABLED:
+        startup_profile.report()
+    # 建表 / 補欄位只在主行程跑一次,worker 不再重複
+    if os.getenv("SKIP_DB_INIT", "0") != "1":
+        init_db()
+    if WORKERS > 1 and hasattr(os, "fork"):
+        serve_prefork(WORKERS)
+    else:
+        if WORKERS > 1:
+            print("WORKERS>1 需要 os.fork(),此平台改用單行程模式", file=sys.stderr)
+        serve(app, host=HOST, port=PORT, threads=THREADS)
@@ -0,0 +1,167 @@
+# backend/shared_cache.py
+"""
+跨行程共用快取(SQLite)
+
+多 worker 模式下各行程的記憶體快取會各自過期、互相不一致，因此：
+- 值存在同一個 SQLite 檔(WAL)，所有 worker 共用
+- 每個 namespace 有一個世代號(generation)；invalidate(ns) 只要把世代 +1，
+  其他 worker 下一次讀取時看到世代變了就會丟掉自己的 L1 —— 等同廣播失效
+- 行程內另有一層 L1 dict，省去重複的 JSON 解碼；讀取前一定先比對世代
+- 值必須可 JSON 序列化
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+log = logging.getLogger("shared_cache")
+
+_DEFAULT_DIR = Path(os.getenv("CACHE_DIR") or Path(__file__).parent / "cache")
+CACHE_PATH = os.getenv("SHARED_CACHE_PATH") or str(_DEFAULT_DIR / "shared_cache.sqlite3")
+ENABLED = os.getenv("SHARED_CACHE", "1") == "1"
+
+_local = threading.local()
+_l1: Dict[Tuple[str, str], Tuple[int, float, Any]] = {}
+_l1_lock = threading.Lock()
+_MISS = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    gen INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (ns, key)
+);
+CREATE TABLE IF NOT EXISTS generations (
+    ns TEXT PRIMARY KEY,
+    gen INTEGER NOT NULL
+);
+"""
+
+
+def _conn() -> sqlite3.Connection:
+    """每個 thread 一條連線；fork 後 pid 改變會重新連線(不可沿用父行程的連線)。"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "pid", None) == os.getpid():
+        return conn
+    Path(CACHE_PATH).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH, timeout=5, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+def _generation(conn: sqlite3.Connection, ns: str) -> int:
+    row = conn.execute("SELECT gen FROM generations WHERE ns = ?", (ns,)).fetchone()
+    return row[0] if row else 0
+
+
+# ─────────────────────────── 對外 API ───────────────────────────
+def get(ns: str, key: str, default: Any = None) -> Any:
+    if not ENABLED:
+        return default
+    try:
+        conn = _conn()
+        gen = _generation(conn, ns)
+        now = time.time()
+        with _l1_lock:
+            hit = _l1.get((ns, key))
+        if hit and hit[0] == gen and hit[1] > now:
+            return hit[2]
+        row = conn.execute(
+            "SELECT value, expires_at FROM entries WHERE ns = ? AND key = ? AND gen = ?",
+            (ns, key, gen),
+        ).fetchone()
+        if not row or row[1] <= now:
+            return default
+        value = json.loads(row[0])
+        with _l1_lock:
+            _l1[(ns, key)] = (gen, row[1], value)
+        return value
+    except sqlite3.Error as e:
+        log.warning("shared cache get failed (%s/%s): %s", ns, key, e)
+        return default
+
+def put(ns: str, key: str, value: Any, ttl: float, gen: Optional[int] = None) -> None:
+    """gen 可指定「開始載入時」的世代：載入期間若已被 invalidate，這筆舊值就不會被讀到。"""
+    if not ENABLED:
+        return
+    try:
+        conn = _conn()
+        if gen is None:
+            gen = _generation(conn, ns)
+        expires = time.time() + ttl
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (ns, key, gen, expires_at, value) VALUES (?, ?, ?, ?, ?)",
+            (ns, key, gen, expires, json.dumps(value, ensure_ascii=False, default=str)),
+        )
+        with _l1_lock:
+            _l1[(ns, key)] = (gen, expires, value)
+    except (sqlite3.Error, TypeError, ValueError) as e:
+        log.warning("shared cache put failed (%s/%s): %s", ns, key, e)
+
+def get_or_set(ns: str, key: str, loader: Callable[[], Any], ttl: float) -> Any:
+    value = get(ns, key, _MISS)
+    if value is _MISS:
+        gen = generation(ns)
+        value = loader()
+        put(ns, key, value, ttl, gen=gen)
+    return value
+
+def watermark(ns: str, key: str) -> Optional[str]:
+    """目前有效快取項目的識別(世代 + 寫入批次)；項目不存在或過期時回傳 None。
+    只讀中繼資料、不解 JSON，可在決定要不要回 304 時便宜地呼叫。"""
+    if not ENABLED:
+        return None
+    try:
+        conn = _conn()
+        gen = _generation(conn, ns)
+        row = conn.execute(
+            "SELECT expires_at FROM entries WHERE ns = ? AND key = ? AND gen = ?",
+            (ns, key, gen),
+        ).fetchone()
+    except sqlite3.Error:
+        return None
+    if not row or row[0] <= time.time():
+        return None
+    return f"{gen}-{row[0]:.6f}"
+
+def generation(ns: str) -> int:
+    if not ENABLED:
+        return 0
+    try:
+        return _generation(_conn(), ns)
+    except sqlite3.Error:
+        return 0
+
+def invalidate(ns: str) -> None:
+    """使整個 namespace 失效：世代 +1（所有 worker 立即看得到），並刪掉舊值。"""
+    if not ENABLED:
+        return
+    try:
+        conn = _conn()
+        conn.execute(
+            "INSERT INTO generations (ns, gen) VALUES (?, 1) "
+            "ON CONFLICT(ns) DO UPDATE SET gen = gen + 1",
+            (ns,),
+        )
+        conn.execute("DELETE FROM entries WHERE ns = ?", (ns,))
+    except sqlite3.Error as e:
+        log.warning("shared cache invalidate failed (%s): %s", ns, e)
+    with _l1_lock:
+        for k in [k for k in _l1 if k[0] == ns]:
+            _l1.pop(k, None)
+
+def purge_expired() -> int:
+    try:
+        cur = _conn().execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        return cur.rowcount
+    except sqlite3.Error:
+        return 0
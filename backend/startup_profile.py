@@ -0,0 +1,83 @@
+# backend/startup_profile.py
+"""
+啟動耗時量測
+
+啟用方式：PROFILE_STARTUP=1 或命令列帶 --profile-startup（python app.py --profile-startup）
+- 必須是 app.py 第一個載入的專案模組，才能記到後續所有 import
+- 啟用時包住 builtins.__import__，記錄每個「第一次載入」模組的累計耗時(含其子模組)；
+  app 建好(app.py 的 create_app 之後)或 report() 時以 stop() 還原，之後的 import 不再經過包裝
+- mark(name) 記錄各階段時間點；report() 輸出階段耗時與最慢的 import
+- STARTUP_BUDGET_MS：超過預算時 report() 回傳 False（--profile-startup 以 exit code 1 結束，可放進 CI）
+未啟用時 mark() 只記一個時間戳，不影響啟動。
+"""
+import os
+import sys
+import time
+import builtins
+import threading
+from typing import Dict, List, Tuple
+
+ENABLED = os.getenv("PROFILE_STARTUP", "0") == "1" or "--profile-startup" in sys.argv
+BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "1500"))
+
+_T0 = time.perf_counter()
+_marks: List[Tuple[str, float]] = []
+_imports: Dict[str, float] = {}
+_local = threading.local()   # 巢狀 import 深度，各執行緒分開計算
+_orig_import = builtins.__import__
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules:
+        return _orig_import(name, globals, locals, fromlist, level)
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    t = time.perf_counter()
+    try:
+        return _orig_import(name, globals, locals, fromlist, level)
+    finally:
+        _local.depth = depth
+        # 只記最外層載入點(子模組已含在父模組的累計時間裡)
+        if depth == 0:
+            _imports[name] = _imports.get(name, 0.0) + (time.perf_counter() - t)
+
+
+if ENABLED:
+    builtins.__import__ = _timed_import
+
+
+def stop() -> None:
+    """還原原本的 builtins.__import__(可重複呼叫)；已記錄的 import 耗時保留給 report()。"""
+    if builtins.__import__ is _timed_import:
+        builtins.__import__ = _orig_import
+
+
+def mark(name: str) -> None:
+    _marks.append((name, time.perf_counter()))
+
+
+def elapsed_ms() -> float:
+    return (time.perf_counter() - _T0) * 1000
+
+
+def report(top: int = 15, stream=None) -> bool:
+    """輸出報告；回傳是否在 STARTUP_BUDGET_MS 預算內。"""
+    stop()
+    stream = stream or sys.stderr
+    total = elapsed_ms()
+    print(f"── startup profile: {total:.1f} ms (budget {BUDGET_MS:.0f} ms) ──", file=stream)
+    prev = _T0
+    for name, t in _marks:
+        print(f"  {name:<28} {(t - prev) * 1000:8.1f} ms", file=stream)
+        prev = t
+    if _imports:
+        print("  slowest top-level imports:", file=stream)
+        for name, secs in sorted(_imports.items(), key=lambda kv: kv[1], reverse=True)[:top]:
+            print(f"    {name:<26} {secs * 1000:8.1f} ms", file=stream)
+    heavy = [m for m in ("openai", "PyPDF2", "ragflow_sdk") if m in sys.modules]
+    if heavy:
+        print(f"  heavy modules loaded at startup: {', '.join(heavy)}", file=stream)
+    ok = total <= BUDGET_MS
+    if not ok:
+        print(f"  !! startup exceeded budget by {total - BUDGET_MS:.1f} ms", file=stream)
+    return ok
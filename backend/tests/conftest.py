@@ -0,0 +1,29 @@
+# backend/tests/conftest.py
+"""後端模組為平面結構(backend/*.py)，測試直接以模組名稱 import。"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def app(tmp_path):
+    """最小 Flask app：暫存 SQLite + 與正式 app 相同的 ORM 事件；測試在 app context 內執行。"""
+    from flask import Flask
+
+    import corpus_stats
+    import data_version
+    from models import db
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'test.db'}"
+    db.init_app(app)
+    data_version.install()
+    corpus_stats.install()
+    with app.app_context():
+        db.create_all()
+        corpus_stats.rebuild()
+        yield app
+        db.session.remove()
@@ -0,0 +1,42 @@
+# backend/tests/test_blob_store.py
+from datetime import date
+
+import blob_store
+from models import db, Document, DocumentVersion, StoredFile
+
+
+def _version(file_path):
+    doc = Document(title="請假規則", department="人事室")
+    db.session.add(doc)
+    db.session.flush()
+    v = DocumentVersion(doc_id=doc.id, date_issued=date(2024, 1, 1), file_path=str(file_path))
+    db.session.add(v)
+    db.session.commit()
+    return v
+
+
+def test_migrate_only_removes_files_inside_upload_folder(app, tmp_path):
+    uploads = tmp_path / "uploads"
+    shared = tmp_path / "shared"
+    uploads.mkdir()
+    shared.mkdir()
+    app.config["UPLOAD_FOLDER"] = str(uploads)
+    inside = uploads / "a.pdf"
+    outside = shared / "b.pdf"
+    inside.write_bytes(b"%PDF inside")
+    outside.write_bytes(b"%PDF outside")
+    v_in, v_out = _version(inside), _version(outside)
+
+    stats = blob_store.migrate_legacy_uploads(dry_run=True)
+    assert stats["kept_outside_upload_folder"] == [str(outside.resolve())]
+    assert db.session.get(DocumentVersion, v_out.id).file_path == str(outside)
+
+    stats = blob_store.migrate_legacy_uploads()
+    assert stats["versions_rewritten"] == 2
+    assert stats["kept_outside_upload_folder"] == [str(outside.resolve())]
+    assert not inside.exists()
+    assert outside.read_bytes() == b"%PDF outside"
+    for v in (v_in, v_out):
+        path = db.session.get(DocumentVersion, v.id).file_path
+        assert blob_store.is_blob_path(path, str(uploads))
+    assert StoredFile.query.count() == 2
@@ -0,0 +1,100 @@
+# backend/tests/test_corpus_stats.py
+from datetime import date
+
+from sqlalchemy import select, update
+
+import corpus_stats
+from models import db, CorpusStat, Document, DocumentVersion
+from ragflow_service import RAGFLOW_DATASET
+
+
+def _snapshot():
+    t = CorpusStat.__table__
+    return sorted(tuple(r) for r in db.session.execute(select(t)).all())
+
+
+def _assert_matches_rebuild():
+    """增量維護的結果必須與全量重建一致。"""
+    incremental = _snapshot()
+    corpus_stats.rebuild()
+    assert incremental == _snapshot()
+
+
+def _add_doc(department="人事室", versions=2, active=True):
+    doc = Document(title="請假規則", department=department)
+    db.session.add(doc)
+    db.session.flush()
+    for i in range(versions):
+        db.session.add(DocumentVersion(doc_id=doc.id, date_issued=date(2020 + i, 1, 1), is_active=active,
+                                       file_path=f"/tmp/v{i}.pdf", rag_doc_id=f"r{i}", rag_chunks=3 + i))
+    db.session.commit()
+    return doc
+
+
+# ─────────────────────────── 增量更新 ───────────────────────────
+def test_insert(app):
+    _add_doc()
+    assert corpus_stats.totals() == {"documents": 1, "versions": 2, "active_versions": 2, "chunks": 4}
+    groups = corpus_stats.summary(["kb", "department", "status"])["groups"]
+    assert [(g["kb"], g["department"], g["status"]) for g in groups] == [(RAGFLOW_DATASET, "人事室", "PENDING")]
+    _assert_matches_rebuild()
+
+
+def test_toggle_is_active(app):
+    doc = _add_doc()
+    v = DocumentVersion.query.filter_by(doc_id=doc.id).order_by(DocumentVersion.id).first()
+    v.is_active = False
+    db.session.commit()
+    assert corpus_stats.totals()["active_versions"] == 1
+    _assert_matches_rebuild()
+
+
+def test_department_change_moves_group(app):
+    doc = _add_doc()
+    doc.department = "教務處"
+    db.session.commit()
+    groups = corpus_stats.summary(["department"])["groups"]
+    assert [(g["department"], g["documents"]) for g in groups] == [("教務處", 1)]
+    _assert_matches_rebuild()
+
+
+def test_delete(app):
+    doc = _add_doc()
+    keep = _add_doc(department="總務處", versions=1)
+    for v in DocumentVersion.query.filter_by(doc_id=doc.id):
+        db.session.delete(v)
+    db.session.delete(doc)
+    db.session.commit()
+    assert corpus_stats.totals() == {"documents": 1, "versions": 1, "active_versions": 1, "chunks": 3}
+    assert [g["department"] for g in corpus_stats.summary(["department"])["groups"]] == [keep.department]
+    _assert_matches_rebuild()
+
+
+# ─────────────────────────── ORM 批次寫入(不經 flush) ───────────────────────────
+def test_query_update(app):
+    doc = _add_doc()
+    other = _add_doc(department="總務處")
+    DocumentVersion.query.filter_by(doc_id=doc.id, is_active=True).update({"is_active": False})
+    db.session.commit()
+    groups = corpus_stats.summary(["department"])["groups"]
+    assert [(g["department"], g["active_versions"]) for g in groups] == [("人事室", 0), (other.department, 2)]
+    _assert_matches_rebuild()
+
+
+def test_session_execute_update_without_where(app):
+    _add_doc()
+    _add_doc(department="總務處", versions=1)
+    db.session.execute(update(DocumentVersion).values(rag_status="done"))
+    db.session.commit()
+    groups = corpus_stats.summary(["status"])["groups"]
+    assert [(g["status"], g["documents"]) for g in groups] == [("DONE", 2)]
+    _assert_matches_rebuild()
+
+
+def test_query_delete(app):
+    doc = _add_doc()
+    DocumentVersion.query.filter_by(doc_id=doc.id).delete(synchronize_session=False)
+    db.session.commit()
+    assert corpus_stats.totals() == {"documents": 1, "versions": 0, "active_versions": 0, "chunks": 0}
+    assert [g["status"] for g in corpus_stats.summary(["status"])["groups"]] == ["NO_FILE"]
+    _assert_matches_rebuild()
@@ -0,0 +1,33 @@
+# backend/tests/test_dashboard.py
+from datetime import date
+
+import dashboard
+from models import db, Document, DocumentVersion
+
+
+def _add(title, kb, rag_doc_id):
+    doc = Document(title=title, department="人事室", date_issued=date(2024, 1, 1))
+    db.session.add(doc)
+    db.session.flush()
+    v = DocumentVersion(doc_id=doc.id, date_issued=date(2024, 1, 1), file_path=f"/tmp/{title}.pdf",
+                        kb=kb, rag_doc_id=rag_doc_id)
+    db.session.add(v)
+    db.session.commit()
+    return v
+
+
+def test_recent_uploads_status_only_for_requested_dataset(app, monkeypatch):
+    dataset = {"id": "ds-a", "name": "A"}
+    docs = [{"id": "a1", "name": "人事室-甲規章.pdf", "status": "DONE", "chunks": 3, "enabled": True}]
+    monkeypatch.setattr(dashboard, "list_all_documents_cached",
+                        lambda kb: {"dataset": dataset, "docs": docs, "fetched_at": "2024-01-01T00:00:00+00:00"})
+    monkeypatch.setattr(dashboard, "_fetch_kbs", lambda: ([dataset], None))
+    in_a = _add("甲規章", "A", "a1")
+    in_b = _add("乙規章", "B", "b1")
+    legacy = _add("丙規章", None, None)
+
+    items = {it["id"]: it for it in dashboard.build("A")["recent_uploads"]["items"]}
+    assert (items[in_a.id]["kb"], items[in_a.id]["rag_status"]) == ("A", "DONE")
+    assert items[in_a.id]["rag_url"]
+    assert (items[in_b.id]["kb"], items[in_b.id]["rag_status"], items[in_b.id]["rag_url"]) == ("B", "UNKNOWN", None)
+    assert (items[legacy.id]["kb"], items[legacy.id]["rag_status"]) == ("A", "NOT_FOUND")
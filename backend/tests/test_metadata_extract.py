@@ -0,0 +1,82 @@
+# backend/tests/test_metadata_extract.py
+import pytest
+
+import llm_gateway
+import metadata_extract
+from metadata_extract import cn_number, find_dates, parse_date
+
+
+# ─────────────────────────── cn_number ───────────────────────────
+@pytest.mark.parametrize("text, expected", [
+    ("112", 112),
+    ("一一二", 112),          # 逐字中文數字
+    ("八九", 89),
+    ("一百一十二", 112),      # 位值中文數字
+    ("八十九", 89),
+    ("十", 10),
+    ("二十", 20),
+    ("兩百", 200),
+    ("三千零五", 3005),
+    ("〇", 0),
+    (" 12 ", 12),
+])
+def test_cn_number(text, expected):
+    assert cn_number(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "  ", "abc", "一x", "十a"])
+def test_cn_number_rejects_non_numbers(text):
+    assert cn_number(text) is None
+
+
+# ─────────────────────────── find_dates / parse_date ───────────────────────────
+@pytest.mark.parametrize("text, expected", [
+    ("民國89年5月10日本校行政會議通過", "2000-05-10"),
+    ("中華民國112年3月8日第123次行政會議修正通過", "2023-03-08"),
+    ("中華民國一一二年三月八日修正", "2023-03-08"),
+    ("一百一十二年十二月三十一日公布", "2023-12-31"),
+    ("民國 １１２ 年 ３ 月 ８ 日", "2023-03-08"),           # 全形數字、夾空白
+    ("112.3.8 修正", "2023-03-08"),
+    ("89/5/10", "2000-05-10"),
+    ("2023-03-08", "2023-03-08"),                           # 四位數年份為西元
+    ("2023年3月8日", "2023-03-08"),
+])
+def test_parse_date(text, expected):
+    assert parse_date(text) == expected
+
+
+@pytest.mark.parametrize("text", ["中華民國112年13月1日", "112.2.30", "沒有日期", ""])
+def test_parse_date_invalid_or_missing(text):
+    assert parse_date(text) is None
+
+
+def test_find_dates_returns_positions_in_order():
+    text = "於112.3.8修正，113年1月2日再修正"
+    assert find_dates(text) == [(1, "2023-03-08"), (11, "2024-01-02")]
+
+
+def test_find_dates_ignores_longer_digit_runs():
+    assert find_dates("電話 02-2345-6789") == []
+
+
+# ─────────────────────────── LLM 額滿 ───────────────────────────
+PAGES = ["學生請假規則\n第一條 本規則依法訂定。"]
+
+
+def test_analyze_propagates_llm_busy(monkeypatch):
+    def _busy(*args, **kwargs):
+        raise llm_gateway.LLMBusy("LLM queue is full")
+
+    monkeypatch.setattr(llm_gateway, "complete", _busy)
+    with pytest.raises(llm_gateway.LLMBusy):
+        metadata_extract.analyze(PAGES, llm="always")
+
+
+def test_analyze_keeps_rule_result_on_llm_error(monkeypatch):
+    def _fail(*args, **kwargs):
+        raise llm_gateway.LLMError("chat: boom; completions: boom")
+
+    monkeypatch.setattr(llm_gateway, "complete", _fail)
+    res = metadata_extract.analyze(PAGES, llm="always")
+    assert res["llm_error"] == "chat: boom; completions: boom"
+    assert res["metadata"]["title"] == "學生請假規則"
@@ -0,0 +1,85 @@
+# backend/tests/test_reconcile.py
+from datetime import date
+
+import pytest
+
+import reconcile
+from models import db, Document, DocumentVersion
+from ragflow_service import RAGFLOW_DATASET
+
+DATASETS = {
+    "A": {"id": "ds-a", "name": "A", "chunk_method": "naive"},
+    "B": {"id": "ds-b", "name": "B", "chunk_method": "naive"},
+    RAGFLOW_DATASET: {"id": "ds-default", "name": RAGFLOW_DATASET, "chunk_method": "naive"},
+}
+
+
+def _upstream(doc_id, name):
+    return {"id": doc_id, "name": name, "run": "DONE", "status": "1", "chunk_method": "naive",
+            "chunks": 3, "enabled": True}
+
+
+@pytest.fixture
+def listings(app, monkeypatch):
+    """{dataset 名稱: RAGFlow 文件列表}；build_report 取列表時以此代替 RAGFlow。"""
+    data = {name: [] for name in DATASETS}
+    monkeypatch.setattr(reconcile, "list_all_documents", lambda name=None: (DATASETS[name], data[name]))
+    return data
+
+
+def _add(title, kb, rag_doc_id=None, date_issued=date(2024, 1, 1)):
+    doc = Document(title=title, department="人事室")
+    db.session.add(doc)
+    db.session.flush()
+    v = DocumentVersion(doc_id=doc.id, date_issued=date_issued, file_path=f"/tmp/{title}.pdf",
+                        kb=kb, rag_doc_id=rag_doc_id)
+    db.session.add(v)
+    db.session.commit()
+    return doc, v
+
+
+def _categories(report):
+    return sorted((it["category"], it["key"]) for it in report["items"])
+
+
+def test_versions_of_other_dataset_are_not_missing(listings):
+    _add("甲規章", "A", "a1")
+    _, vb = _add("乙規章", "B", "b1")
+    listings["A"].append(_upstream("a1", "人事室-甲規章.pdf"))
+
+    report = reconcile.build_report("A")
+    assert report["items"] == []
+    assert report["local_total"] == 1
+
+    report = reconcile.build_report("B")
+    assert _categories(report) == [("missing_upstream", f"missing_upstream:{vb.id}")]
+    plan = reconcile.repair(report, ["reupload"], dry_run=True)["actions"]["reupload"]
+    assert plan == {"planned": 1, "keys": [f"missing_upstream:{vb.id}"]}
+
+
+def test_older_version_of_other_dataset_does_not_claim_upstream(listings):
+    doc, _ = _add("甲規章", "A", "shared", date_issued=date(2020, 1, 1))
+    db.session.add(DocumentVersion(doc_id=doc.id, date_issued=date(2024, 1, 1), file_path="/tmp/甲規章-2.pdf",
+                                   kb="A", rag_doc_id="a2"))
+    db.session.commit()
+    listings["B"].append(_upstream("shared", "其他.pdf"))
+
+    report = reconcile.build_report("B")
+    assert _categories(report) == [("orphan_upstream", "orphan_upstream:shared")]
+
+
+def test_legacy_version_without_kb_is_missing_only_in_default_dataset(listings):
+    _, v = _add("丙規章", None)
+
+    assert reconcile.build_report("B")["items"] == []
+    report = reconcile.build_report(RAGFLOW_DATASET)
+    assert _categories(report) == [("missing_upstream", f"missing_upstream:{v.id}")]
+
+
+def test_legacy_version_without_kb_still_matches_any_dataset(listings):
+    _add("丙規章", None, "b9")
+    listings["B"].append(_upstream("b9", "人事室-丙規章.pdf"))
+
+    report = reconcile.build_report("B")
+    assert report["items"] == []
+    assert report["local_total"] == 1
@@ -0,0 +1,39 @@
+# backend/tests/test_startup_profile.py
+import builtins
+import sys
+import threading
+
+import startup_profile
+
+
+def test_stop_restores_import_and_depth_is_per_thread(monkeypatch):
+    monkeypatch.setattr(builtins, "__import__", startup_profile._timed_import)
+    monkeypatch.setattr(startup_profile, "_imports", {})
+    started, release = threading.Event(), threading.Event()
+
+    def _slow_import(name, *args, **kwargs):
+        if name == "_sp_slow":
+            started.set()
+            release.wait(5)
+            return sys
+        return real(name, *args, **kwargs)
+
+    real = startup_profile._orig_import
+    monkeypatch.setattr(startup_profile, "_orig_import", _slow_import)
+    t = threading.Thread(target=lambda: __import__("_sp_slow"))
+    t.start()
+    started.wait(5)
+    # 另一個執行緒卡在 import 中，本執行緒的 import 仍是最外層，要被記到
+    try:
+        __import__("_sp_not_a_module")
+    except ImportError:
+        pass
+    release.set()
+    t.join(5)
+    assert {"_sp_slow", "_sp_not_a_module"} <= set(startup_profile._imports)
+
+    monkeypatch.setattr(startup_profile, "_orig_import", real)
+    startup_profile.stop()
+    assert builtins.__import__ is real
+    startup_profile.stop()   # 可重複呼叫
+    assert builtins.__import__ is real
@@ -0,0 +1,31 @@
+# backend/tests/test_tracing.py
+import pytest
+from flask import Flask
+from werkzeug.exceptions import Forbidden
+
+import tracing
+
+_app = Flask(__name__)
+
+
+def _check(headers=None, remote_addr="127.0.0.1"):
+    with _app.test_request_context("/api/debug/traces", headers=headers or {},
+                                   environ_base={"REMOTE_ADDR": remote_addr}):
+        tracing.check_debug_access()
+
+
+def test_debug_access_denied_without_token_even_from_localhost(monkeypatch):
+    monkeypatch.setattr(tracing, "DEBUG_TOKEN", "")
+    with pytest.raises(Forbidden):
+        _check()
+    with pytest.raises(Forbidden):
+        _check({"X-Debug-Token": ""}, remote_addr="::1")
+
+
+def test_debug_access_requires_matching_token(monkeypatch):
+    monkeypatch.setattr(tracing, "DEBUG_TOKEN", "s3cret")
+    _check({"X-Debug-Token": "s3cret"}, remote_addr="10.0.0.8")
+    with pytest.raises(Forbidden):
+        _check({"X-Debug-Token": "wrong"})
+    with pytest.raises(Forbidden):
+        _check()
@@ -0,0 +1,43 @@
+# backend/tests/test_upload_sessions.py
+import hashlib
+import io
+
+import pytest
+
+import upload_sessions
+from upload_sessions import UploadError
+
+
+@pytest.fixture
+def sess(app, tmp_path):
+    app.config["UPLOAD_FOLDER"] = str(tmp_path / "uploads")
+    return upload_sessions.create_session("a.pdf", 8, chunk_size=4)
+
+
+def _put(sess, offset, data):
+    return upload_sessions.write_chunk(sess, offset, io.BytesIO(data), len(data))
+
+
+def _digest(sess):
+    with upload_sessions._lock_for(sess.id):
+        hasher, _pos = upload_sessions._advance_hash(sess, sess.total_size)
+    return hasher.hexdigest()
+
+
+def test_resending_same_chunk_is_idempotent(sess):
+    _put(sess, 0, b"abcd")
+    _put(sess, 4, b"efgh")
+    res = _put(sess, 0, b"abcd")
+    assert res["complete"] and res["received_bytes"] == 8
+    assert _digest(sess) == hashlib.sha256(b"abcdefgh").hexdigest()
+
+
+def test_rewriting_received_range_with_other_bytes_is_rejected(sess):
+    _put(sess, 0, b"abcd")
+    with pytest.raises(UploadError) as e:
+        _put(sess, 2, b"XXef")
+    assert e.value.status == 409
+    _put(sess, 2, b"cdef")   # 重疊部分相同、後半是新資料
+    _put(sess, 6, b"gh")
+    assert upload_sessions.temp_path(sess.id).read_bytes() == b"abcdefgh"
+    assert _digest(sess) == hashlib.sha256(b"abcdefgh").hexdigest()
@@ -0,0 +1,87 @@
+# backend/tests/test_version_update.py
+from version_update import PREAMBLE, adopt_chunk_ids, diff_sections, section_hash, split_sections
+
+
+def _refs(sections):
+    return [s["ref"] for s in sections]
+
+
+# ─────────────────────────── split_sections ───────────────────────────
+def test_split_sections_preamble_and_articles():
+    text = "某某辦法\n中華民國一百年公布\n第一條 本辦法依法訂定。\n第二條 用詞定義如下。\n第二條之一 補充規定。\n"
+    sections = split_sections(text)
+    assert _refs(sections) == [PREAMBLE, "第一條", "第二條", "第二條之一"]
+    assert sections[0]["content"] == "某某辦法\n中華民國一百年公布"
+    assert sections[1]["content"] == "第一條 本辦法依法訂定。"
+    assert all(s["hash"] == section_hash(s["content"]) for s in sections)
+
+
+def test_split_sections_normalizes_spacing_in_ref():
+    sections = split_sections("第 3 條 全形空白　也可以\n　第　十　條 縮排的條號\n")
+    assert _refs(sections) == ["第3條", "第十條"]
+
+
+def test_split_sections_only_matches_line_start():
+    sections = split_sections("第一條 依第二條規定辦理。\n第二條 內容。")
+    assert _refs(sections) == ["第一條", "第二條"]
+    assert sections[0]["content"] == "第一條 依第二條規定辦理。"
+
+
+def test_split_sections_repeated_ref_gets_suffix():
+    sections = split_sections("第一條 本文。\n第二條 本文。\n附表\n第一條 附表引用。\n")
+    assert _refs(sections) == ["第一條", "第二條", "第一條#2"]
+
+
+def test_split_sections_without_articles_is_single_preamble():
+    sections = split_sections("沒有條文結構的公告\f第二頁")
+    assert _refs(sections) == [PREAMBLE]
+    assert sections[0]["content"] == "沒有條文結構的公告\n第二頁"
+
+
+def test_split_sections_empty():
+    assert split_sections("") == []
+    assert split_sections(None) == []
+
+
+# ─────────────────────────── diff_sections ───────────────────────────
+def test_diff_sections_classifies_changes():
+    old = split_sections("第一條 甲。\n第二條 乙。\n第三條 丙。")
+    new = split_sections("第一條 甲。\n第二條 乙修正。\n第四條 丁。")
+    assert diff_sections(old, new) == {
+        "added": ["第四條"],
+        "changed": ["第二條"],
+        "removed": ["第三條"],
+        "unchanged": ["第一條"],
+    }
+
+
+def test_diff_sections_ignores_whitespace_only_changes():
+    old = split_sections("第一條 本辦法\n依法訂定。")
+    new = split_sections("第一條  本辦法依法\n\n訂定。")
+    assert diff_sections(old, new)["unchanged"] == ["第一條"]
+
+
+# ─────────────────────────── adopt_chunk_ids ───────────────────────────
+def test_adopt_chunk_ids_matches_by_content():
+    sections = split_sections("前言文字\n第一條 甲。\n第二條 乙。")
+    upstream = [
+        {"id": "c2", "content": "第二條\n乙。"},
+        {"id": "c0", "content": "前言文字"},
+        {"id": "c1", "content": "第一條 甲。"},
+    ]
+    assert adopt_chunk_ids(sections, upstream) == {PREAMBLE: "c0", "第一條": "c1", "第二條": "c2"}
+
+
+def test_adopt_chunk_ids_skips_merged_or_missing_chunks():
+    sections = split_sections("第一條 甲。\n第二條 乙。\n第三條 丙。")
+    upstream = [
+        {"id": "m", "content": "第一條 甲。\n第二條 乙。"},   # 切分方法把兩條合成一個 chunk
+        {"id": None, "content": "第三條 丙。"},
+    ]
+    assert adopt_chunk_ids(sections, upstream) == {}
+
+
+def test_adopt_chunk_ids_each_chunk_claimed_once():
+    sections = split_sections("第一條 相同內容。\n第一條 相同內容。")
+    upstream = [{"id": "a", "content": "第一條 相同內容。"}, {"id": "b", "content": "第一條相同內容。"}]
+    assert adopt_chunk_ids(sections, upstream) == {"第一條": "a", "第一條#2": "b"}
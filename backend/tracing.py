@@ -0,0 +1,239 @@
+# backend/tracing.py
+"""
+輕量的每請求 span 追蹤
+
+- 抽樣：TRACE_SAMPLE(0~1，預設 0 = 關閉)；請求帶 `X-Trace: 1` 可強制追蹤，
+  但需通過 check_debug_access(與 X-Profile 相同，沒有權限時直接忽略)；TRACE_ALLOW_FORCE=0 可整個關掉
+- 被追蹤的請求：
+  * 回應帶 Server-Timing，依類別彙總(db / ragflow / http / pdf / llm / total)
+  * 完整 span 清單保留在記憶體(最近 TRACE_KEEP 筆，預設 200)，
+    可由 GET /api/debug/traces/<request-id> 取回 JSON(需 debug 權限：X-Debug-Token，見 check_debug_access)；
+    存放在處理該請求的 worker 行程內 —— 多 worker(pre-fork)時查詢可能落到別的 worker 而 404，
+    回應的 X-Trace-Worker 標出是哪個行程
+- 來源：SQLAlchemy cursor 事件(每條 SQL)、ragflow_service 函式(@traced)、SDK HTTP 呼叫、PDF 解析、LLM 呼叫
+- 未被抽中的請求 span() 只做一次 has_request_context + getattr，幾乎零成本
+"""
+import os
+import hmac
+import time
+import random
+import threading
+import functools
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import Flask, g, has_request_context, request, abort
+from werkzeug.exceptions import HTTPException
+
+TRACE_SAMPLE = float(os.getenv("TRACE_SAMPLE", "0"))
+TRACE_ALLOW_FORCE = os.getenv("TRACE_ALLOW_FORCE", "1") == "1"
+TRACE_KEEP = int(os.getenv("TRACE_KEEP", "200"))
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")   # 未設定時 debug 端點與強制追蹤 / 剖析全部關閉
+
+# Server-Timing 輸出順序
+_CATEGORIES = ("db", "ragflow", "http", "pdf", "llm")
+
+_store: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_store_lock = threading.Lock()
+_sql_hooks_installed = False
+
+
+class Trace:
+    __slots__ = ("request_id", "started", "spans", "lock")
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    def add(self, cat: str, name: str, start: float, end: float, meta: Optional[Dict[str, Any]] = None) -> None:
+        item = {
+            "cat": cat,
+            "name": name,
+            "start_ms": round((start - self.started) * 1000, 3),
+            "dur_ms": round((end - start) * 1000, 3),
+        }
+        if meta:
+            item["meta"] = meta
+        with self.lock:
+            self.spans.append(item)
+
+    def totals(self) -> Dict[str, Dict[str, float]]:
+        """各類別的實際經過時間：巢狀 / 並行的 span 先合併區間，避免重複計算。"""
+        by_cat: Dict[str, List[Tuple[float, float]]] = {}
+        with self.lock:
+            for s in self.spans:
+                by_cat.setdefault(s["cat"], []).append((s["start_ms"], s["start_ms"] + s["dur_ms"]))
+        out: Dict[str, Dict[str, float]] = {}
+        for cat, intervals in by_cat.items():
+            intervals.sort()
+            wall, cur_start, cur_end = 0.0, intervals[0][0], intervals[0][1]
+            for start, end in intervals[1:]:
+                if start > cur_end:
+                    wall += cur_end - cur_start
+                    cur_start, cur_end = start, end
+                else:
+                    cur_end = max(cur_end, end)
+            wall += cur_end - cur_start
+            out[cat] = {"dur_ms": wall, "count": len(intervals)}
+        return out
+
+
+def current_trace() -> Optional[Trace]:
+    if not has_request_context():
+        return None
+    return getattr(g, "trace", None)
+
+
+@contextmanager
+def span(cat: str, name: str, **meta: Any):
+    """記錄一段耗時；請求未被抽樣時不做任何事。"""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(cat, name, start, time.perf_counter(), meta or None)
+
+
+def traced(cat: str, name: Optional[str] = None):
+    """函式層級的 span 裝飾器，例：@traced("ragflow")。"""
+
+    def deco(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = current_trace()
+            if trace is None:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                trace.add(cat, label, start, time.perf_counter())
+
+        return wrapper
+
+    return deco
+
+
+# ─────────────────────────── SQLAlchemy ───────────────────────────
+def _install_sql_hooks() -> None:
+    """Engine 層級的事件(全域一次)；create_app 重複呼叫時不可重複註冊。"""
+    global _sql_hooks_installed
+    if _sql_hooks_installed:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if current_trace() is not None:
+            conn.info.setdefault("_trace_start", []).append(time.perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        trace = current_trace()
+        stack = conn.info.get("_trace_start")
+        if trace is None or not stack:
+            return
+        start = stack.pop()
+        trace.add("db", statement.split(None, 1)[0].upper() if statement else "SQL",
+                  start, time.perf_counter(), {"sql": " ".join(statement.split())[:300]})
+
+    _sql_hooks_installed = True
+
+
+# ─────────────────────────── 輸出 ───────────────────────────
+def server_timing(trace: Trace, total_ms: float) -> str:
+    totals = trace.totals()
+    parts = []
+    for cat in _CATEGORIES:
+        if cat in totals:
+            t = totals[cat]
+            parts.append(f'{cat};dur={t["dur_ms"]:.1f};desc="{cat} x{t["count"]}"')
+    parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+def _remember(trace: Trace, method: str, path: str, status: int, total_ms: float) -> None:
+    if TRACE_KEEP <= 0:
+        return
+    with trace.lock:
+        spans = list(trace.spans)
+    record = {
+        "request_id": trace.request_id,
+        "worker_pid": os.getpid(),
+        "method": method,
+        "path": path,
+        "status": status,
+        "total_ms": round(total_ms, 3),
+        "totals": {k: {"dur_ms": round(v["dur_ms"], 3), "count": v["count"]}
+                   for k, v in trace.totals().items()},
+        "spans": sorted(spans, key=lambda s: s["start_ms"]),
+    }
+    with _store_lock:
+        _store[trace.request_id] = record
+        _store.move_to_end(trace.request_id)
+        while len(_store) > TRACE_KEEP:
+            _store.popitem(last=False)
+
+
+def get_trace(request_id: str) -> Optional[Dict[str, Any]]:
+    with _store_lock:
+        return _store.get(request_id)
+
+
+def recent_traces(limit: int = 50) -> List[Dict[str, Any]]:
+    with _store_lock:
+        items = list(_store.values())[-limit:]
+    return [{k: r[k] for k in ("request_id", "worker_pid", "method", "path", "status", "total_ms")}
+            for r in reversed(items)]
+
+
+def check_debug_access() -> None:
+    """
+    debug 端點 / 強制追蹤 / 強制剖析：需帶與 DEBUG_TOKEN 相同的 X-Debug-Token；未設定 DEBUG_TOKEN 時一律拒絕。
+    不看 remote_addr：經本機反向代理時所有連線都是 127.0.0.1。
+    """
+    token = request.headers.get("X-Debug-Token") or ""
+    if not DEBUG_TOKEN or not hmac.compare_digest(token.encode(), DEBUG_TOKEN.encode()):
+        abort(403)
+
+
+def init_tracing(app: Flask) -> None:
+    _install_sql_hooks()
+
+    def _force_allowed() -> bool:
+        if not (TRACE_ALLOW_FORCE and request.headers.get("X-Trace") == "1"):
+            return False
+        try:
+            check_debug_access()
+        except HTTPException:
+            return False
+        return True
+
+    @app.before_request
+    def _maybe_start_trace():
+        if _force_allowed() or (TRACE_SAMPLE > 0 and random.random() < TRACE_SAMPLE):
+            g.trace = Trace(getattr(g, "request_id", None) or os.urandom(8).hex())
+
+    @app.after_request
+    def _finish_trace(response):
+        trace = getattr(g, "trace", None)
+        if trace is None:
+            return response
+        total_ms = (time.perf_counter() - trace.started) * 1000
+        response.headers["Server-Timing"] = server_timing(trace, total_ms)
+        response.headers["X-Trace-ID"] = trace.request_id
+        response.headers["X-Trace-Worker"] = str(os.getpid())
+        response.headers.setdefault("Timing-Allow-Origin", "*")  # 前端跨來源時 DevTools 才看得到
+        _remember(trace, request.method, request.path, response.status_code, total_ms)
+        g.trace = None
+        return response
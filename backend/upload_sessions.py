@@ -0,0 +1,280 @@
+# backend/upload_sessions.py
+"""
+分段續傳(resumable chunked upload)
+
+流程：建立 session → PUT 各段(可並行、可亂序、可重送) → 查詢進度 → finalize
+- 各段直接寫入 blob store 的 tmp/<session>.part（預先配置成最終大小，依 offset 寫入）
+- 已收區段一段一列存在 upload_chunks，重啟 / 多 worker 都能正確回報進度
+- SHA-256 逐步計算：前綴連續的部分一接上就餵進 hasher（讀回剛寫入的資料，通常命中 page cache），
+  finalize 時只需補算尚未計算的尾段；hasher 遺失(例如換了 worker)則從頭重算
+- finalize 後暫存檔直接 os.replace 進 blob store，交給一般的上傳流程建檔
+- 多 worker：finalize 先以條件式 UPDATE(status OPEN → FINALIZING)在 DB 搶下 session，同時間只會有一個請求建檔；
+  _HASHERS / _LOCKS 只是單一行程內的加速與互斥，不跨 worker(換了 worker 時 hasher 從頭重算，正確性不依賴它們)
+"""
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import IO, Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+
+from models import db, UploadSession, UploadChunk, Blob
+import blob_store
+
+log = logging.getLogger("uploads")
+
+DEFAULT_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))    # 8MB
+MAX_UPLOAD_SIZE    = int(os.getenv("MAX_RESUMABLE_SIZE", str(1024 * 1024 * 1024)))  # 1GB
+SESSION_TTL_HOURS  = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+_IO_BUFSIZE = 1024 * 1024
+ACTIVE_STATUSES = ("OPEN", "FINALIZING")   # 暫存檔仍在使用中的狀態
+
+# session_id -> [hasher, hashed_upto]；只是加速用的行程內狀態(每個 worker 各自一份，不跨行程)
+_HASHERS: Dict[str, List[Any]] = {}
+_LOCKS: Dict[str, threading.Lock] = {}
+_LOCKS_GUARD = threading.Lock()
+
+
+class UploadError(ValueError):
+    """客戶端可修正的錯誤(offset 超界、長度不符...)，API 層轉成 4xx。"""
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _lock_for(session_id: str) -> threading.Lock:
+    with _LOCKS_GUARD:
+        return _LOCKS.setdefault(session_id, threading.Lock())
+
+def _forget(session_id: str) -> None:
+    with _LOCKS_GUARD:
+        _LOCKS.pop(session_id, None)
+    _HASHERS.pop(session_id, None)
+
+def temp_path(session_id: str) -> Path:
+    return blob_store.blob_root() / "tmp" / f"{session_id}.part"
+
+
+# ─────────────────────────── 區段計算 ───────────────────────────
+def received_ranges(session_id: str) -> List[Tuple[int, int]]:
+    """回傳合併後的已收區段 [(start, end), ...]，end 不含。"""
+    rows = (
+        db.session.query(UploadChunk.offset, UploadChunk.length)
+        .filter(UploadChunk.session_id == session_id)
+        .order_by(UploadChunk.offset)
+        .all()
+    )
+    merged: List[Tuple[int, int]] = []
+    for off, length in rows:
+        end = off + length
+        if merged and off <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((off, end))
+    return merged
+
+def _missing(ranges: List[Tuple[int, int]], total: int) -> List[Tuple[int, int]]:
+    gaps, pos = [], 0
+    for start, end in ranges:
+        if start > pos:
+            gaps.append((pos, start))
+        pos = max(pos, end)
+    if pos < total:
+        gaps.append((pos, total))
+    return gaps
+
+def _contiguous_end(ranges: List[Tuple[int, int]]) -> int:
+    return ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+
+def _overlaps(ranges: List[Tuple[int, int]], start: int, end: int) -> List[Tuple[int, int]]:
+    return [(max(a, start), min(b, end)) for a, b in ranges if a < end and b > start]
+
+def _advance_hash(sess: UploadSession, upto: int) -> Tuple[Any, int]:
+    """把 hasher 推進到 upto（呼叫端需持有該 session 的鎖）。"""
+    state = _HASHERS.get(sess.id)
+    if state is None:
+        state = [hashlib.sha256(), 0]
+        _HASHERS[sess.id] = state
+    hasher, pos = state
+    if upto > pos:
+        with open(temp_path(sess.id), "rb") as fh:
+            fh.seek(pos)
+            remaining = upto - pos
+            while remaining > 0:
+                block = fh.read(min(_IO_BUFSIZE, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+                pos += len(block)
+        state[1] = pos
+    return hasher, pos
+
+
+# ─────────────────────────── 對外操作 ───────────────────────────
+def create_session(filename: str, total_size: int, *, chunk_size: Optional[int] = None,
+                   expected_sha256: Optional[str] = None,
+                   fields: Optional[Dict[str, Any]] = None) -> UploadSession:
+    if total_size <= 0:
+        raise UploadError("size must be > 0")
+    if total_size > MAX_UPLOAD_SIZE:
+        raise UploadError(f"size exceeds limit ({MAX_UPLOAD_SIZE} bytes)", 413)
+
+    expire_stale_sessions()
+
+    sess = UploadSession(
+        id=uuid.uuid4().hex,
+        filename=filename,
+        total_size=total_size,
+        chunk_size=int(chunk_size or DEFAULT_CHUNK_SIZE),
+        expected_sha256=(expected_sha256 or "").lower() or None,
+        fields=json.dumps(fields or {}, ensure_ascii=False),
+        status="OPEN",
+    )
+    tmp = temp_path(sess.id)
+    tmp.parent.mkdir(parents=True, exist_ok=True)
+    with open(tmp, "wb") as fh:
+        fh.truncate(total_size)  # 預先配置，並行的 PUT 各自依 offset 寫入
+    db.session.add(sess)
+    db.session.commit()
+    return sess
+
+def write_chunk(sess: UploadSession, offset: int, stream: IO[bytes], length: int) -> Dict[str, Any]:
+    """
+    把一段資料寫到 offset；length 須等於實際讀到的位元組數，否則此段不記錄。
+    與已收區段重疊的部分必須與檔案內容相同(重送同一段)，否則 409：已收的資料可能已餵進任一 worker 的 hasher，
+    改寫會讓 finalize 記下與內容不符的 sha256。
+    """
+    if sess.status != "OPEN":
+        raise UploadError(f"session is {sess.status}", 409)
+    if offset < 0 or length <= 0 or offset + length > sess.total_size:
+        raise UploadError(f"chunk [{offset}, {offset + length}) outside file size {sess.total_size}", 416)
+
+    received = _overlaps(received_ranges(sess.id), offset, offset + length)
+    written = 0
+    with open(temp_path(sess.id), "r+b") as fh:
+        while written < length:
+            block = stream.read(min(_IO_BUFSIZE, length - written))
+            if not block:
+                break
+            pos = offset + written
+            for start, end in _overlaps(received, pos, pos + len(block)):
+                fh.seek(start)
+                if fh.read(end - start) != block[start - pos:end - pos]:
+                    raise UploadError(f"chunk differs from data already received at [{start}, {end})", 409)
+            fh.seek(pos)
+            fh.write(block)
+            written += len(block)
+    if written != length:
+        raise UploadError(f"incomplete chunk: got {written} of {length} bytes")
+
+    db.session.add(UploadChunk(session_id=sess.id, offset=offset, length=length))
+    sess.updated_at = datetime.utcnow()
+    db.session.commit()
+
+    ranges = received_ranges(sess.id)
+    with _lock_for(sess.id):
+        _advance_hash(sess, _contiguous_end(ranges))
+    return progress(sess, ranges)
+
+def progress(sess: UploadSession, ranges: Optional[List[Tuple[int, int]]] = None) -> Dict[str, Any]:
+    ranges = received_ranges(sess.id) if ranges is None else ranges
+    received = sum(end - start for start, end in ranges)
+    return {
+        "id": sess.id,
+        "filename": sess.filename,
+        "size": sess.total_size,
+        "chunk_size": sess.chunk_size,
+        "status": sess.status,
+        "received_bytes": received,
+        "complete": received >= sess.total_size,
+        "ranges": [list(r) for r in ranges],
+        "missing": [list(r) for r in _missing(ranges, sess.total_size)],
+        "fields": json.loads(sess.fields or "{}"),
+    }
+
+def _claim(sess: UploadSession) -> None:
+    """條件式 UPDATE 把 session 從 OPEN 改成 FINALIZING 並立即 commit；沒搶到(別的請求 / worker 已在處理)→ 409。"""
+    t = UploadSession.__table__
+    res = db.session.execute(
+        update(t).where(t.c.id == sess.id, t.c.status == "OPEN")
+        .values(status="FINALIZING", updated_at=datetime.utcnow())
+    )
+    db.session.commit()
+    if res.rowcount != 1:
+        db.session.refresh(sess)
+        raise UploadError(f"session is {sess.status}", 409)
+    db.session.refresh(sess)
+
+def release(sess: UploadSession) -> None:
+    """finalize 失敗時把 FINALIZING 還原成 OPEN(可補傳後重試)；暫存檔已收進 blob store 而無法重試時改為 ABORTED。"""
+    db.session.rollback()
+    t = UploadSession.__table__
+    status = "OPEN" if temp_path(sess.id).exists() else "ABORTED"
+    db.session.execute(
+        update(t).where(t.c.id == sess.id, t.c.status == "FINALIZING").values(status=status)
+    )
+    db.session.commit()
+    db.session.refresh(sess)
+
+def finalize(sess: UploadSession) -> Tuple[Blob, Path]:
+    """
+    搶下 session(OPEN → FINALIZING)→ 驗證完整性 → 補算雜湊 → 收進 blob store
+    （不 commit Blob，由呼叫端與建檔同一交易 commit；之後呼叫 mark_done，失敗則 release）。
+    """
+    _claim(sess)
+    try:
+        ranges = received_ranges(sess.id)
+        gaps = _missing(ranges, sess.total_size)
+        if gaps:
+            raise UploadError(f"upload incomplete, missing {gaps[:5]}", 409)
+
+        with _lock_for(sess.id):
+            hasher, _ = _advance_hash(sess, sess.total_size)
+            digest = hasher.hexdigest()
+
+        if sess.expected_sha256 and digest != sess.expected_sha256:
+            raise UploadError(f"sha256 mismatch: expected {sess.expected_sha256}, got {digest}", 422)
+
+        tmp = temp_path(sess.id)
+        blob, target = blob_store.commit_temp_file(str(tmp), digest, sess.total_size, sess.filename)
+    except Exception:
+        release(sess)
+        raise
+    if tmp.exists():  # 內容已存在(去重)：暫存檔不再需要
+        tmp.unlink()
+    return blob, target
+
+def mark_done(sess: UploadSession, result: Dict[str, Any]) -> None:
+    sess.status = "DONE"
+    sess.result = json.dumps(result, ensure_ascii=False, default=str)
+    UploadChunk.query.filter_by(session_id=sess.id).delete(synchronize_session=False)
+    db.session.commit()
+    _forget(sess.id)
+
+def abort(sess: UploadSession) -> None:
+    sess.status = "ABORTED"
+    UploadChunk.query.filter_by(session_id=sess.id).delete(synchronize_session=False)
+    db.session.commit()
+    temp_path(sess.id).unlink(missing_ok=True)
+    _forget(sess.id)
+
+def expire_stale_sessions(ttl_hours: int = SESSION_TTL_HOURS) -> int:
+    """把超過 TTL 未活動的 OPEN session(及 finalize 中途行程終止而卡住的 FINALIZING)標成 ABORTED 並刪暫存檔。"""
+    cutoff = datetime.utcnow() - timedelta(hours=ttl_hours)
+    stale = UploadSession.query.filter(
+        UploadSession.status.in_(ACTIVE_STATUSES), UploadSession.updated_at < cutoff
+    ).all()
+    for sess in stale:
+        log.info("expire upload session %s (%s)", sess.id, sess.filename)
+        abort(sess)
+    return len(stale)
+
+def open_session_ids() -> set:
+    return {sid for (sid,) in db.session.query(UploadSession.id).filter(UploadSession.status.in_(ACTIVE_STATUSES))}
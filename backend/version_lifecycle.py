@@ -0,0 +1,194 @@
+# backend/version_lifecycle.py
+"""
+版本生效 / 失效的批次操作(/api/versions/lifecycle)，並同步 RAGFlow 的 enabled 旗標
+
+原本 /api/versions/<id>/toggle 一次只改一個版本的 is_active，而且不會通知 RAGFlow ——
+已廢止的規章仍會出現在檢索結果。這裡：
+1. 依條件選出版本(version_ids / doc_ids / 處室 / 在某日前已被新版本取代)，同一個交易內改 is_active
+2. 依 dataset 分組，把對應 RAGFlow 文件的啟用狀態以 update_documents_enabled 並行送出
+3. 回報每個版本的結果
+RAGFlow 文件的目標狀態：只要還有任一生效版本指向同一份 RAGFlow 文件就維持啟用
+(條文增量更新的新版本沿用舊版的 rag_doc_id，停用舊版不能連帶停用現行版)。
+沒有 rag_doc_id 的版本：只有該文件的最新版本會以顯示名稱比對 dataset 全部文件(與對帳相同規則)，
+對到後回寫 rag_doc_id；較舊的版本沒有自己的 RAGFlow 文件，結果為 skipped。
+"""
+import os
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import aliased
+
+from models import db, Document, DocumentVersion
+from ragflow_service import list_all_documents_cached, update_documents_enabled
+from reconcile import index_upstream, match_version, pick_primary
+
+LIFECYCLE_CONCURRENCY = int(os.getenv("LIFECYCLE_CONCURRENCY", "8"))
+LIFECYCLE_MAX_VERSIONS = int(os.getenv("LIFECYCLE_MAX_VERSIONS", "5000"))
+
+ACTIONS = {"activate": True, "deactivate": False}
+
+
+class LifecycleError(ValueError):
+    pass
+
+
+# ─────────────────────────── 篩選 ───────────────────────────
+def select_versions(*, version_ids: Optional[Iterable[int]] = None, doc_ids: Optional[Iterable[int]] = None,
+                    department: Optional[str] = None, superseded_before: Optional[date] = None):
+    """
+    依條件組出 DocumentVersion 查詢(條件之間為 AND；至少要有一個條件)。
+    superseded_before：同一文件有公布日期早於此日、且比該版本新的版本(＝在此日前已被取代)。
+    """
+    version_ids, doc_ids = list(version_ids or []), list(doc_ids or [])
+    if not (version_ids or doc_ids or department or superseded_before):
+        raise LifecycleError("at least one filter is required: version_ids, doc_ids, department, superseded_before")
+
+    query = DocumentVersion.query
+    if version_ids:
+        query = query.filter(DocumentVersion.id.in_(version_ids))
+    if doc_ids:
+        query = query.filter(DocumentVersion.doc_id.in_(doc_ids))
+    if department:
+        query = query.join(Document, Document.id == DocumentVersion.doc_id).filter(Document.department == department)
+    if superseded_before:
+        newer = aliased(DocumentVersion)
+        query = query.filter(
+            db.session.query(newer.id).filter(
+                newer.doc_id == DocumentVersion.doc_id,
+                newer.id != DocumentVersion.id,
+                newer.date_issued.isnot(None),
+                newer.date_issued < superseded_before,
+                or_(
+                    DocumentVersion.date_issued.is_(None),
+                    newer.date_issued > DocumentVersion.date_issued,
+                    and_(newer.date_issued == DocumentVersion.date_issued, newer.id > DocumentVersion.id),
+                ),
+            ).exists()
+        )
+    return query.order_by(DocumentVersion.doc_id, DocumentVersion.id)
+
+
+# ─────────────────────────── RAGFlow 同步 ───────────────────────────
+def _latest_ids(doc_ids: Iterable[int]) -> Dict[int, int]:
+    """{doc_id: 最新版本 id}(與 /api/docs 相同排序)。"""
+    latest: Dict[int, int] = {}
+    rows = (db.session.query(DocumentVersion.doc_id, DocumentVersion.id)
+            .filter(DocumentVersion.doc_id.in_(list(doc_ids)))
+            .order_by(DocumentVersion.doc_id, DocumentVersion.date_issued.desc(), DocumentVersion.id.desc()))
+    for doc_id, vid in rows:
+        latest.setdefault(doc_id, vid)
+    return latest
+
+
+def _resolve(versions: List[DocumentVersion], dataset_name: Optional[str]) -> Dict[int, str]:
+    """沒有 rag_doc_id 的最新版本 → 以顯示名稱比對 dataset 全部文件；回傳 {version_id: rag_doc_id}。"""
+    latest = _latest_ids({v.doc_id for v in versions})
+    versions = [v for v in versions if latest.get(v.doc_id) == v.id and v.file_path]
+    if not versions:
+        return {}
+    listing = list_all_documents_cached(dataset_name)
+    by_id, by_name = index_upstream(listing["docs"])
+    docs = {d.id: d for d in Document.query.filter(Document.id.in_({v.doc_id for v in versions}))}
+    out = {}
+    for v in versions:
+        _names, hits = match_version(docs[v.doc_id], v, by_id, by_name)
+        if hits:
+            out[v.id] = pick_primary(hits)["id"]
+    return out
+
+
+def push(versions: List[DocumentVersion], kb: Optional[str] = None,
+         concurrency: Optional[int] = None) -> Dict[int, Dict[str, Any]]:
+    """
+    把版本目前的 is_active 反映到 RAGFlow；回傳 {version_id: {status, doc_id?, enabled?, dataset?, error?}}。
+    status：updated / failed / skipped(沒有對應的 RAGFlow 文件)。版本的 kb 優先，否則用參數 kb。
+    """
+    results: Dict[int, Dict[str, Any]] = {}
+    groups: Dict[Optional[str], List[DocumentVersion]] = defaultdict(list)
+    for v in versions:
+        groups[v.kb or kb].append(v)
+
+    for ds_name, vers in groups.items():
+        resolved: Dict[int, str] = {}
+        need = [v for v in vers if not v.rag_doc_id]
+        if need:
+            try:
+                resolved = _resolve(need, ds_name)
+            except Exception as e:
+                for v in need:
+                    results[v.id] = {"status": "failed", "dataset": ds_name, "error": f"list documents: {e}"}
+        for v in need:
+            if v.id in resolved:
+                v.rag_doc_id = resolved[v.id]
+
+        rag_of = {v.id: v.rag_doc_id for v in vers if v.rag_doc_id}
+        if rag_of:
+            enabled_ids = {
+                r for (r,) in db.session.query(DocumentVersion.rag_doc_id)
+                .filter(DocumentVersion.rag_doc_id.in_(set(rag_of.values())), DocumentVersion.is_active.is_(True))
+            }
+            states = {r: r in enabled_ids for r in rag_of.values()}
+            try:
+                res = update_documents_enabled(states, ds_name, concurrency or LIFECYCLE_CONCURRENCY)
+                failed = {f["id"]: f["error"] for f in res["failed"]}
+                ds_label = res["dataset"]
+            except Exception as e:
+                failed, ds_label = {r: str(e) for r in states}, ds_name
+            for vid, r in rag_of.items():
+                item = {"doc_id": r, "enabled": states[r], "dataset": ds_label}
+                if r in failed:
+                    results[vid] = {"status": "failed", **item, "error": failed[r]}
+                else:
+                    results[vid] = {"status": "updated", **item}
+        for v in vers:
+            results.setdefault(v.id, {"status": "skipped", "dataset": ds_name,
+                                      "error": "no RAGFlow document for this version"})
+    db.session.commit()   # 回寫比對到的 rag_doc_id
+    return results
+
+
+# ─────────────────────────── 批次操作 ───────────────────────────
+def apply(action: str, *, version_ids: Optional[Iterable[int]] = None, doc_ids: Optional[Iterable[int]] = None,
+          department: Optional[str] = None, superseded_before: Optional[date] = None,
+          kb: Optional[str] = None, sync_to_ragflow: bool = True, dry_run: bool = False,
+          concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """
+    選出的版本在同一個交易內改為生效(activate)/ 失效(deactivate)，commit 後同步 RAGFlow。
+    回傳 {action, matched, changed, dry_run, items: [{version_id, doc_id, title, was_active, is_active, changed, ragflow?}]}。
+    """
+    if action not in ACTIONS:
+        raise LifecycleError(f"action must be one of: {', '.join(ACTIONS)}")
+    target = ACTIONS[action]
+    query = select_versions(version_ids=version_ids, doc_ids=doc_ids, department=department,
+                            superseded_before=superseded_before)
+    versions = query.limit(LIFECYCLE_MAX_VERSIONS + 1).all()
+    if len(versions) > LIFECYCLE_MAX_VERSIONS:
+        raise LifecycleError(f"filter matches more than {LIFECYCLE_MAX_VERSIONS} versions; narrow it down")
+
+    titles = dict(db.session.query(Document.id, Document.title)
+                  .filter(Document.id.in_({v.doc_id for v in versions})))
+    items = []
+    for v in versions:
+        was = bool(v.is_active)
+        items.append({"version_id": v.id, "doc_id": v.doc_id, "title": titles.get(v.doc_id),
+                      "was_active": was, "is_active": target if not dry_run else was, "changed": was != target})
+        if not dry_run:
+            v.is_active = target
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+
+    if sync_to_ragflow and not dry_run and versions:
+        pushed = push(versions, kb, concurrency)
+        for it in items:
+            it["ragflow"] = pushed.get(it["version_id"])
+    return {
+        "action": action,
+        "matched": len(items),
+        "changed": sum(1 for it in items if it["changed"]),
+        "dry_run": dry_run,
+        "items": items,
+    }
@@ -0,0 +1,362 @@
+# backend/version_update.py
+"""
+規章改版：以「條」為單位的增量更新
+
+修正案通常只動到幾條，整份重新上傳會讓 RAGFlow 重新解析、重新 embedding 全部內容。
+這裡的流程：
+1. 新版 PDF 擷取全文(file_service.extract_pdf_text，有快取)，依行首「第X條(之Y)」切成條文
+2. 與前一版的條文雜湊比對 → added / changed / removed / unchanged
+   - 前一版的條文索引存在 chunk 表(section_ref / hash / rag_chunk_id)
+   - 前一版沒有索引(一般上傳、由 RAGFlow 自行解析)時，改由前一版檔案切條，
+     再列出 RAGFlow 端 chunk，以「內容相同」認領各條對應的 chunk id
+3. 只把有變動的條文經 chunk API 推送(新增 / 修改 / 刪除)，未變動的 chunk 不動
+4. 下列情況改走整份重新解析(上傳新檔並解析 → 成功後才刪除舊的 RAGFlow 文件)：
+   - 找不到 RAGFlow 端文件、新舊任一版條數少於 VERSION_DIFF_MIN_SECTIONS(看不出條文結構)
+   - 變動比例超過 VERSION_DIFF_MAX_RATIO(結構改太多，逐條推送不划算)
+   - 需要修改 / 刪除的條文認領不到對應 chunk、或 chunk API 呼叫失敗
+注意：增量模式下 RAGFlow 端保存的原始檔仍是舊版 PDF，檢索內容則已是新版條文；本地保存新版檔案。
+"""
+import os
+import re
+import hashlib
+import logging
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app
+
+from models import db, Document, DocumentVersion, Chunk, Blob
+import blob_store
+from file_service import extract_pdf_text
+from regulation_text import ARTICLE_RE
+from ragflow_service import (
+    rag_display_name,
+    find_by_display_name_exact,
+    list_document_chunks,
+    apply_chunk_changes,
+    delete_documents_batched,
+    upload_documents_batch,
+    update_documents_chunking,
+    parse_documents_batched,
+    _normalize_chunk_method,
+)
+
+log = logging.getLogger("version_update")
+
+VERSION_DIFF_MAX_RATIO = float(os.getenv("VERSION_DIFF_MAX_RATIO", "0.5"))
+VERSION_DIFF_MIN_SECTIONS = int(os.getenv("VERSION_DIFF_MIN_SECTIONS", "3"))
+VERSION_CHUNK_CONCURRENCY = int(os.getenv("VERSION_CHUNK_CONCURRENCY", "4"))
+
+PREAMBLE = "前言"
+_WS_RE = re.compile(r"\s+")
+
+
+# ─────────────────────────── 切條 / 比對 ───────────────────────────
+def normalize(text: str) -> str:
+    """比對用：去除所有空白(PDF 擷取的換行位置每版都可能不同)。"""
+    return _WS_RE.sub("", text or "")
+
+
+def section_hash(content: str) -> str:
+    return hashlib.sha256(normalize(content).encode("utf-8")).hexdigest()
+
+
+def split_sections(text: str) -> List[Dict[str, Any]]:
+    """
+    依行首「第X條 / 第X條之Y」切段，回傳 [{ref, content, hash}]。
+    第一條之前的文字(名稱、沿革)為「前言」；同一條號重複出現時(如附表引用)第二次起加上 #2、#3。
+    """
+    text = (text or "").replace("\f", "\n")
+    marks = [(m.start(), _WS_RE.sub("", m.group(1))) for m in ARTICLE_RE.finditer(text)]
+    out: List[Dict[str, Any]] = []
+    seen: Dict[str, int] = {}
+
+    def _add(ref: str, body: str):
+        body = body.strip()
+        if not body:
+            return
+        seen[ref] = seen.get(ref, 0) + 1
+        key = ref if seen[ref] == 1 else f"{ref}#{seen[ref]}"
+        out.append({"ref": key, "content": body, "hash": section_hash(body)})
+
+    if not marks:
+        _add(PREAMBLE, text)
+        return out
+    _add(PREAMBLE, text[:marks[0][0]])
+    for i, (start, ref) in enumerate(marks):
+        end = marks[i + 1][0] if i + 1 < len(marks) else len(text)
+        _add(ref, text[start:end])
+    return out
+
+
+def diff_sections(old: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    old_by = {s["ref"]: s["hash"] for s in old}
+    new_by = {s["ref"]: s["hash"] for s in new}
+    return {
+        "added": [r for r in new_by if r not in old_by],
+        "changed": [r for r in new_by if r in old_by and old_by[r] != new_by[r]],
+        "removed": [r for r in old_by if r not in new_by],
+        "unchanged": [r for r in new_by if r in old_by and old_by[r] == new_by[r]],
+    }
+
+
+def change_ratio(diff: Dict[str, List[str]], n_old: int, n_new: int) -> float:
+    touched = len(diff["added"]) + len(diff["changed"]) + len(diff["removed"])
+    return touched / max(1, n_old, n_new)
+
+
+def adopt_chunk_ids(sections: List[Dict[str, Any]], upstream: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    以內容相同(去空白後雜湊相等)把 RAGFlow 端 chunk 認領給條文；回傳 {ref: chunk_id}。
+    一個 chunk 含多條(切分方法把數條合併)時認領不到 —— 呼叫端會改走整份重新解析。
+    """
+    by_hash: Dict[str, List[str]] = {}
+    for c in upstream:
+        if c.get("id"):
+            by_hash.setdefault(section_hash(c.get("content") or ""), []).append(c["id"])
+    out: Dict[str, str] = {}
+    for s in sections:
+        ids = by_hash.get(s["hash"])
+        if ids:
+            out[s["ref"]] = ids.pop(0)
+    return out
+
+
+# ─────────────────────────── 前一版 / RAGFlow 文件 ───────────────────────────
+def latest_version(doc_id: int) -> Optional[DocumentVersion]:
+    return (
+        DocumentVersion.query.filter_by(doc_id=doc_id)
+        .order_by(DocumentVersion.date_issued.desc(), DocumentVersion.id.desc())
+        .first()
+    )
+
+
+def _cache_dir() -> str:
+    return current_app.config["CACHE_FOLDER"]
+
+
+def previous_sections(ver: DocumentVersion) -> Tuple[List[Dict[str, Any]], Dict[str, str], str]:
+    """回傳 (條文, {ref: rag_chunk_id}, 來源 "index" / "file" / "none")。"""
+    rows = Chunk.query.filter_by(version_id=ver.id).order_by(Chunk.chunk_index).all()
+    if rows:
+        sections = [{"ref": r.section_ref, "content": r.content, "hash": r.hash} for r in rows]
+        return sections, {r.section_ref: r.rag_chunk_id for r in rows if r.rag_chunk_id}, "index"
+    if ver.file_path and os.path.isfile(ver.file_path):
+        return split_sections(extract_pdf_text(ver.file_path, _cache_dir())), {}, "file"
+    return [], {}, "none"
+
+
+def find_rag_doc_id(doc: Document, ver: Optional[DocumentVersion], dataset_name: Optional[str]) -> Optional[str]:
+    if ver is not None and ver.rag_doc_id:
+        return ver.rag_doc_id
+    ext = Path(ver.file_path).suffix if ver is not None and ver.file_path else ".pdf"
+    names = [rag_display_name(doc.title, doc.department, ext)]
+    legacy = doc.title if doc.title.endswith(ext) else f"{doc.title}{ext}"
+    if legacy not in names:
+        names.append(legacy)
+    for name in names:
+        res = find_by_display_name_exact(name, dataset_name=dataset_name)
+        matches = res.get("matches") or []
+        if len(matches) == 1:
+            return matches[0]["id"]
+    return None
+
+
+# ─────────────────────────── 規劃 / 執行 ───────────────────────────
+def plan_update(doc: Document, new_file: str, *, dataset_name: Optional[str] = None,
+                force_full: bool = False, max_ratio: Optional[float] = None) -> Dict[str, Any]:
+    """只讀：算出條文差異與要採用的模式(incremental / full / none)，不動 RAGFlow 與 DB。"""
+    max_ratio = VERSION_DIFF_MAX_RATIO if max_ratio is None else max_ratio
+    new_text = extract_pdf_text(new_file, _cache_dir())
+    new_sections = split_sections(new_text)
+    prev = latest_version(doc.id)
+    old_sections, chunk_ids, source = previous_sections(prev) if prev else ([], {}, "none")
+    diff = diff_sections(old_sections, new_sections)
+    ratio = change_ratio(diff, len(old_sections), len(new_sections))
+
+    plan: Dict[str, Any] = {
+        "previous_version_id": prev.id if prev else None,
+        "previous_source": source,
+        "text_hash": section_hash(new_text),
+        "sections": new_sections,
+        "old_sections": old_sections,
+        "diff": diff,
+        "change_ratio": round(ratio, 4),
+        "rag_doc_id": None,
+        "chunk_ids": chunk_ids,
+        "mode": "full",
+        "reason": None,
+    }
+
+    rag_doc_id = find_rag_doc_id(doc, prev, dataset_name)
+    plan["rag_doc_id"] = rag_doc_id
+    touched = diff["added"] or diff["changed"] or diff["removed"]
+    if force_full:
+        plan["reason"] = "force_full"
+    elif rag_doc_id is None:
+        plan["reason"] = "no upstream document"
+    elif min(len(old_sections), len(new_sections)) < VERSION_DIFF_MIN_SECTIONS:
+        plan["reason"] = "no article structure"
+    elif not touched:
+        plan["mode"] = "none"
+    elif ratio > max_ratio:
+        plan["reason"] = f"change ratio {ratio:.2f} > {max_ratio:.2f}"
+    else:
+        needed = diff["changed"] + diff["removed"]
+        if any(r not in chunk_ids for r in needed):
+            adopted = adopt_chunk_ids(old_sections, list_document_chunks(rag_doc_id, dataset_name))
+            chunk_ids = {**adopted, **chunk_ids}
+            plan["chunk_ids"] = chunk_ids
+        missing = [r for r in needed if r not in chunk_ids]
+        if missing:
+            plan["reason"] = f"{len(missing)} changed/removed sections have no matching upstream chunk"
+        else:
+            plan["mode"] = "incremental"
+    return plan
+
+
+def _keywords(doc: Document, ref: str) -> List[str]:
+    return [k for k in (doc.title, ref.split("#")[0]) if k and k != PREAMBLE]
+
+
+def _push_incremental(doc: Document, plan: Dict[str, Any], dataset_name: Optional[str]) -> Dict[str, Any]:
+    by_ref = {s["ref"]: s for s in plan["sections"]}
+    ids = plan["chunk_ids"]
+    diff = plan["diff"]
+    res = apply_chunk_changes(
+        plan["rag_doc_id"],
+        add=[{"content": by_ref[r]["content"], "important_keywords": _keywords(doc, r)} for r in diff["added"]],
+        update=[{"id": ids[r], "content": by_ref[r]["content"]} for r in diff["changed"]],
+        delete=[ids[r] for r in diff["removed"]],
+        dataset_name=dataset_name,
+        concurrency=VERSION_CHUNK_CONCURRENCY,
+    )
+    new_ids = {r: ids[r] for r in diff["unchanged"] + diff["changed"] if r in ids}
+    new_ids.update({r: cid for r, cid in zip(diff["added"], res["added"]) if cid})
+    res["chunk_ids"] = new_ids
+    return res
+
+
+def _push_full(doc: Document, plan: Dict[str, Any], new_file: str, dataset_name: Optional[str],
+               parse_options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    先上傳新檔(文件 id 取自上傳回應，不以名稱搜尋，同名的舊文件不受影響)並觸發解析，
+    兩者都成功後才刪除舊文件 —— 任何一步失敗時舊文件保留，檢索不會出現空窗。
+    """
+    name = rag_display_name(doc.title, doc.department, Path(new_file).suffix or "")
+    res: Dict[str, Any] = {"success": False, "display_name": name, "rag_doc_id": None,
+                           "parsed_ids": [], "deleted_previous": None}
+    try:
+        up = upload_documents_batch([(name, Path(new_file).read_bytes())], dataset_name)
+    except Exception as e:
+        res["error"] = f"upload_failed: {e}"
+        return res
+    res["dataset"] = up["dataset"]
+    new_id = up["ids"][0] if up["ids"] else None
+    if not new_id:
+        res["error"] = "upload returned no document id"
+        return res
+    res["rag_doc_id"] = new_id
+
+    cm = _normalize_chunk_method((parse_options or {}).get("method"))
+    if cm:
+        chunking = update_documents_chunking([new_id], cm, dataset_name=dataset_name)
+        if chunking["failed"]:
+            res["warn"] = f"chunk_method not applied: {chunking['failed'][0]['error']}"
+    parsed = parse_documents_batched([new_id], dataset_name)
+    res["parsed_ids"] = parsed["triggered"]
+    if parsed["failed"]:
+        res["error"] = f"parse_trigger_failed: {parsed['failed'][0]['error']}"
+        return res
+
+    res["success"] = True
+    if plan["rag_doc_id"] and plan["rag_doc_id"] != new_id:
+        res["deleted_previous"] = delete_documents_batched([plan["rag_doc_id"]], dataset_name)
+    return res
+
+
+def apply_update(doc: Document, blob: Optional[Blob], new_file: str, filename: str, *,
+                 date_issued: Optional[date] = None, dataset_name: Optional[str] = None,
+                 force_full: bool = False, max_ratio: Optional[float] = None,
+                 deactivate_previous: bool = True, dry_run: bool = False,
+                 parse_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    規劃 → 推送 RAGFlow → 一次交易寫入新版本與條文索引。
+    RAGFlow 呼叫在交易之外進行(不在網路等待期間佔住 DB 寫鎖)。
+    dry_run 只規劃不寫入，此時 blob 可為 None(new_file 為暫存檔)。
+    """
+    plan = plan_update(doc, new_file, dataset_name=dataset_name, force_full=force_full, max_ratio=max_ratio)
+    summary = {
+        "mode": plan["mode"],
+        "reason": plan["reason"],
+        "previous_version_id": plan["previous_version_id"],
+        "previous_source": plan["previous_source"],
+        "change_ratio": plan["change_ratio"],
+        "sections": len(plan["sections"]),
+        "diff": plan["diff"],
+    }
+    if dry_run:
+        summary["dry_run"] = True
+        return {"success": True, **summary}
+
+    ragflow: Dict[str, Any] = {}
+    chunk_ids: Dict[str, str] = {}
+    rag_doc_id = plan["rag_doc_id"]
+    if plan["mode"] == "incremental":
+        ragflow = _push_incremental(doc, plan, dataset_name)
+        if ragflow["failed"]:
+            # 部分失敗時 RAGFlow 端狀態不完整：整份重新解析以回到一致
+            log.warning("incremental update of doc %s failed (%s), falling back to full re-parse",
+                        doc.id, ragflow["failed"][:3])
+            summary.update(mode="full", reason="chunk api failed", incremental=ragflow)
+        else:
+            chunk_ids = ragflow.pop("chunk_ids")
+    elif plan["mode"] == "none":
+        chunk_ids = dict(plan["chunk_ids"])
+    if summary["mode"] == "full":
+        ragflow = _push_full(doc, plan, new_file, dataset_name, parse_options)
+        rag_doc_id = ragflow.get("rag_doc_id")
+        if not ragflow["success"] and deactivate_previous:
+            # RAGFlow 端仍是舊文件在服務：舊版本維持生效，待重新推送成功後再停用
+            deactivate_previous = False
+            summary["previous_kept_active"] = True
+
+    if deactivate_previous:
+        DocumentVersion.query.filter_by(doc_id=doc.id, is_active=True).update({"is_active": False})
+    ver = DocumentVersion(
+        doc_id=doc.id,
+        date_issued=date_issued,
+        is_active=True,
+        file_path=new_file,
+        text_hash=plan["text_hash"],
+        rag_doc_id=rag_doc_id,
+        kb=dataset_name,
+    )
+    db.session.add(ver)
+    db.session.flush()
+    blob_store.register_file(blob, filename, version_id=ver.id)
+    db.session.add_all(
+        Chunk(version_id=ver.id, section_ref=s["ref"], content=s["content"], chunk_index=i,
+              hash=s["hash"], rag_doc_id=rag_doc_id, rag_chunk_id=chunk_ids.get(s["ref"]))
+        for i, s in enumerate(plan["sections"])
+    )
+    if date_issued and (doc.date_issued is None or date_issued >= doc.date_issued):
+        doc.date_issued = date_issued
+    db.session.commit()
+
+    ok = summary["mode"] == "none" or (
+        not ragflow.get("failed") if summary["mode"] == "incremental" else bool(ragflow.get("success"))
+    )
+    summary.update(
+        success=ok,
+        version={
+            "id": ver.id,
+            "file_path": ver.file_path,
+            "date_issued": ver.date_issued.isoformat() if ver.date_issued else None,
+            "is_active": ver.is_active,
+            "rag_doc_id": ver.rag_doc_id,
+        },
+        ragflow=ragflow,
+    )
+    return summary
@@ -0,0 +1,169 @@
+# backend/version_validity.py
+"""
+版本生效區間(/api/docs/as-of：某一天各規章適用哪個版本)
+
+每個版本存 [effective_from, effective_to)(DocumentVersion 上，(effective_from, effective_to) 有 index)：
+- 同一文件的版本依公布日期(沒有時用建檔日)、id 排序；每個版本自公布日起生效，到下一個版本公布日為止
+  (同一天公布多個版本時以最後建立者為準，前面的區間長度為 0，不會被查到)
+- 最後一個版本：is_active 為真 → effective_to 為空(至今仍生效)；
+  已失效 → 區間結束在失效當天(保留已記錄的結束日；全量重建時以 updated_at 推估)
+查詢某日 X 在效的版本：effective_from <= X AND (effective_to IS NULL OR effective_to > X)，只掃 index 範圍；
+查詢期間 [X, Y] 內曾經在效：effective_from <= Y AND (effective_to IS NULL OR effective_to > X)。
+
+ORM flush 後(after_flush，與寫入同一交易)重算「新增 / 刪除 / 改了公布日期或 is_active 的版本」所屬文件的區間；
+繞過 ORM 的批次寫入(封存匯入)之後呼叫 rebuild()。尚未建立過區間(升級後第一次)時，第一次查詢會先 rebuild()。
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import bindparam, event, inspect, or_, select, update
+from sqlalchemy.orm import Session
+
+from models import db, DataVersion, Document, DocumentVersion
+import data_version
+
+log = logging.getLogger("version_validity")
+
+MARKER = "version_validity"   # data_versions 中的標記：> 0 表示已建立過區間
+_WATCHED = ("date_issued", "is_active", "doc_id")
+_BATCH = 500
+
+_installed = False
+_ready = False
+
+
+# ─────────────────────────── 區間計算 ───────────────────────────
+def _start(r) -> date:
+    if r.date_issued:
+        return r.date_issued
+    if r.created_at:
+        return r.created_at.date()
+    return datetime.utcnow().date()
+
+
+def _recompute(conn, doc_ids: Iterable[int], closed_on: Callable[[Any], date]) -> int:
+    """重算指定文件全部版本的區間，只寫入有變動的列；回傳更新列數。closed_on(row) 為最後一個版本失效時的結束日。"""
+    v = DocumentVersion.__table__
+    ids = sorted(set(doc_ids))
+    changed = 0
+    for i in range(0, len(ids), _BATCH):
+        rows = conn.execute(
+            select(v.c.id, v.c.doc_id, v.c.date_issued, v.c.is_active, v.c.created_at, v.c.updated_at,
+                   v.c.effective_from, v.c.effective_to)
+            .where(v.c.doc_id.in_(ids[i:i + _BATCH]))
+        ).all()
+        by_doc: Dict[int, List[Any]] = defaultdict(list)
+        for r in rows:
+            by_doc[r.doc_id].append(r)
+
+        updates = []
+        for vers in by_doc.values():
+            vers.sort(key=lambda r: (_start(r), r.id))
+            for k, r in enumerate(vers):
+                start = _start(r)
+                if k + 1 < len(vers):
+                    end = _start(vers[k + 1])
+                elif r.is_active:
+                    end = None
+                elif r.effective_to is not None and r.effective_from == start:
+                    end = r.effective_to
+                else:
+                    end = closed_on(r)
+                if end is not None and end < start:
+                    end = start
+                if (r.effective_from, r.effective_to) != (start, end):
+                    updates.append({"_id": r.id, "_from": start, "_to": end, "_updated": r.updated_at})
+        if updates:
+            # 帶回原本的 updated_at：區間是衍生欄位，不應讓版本看起來被修改過(增量匯出依 updated_at 篩選)
+            conn.execute(
+                update(v).where(v.c.id == bindparam("_id")).values(
+                    effective_from=bindparam("_from"), effective_to=bindparam("_to"),
+                    updated_at=bindparam("_updated")),
+                updates,
+            )
+            changed += len(updates)
+    return changed
+
+
+# ─────────────────────────── flush 事件 ───────────────────────────
+def _affected(session: Session) -> Set[int]:
+    ids: Set[int] = set()
+    for obj in session.new:
+        if isinstance(obj, DocumentVersion) and obj.doc_id is not None:
+            ids.add(obj.doc_id)
+    for obj in session.deleted:
+        if isinstance(obj, DocumentVersion) and obj.doc_id is not None:
+            ids.add(obj.doc_id)
+    for obj in session.dirty:
+        if not isinstance(obj, DocumentVersion):
+            continue
+        state = inspect(obj)
+        for attr in _WATCHED:
+            hist = state.attrs[attr].history
+            if not hist.has_changes():
+                continue
+            if attr == "doc_id":   # 移到別的文件：原文件也要重算
+                ids.update(x for x in hist.deleted if x is not None)
+            if obj.doc_id is not None:
+                ids.add(obj.doc_id)
+    return ids
+
+
+def install() -> None:
+    """註冊 flush 事件(全域一次)。"""
+    global _installed
+    if _installed:
+        return
+
+    @event.listens_for(Session, "after_flush")
+    def _update_validity(session, flush_context):
+        ids = _affected(session)
+        if ids:
+            today = datetime.utcnow().date()
+            _recompute(session.connection(), ids, lambda _r: today)
+
+    _installed = True
+
+
+# ─────────────────────────── 全量重建 ───────────────────────────
+def rebuild() -> Dict[str, int]:
+    """依目前 DB 重算全部版本的區間並 commit；已失效的最後版本以 updated_at 當結束日。需在 app context 內。"""
+    global _ready
+    conn = db.session.connection()
+    d = Document.__table__
+    ids = [doc_id for (doc_id,) in conn.execute(select(d.c.id).order_by(d.c.id))]
+    today = datetime.utcnow().date()
+    changed = _recompute(conn, ids, lambda r: r.updated_at.date() if r.updated_at else today)
+    data_version.bump(MARKER)
+    db.session.commit()
+    _ready = True
+    return {"documents": len(ids), "versions_updated": changed}
+
+
+def ensure_ready() -> None:
+    global _ready
+    if not _ready:
+        t = DataVersion.__table__
+        _ready = bool(db.session.execute(select(t.c.version).where(t.c.name == MARKER)).scalar())
+    if not _ready:
+        log.info("version validity intervals not built yet, rebuilding")
+        rebuild()
+
+
+# ─────────────────────────── 查詢 ───────────────────────────
+def in_force_query(on: date, until: Optional[date] = None):
+    """
+    (Document, DocumentVersion) 查詢：on 當天在效的版本；給 until 時為 [on, until] 期間內曾經在效的版本。
+    """
+    ensure_ready()
+    end = until or on
+    return (
+        db.session.query(Document, DocumentVersion)
+        .join(DocumentVersion, Document.id == DocumentVersion.doc_id)
+        .filter(
+            DocumentVersion.effective_from <= end,
+            or_(DocumentVersion.effective_to.is_(None), DocumentVersion.effective_to > on),
+        )
+    )
@@ -41,10 +41,21 @@ export const fetchDocs = async (opts?: { kb?: string }): Promise<DocsListItem[]>
   return handleResponse<DocsListItem[]>(response);
 };
 
+// 超過此大小改走分段續傳(/uploads/sessions),斷線只需補傳缺的段落
+const RESUMABLE_THRESHOLD = 8 * 1024 * 1024;
+
 export const uploadDoc = async (formData: FormData, opts?: { kb?: string }): Promise<UploadResponse> => {
   // [修改] 移除了 /api
   const url = new URL(`${API_BASE}/docs`);
   if (opts?.kb && !formData.has('kb')) formData.append('kb', opts.kb);
+  const file = formData.get('file');
+  if (file instanceof File && file.size > RESUMABLE_THRESHOLD) {
+    const fields: Record<string, string> = {};
+    formData.forEach((value, key) => {
+      if (key !== 'file' && typeof value === 'string') fields[key] = value;
+    });
+    return uploadDocResumable(file, fields);
+  }
   const response = await fetch(url.toString(), {
     method: 'POST',
     body: formData
@@ -52,6 +63,74 @@ export const uploadDoc = async (formData: FormData, opts?: { kb?: string }): Pro
   return handleResponse<UploadResponse>(response);
 };
 
+export interface UploadSessionProgress {
+  id: string;
+  size: number;
+  chunk_size: number;
+  status: string;
+  received_bytes: number;
+  complete: boolean;
+  missing: [number, number][];
+}
+
+/**
+ * 分段續傳:建立 session 後以 parallel 條連線同時 PUT 各段,失敗的段落重試 retries 次;
+ * 傳入既有 sessionId 時先查詢進度,只補傳缺的段落。完成後 finalize,回傳與 uploadDoc 相同的結果。
+ */
+export const uploadDocResumable = async (
+  file: File,
+  fields: Record<string, string>,
+  opts?: { sessionId?: string; parallel?: number; retries?: number; onProgress?: (sent: number, total: number) => void }
+): Promise<UploadResponse> => {
+  const base = `${API_BASE}/uploads/sessions`;
+  let session: UploadSessionProgress;
+  if (opts?.sessionId) {
+    session = await handleResponse<UploadSessionProgress>(await fetch(`${base}/${opts.sessionId}`));
+  } else {
+    session = await handleResponse<UploadSessionProgress>(await fetch(base, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ filename: file.name, size: file.size, fields })
+    }));
+  }
+
+  // 把缺少的區段切成 chunk_size 大小的工作
+  const queue: [number, number][] = [];
+  for (const [start, end] of session.missing) {
+    for (let off = start; off < end; off += session.chunk_size) {
+      queue.push([off, Math.min(off + session.chunk_size, end)]);
+    }
+  }
+
+  let sent = session.received_bytes;
+  const retries = opts?.retries ?? 3;
+  const worker = async () => {
+    for (let job = queue.shift(); job; job = queue.shift()) {
+      const [start, end] = job;
+      for (let attempt = 0; ; attempt++) {
+        try {
+          const res = await fetch(`${base}/${session.id}?offset=${start}`, {
+            method: 'PUT',
+            headers: { 'Content-Type': 'application/octet-stream' },
+            body: file.slice(start, end)
+          });
+          await handleResponse<UploadSessionProgress>(res);
+          break;
+        } catch (e) {
+          if (attempt >= retries) throw e;
+          await new Promise(r => setTimeout(r, 500 * 2 ** attempt));
+        }
+      }
+      sent += end - start;
+      opts?.onProgress?.(sent, file.size);
+    }
+  };
+  await Promise.all(Array.from({ length: Math.max(1, opts?.parallel ?? 3) }, worker));
+
+  const response = await fetch(`${base}/${session.id}/finalize`, { method: 'POST' });
+  return handleResponse<UploadResponse>(response);
+};
+
 export const fetchFiles = async (): Promise<FileItem[]> => {
   // [修改] 移除了 /api
   const response = await fetch(`${API_BASE}/files`);